@@ -0,0 +1,143 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measure how long finding the projects that a new project would be squatting on
+takes as the number of projects grows, comparing the index backed lookup used
+by forklift with the levenshtein scan over every project that it replaced.
+
+    docker-compose run --rm web python dev/benchmarks/squat_candidates.py
+
+The projects are inserted into the database in $DATABASE_URL inside of a
+transaction which is rolled back at the end, so it needs to have been migrated
+but nothing is left behind in it.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+
+import packaging.utils
+import sqlalchemy
+import sqlalchemy.orm
+
+from sqlalchemy import func
+
+from warehouse.forklift.legacy import SQUAT_MAX_DISTANCE, _find_squattees
+from warehouse.packaging.models import Project
+
+
+PROJECT_COUNTS = [10000, 100000, 500000]
+REPEAT = 10
+BATCH_SIZE = 10000
+
+SYLLABLES = (
+    "py re quest django flask test lib data net http json yaml aws cli tool util "
+    "core web api async io db sql ml nlp graph plot num sci kit auth log conf doc "
+    "gen pack age x"
+).split()
+
+# The names that we look up, both short ones which are found by their length
+# and longer ones which are found through the trigram index.
+NAMES = ["ab", "pyx", "reqests", "flask-logins", "django-rest-frameworks"]
+
+
+def project_names(count, *, seed=0):
+    rng = random.Random(seed)
+    names = {}
+    while len(names) < count:
+        parts = [rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))]
+        separator = rng.choice(["", "-", "_", "."])
+        name = separator.join(parts) + str(rng.randint(0, 999))
+        # Names have to be unique once they've been normalized.
+        names.setdefault(packaging.utils.canonicalize_name(name), name)
+    return list(names.values())
+
+
+def populate(connection, names):
+    table = Project.__table__
+    for start in range(0, len(names), BATCH_SIZE):
+        connection.execute(
+            table.insert(),
+            [{"name": name} for name in names[start : start + BATCH_SIZE]],
+        )
+    connection.execute("ANALYZE projects")
+
+
+def scan_squattees(session, name):
+    return (
+        session.query(Project)
+        .filter(
+            func.levenshtein(Project.normalized_name, func.normalize_pep426_name(name))
+            <= SQUAT_MAX_DISTANCE
+        )
+        .all()
+    )
+
+
+def measure(find, session):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        for name in NAMES:
+            find(session, name)
+        timings.append((time.perf_counter() - start) * 1000 / len(NAMES))
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL"))
+    args = parser.parse_args()
+
+    engine = sqlalchemy.create_engine(args.database_url)
+    connection = engine.connect()
+    transaction = connection.begin()
+    session = sqlalchemy.orm.Session(bind=connection)
+
+    try:
+        names = project_names(max(PROJECT_COUNTS))
+        inserted = 0
+
+        print(
+            f"{'projects':>10} {'scan (ms)':>12} {'index (ms)':>12} "
+            f"{'found':>8} {'of':>6}"
+        )
+        for count in PROJECT_COUNTS:
+            populate(connection, names[inserted:count])
+            inserted = count
+
+            # The index only narrows down which projects we compute the
+            # distance to, and it mustn't leave out any that the scan finds.
+            found = scanned = 0
+            for name in NAMES:
+                indexed = {p.name for p in _find_squattees(session, name)}
+                everything = {p.name for p in scan_squattees(session, name)}
+                assert indexed == everything
+                found += len(indexed)
+                scanned += len(everything)
+
+            print(
+                f"{count:>10} {measure(scan_squattees, session):>12.3f} "
+                f"{measure(_find_squattees, session):>12.3f} "
+                f"{found:>8} {scanned:>6}"
+            )
+    finally:
+        session.close()
+        transaction.rollback()
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
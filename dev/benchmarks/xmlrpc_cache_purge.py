@@ -0,0 +1,109 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measure how long purging a single tag from the XML-RPC cache takes as the
+number of other keys in Redis grows, comparing the tag index used by RedisLru
+with the SCAN over the whole keyspace that it replaced.
+
+    docker-compose run --rm web python dev/benchmarks/xmlrpc_cache_purge.py
+
+The benchmark flushes the selected Redis database, so by default it uses
+database 15 of the Redis in $REDIS_URL rather than the one warehouse uses.
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+import redis
+
+from warehouse.legacy.api.xmlrpc.cache.fncache import RedisLru
+
+
+KEYSPACE_SIZES = [1000, 10000, 100000]
+REPEAT = 20
+
+
+def scan_purge(conn, name, tag):
+    pipeline = conn.pipeline()
+    for key in conn.scan_iter(":".join([name, tag, "*"])):
+        pipeline.delete(key)
+    pipeline.execute()
+
+
+def populate(conn, size):
+    conn.flushdb()
+    for start in range(0, size, 1000):
+        pipeline = conn.pipeline()
+        for i in range(start, min(start + 1000, size)):
+            pipeline.hset(f"lru:project-{i}:release_data", "[]", "{}")
+            pipeline.sadd(f"lru:tag-index:project-{i}", f"lru:project-{i}:release_data")
+        pipeline.execute()
+
+
+def measure(purge):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        purge()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--redis-url",
+        default=os.environ.get("REDIS_URL", "redis://localhost:6379/0"),
+    )
+    parser.add_argument("--db", type=int, default=15)
+    parser.add_argument(
+        "--fake", action="store_true", help="use fakeredis instead of a server"
+    )
+    args = parser.parse_args()
+
+    if args.fake:
+        import fakeredis
+
+        conn = fakeredis.FakeStrictRedis()
+    else:
+        conn = redis.StrictRedis.from_url(args.redis_url, db=args.db)
+
+    redis_lru = RedisLru(conn)
+
+    print(f"{'keys':>10} {'scan (ms)':>12} {'index (ms)':>12}")
+    for size in KEYSPACE_SIZES:
+        populate(conn, size)
+
+        # Purging a tag which has been purged already costs the same as the
+        # first purge for the SCAN, and touches nothing for the index, so each
+        # repetition refills the entry that is being purged.
+        def refill():
+            redis_lru.add("release_data", "[]", {}, "project-0", None)
+
+        def timed_scan():
+            refill()
+            scan_purge(conn, "lru", "project-0")
+
+        def timed_index():
+            refill()
+            redis_lru.purge("project-0")
+
+        print(f"{size:>10} {measure(timed_scan):>12.3f} {measure(timed_index):>12.3f}")
+
+    conn.flushdb()
+
+
+if __name__ == "__main__":
+    main()
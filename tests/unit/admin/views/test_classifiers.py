@@ -61,6 +61,7 @@ class TestAddClassifier:
         assert new.l3 == new_l3 if new_l3 is not None else new.id
         assert new.l4 == new_l4 if new_l4 is not None else new.id
         assert new.l5 == new_l5 if new_l5 is not None else new.id
+        assert db_request.db.info["warehouse.classifiers.changed"]
 
     def test_add_parent_classifier(self, db_request):
         db_request.params = {"parent": "Foo :: Bar"}
@@ -79,6 +80,7 @@ class TestAddClassifier:
         assert new.l3 == 0
         assert new.l4 == 0
         assert new.l5 == 0
+        assert db_request.db.info["warehouse.classifiers.changed"]
 
 
 class TestDeprecateClassifier:
@@ -93,3 +95,4 @@ class TestDeprecateClassifier:
         db_request.db.flush()
 
         assert classifier.deprecated
+        assert db_request.db.info["warehouse.classifiers.changed"]
@@ -21,6 +21,15 @@ from warehouse.cache.origin import fastly
 from warehouse.cache.origin.interfaces import IOriginCache
 
 
+@pytest.fixture
+def fakeredis():
+    import fakeredis
+
+    _fakeredis = fakeredis.FakeStrictRedis()
+    yield _fakeredis
+    _fakeredis.flushall()
+
+
 class TestPurgeKey:
     def test_purges_successfully(self, monkeypatch):
         task = pretend.stub()
@@ -82,12 +91,95 @@ class TestPurgeKey:
         ]
 
 
+class TestPurgeKeys:
+    @pytest.fixture
+    def request_(self):
+        purge_key = pretend.stub(delay=pretend.call_recorder(lambda key: None))
+        return pretend.stub(
+            log=pretend.stub(
+                info=pretend.call_recorder(lambda *args, **kwargs: None),
+                error=pretend.call_recorder(lambda *args, **kwargs: None),
+            ),
+            task=pretend.call_recorder(lambda f: purge_key),
+            purge_key=purge_key,
+        )
+
+    def test_purges_in_batches(self, monkeypatch, request_):
+        monkeypatch.setattr(fastly, "PURGE_BATCH_SIZE", 2)
+        cacher = pretend.stub(purge_keys=pretend.call_recorder(lambda keys: None))
+        request_.find_service = pretend.call_recorder(lambda iface: cacher)
+
+        fastly.purge_keys(pretend.stub(), request_, ["c", "a", "b"])
+
+        assert request_.find_service.calls == [pretend.call(IOriginCache)]
+        assert cacher.purge_keys.calls == [
+            pretend.call(["a", "b"]),
+            pretend.call(["c"]),
+        ]
+        assert request_.log.info.calls == [
+            pretend.call("Purging %d keys", 2),
+            pretend.call("Purging %d keys", 1),
+        ]
+        assert request_.purge_key.delay.calls == []
+
+    @pytest.mark.parametrize(
+        "exception_type",
+        [
+            requests.ConnectionError,
+            requests.HTTPError,
+            requests.Timeout,
+            fastly.UnsuccessfulPurge,
+        ],
+    )
+    def test_falls_back_to_purge_key(self, request_, exception_type):
+        cacher = pretend.stub(
+            purge_keys=pretend.call_recorder(pretend.raiser(exception_type))
+        )
+        request_.find_service = lambda iface: cacher
+
+        fastly.purge_keys(pretend.stub(), request_, ["b", "a"])
+
+        assert request_.task.calls == [pretend.call(fastly.purge_key)] * 2
+        assert request_.purge_key.delay.calls == [
+            pretend.call("a"),
+            pretend.call("b"),
+        ]
+        assert request_.log.error.calls == [
+            pretend.call("Error purging %d keys: %s", 2, str(exception_type()))
+        ]
+
+    def test_purges_pending_keys(self, request_):
+        cacher = pretend.stub(
+            pop_pending_purges=pretend.call_recorder(lambda: {"b", "a"}),
+            purge_keys=pretend.call_recorder(lambda keys: None),
+        )
+        request_.find_service = lambda iface: cacher
+
+        fastly.purge_pending_keys(pretend.stub(), request_)
+
+        assert cacher.pop_pending_purges.calls == [pretend.call()]
+        assert cacher.purge_keys.calls == [pretend.call(["a", "b"])]
+
+    def test_no_pending_keys(self, request_):
+        cacher = pretend.stub(
+            pop_pending_purges=lambda: set(),
+            purge_keys=pretend.call_recorder(lambda keys: None),
+        )
+        request_.find_service = lambda iface: cacher
+
+        fastly.purge_pending_keys(pretend.stub(), request_)
+
+        assert cacher.purge_keys.calls == []
+
+
 class TestFastlyCache:
     def test_verify_service(self):
         assert verifyClass(IOriginCache, fastly.FastlyCache)
 
     def test_create_service(self):
         purge_key = pretend.stub(delay=pretend.stub())
+        purge_keys = pretend.stub(delay=pretend.stub())
+        tasks = {fastly.purge_key: purge_key, fastly.purge_keys: purge_keys}
         request = pretend.stub(
             registry=pretend.stub(
                 settings={
@@ -95,13 +187,51 @@ class TestFastlyCache:
                     "origin_cache.service_id": "the service id",
                 }
             ),
-            task=lambda f: purge_key,
+            task=lambda f: tasks[f],
+            http=pretend.stub(),
         )
         cacher = fastly.FastlyCache.create_service(None, request)
         assert isinstance(cacher, fastly.FastlyCache)
         assert cacher.api_key == "the api key"
         assert cacher.service_id == "the service id"
         assert cacher._purger is purge_key.delay
+        assert cacher._batch_purger is purge_keys.delay
+        assert cacher._http is request.http
+        assert cacher.redis_conn is None
+
+    def test_create_service_buffered(self, monkeypatch):
+        purge_key = pretend.stub(delay=pretend.stub())
+        purge_pending_keys = pretend.stub(
+            apply_async=pretend.call_recorder(lambda **kw: None)
+        )
+        tasks = {
+            fastly.purge_key: purge_key,
+            fastly.purge_pending_keys: purge_pending_keys,
+        }
+        redis_conn = pretend.stub()
+        from_url = pretend.call_recorder(lambda url: redis_conn)
+        monkeypatch.setattr(fastly.redis.StrictRedis, "from_url", from_url)
+        request = pretend.stub(
+            registry=pretend.stub(
+                settings={
+                    "origin_cache.api_key": "the api key",
+                    "origin_cache.service_id": "the service id",
+                    "origin_cache.redis_url": "redis://redis:6379/0",
+                    "origin_cache.purge_window": "10",
+                }
+            ),
+            task=lambda f: tasks[f],
+        )
+        cacher = fastly.FastlyCache.create_service(None, request)
+
+        assert from_url.calls == [pretend.call("redis://redis:6379/0")]
+        assert cacher.redis_conn is redis_conn
+        assert cacher.purge_window == 10
+        assert cacher._http is requests
+
+        cacher._batch_purger()
+
+        assert purge_pending_keys.apply_async.calls == [pretend.call(countdown=10)]
 
     def test_adds_surrogate_key(self):
         request = pretend.stub()
@@ -164,7 +294,51 @@ class TestFastlyCache:
 
         cacher.purge(["one", "two"])
 
-        assert purge_delay.calls == [pretend.call("one"), pretend.call("two")]
+        assert set(purge_delay.calls) == {pretend.call("one"), pretend.call("two")}
+
+    def test_purge_batch(self):
+        batch_purger = pretend.call_recorder(lambda keys: None)
+        cacher = fastly.FastlyCache(
+            api_key="an api key",
+            service_id="the-service-id",
+            purger=None,
+            batch_purger=batch_purger,
+        )
+
+        cacher.purge(["two", "one", "two"])
+        cacher.purge([])
+
+        assert batch_purger.calls == [pretend.call(["one", "two"])]
+
+    def test_purge_buffered(self, fakeredis):
+        batch_purger = pretend.call_recorder(lambda: None)
+        cacher = fastly.FastlyCache(
+            api_key="an api key",
+            service_id="the-service-id",
+            purger=None,
+            batch_purger=batch_purger,
+            redis_conn=fakeredis,
+        )
+
+        cacher.purge(["one", "two"])
+        cacher.purge(["two", "three"])
+
+        assert batch_purger.calls == [pretend.call()]
+        assert fakeredis.smembers(fastly.PENDING_PURGES_KEY) == {
+            b"one",
+            b"two",
+            b"three",
+        }
+        assert 0 < fakeredis.ttl(fastly.PURGE_SCHEDULED_KEY) <= 60
+
+        assert cacher.pop_pending_purges() == {"one", "two", "three"}
+        assert fakeredis.exists(fastly.PENDING_PURGES_KEY) == 0
+        assert fakeredis.exists(fastly.PURGE_SCHEDULED_KEY) == 0
+
+        cacher.purge(["four"])
+
+        assert batch_purger.calls == [pretend.call(), pretend.call()]
+        assert cacher.pop_pending_purges() == {"four"}
 
     def test_purge_key_ok(self, monkeypatch):
         cacher = fastly.FastlyCache(
@@ -218,3 +392,44 @@ class TestFastlyCache:
             )
         ]
         assert response.raise_for_status.calls == [pretend.call()]
+
+    def test_purge_keys_ok(self):
+        response = pretend.stub(
+            raise_for_status=pretend.call_recorder(lambda: None),
+            json=lambda: {
+                "one": "108-1391560174-974124",
+                "two": "108-1391560174-974125",
+            },
+        )
+        http = pretend.stub(post=pretend.call_recorder(lambda *a, **kw: response))
+        cacher = fastly.FastlyCache(
+            api_key="an api key", service_id="the-service-id", purger=None, http=http
+        )
+
+        cacher.purge_keys(["one", "two"])
+
+        assert http.post.calls == [
+            pretend.call(
+                "https://api.fastly.com/service/the-service-id/purge",
+                headers={
+                    "Accept": "application/json",
+                    "Fastly-Key": "an api key",
+                    "Fastly-Soft-Purge": "1",
+                    "Surrogate-Key": "one two",
+                },
+            )
+        ]
+        assert response.raise_for_status.calls == [pretend.call()]
+
+    @pytest.mark.parametrize("result", [{"one": "108-1391560174-974124"}, []])
+    def test_purge_keys_unsuccessful(self, result):
+        response = pretend.stub(
+            raise_for_status=pretend.call_recorder(lambda: None), json=lambda: result
+        )
+        http = pretend.stub(post=pretend.call_recorder(lambda *a, **kw: response))
+        cacher = fastly.FastlyCache(
+            api_key="an api key", service_id="the-service-id", purger=None, http=http
+        )
+
+        with pytest.raises(fastly.UnsuccessfulPurge):
+            cacher.purge_keys(["one", "two"])
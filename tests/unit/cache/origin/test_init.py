@@ -70,6 +70,25 @@ def test_execute_purge_success(app_config):
     assert "warehouse.cache.origin.purges" not in session.info
 
 
+def test_execute_purge_throttled(monkeypatch):
+    cacher = pretend.stub(purge=pretend.call_recorder(lambda purges: None))
+    config = pretend.stub(find_service_factory=lambda iface: lambda ctx, c: cacher)
+    throttle = pretend.stub(
+        filter=pretend.call_recorder(lambda purges: purges - {"all-projects"})
+    )
+    throttle_from_config = pretend.call_recorder(lambda c: throttle)
+    monkeypatch.setattr(origin, "throttle_from_config", throttle_from_config)
+    session = pretend.stub(
+        info={"warehouse.cache.origin.purges": {"type_1", "all-projects"}}
+    )
+
+    origin.execute_purge(config, session)
+
+    assert throttle_from_config.calls == [pretend.call(config)]
+    assert throttle.filter.calls == [pretend.call({"type_1", "all-projects"})]
+    assert cacher.purge.calls == [pretend.call({"type_1"})]
+
+
 def test_execute_purge_no_backend():
     @pretend.call_recorder
     def find_service_factory(interface):
@@ -259,6 +278,27 @@ def test_register_origin_keys(monkeypatch):
     assert config.registry == {"cache_keys": {Fake1: key_maker, Fake2: key_maker}}
 
 
+def test_register_origin_keys_purge_intervals(monkeypatch):
+    class Fake1:
+        pass
+
+    class Fake2:
+        pass
+
+    monkeypatch.setattr(origin, "key_maker_factory", lambda **kw: pretend.stub())
+
+    config = pretend.stub(registry={})
+
+    origin.register_origin_cache_keys(
+        config, Fake1, purge_keys=["all"], purge_intervals={"all": 60}
+    )
+    origin.register_origin_cache_keys(
+        config, Fake2, purge_keys=["all", "some"], purge_intervals={"some": 30}
+    )
+
+    assert config.registry["cache_purge_intervals"] == {"all": 60, "some": 30}
+
+
 def test_includeme_no_origin_cache():
     config = pretend.stub(
         add_directive=pretend.call_recorder(lambda name, func: None),
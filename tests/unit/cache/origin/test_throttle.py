@@ -0,0 +1,213 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pretend
+import pytest
+
+from warehouse.cache.origin import throttle
+from warehouse.cache.origin.interfaces import IOriginCache
+from warehouse.metrics import IMetricsService
+
+
+@pytest.fixture
+def fakeredis():
+    import fakeredis
+
+    _fakeredis = fakeredis.FakeStrictRedis()
+    yield _fakeredis
+    _fakeredis.flushall()
+
+
+@pytest.fixture
+def metrics():
+    return pretend.stub(increment=pretend.call_recorder(lambda *a, **kw: None))
+
+
+@pytest.fixture
+def scheduler():
+    return pretend.call_recorder(lambda key, interval: None)
+
+
+@pytest.fixture
+def purge_throttle(fakeredis, metrics, scheduler):
+    return throttle.PurgeThrottle(
+        fakeredis, {"all-projects": 60}, metrics=metrics, scheduler=scheduler
+    )
+
+
+class TestPurgeThrottle:
+    def test_first_purge_is_sent(self, purge_throttle, fakeredis, metrics, scheduler):
+        assert purge_throttle.filter({"all-projects", "project/foo"}) == {
+            "all-projects",
+            "project/foo",
+        }
+        assert scheduler.calls == [pretend.call("all-projects", 60)]
+        assert 0 < fakeredis.ttl("origin-cache/throttle/all-projects") <= 60
+        assert metrics.increment.calls == [
+            pretend.call(
+                "warehouse.cache.origin.throttle",
+                tags=["key:all-projects", "action:purged"],
+            )
+        ]
+
+    def test_later_purges_are_collapsed(
+        self, purge_throttle, fakeredis, metrics, scheduler
+    ):
+        purge_throttle.filter({"all-projects"})
+
+        assert purge_throttle.filter({"all-projects", "project/foo"}) == {"project/foo"}
+        assert purge_throttle.filter({"all-projects"}) == set()
+        assert scheduler.calls == [pretend.call("all-projects", 60)]
+        assert fakeredis.get("origin-cache/throttle/all-projects/collapsed") == b"1"
+        assert (
+            metrics.increment.calls[1:]
+            == [
+                pretend.call(
+                    "warehouse.cache.origin.throttle",
+                    tags=["key:all-projects", "action:collapsed"],
+                )
+            ]
+            * 2
+        )
+
+    def test_trailing_without_collapsed(self, purge_throttle, metrics, scheduler):
+        purge_throttle.filter({"all-projects"})
+
+        assert not purge_throttle.trailing("all-projects")
+        assert scheduler.calls == [pretend.call("all-projects", 60)]
+        assert len(metrics.increment.calls) == 1
+
+    def test_trailing_with_collapsed(
+        self, purge_throttle, fakeredis, metrics, scheduler
+    ):
+        purge_throttle.filter({"all-projects"})
+        purge_throttle.filter({"all-projects"})
+        fakeredis.delete("origin-cache/throttle/all-projects")
+
+        assert purge_throttle.trailing("all-projects")
+        assert scheduler.calls == [pretend.call("all-projects", 60)] * 2
+        assert 0 < fakeredis.ttl("origin-cache/throttle/all-projects") <= 60
+        assert not fakeredis.exists("origin-cache/throttle/all-projects/collapsed")
+        assert metrics.increment.calls[-1] == pretend.call(
+            "warehouse.cache.origin.throttle",
+            tags=["key:all-projects", "action:trailing"],
+        )
+
+        # The trailing purge started a new interval.
+        assert purge_throttle.filter({"all-projects"}) == set()
+
+    def test_trailing_for_unconfigured_key(self, fakeredis, metrics, scheduler):
+        fakeredis.set("origin-cache/throttle/all-projects/collapsed", "1")
+        purge_throttle = throttle.PurgeThrottle(
+            fakeredis, {}, metrics=metrics, scheduler=scheduler
+        )
+
+        assert purge_throttle.trailing("all-projects")
+        assert scheduler.calls == []
+
+
+class TestThrottleFactories:
+    @pytest.mark.parametrize(
+        ("registry", "settings"),
+        [
+            ({}, {"origin_cache.redis_url": "redis://redis:6379/0"}),
+            ({"cache_purge_intervals": {"all-projects": 60}}, {}),
+        ],
+    )
+    def test_not_configured(self, registry, settings):
+        registry = pretend.stub(get=registry.get, settings=settings)
+        config = pretend.stub(registry=registry)
+
+        assert throttle.throttle_from_config(config) is None
+
+    def test_from_config(self, monkeypatch):
+        redis_conn = pretend.stub()
+        monkeypatch.setattr(
+            throttle.redis.StrictRedis, "from_url", lambda url: redis_conn
+        )
+        metrics = pretend.stub()
+        purge_task = pretend.stub(
+            apply_async=pretend.call_recorder(lambda *a, **kw: None)
+        )
+        intervals = {"all-projects": 60}
+        config = pretend.stub(
+            registry=pretend.stub(
+                get={"cache_purge_intervals": intervals}.get,
+                settings={"origin_cache.redis_url": "redis://redis:6379/0"},
+            ),
+            find_service_factory=lambda iface: (
+                {IMetricsService: lambda ctx, c: metrics}[iface]
+            ),
+            task=lambda f: purge_task,
+        )
+
+        purge_throttle = throttle.throttle_from_config(config)
+
+        assert purge_throttle.redis_conn is redis_conn
+        assert purge_throttle.intervals is intervals
+        assert purge_throttle._metrics is metrics
+
+        purge_throttle._scheduler("all-projects", 60)
+
+        assert purge_task.apply_async.calls == [
+            pretend.call(("all-projects",), countdown=60)
+        ]
+
+    def test_from_request(self, monkeypatch):
+        redis_conn = pretend.stub()
+        monkeypatch.setattr(
+            throttle.redis.StrictRedis, "from_url", lambda url: redis_conn
+        )
+        metrics = pretend.stub()
+        request = pretend.stub(
+            registry=pretend.stub(
+                get={"cache_purge_intervals": {"all-projects": 60}}.get,
+                settings={"origin_cache.redis_url": "redis://redis:6379/0"},
+            ),
+            find_service=pretend.call_recorder(lambda iface, context: metrics),
+        )
+
+        purge_throttle = throttle.throttle_from_request(request)
+
+        assert purge_throttle._metrics is metrics
+        assert request.find_service.calls == [
+            pretend.call(IMetricsService, context=None)
+        ]
+
+
+class TestPurgeThrottledKey:
+    @pytest.mark.parametrize("trailing", [True, False])
+    def test_purges_when_trailing(self, monkeypatch, trailing):
+        purge_throttle = pretend.stub(
+            trailing=pretend.call_recorder(lambda key: trailing)
+        )
+        monkeypatch.setattr(
+            throttle, "throttle_from_request", lambda request: purge_throttle
+        )
+        cacher = pretend.stub(purge=pretend.call_recorder(lambda keys: None))
+        request = pretend.stub(
+            find_service=lambda iface: {IOriginCache: cacher}[iface],
+            log=pretend.stub(info=pretend.call_recorder(lambda *a: None)),
+        )
+
+        throttle.purge_throttled_key(pretend.stub(), request, "all-projects")
+
+        assert purge_throttle.trailing.calls == [pretend.call("all-projects")]
+        assert cacher.purge.calls == (
+            [pretend.call(["all-projects"])] if trailing else []
+        )
+
+    def test_not_configured(self, monkeypatch):
+        monkeypatch.setattr(throttle, "throttle_from_request", lambda request: None)
+        request = pretend.stub()
+
+        throttle.purge_throttled_key(pretend.stub(), request, "all-projects")
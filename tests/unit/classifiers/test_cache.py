@@ -0,0 +1,210 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pretend
+import pytest
+import redis
+
+from warehouse.classifiers import cache
+from warehouse.classifiers.cache import ClassifierCache, ClassifierSet
+
+from ...common.db.classifiers import ClassifierFactory
+
+
+class TestClassifiersRedis:
+    def test_not_configured(self):
+        assert cache.classifiers_redis({}) is None
+
+    def test_configured(self, monkeypatch):
+        redis_conn = pretend.stub()
+        from_url = pretend.call_recorder(lambda url: redis_conn)
+        monkeypatch.setattr(redis.StrictRedis, "from_url", from_url)
+
+        settings = {"classifiers.redis_url": "redis://localhost:6379/0"}
+
+        assert cache.classifiers_redis(settings) is redis_conn
+        assert from_url.calls == [pretend.call("redis://localhost:6379/0")]
+
+
+class TestClassifierSet:
+    def test_indexes_classifiers(self):
+        classifiers = ClassifierSet(
+            [(1, "AA :: BB", False), (2, "CC :: DD", True)], version=b"3", loaded_at=7
+        )
+
+        assert classifiers.version == b"3"
+        assert classifiers.loaded_at == 7
+        assert classifiers.ids == {"AA :: BB": 1, "CC :: DD": 2}
+        assert classifiers.deprecated == {"CC :: DD"}
+        assert "AA :: BB" in classifiers
+        assert "EE :: FF" not in classifiers
+        assert list(classifiers) == [("AA :: BB", "AA :: BB"), ("CC :: DD", "CC :: DD")]
+        assert len(classifiers) == 2
+
+    def test_load(self, db_session):
+        classifier_a = ClassifierFactory(classifier="AA :: BB")
+        classifier_b = ClassifierFactory(classifier="CC :: DD", deprecated=True)
+
+        classifiers = ClassifierSet.load(db_session, version=b"1", loaded_at=0)
+
+        assert classifiers.version == b"1"
+        assert classifiers.ids == {
+            "AA :: BB": classifier_a.id,
+            "CC :: DD": classifier_b.id,
+        }
+        assert classifiers.deprecated == {"CC :: DD"}
+
+
+class TestClassifierCache:
+    @pytest.fixture
+    def loads(self, monkeypatch):
+        loads = []
+
+        def load(session, **kwargs):
+            loads.append(ClassifierSet([], **kwargs))
+            return loads[-1]
+
+        monkeypatch.setattr(ClassifierSet, "load", load)
+        return loads
+
+    def test_loads_once(self, loads):
+        classifier_cache = ClassifierCache(clock=lambda: 0)
+        session = pretend.stub()
+
+        first = classifier_cache.get(session)
+        second = classifier_cache.get(session)
+
+        assert first is second
+        assert loads == [first]
+        assert first.version is None
+
+    def test_reloads_on_new_version(self, loads):
+        versions = iter([b"1", b"1", b"2"])
+        redis_conn = pretend.stub(get=lambda key: next(versions))
+        classifier_cache = ClassifierCache(clock=lambda: 0)
+        session = pretend.stub()
+
+        first = classifier_cache.get(session, redis_conn)
+        second = classifier_cache.get(session, redis_conn)
+        third = classifier_cache.get(session, redis_conn)
+
+        assert first is second
+        assert third is not first
+        assert [c.version for c in loads] == [b"1", b"2"]
+
+    def test_reloads_when_too_old(self, loads):
+        now = [0]
+        classifier_cache = ClassifierCache(max_age=30, clock=lambda: now[0])
+        session = pretend.stub()
+
+        first = classifier_cache.get(session)
+        now[0] = 20
+        second = classifier_cache.get(session)
+        now[0] = 31
+        third = classifier_cache.get(session)
+
+        assert first is second
+        assert third is not first
+        assert [c.loaded_at for c in loads] == [0, 31]
+
+    def test_ignores_redis_errors(self, loads):
+        def get(key):
+            raise redis.exceptions.ConnectionError
+
+        classifier_cache = ClassifierCache(clock=lambda: 0)
+
+        classifiers = classifier_cache.get(pretend.stub(), pretend.stub(get=get))
+
+        assert classifiers.version is None
+
+    def test_invalidate(self, loads):
+        classifier_cache = ClassifierCache(clock=lambda: 0)
+        session = pretend.stub()
+
+        first = classifier_cache.get(session)
+        classifier_cache.invalidate()
+        second = classifier_cache.get(session)
+
+        assert first is not second
+        assert loads == [first, second]
+
+
+def test_get_classifiers(monkeypatch):
+    classifiers = pretend.stub()
+    redis_conn = pretend.stub()
+    classifier_cache = pretend.stub(
+        get=pretend.call_recorder(lambda session, redis_conn: classifiers)
+    )
+    monkeypatch.setattr(cache, "classifier_cache", classifier_cache)
+    monkeypatch.setattr(cache, "classifiers_redis", lambda settings: redis_conn)
+    request = pretend.stub(db=pretend.stub(), registry=pretend.stub(settings={}))
+
+    assert cache.get_classifiers(request) is classifiers
+    assert classifier_cache.get.calls == [pretend.call(request.db, redis_conn)]
+
+
+def test_classifiers_changed():
+    session = pretend.stub(info={})
+
+    cache.classifiers_changed(session)
+
+    assert session.info == {"warehouse.classifiers.changed": True}
+
+
+class TestExecuteClassifiersChanged:
+    @pytest.fixture
+    def classifier_cache(self, monkeypatch):
+        classifier_cache = pretend.stub(invalidate=pretend.call_recorder(lambda: None))
+        monkeypatch.setattr(cache, "classifier_cache", classifier_cache)
+        return classifier_cache
+
+    def test_bumps_version(self, monkeypatch, classifier_cache):
+        redis_conn = pretend.stub(incr=pretend.call_recorder(lambda key: 2))
+        monkeypatch.setattr(cache, "classifiers_redis", lambda settings: redis_conn)
+        config = pretend.stub(registry=pretend.stub(settings={}))
+        session = pretend.stub(info={"warehouse.classifiers.changed": True})
+
+        cache.execute_classifiers_changed(config, session)
+
+        assert session.info == {}
+        assert classifier_cache.invalidate.calls == [pretend.call()]
+        assert redis_conn.incr.calls == [pretend.call(cache.CLASSIFIERS_VERSION_KEY)]
+
+    def test_not_changed(self, classifier_cache):
+        cache.execute_classifiers_changed(pretend.stub(), pretend.stub(info={}))
+
+        assert classifier_cache.invalidate.calls == []
+
+    def test_not_configured(self, monkeypatch, classifier_cache):
+        monkeypatch.setattr(cache, "classifiers_redis", lambda settings: None)
+        config = pretend.stub(registry=pretend.stub(settings={}))
+        session = pretend.stub(info={"warehouse.classifiers.changed": True})
+
+        cache.execute_classifiers_changed(config, session)
+
+        assert classifier_cache.invalidate.calls == [pretend.call()]
+
+    def test_ignores_redis_errors(self, monkeypatch, classifier_cache):
+        @pretend.call_recorder
+        def incr(key):
+            raise redis.exceptions.ConnectionError
+
+        monkeypatch.setattr(
+            cache, "classifiers_redis", lambda settings: pretend.stub(incr=incr)
+        )
+        config = pretend.stub(registry=pretend.stub(settings={}))
+        session = pretend.stub(info={"warehouse.classifiers.changed": True})
+
+        cache.execute_classifiers_changed(config, session)
+
+        assert classifier_cache.invalidate.calls == [pretend.call()]
+        assert len(incr.calls) == 1
@@ -0,0 +1,59 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pretend
+import pytest
+
+from warehouse.cli import changelog
+from warehouse.cli.changelog import relay
+
+
+class TestCLIChangelog:
+    def test_relay_not_configured(self, cli, monkeypatch):
+        monkeypatch.setattr(changelog, "changelog_redis", lambda settings: None)
+        config = pretend.stub(registry=pretend.stub(settings={}))
+
+        result = cli.invoke(relay, obj=config)
+
+        assert result.exit_code == 1
+        assert "changelog.redis_url is not configured" in result.output
+
+    def test_relay_restarts(self, cli, monkeypatch):
+        class Stop(BaseException):
+            pass
+
+        redis_conn = pretend.stub()
+        engine = pretend.stub()
+        monkeypatch.setattr(changelog, "changelog_redis", lambda settings: redis_conn)
+        results = iter([ValueError("whoops"), Stop()])
+
+        @pretend.call_recorder
+        def relay_journal_notifications(engine, redis_conn):
+            raise next(results)
+
+        monkeypatch.setattr(
+            changelog, "relay_journal_notifications", relay_journal_notifications
+        )
+        sleep = pretend.call_recorder(lambda seconds: None)
+        monkeypatch.setattr(changelog.time, "sleep", sleep)
+        config = pretend.stub(
+            registry=pretend.stub(settings={}, __getitem__=lambda key: engine)
+        )
+
+        with pytest.raises(Stop):
+            cli.invoke(relay, obj=config, catch_exceptions=False)
+
+        assert relay_journal_notifications.calls == [
+            pretend.call(engine, redis_conn),
+            pretend.call(engine, redis_conn),
+        ]
+        assert sleep.calls == [pretend.call(changelog.RELAY_INTERVAL)]
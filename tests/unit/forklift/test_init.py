@@ -40,6 +40,11 @@ def test_includeme(forklift_domain, monkeypatch):
         pretend.call(
             "forklift.legacy.file_upload", "file_upload", domain=forklift_domain
         ),
+        pretend.call(
+            "forklift.legacy.file_upload_multiple",
+            "file_upload_multiple",
+            domain=forklift_domain,
+        ),
         pretend.call("forklift.legacy.submit", "submit", domain=forklift_domain),
         pretend.call(
             "forklift.legacy.submit_pkg_info", "submit_pkg_info", domain=forklift_domain
@@ -31,6 +31,8 @@ from wtforms.form import Form
 from wtforms.validators import ValidationError
 
 from warehouse.admin.squats import Squat
+from warehouse.classifiers import cache as classifiers_cache
+from warehouse.classifiers.cache import ClassifierCache, ClassifierSet
 from warehouse.classifiers.models import Classifier
 from warehouse.forklift import legacy
 from warehouse.packaging.interfaces import IFileStorage
@@ -63,6 +65,16 @@ def test_exc_with_message():
     assert exc.status == "400 My Test Message."
 
 
+@pytest.fixture(autouse=True)
+def classifier_cache(monkeypatch):
+    # Every test gets a cache of its own, so that none of them see the
+    # classifiers that were created by another.
+    cache = ClassifierCache()
+    monkeypatch.setattr(classifiers_cache, "classifier_cache", cache)
+    monkeypatch.setattr(classifiers_cache, "classifiers_redis", lambda s: None)
+    return cache
+
+
 class TestValidation:
     @pytest.mark.parametrize("version", ["1.0", "30a1", "1!1", "1.0-1"])
     def test_validates_valid_pep440_version(self, version):
@@ -299,23 +311,23 @@ class TestValidation:
         with pytest.raises(ValidationError):
             legacy._validate_description_content_type(form, field)
 
-    def test_validate_no_deprecated_classifiers_valid(self, db_request):
-        valid_classifier = ClassifierFactory(deprecated=False)
-        validator = legacy._no_deprecated_classifiers(db_request)
+    def test_validate_no_deprecated_classifiers_valid(self, pyramid_request):
+        classifiers = ClassifierSet([(1, "AA :: BB", False), (2, "CC :: DD", True)])
+        validator = legacy._no_deprecated_classifiers(pyramid_request, classifiers)
 
         form = pretend.stub()
-        field = pretend.stub(data=[valid_classifier.classifier])
+        field = pretend.stub(data=["AA :: BB"])
 
         validator(form, field)
 
-    def test_validate_no_deprecated_classifiers_invalid(self, db_request):
-        deprecated_classifier = ClassifierFactory(classifier="AA: BB", deprecated=True)
-        validator = legacy._no_deprecated_classifiers(db_request)
-        db_request.registry = pretend.stub(settings={"warehouse.domain": "host"})
-        db_request.route_url = pretend.call_recorder(lambda *a, **kw: "/url")
+    def test_validate_no_deprecated_classifiers_invalid(self, pyramid_request):
+        classifiers = ClassifierSet([(1, "AA :: BB", False), (2, "CC :: DD", True)])
+        validator = legacy._no_deprecated_classifiers(pyramid_request, classifiers)
+        pyramid_request.registry = pretend.stub(settings={"warehouse.domain": "host"})
+        pyramid_request.route_url = pretend.call_recorder(lambda *a, **kw: "/url")
 
         form = pretend.stub()
-        field = pretend.stub(data=[deprecated_classifier.classifier])
+        field = pretend.stub(data=["CC :: DD"])
 
         with pytest.raises(ValidationError):
             validator(form, field)
@@ -367,7 +379,34 @@ class TestListField:
         assert form.test.data == expected
 
 
-class TestMetadataForm:
+class TestClassifiersField:
+    @pytest.mark.parametrize("data", [[], ["AA :: BB"], ["AA :: BB", "CC :: DD"]])
+    def test_valid_classifiers(self, data):
+        class MyForm(Form):
+            classifiers = legacy.ClassifiersField()
+
+        form = MyForm(MultiDict([("classifiers", c) for c in data]))
+        form.classifiers.choices = ClassifierSet(
+            [(1, "AA :: BB", False), (2, "CC :: DD", False)]
+        )
+
+        assert form.validate()
+        assert form.classifiers.data == data
+
+    def test_invalid_classifier(self):
+        class MyForm(Form):
+            classifiers = legacy.ClassifiersField()
+
+        form = MyForm(MultiDict([("classifiers", "AA :: BB"), ("classifiers", "EE")]))
+        form.classifiers.choices = ClassifierSet([(1, "AA :: BB", False)])
+
+        assert not form.validate()
+        assert form.errors == {
+            "classifiers": ["'EE' is not a valid choice for this field"]
+        }
+
+
+class TestFileForm:
     @pytest.mark.parametrize(
         "data",
         [
@@ -385,17 +424,23 @@ class TestMetadataForm:
         ],
     )
     def test_full_validate_valid(self, data):
-        form = legacy.MetadataForm(MultiDict(data))
+        form = legacy.FileForm(MultiDict(data))
         form.full_validate()
 
     @pytest.mark.parametrize(
         "data", [{"filetype": "sdist", "pyversion": "3.4"}, {"filetype": "bdist_wheel"}]
     )
     def test_full_validate_invalid(self, data):
-        form = legacy.MetadataForm(MultiDict(data))
+        form = legacy.FileForm(MultiDict(data))
         with pytest.raises(ValidationError):
             form.full_validate()
 
+
+class TestMetadataForm:
+    def test_has_no_file_fields(self):
+        form = legacy.MetadataForm(MultiDict({"filetype": "sdist"}))
+        assert all(field not in form for field in legacy._file_form_fields)
+
     def test_requires_python(self):
         form = legacy.MetadataForm(MultiDict({"requires_python": ">= 3.5"}))
         form.requires_python.validate(form)
@@ -403,14 +448,14 @@ class TestMetadataForm:
 
 class TestFileValidation:
     def test_defaults_to_true(self):
-        assert legacy._is_valid_dist_file("", "")
+        assert legacy._inspect_dist_file("", "").valid
 
     @pytest.mark.parametrize(
         ("filename", "filetype"),
         [("test.exe", "bdist_msi"), ("test.msi", "bdist_wininst")],
     )
     def test_bails_with_invalid_package_type(self, filename, filetype):
-        assert not legacy._is_valid_dist_file(filename, filetype)
+        assert not legacy._inspect_dist_file(filename, filetype).valid
 
     @pytest.mark.parametrize(
         ("filename", "filetype"),
@@ -427,7 +472,7 @@ class TestFileValidation:
         with open(f, "wb") as fp:
             fp.write(b"this isn't a valid zip file")
 
-        assert not legacy._is_valid_dist_file(f, filetype)
+        assert not legacy._inspect_dist_file(f, filetype).valid
 
     def test_wininst_unsafe_filename(self, tmpdir):
         f = str(tmpdir.join("test.exe"))
@@ -435,7 +480,7 @@ class TestFileValidation:
         with zipfile.ZipFile(f, "w") as zfp:
             zfp.writestr("something/bar.py", b"the test file")
 
-        assert not legacy._is_valid_dist_file(f, "bdist_wininst")
+        assert not legacy._inspect_dist_file(f, "bdist_wininst").valid
 
     def test_wininst_safe_filename(self, tmpdir):
         f = str(tmpdir.join("test.exe"))
@@ -443,7 +488,7 @@ class TestFileValidation:
         with zipfile.ZipFile(f, "w") as zfp:
             zfp.writestr("purelib/bar.py", b"the test file")
 
-        assert legacy._is_valid_dist_file(f, "bdist_wininst")
+        assert legacy._inspect_dist_file(f, "bdist_wininst").valid
 
     def test_msi_invalid_header(self, tmpdir):
         f = str(tmpdir.join("test.msi"))
@@ -451,7 +496,7 @@ class TestFileValidation:
         with open(f, "wb") as fp:
             fp.write(b"this isn't the correct header for an msi")
 
-        assert not legacy._is_valid_dist_file(f, "bdist_msi")
+        assert not legacy._inspect_dist_file(f, "bdist_msi").valid
 
     def test_msi_valid_header(self, tmpdir):
         f = str(tmpdir.join("test.msi"))
@@ -459,7 +504,7 @@ class TestFileValidation:
         with open(f, "wb") as fp:
             fp.write(b"\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1")
 
-        assert legacy._is_valid_dist_file(f, "bdist_msi")
+        assert legacy._inspect_dist_file(f, "bdist_msi").valid
 
     def test_zip_no_pkg_info(self, tmpdir):
         f = str(tmpdir.join("test.zip"))
@@ -467,7 +512,7 @@ class TestFileValidation:
         with zipfile.ZipFile(f, "w") as zfp:
             zfp.writestr("something.txt", b"Just a placeholder file")
 
-        assert not legacy._is_valid_dist_file(f, "sdist")
+        assert not legacy._inspect_dist_file(f, "sdist").valid
 
     def test_zip_has_pkg_info(self, tmpdir):
         f = str(tmpdir.join("test.zip"))
@@ -476,7 +521,7 @@ class TestFileValidation:
             zfp.writestr("something.txt", b"Just a placeholder file")
             zfp.writestr("PKG-INFO", b"this is the package info")
 
-        assert legacy._is_valid_dist_file(f, "sdist")
+        assert legacy._inspect_dist_file(f, "sdist").valid
 
     def test_zipfile_supported_compression(self, tmpdir):
         f = str(tmpdir.join("test.zip"))
@@ -486,7 +531,7 @@ class TestFileValidation:
             zfp.writestr("1.txt", b"1", zipfile.ZIP_STORED)
             zfp.writestr("2.txt", b"2", zipfile.ZIP_DEFLATED)
 
-        assert legacy._is_valid_dist_file(f, "")
+        assert legacy._inspect_dist_file(f, "").valid
 
     @pytest.mark.parametrize("method", [zipfile.ZIP_BZIP2, zipfile.ZIP_LZMA])
     def test_zipfile_unsupported_compression(self, tmpdir, method):
@@ -497,7 +542,7 @@ class TestFileValidation:
             zfp.writestr("2.txt", b"2", zipfile.ZIP_DEFLATED)
             zfp.writestr("3.txt", b"3", method)
 
-        assert not legacy._is_valid_dist_file(f, "")
+        assert not legacy._inspect_dist_file(f, "").valid
 
     def test_egg_no_pkg_info(self, tmpdir):
         f = str(tmpdir.join("test.egg"))
@@ -505,7 +550,7 @@ class TestFileValidation:
         with zipfile.ZipFile(f, "w") as zfp:
             zfp.writestr("something.txt", b"Just a placeholder file")
 
-        assert not legacy._is_valid_dist_file(f, "bdist_egg")
+        assert not legacy._inspect_dist_file(f, "bdist_egg").valid
 
     def test_egg_has_pkg_info(self, tmpdir):
         f = str(tmpdir.join("test.egg"))
@@ -514,7 +559,7 @@ class TestFileValidation:
             zfp.writestr("something.txt", b"Just a placeholder file")
             zfp.writestr("PKG-INFO", b"this is the package info")
 
-        assert legacy._is_valid_dist_file(f, "bdist_egg")
+        assert legacy._inspect_dist_file(f, "bdist_egg").valid
 
     def test_wheel_no_wheel_file(self, tmpdir):
         f = str(tmpdir.join("test.whl"))
@@ -522,7 +567,7 @@ class TestFileValidation:
         with zipfile.ZipFile(f, "w") as zfp:
             zfp.writestr("something.txt", b"Just a placeholder file")
 
-        assert not legacy._is_valid_dist_file(f, "bdist_wheel")
+        assert not legacy._inspect_dist_file(f, "bdist_wheel").valid
 
     def test_wheel_has_wheel_file(self, tmpdir):
         f = str(tmpdir.join("test.whl"))
@@ -531,10 +576,215 @@ class TestFileValidation:
             zfp.writestr("something.txt", b"Just a placeholder file")
             zfp.writestr("WHEEL", b"this is the package info")
 
-        assert legacy._is_valid_dist_file(f, "bdist_wheel")
+        assert legacy._inspect_dist_file(f, "bdist_wheel").valid
+
+    def test_wheel_extracts_metadata(self, tmpdir):
+        f = str(tmpdir.join("foo-1.0-py3-none-any.whl"))
+
+        with zipfile.ZipFile(f, "w") as zfp:
+            zfp.writestr("foo/__init__.py", b"")
+            zfp.writestr("foo-1.0.dist-info/WHEEL", b"Wheel-Version: 1.0")
+            zfp.writestr(
+                "foo-1.0.dist-info/METADATA",
+                b"Metadata-Version: 2.1\nName: foo\nVersion: 1.0\n",
+                zipfile.ZIP_DEFLATED,
+            )
+            zfp.writestr("bar-1.0.dist-info/METADATA", b"Name: bar")
+
+        assert legacy._inspect_dist_file(f, "bdist_wheel") == legacy._DistFile(
+            valid=True, metadata=b"Metadata-Version: 2.1\nName: foo\nVersion: 1.0\n"
+        )
+
+    def test_wheel_without_metadata(self, tmpdir):
+        f = str(tmpdir.join("foo-1.0-py3-none-any.whl"))
+
+        with zipfile.ZipFile(f, "w") as zfp:
+            zfp.writestr("foo-1.0.dist-info/WHEEL", b"Wheel-Version: 1.0")
+
+        assert legacy._inspect_dist_file(f, "bdist_wheel") == legacy._DistFile(
+            valid=True, metadata=None
+        )
+
+    def test_wheel_metadata_too_large(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(legacy, "MAX_WHEEL_METADATA_SIZE", 5)
+        f = str(tmpdir.join("foo-1.0-py3-none-any.whl"))
+
+        with zipfile.ZipFile(f, "w") as zfp:
+            zfp.writestr("foo-1.0.dist-info/WHEEL", b"Wheel-Version: 1.0")
+            zfp.writestr("foo-1.0.dist-info/METADATA", b"Name: foo")
+
+        assert legacy._inspect_dist_file(f, "bdist_wheel") == legacy._DistFile(
+            valid=True, metadata=None
+        )
+
+    def test_wheel_corrupt_metadata(self, tmpdir):
+        f = str(tmpdir.join("foo-1.0-py3-none-any.whl"))
+
+        with zipfile.ZipFile(f, "w") as zfp:
+            zfp.writestr("foo-1.0.dist-info/WHEEL", b"Wheel-Version: 1.0")
+            zfp.writestr("foo-1.0.dist-info/METADATA", b"Name: foo")
+
+        with open(f, "rb") as fp:
+            data = fp.read()
+        with open(f, "wb") as fp:
+            fp.write(data.replace(b"Name: foo", b"Name: bar"))
+
+        assert not legacy._inspect_dist_file(f, "bdist_wheel").valid
+
+    def test_non_zip_extension_unsupported_compression(self, tmpdir):
+        f = str(tmpdir.join("test.tar.gz"))
+
+        with zipfile.ZipFile(f, "w") as zfp:
+            zfp.writestr("1.txt", b"1", zipfile.ZIP_BZIP2)
+
+        assert not legacy._inspect_dist_file(f, "sdist").valid
+
+    def test_non_zip_extension_not_a_zipfile(self, tmpdir):
+        f = str(tmpdir.join("test.tar.gz"))
+
+        with open(f, "wb") as fp:
+            fp.write(b"this isn't a zip file")
+
+        assert legacy._inspect_dist_file(f, "sdist") == legacy._DistFile(
+            valid=True, metadata=None
+        )
+
+
+class TestFileHasher:
+    def test_hashes(self):
+        chunks = [b"a" * 4096, b"b" * 10, b"", b"c" * 1024 * 1024]
+        hasher = legacy._FileHasher({"md5": hashlib.md5(), "sha256": hashlib.sha256()})
+
+        for chunk in chunks:
+            hasher.update(chunk)
+
+        data = b"".join(chunks)
+        assert hasher.hexdigests() == {
+            "md5": hashlib.md5(data).hexdigest(),
+            "sha256": hashlib.sha256(data).hexdigest(),
+        }
+
+    def test_waits_for_previous_chunk(self):
+        events = []
+
+        class Future:
+            def __init__(self, fn, chunk):
+                self.fn, self.chunk = fn, chunk
+
+            def result(self):
+                events.append(("result", self.chunk))
+                self.fn(self.chunk)
+
+        executor = pretend.stub(
+            submit=lambda fn, chunk: events.append(("submit", chunk))
+            or Future(fn, chunk)
+        )
+        md5 = hashlib.md5()
+        hasher = legacy._FileHasher({"md5": md5}, executor=executor)
+
+        hasher.update(b"a")
+        hasher.update(b"b")
 
+        assert events == [("submit", b"a"), ("result", b"a"), ("submit", b"b")]
+        assert hasher.hexdigests() == {"md5": hashlib.md5(b"ab").hexdigest()}
 
-class TestIsDuplicateFile:
+    def test_propagates_errors(self):
+        class Hasher:
+            def update(self, chunk):
+                raise ValueError("whoops")
+
+        hasher = legacy._FileHasher({"broken": Hasher()})
+        hasher.update(b"a")
+
+        with pytest.raises(ValueError):
+            hasher.hexdigests()
+
+
+class TestMakeRoomForRelease:
+    @pytest.fixture
+    def releases(self):
+        project = ProjectFactory.create()
+        return {
+            version: ReleaseFactory.create(
+                project=project, version=version, _pypi_ordering=i
+            )
+            for i, version in enumerate(["1.0", "2.0", "3.0"])
+        }
+
+    @pytest.mark.parametrize(
+        ("version", "expected_position", "expected_orderings"),
+        [
+            ("0.1", 0, {"1.0": 1, "2.0": 2, "3.0": 3}),
+            ("2.5", 2, {"1.0": 0, "2.0": 1, "3.0": 3}),
+            ("2.0.0", 2, {"1.0": 0, "2.0": 1, "3.0": 3}),
+            ("4.0", 3, {"1.0": 0, "2.0": 1, "3.0": 2}),
+        ],
+    )
+    def test_makes_room(
+        self, db_request, releases, version, expected_position, expected_orderings
+    ):
+        other = ReleaseFactory.create(version="2.0", _pypi_ordering=0)
+        project = releases["1.0"].project
+
+        position = legacy._make_room_for_release(db_request.db, project, version)
+
+        assert position == expected_position
+        for release in releases.values():
+            db_request.db.refresh(release)
+        assert {
+            version: release._pypi_ordering for version, release in releases.items()
+        } == expected_orderings
+        db_request.db.refresh(other)
+        assert other._pypi_ordering == 0
+
+    def test_first_release(self, db_request):
+        project = ProjectFactory.create()
+
+        assert legacy._make_room_for_release(db_request.db, project, "1.0") == 0
+
+
+class TestFindSquattees:
+    def test_finds_long_names_by_trigrams(self, db_request):
+        toolbelt = ProjectFactory.create(name="requests-toolbelt")
+        toolbelts = ProjectFactory.create(name="Requests-Toolbelts")
+        ProjectFactory.create(name="requests")
+        ProjectFactory.create(name="requests-oauthlib")
+
+        squattees = legacy._find_squattees(db_request.db, "requests-toolbet")
+
+        assert set(squattees) == {toolbelt, toolbelts}
+
+    @pytest.mark.parametrize(
+        ("name", "squattee"),
+        [
+            # Transpositions
+            ("djnago", "django"),
+            ("sqlalchmey", "SQLAlchemy"),
+            ("djnago-filter", "django-filter"),
+            # Double substitutions
+            ("reqxestz", "requests"),
+            ("requosts-toolbalt", "requests-toolbelt"),
+        ],
+    )
+    def test_finds_names_two_edits_away(self, db_request, name, squattee):
+        squattee = ProjectFactory.create(name=squattee)
+        ProjectFactory.create(name="flask")
+
+        assert legacy._find_squattees(db_request.db, name) == [squattee]
+
+    def test_finds_short_names_by_length(self, db_request):
+        ab = ProjectFactory.create(name="ab")
+        cd = ProjectFactory.create(name="cd")
+        abcd = ProjectFactory.create(name="abcd")
+        ProjectFactory.create(name="abcde")
+        ProjectFactory.create(name="xyzzy")
+
+        squattees = legacy._find_squattees(db_request.db, "AB")
+
+        assert set(squattees) == {ab, cd, abcd}
+
+
+class TestFileConflicts:
     def test_is_duplicate_true(self, pyramid_config, db_request):
         pyramid_config.testing_securitypolicy(userid=1)
 
@@ -566,7 +816,9 @@ class TestIsDuplicateFile:
             )
         )
 
-        assert legacy._is_duplicate_file(db_request.db, filename, hashes)
+        assert legacy._file_conflicts(
+            db_request.db, release, filename, hashes
+        ).duplicate
 
     def test_is_duplicate_none(self, pyramid_config, db_request):
         pyramid_config.testing_securitypolicy(userid=1)
@@ -603,7 +855,9 @@ class TestIsDuplicateFile:
         hashes["blake2_256"] = "another blake2 digest"
 
         assert (
-            legacy._is_duplicate_file(db_request.db, requested_file_name, hashes)
+            legacy._file_conflicts(
+                db_request.db, release, requested_file_name, hashes
+            ).duplicate
             is None
         )
 
@@ -640,7 +894,9 @@ class TestIsDuplicateFile:
         )
 
         assert (
-            legacy._is_duplicate_file(db_request.db, requested_file_name, hashes)
+            legacy._file_conflicts(
+                db_request.db, release, requested_file_name, hashes
+            ).duplicate
             is False
         )
 
@@ -678,14 +934,57 @@ class TestIsDuplicateFile:
             )
         )
 
-        assert legacy._is_duplicate_file(db_request.db, filename, wrong_hashes) is False
+        assert (
+            legacy._file_conflicts(
+                db_request.db, release, filename, wrong_hashes
+            ).duplicate
+            is False
+        )
+
+    def test_no_conflicts(self, db_request, query_recorder):
+        release = ReleaseFactory.create()
+        hashes = {"sha256": "sha256", "md5": "md5", "blake2_256": "blake2_256"}
+
+        with query_recorder:
+            conflicts = legacy._file_conflicts(
+                db_request.db, release, "foo-1.0.tar.gz", hashes
+            )
+
+        assert conflicts == legacy._FileConflicts(
+            duplicate=None, filename_used=False, release_has_sdist=False
+        )
+        assert len(query_recorder.queries) == 1
+
+    def test_filename_used(self, db_request):
+        release = ReleaseFactory.create()
+        db_request.db.add(Filename(filename="foo-1.0.tar.gz"))
+        hashes = {"sha256": "sha256", "md5": "md5", "blake2_256": "blake2_256"}
+
+        conflicts = legacy._file_conflicts(
+            db_request.db, release, "foo-1.0.tar.gz", hashes
+        )
+
+        assert conflicts.filename_used
+
+    @pytest.mark.parametrize("packagetype", ["sdist", "bdist_wheel"])
+    def test_release_has_sdist(self, db_request, packagetype):
+        release = ReleaseFactory.create()
+        FileFactory.create(release=release, packagetype=packagetype)
+        FileFactory.create(packagetype="sdist")
+        hashes = {"sha256": "sha256", "md5": "md5", "blake2_256": "blake2_256"}
+
+        conflicts = legacy._file_conflicts(
+            db_request.db, release, "foo-1.0.tar.gz", hashes
+        )
+
+        assert conflicts.release_has_sdist == (packagetype == "sdist")
 
 
 class TestFileUpload:
     @pytest.mark.parametrize("version", ["2", "3", "-1", "0", "dog", "cat"])
     def test_fails_invalid_version(self, pyramid_config, pyramid_request, version):
         pyramid_config.testing_securitypolicy(userid=1)
-        pyramid_request.POST["protocol_version"] = version
+        pyramid_request.POST = MultiDict({"protocol_version": version})
         pyramid_request.flags = pretend.stub(enabled=lambda *a: False)
 
         pyramid_request.user = pretend.stub(primary_email=pretend.stub(verified=True))
@@ -1131,6 +1430,34 @@ class TestFileUpload:
 
         assert "name" not in db_request.POST
 
+    def test_upload_cleans_unknown_values_individually(
+        self, pyramid_config, db_request
+    ):
+        pyramid_config.testing_securitypolicy(userid=1)
+        user = UserFactory.create()
+        EmailFactory.create(user=user)
+        db_request.user = user
+        db_request.POST = MultiDict(
+            [
+                ("metadata_version", "1.2"),
+                ("name", "UNKNOWN"),
+                ("version", "1.0"),
+                ("filetype", "sdist"),
+                ("md5_digest", "a fake md5 digest"),
+                ("classifiers", "Environment :: Other Environment"),
+                ("classifiers", "UNKNOWN"),
+                ("classifiers", "Framework :: Django\x00"),
+            ]
+        )
+
+        with pytest.raises(HTTPBadRequest):
+            legacy.file_upload(db_request)
+
+        assert db_request.POST.getall("classifiers") == [
+            "Environment :: Other Environment",
+            "Framework :: Django\\x00",
+        ]
+
     def test_upload_escapes_nul_characters(self, pyramid_config, db_request):
         pyramid_config.testing_securitypolicy(userid=1)
         user = UserFactory.create()
@@ -1246,7 +1573,7 @@ class TestFileUpload:
             assert isinstance(db_request.POST["gpg_signature"], FieldStorage)
 
         @pretend.call_recorder
-        def storage_service_store(path, file_path, *, meta):
+        def storage_service_stage(path, file_path, *, meta):
             if file_path.endswith(".asc"):
                 expected = (
                     b"-----BEGIN PGP SIGNATURE-----\n" b" This is a Fake Signature"
@@ -1257,7 +1584,7 @@ class TestFileUpload:
             with open(file_path, "rb") as fp:
                 assert fp.read() == expected
 
-        storage_service = pretend.stub(store=storage_service_store)
+        storage_service = pretend.stub(stage=storage_service_stage)
         db_request.find_service = pretend.call_recorder(
             lambda svc, name=None: storage_service
         )
@@ -1266,8 +1593,8 @@ class TestFileUpload:
 
         assert resp.status_code == 200
         assert db_request.find_service.calls == [pretend.call(IFileStorage)]
-        assert len(storage_service.store.calls) == 2 if has_signature else 1
-        assert storage_service.store.calls[0] == pretend.call(
+        assert len(storage_service.stage.calls) == 2 if has_signature else 1
+        assert storage_service.stage.calls[0] == pretend.call(
             "/".join(
                 [
                     "4e",
@@ -1286,7 +1613,7 @@ class TestFileUpload:
         )
 
         if has_signature:
-            assert storage_service.store.calls[1] == pretend.call(
+            assert storage_service.stage.calls[1] == pretend.call(
                 "/".join(
                     [
                         "4e",
@@ -1316,6 +1643,12 @@ class TestFileUpload:
 
         assert uploaded_file.uploaded_via == "warehouse-tests/6.6.6"
 
+        # Ensure that the staged files will be promoted once we commit.
+        staged = [
+            path for _, path in db_request.db.info["warehouse.packaging.staged_files"]
+        ]
+        assert staged == [call.args[0] for call in storage_service.stage.calls]
+
         # Ensure that a Filename object has been created.
         db_request.db.query(Filename).filter(Filename.filename == filename).one()
 
@@ -1496,7 +1829,7 @@ class TestFileUpload:
         assert resp.status_code == 400
         assert resp.status == "400 Only one sdist may be uploaded per release."
 
-    @pytest.mark.parametrize("sig", [b"lol nope"])
+    @pytest.mark.parametrize("sig", [b"lol nope", b"-----BEGIN PGP"])
     def test_upload_fails_with_invalid_signature(self, pyramid_config, db_request, sig):
         pyramid_config.testing_securitypolicy(userid=1)
 
@@ -2213,22 +2546,24 @@ class TestFileUpload:
         )
 
         @pretend.call_recorder
-        def storage_service_store(path, file_path, *, meta):
+        def storage_service_stage(path, file_path, *, meta):
             with open(file_path, "rb") as fp:
                 assert fp.read() == b"A fake file."
 
-        storage_service = pretend.stub(store=storage_service_store)
+        storage_service = pretend.stub(stage=storage_service_stage)
         db_request.find_service = pretend.call_recorder(
             lambda svc, name=None: storage_service
         )
 
-        monkeypatch.setattr(legacy, "_is_valid_dist_file", lambda *a, **kw: True)
+        monkeypatch.setattr(
+            legacy, "_inspect_dist_file", lambda *a, **kw: legacy._DistFile(True, None)
+        )
 
         resp = legacy.file_upload(db_request)
 
         assert resp.status_code == 200
         assert db_request.find_service.calls == [pretend.call(IFileStorage)]
-        assert storage_service.store.calls == [
+        assert storage_service.stage.calls == [
             pretend.call(
                 "/".join(
                     [
@@ -2279,6 +2614,74 @@ class TestFileUpload:
             )
         ]
 
+    def test_upload_stores_wheel_metadata(
+        self, tmpdir, monkeypatch, pyramid_config, db_request
+    ):
+        monkeypatch.setattr(tempfile, "tempdir", str(tmpdir))
+
+        pyramid_config.testing_securitypolicy(userid=1)
+
+        user = UserFactory.create()
+        EmailFactory.create(user=user)
+        project = ProjectFactory.create()
+        release = ReleaseFactory.create(project=project, version="1.0")
+        RoleFactory.create(user=user, project=project)
+
+        filename = "{}-{}-cp34-none-any.whl".format(project.name, release.version)
+        metadata = b"Metadata-Version: 2.1\nName: foo\n"
+
+        db_request.user = user
+        db_request.remote_addr = "10.10.10.30"
+        db_request.user_agent = "warehouse-tests/6.6.6"
+        db_request.POST = MultiDict(
+            {
+                "metadata_version": "1.2",
+                "name": project.name,
+                "version": release.version,
+                "filetype": "bdist_wheel",
+                "pyversion": "cp34",
+                "md5_digest": "335c476dc930b959dda9ec82bd65ef19",
+                "content": pretend.stub(
+                    filename=filename,
+                    file=io.BytesIO(b"A fake file."),
+                    type="application/tar",
+                ),
+            }
+        )
+
+        stored = {}
+
+        @pretend.call_recorder
+        def storage_service_stage(path, file_path, *, meta):
+            with open(file_path, "rb") as fp:
+                stored[path] = fp.read()
+
+        storage_service = pretend.stub(stage=storage_service_stage)
+        db_request.find_service = lambda svc, name=None: storage_service
+
+        monkeypatch.setattr(
+            legacy,
+            "_inspect_dist_file",
+            lambda *a, **kw: legacy._DistFile(True, metadata),
+        )
+
+        resp = legacy.file_upload(db_request)
+
+        assert resp.status_code == 200
+
+        file_ = (
+            db_request.db.query(File)
+            .filter((File.release == release) & (File.filename == filename))
+            .one()
+        )
+        assert file_.metadata_file_sha256_digest == (
+            hashlib.sha256(metadata).hexdigest()
+        )
+        assert stored == {file_.path: b"A fake file.", file_.metadata_path: metadata}
+        assert [
+            path for _, path in db_request.db.info["warehouse.packaging.staged_files"]
+        ] == [file_.path, file_.metadata_path]
+
     def test_upload_succeeds_with_wheel_after_sdist(
         self, tmpdir, monkeypatch, pyramid_config, db_request
     ):
@@ -2319,22 +2722,24 @@ class TestFileUpload:
         )
 
         @pretend.call_recorder
-        def storage_service_store(path, file_path, *, meta):
+        def storage_service_stage(path, file_path, *, meta):
             with open(file_path, "rb") as fp:
                 assert fp.read() == b"A fake file."
 
-        storage_service = pretend.stub(store=storage_service_store)
+        storage_service = pretend.stub(stage=storage_service_stage)
         db_request.find_service = pretend.call_recorder(
             lambda svc, name=None: storage_service
         )
 
-        monkeypatch.setattr(legacy, "_is_valid_dist_file", lambda *a, **kw: True)
+        monkeypatch.setattr(
+            legacy, "_inspect_dist_file", lambda *a, **kw: legacy._DistFile(True, None)
+        )
 
         resp = legacy.file_upload(db_request)
 
         assert resp.status_code == 200
         assert db_request.find_service.calls == [pretend.call(IFileStorage)]
-        assert storage_service.store.calls == [
+        assert storage_service.stage.calls == [
             pretend.call(
                 "/".join(
                     [
@@ -2419,14 +2824,16 @@ class TestFileUpload:
             }
         )
 
-        def storage_service_store(path, file_path, *, meta):
+        def storage_service_stage(path, file_path, *, meta):
             with open(file_path, "rb") as fp:
                 assert fp.read() == b"A fake file."
 
-        storage_service = pretend.stub(store=storage_service_store)
+        storage_service = pretend.stub(stage=storage_service_stage)
         db_request.find_service = lambda svc, name=None: storage_service
 
-        monkeypatch.setattr(legacy, "_is_valid_dist_file", lambda *a, **kw: True)
+        monkeypatch.setattr(
+            legacy, "_inspect_dist_file", lambda *a, **kw: legacy._DistFile(True, None)
+        )
 
         resp = legacy.file_upload(db_request)
 
@@ -2466,14 +2873,16 @@ class TestFileUpload:
             }
         )
 
-        def storage_service_store(path, file_path, *, meta):
+        def storage_service_stage(path, file_path, *, meta):
             with open(file_path, "rb") as fp:
                 assert fp.read() == b"A fake file."
 
-        storage_service = pretend.stub(store=storage_service_store)
+        storage_service = pretend.stub(stage=storage_service_stage)
         db_request.find_service = lambda svc, name=None: storage_service
 
-        monkeypatch.setattr(legacy, "_is_valid_dist_file", lambda *a, **kw: True)
+        monkeypatch.setattr(
+            legacy, "_inspect_dist_file", lambda *a, **kw: legacy._DistFile(True, None)
+        )
 
         resp = legacy.file_upload(db_request)
 
@@ -2510,7 +2919,9 @@ class TestFileUpload:
             }
         )
 
-        monkeypatch.setattr(legacy, "_is_valid_dist_file", lambda *a, **kw: True)
+        monkeypatch.setattr(
+            legacy, "_inspect_dist_file", lambda *a, **kw: legacy._DistFile(True, None)
+        )
 
         with pytest.raises(HTTPBadRequest) as excinfo:
             legacy.file_upload(db_request)
@@ -2565,7 +2976,7 @@ class TestFileUpload:
             ]
         )
 
-        storage_service = pretend.stub(store=lambda path, filepath, meta: None)
+        storage_service = pretend.stub(stage=lambda path, filepath, meta: None)
         db_request.find_service = lambda svc, name=None: storage_service
 
         resp = legacy.file_upload(db_request)
@@ -2652,7 +3063,7 @@ class TestFileUpload:
             }
         )
 
-        storage_service = pretend.stub(store=lambda path, filepath, meta: None)
+        storage_service = pretend.stub(stage=lambda path, filepath, meta: None)
         db_request.find_service = lambda svc, name=None: storage_service
 
         resp = legacy.file_upload(db_request)
@@ -2698,7 +3109,7 @@ class TestFileUpload:
             }
         )
 
-        storage_service = pretend.stub(store=lambda path, filepath, meta: None)
+        storage_service = pretend.stub(stage=lambda path, filepath, meta: None)
         db_request.find_service = lambda svc, name=None: storage_service
 
         legacy.file_upload(db_request)
@@ -2730,7 +3141,7 @@ class TestFileUpload:
             }
         )
 
-        storage_service = pretend.stub(store=lambda path, filepath, meta: None)
+        storage_service = pretend.stub(stage=lambda path, filepath, meta: None)
         db_request.find_service = lambda svc, name=None: storage_service
         db_request.remote_addr = "10.10.10.10"
         db_request.user_agent = "warehouse-tests/6.6.6"
@@ -2821,7 +3232,7 @@ class TestFileUpload:
             }
         )
 
-        storage_service = pretend.stub(store=lambda path, filepath, meta: None)
+        storage_service = pretend.stub(stage=lambda path, filepath, meta: None)
         db_request.find_service = lambda svc, name=None: storage_service
         db_request.remote_addr = "10.10.10.10"
         db_request.user_agent = "warehouse-tests/6.6.6"
@@ -2879,7 +3290,7 @@ class TestFileUpload:
             }
         )
 
-        storage_service = pretend.stub(store=lambda path, filepath, meta: None)
+        storage_service = pretend.stub(stage=lambda path, filepath, meta: None)
         db_request.find_service = lambda svc, name=None: storage_service
         db_request.remote_addr = "10.10.10.10"
         db_request.user_agent = "warehouse-tests/6.6.6"
@@ -2930,7 +3341,7 @@ class TestFileUpload:
             }
         )
 
-        storage_service = pretend.stub(store=lambda path, filepath, meta: None)
+        storage_service = pretend.stub(stage=lambda path, filepath, meta: None)
         db_request.find_service = lambda svc, name=None: storage_service
         db_request.remote_addr = "10.10.10.10"
         db_request.user_agent = "warehouse-tests/6.6.6"
@@ -2965,6 +3376,510 @@ class TestFileUpload:
         )
 
 
+class TestFileUploadMultiple:
+    @staticmethod
+    def _content(filename, data=b"A fake file."):
+        content = FieldStorage()
+        content.filename = filename
+        content.file = io.BytesIO(data)
+        content.type = "application/tar"
+        return content
+
+    def test_fails_in_read_only_mode(self, pyramid_request):
+        pyramid_request.flags = pretend.stub(enabled=lambda *a: True)
+
+        with pytest.raises(HTTPForbidden) as excinfo:
+            legacy.file_upload_multiple(pyramid_request)
+
+        resp = excinfo.value
+
+        assert resp.status_code == 403
+        assert resp.status == ("403 Read-only mode: Uploads are temporarily disabled")
+
+    def test_fails_without_user(self, pyramid_config, pyramid_request):
+        pyramid_request.flags = pretend.stub(enabled=lambda *a: False)
+        pyramid_config.testing_securitypolicy(userid=None)
+
+        with pytest.raises(HTTPForbidden) as excinfo:
+            legacy.file_upload_multiple(pyramid_request)
+
+        resp = excinfo.value
+
+        assert resp.status_code == 403
+        assert resp.status == (
+            "403 Invalid or non-existent authentication information."
+        )
+
+    def test_upload_fails_without_file(self, pyramid_config, db_request):
+        pyramid_config.testing_securitypolicy(userid=1)
+        user = UserFactory.create()
+        EmailFactory.create(user=user)
+        db_request.user = user
+        db_request.POST = MultiDict(
+            {
+                "metadata_version": "1.2",
+                "name": "example",
+                "version": "1.0",
+                "filetype": "sdist",
+                "md5_digest": "a fake md5 digest",
+            }
+        )
+
+        with pytest.raises(HTTPBadRequest) as excinfo:
+            legacy.file_upload_multiple(db_request)
+
+        resp = excinfo.value
+
+        assert resp.status_code == 400
+        assert resp.status == "400 Upload payload does not have a file."
+
+    def test_upload_fails_with_too_many_files(
+        self, monkeypatch, pyramid_config, db_request
+    ):
+        monkeypatch.setattr(legacy, "MAX_FILES_PER_UPLOAD", 1)
+
+        pyramid_config.testing_securitypolicy(userid=1)
+        user = UserFactory.create()
+        EmailFactory.create(user=user)
+        db_request.user = user
+        db_request.POST = MultiDict(
+            [
+                ("metadata_version", "1.2"),
+                ("name", "example"),
+                ("version", "1.0"),
+                ("filetype", "sdist"),
+                ("filetype", "bdist_wheel"),
+                ("pyversion", "source"),
+                ("pyversion", "py3"),
+                ("md5_digest", "a fake md5 digest"),
+                ("md5_digest", "a fake md5 digest"),
+                ("content", self._content("example-1.0.tar.gz")),
+                ("content", self._content("example-1.0-py3-none-any.whl")),
+            ]
+        )
+
+        with pytest.raises(HTTPBadRequest) as excinfo:
+            legacy.file_upload_multiple(db_request)
+
+        resp = excinfo.value
+
+        assert resp.status_code == 400
+        assert resp.status == "400 Upload at most 1 files at once."
+
+    def test_upload_fails_with_same_file_twice(self, pyramid_config, db_request):
+        pyramid_config.testing_securitypolicy(userid=1)
+        user = UserFactory.create()
+        EmailFactory.create(user=user)
+        db_request.user = user
+        db_request.POST = MultiDict(
+            [
+                ("metadata_version", "1.2"),
+                ("name", "example"),
+                ("version", "1.0"),
+                ("filetype", "sdist"),
+                ("filetype", "sdist"),
+                ("md5_digest", "a fake md5 digest"),
+                ("md5_digest", "a fake md5 digest"),
+                ("content", self._content("example-1.0.tar.gz")),
+                ("content", self._content("example-1.0.tar.gz")),
+            ]
+        )
+
+        with pytest.raises(HTTPBadRequest) as excinfo:
+            legacy.file_upload_multiple(db_request)
+
+        resp = excinfo.value
+
+        assert resp.status_code == 400
+        assert resp.status == "400 Upload each file only once."
+
+    def test_upload_fails_without_a_value_for_each_file(
+        self, pyramid_config, db_request
+    ):
+        pyramid_config.testing_securitypolicy(userid=1)
+        user = UserFactory.create()
+        EmailFactory.create(user=user)
+        db_request.user = user
+        db_request.POST = MultiDict(
+            [
+                ("metadata_version", "1.2"),
+                ("name", "example"),
+                ("version", "1.0"),
+                ("filetype", "bdist_wheel"),
+                ("pyversion", "py2"),
+                ("pyversion", "py3"),
+                ("md5_digest", "a fake md5 digest"),
+                ("md5_digest", "a fake md5 digest"),
+                ("content", self._content("example-1.0-py2-none-any.whl")),
+                ("content", self._content("example-1.0-py3-none-any.whl")),
+            ]
+        )
+
+        with pytest.raises(HTTPBadRequest) as excinfo:
+            legacy.file_upload_multiple(db_request)
+
+        resp = excinfo.value
+
+        assert resp.status_code == 400
+        assert resp.status == "400 filetype: Give one value for each file."
+
+    def test_upload_fails_with_invalid_file_data(self, pyramid_config, db_request):
+        pyramid_config.testing_securitypolicy(userid=1)
+        user = UserFactory.create()
+        EmailFactory.create(user=user)
+        db_request.user = user
+        db_request.POST = MultiDict(
+            [
+                ("metadata_version", "1.2"),
+                ("name", "example"),
+                ("version", "1.0"),
+                ("filetype", "sdist"),
+                ("filetype", "bdist_wheel"),
+                ("md5_digest", "a fake md5 digest"),
+                ("md5_digest", "a fake md5 digest"),
+                ("content", self._content("example-1.0.tar.gz")),
+                ("content", self._content("example-1.0-py3-none-any.whl")),
+            ]
+        )
+
+        with pytest.raises(HTTPBadRequest) as excinfo:
+            legacy.file_upload_multiple(db_request)
+
+        resp = excinfo.value
+
+        assert resp.status_code == 400
+        assert resp.status == (
+            "400 example-1.0-py3-none-any.whl: Error: Python version is required "
+            "for binary distribution uploads."
+        )
+
+    def test_upload_fails_with_unmatched_signature(self, pyramid_config, db_request):
+        pyramid_config.testing_securitypolicy(userid=1)
+        user = UserFactory.create()
+        EmailFactory.create(user=user)
+        db_request.user = user
+        db_request.POST = MultiDict(
+            [
+                ("metadata_version", "1.2"),
+                ("name", "example"),
+                ("version", "1.0"),
+                ("filetype", "sdist"),
+                ("md5_digest", "a fake md5 digest"),
+                ("content", self._content("example-1.0.tar.gz")),
+                ("gpg_signature", self._content("example-1.0.zip.asc")),
+            ]
+        )
+
+        with pytest.raises(HTTPBadRequest) as excinfo:
+            legacy.file_upload_multiple(db_request)
+
+        resp = excinfo.value
+
+        assert resp.status_code == 400
+        assert resp.status == (
+            "400 gpg_signature: Name each signature after its file, with '.asc' "
+            "added."
+        )
+
+    def test_successful_upload(self, tmpdir, monkeypatch, pyramid_config, db_request):
+        monkeypatch.setattr(tempfile, "tempdir", str(tmpdir))
+
+        pyramid_config.testing_securitypolicy(userid=1)
+        user = UserFactory.create()
+        EmailFactory.create(user=user)
+        project = ProjectFactory.create()
+        RoleFactory.create(user=user, project=project)
+
+        sdist_filename = "{}-1.0.tar.gz".format(project.name)
+        wheel_filename = "{}-1.0-py3-none-any.whl".format(project.name)
+        signature = b"-----BEGIN PGP SIGNATURE-----\n This is a Fake Signature"
+
+        db_request.user = user
+        db_request.remote_addr = "10.10.10.40"
+        db_request.user_agent = "warehouse-tests/6.6.6"
+        db_request.POST = MultiDict(
+            [
+                ("metadata_version", "1.2"),
+                ("name", project.name),
+                ("version", "1.0"),
+                ("filetype", "sdist"),
+                ("filetype", "bdist_wheel"),
+                ("pyversion", "source"),
+                ("pyversion", "py3"),
+                ("md5_digest", hashlib.md5(b"A fake sdist.").hexdigest()),
+                ("md5_digest", hashlib.md5(b"A fake wheel.").hexdigest()),
+                ("content", self._content(sdist_filename, b"A fake sdist.")),
+                ("content", self._content(wheel_filename, b"A fake wheel.")),
+                ("gpg_signature", self._content(wheel_filename + ".asc", signature)),
+            ]
+        )
+
+        stored = {}
+
+        @pretend.call_recorder
+        def storage_service_stage(path, file_path, *, meta):
+            with open(file_path, "rb") as fp:
+                stored[path] = (fp.read(), meta)
+
+        storage_service = pretend.stub(stage=storage_service_stage)
+        db_request.find_service = pretend.call_recorder(
+            lambda svc, name=None: storage_service
+        )
+
+        monkeypatch.setattr(
+            legacy, "_inspect_dist_file", lambda *a, **kw: legacy._DistFile(True, None)
+        )
+
+        resp = legacy.file_upload_multiple(db_request)
+
+        assert resp.status_code == 200
+        assert db_request.find_service.calls == [pretend.call(IFileStorage)]
+
+        # Ensure that a single release has been created for all of the files.
+        release = db_request.db.query(Release).filter(Release.project == project).one()
+        sdist, wheel = (
+            db_request.db.query(File)
+            .filter(File.release == release)
+            .order_by(File.packagetype.desc())
+            .all()
+        )
+        assert (sdist.filename, sdist.python_version) == (sdist_filename, "source")
+        assert (wheel.filename, wheel.python_version) == (wheel_filename, "py3")
+        assert not sdist.has_signature
+        assert wheel.has_signature
+
+        sdist_meta = {
+            "project": project.normalized_name,
+            "version": "1.0",
+            "package-type": "sdist",
+            "python-version": "source",
+        }
+        wheel_meta = {
+            "project": project.normalized_name,
+            "version": "1.0",
+            "package-type": "bdist_wheel",
+            "python-version": "py3",
+        }
+        assert stored == {
+            sdist.path: (b"A fake sdist.", sdist_meta),
+            wheel.path: (b"A fake wheel.", wheel_meta),
+            wheel.pgp_path: (signature, wheel_meta),
+        }
+
+        # Ensure that the staged files will be promoted once we commit.
+        assert [
+            path for _, path in db_request.db.info["warehouse.packaging.staged_files"]
+        ] == [sdist.path, wheel.path, wheel.pgp_path]
+
+        # Ensure that all of our journal entries have been created
+        journals = (
+            db_request.db.query(JournalEntry)
+            .options(joinedload("submitted_by"))
+            .order_by("submitted_date", "id")
+            .all()
+        )
+        assert [
+            (j.name, j.version, j.action, j.submitted_by, j.submitted_from)
+            for j in journals
+        ] == [
+            (project.name, "1.0", "new release", user, "10.10.10.40"),
+            (
+                project.name,
+                "1.0",
+                "add source file {}".format(sdist_filename),
+                user,
+                "10.10.10.40",
+            ),
+            (
+                project.name,
+                "1.0",
+                "add py3 file {}".format(wheel_filename),
+                user,
+                "10.10.10.40",
+            ),
+        ]
+
+    def test_upload_keeps_file_fields_in_line_with_unknown_values(
+        self, tmpdir, monkeypatch, pyramid_config, db_request
+    ):
+        monkeypatch.setattr(tempfile, "tempdir", str(tmpdir))
+
+        pyramid_config.testing_securitypolicy(userid=1)
+        user = UserFactory.create()
+        EmailFactory.create(user=user)
+        project = ProjectFactory.create()
+        RoleFactory.create(user=user, project=project)
+
+        sdist_filename = "{}-1.0.tar.gz".format(project.name)
+        wheel_filename = "{}-1.0-py3-none-any.whl".format(project.name)
+
+        db_request.user = user
+        db_request.POST = MultiDict(
+            [
+                ("metadata_version", "1.2"),
+                ("name", project.name),
+                ("version", "1.0"),
+                ("filetype", "sdist"),
+                ("filetype", "bdist_wheel"),
+                ("pyversion", "source"),
+                ("pyversion", "py3"),
+                ("comment", "UNKNOWN"),
+                ("comment", "A wheel."),
+                ("md5_digest", hashlib.md5(b"A fake sdist.").hexdigest()),
+                ("md5_digest", hashlib.md5(b"A fake wheel.").hexdigest()),
+                ("content", self._content(sdist_filename, b"A fake sdist.")),
+                ("content", self._content(wheel_filename, b"A fake wheel.")),
+            ]
+        )
+
+        storage_service = pretend.stub(
+            stage=pretend.call_recorder(lambda path, file_path, *, meta: None)
+        )
+        db_request.find_service = lambda svc, name=None: storage_service
+
+        monkeypatch.setattr(
+            legacy, "_inspect_dist_file", lambda *a, **kw: legacy._DistFile(True, None)
+        )
+
+        resp = legacy.file_upload_multiple(db_request)
+
+        assert resp.status_code == 200
+        assert db_request.POST.getall("comment") == ["", "A wheel."]
+
+        sdist, wheel = (
+            db_request.db.query(File)
+            .join(Release)
+            .filter(Release.project == project)
+            .order_by(File.packagetype.desc())
+            .all()
+        )
+        assert (sdist.filename, sdist.comment_text) == (sdist_filename, "")
+        assert (wheel.filename, wheel.comment_text) == (wheel_filename, "A wheel.")
+
+    def test_upload_skips_existing_file(
+        self, tmpdir, monkeypatch, pyramid_config, db_request
+    ):
+        monkeypatch.setattr(tempfile, "tempdir", str(tmpdir))
+
+        pyramid_config.testing_securitypolicy(userid=1)
+        user = UserFactory.create()
+        EmailFactory.create(user=user)
+        project = ProjectFactory.create()
+        release = ReleaseFactory.create(project=project, version="1.0")
+        RoleFactory.create(user=user, project=project)
+
+        sdist_filename = "{}-1.0.tar.gz".format(project.name)
+        wheel_filename = "{}-1.0-py3-none-any.whl".format(project.name)
+
+        db_request.db.add(
+            File(
+                release=release,
+                filename=sdist_filename,
+                md5_digest=hashlib.md5(b"A fake sdist.").hexdigest(),
+                sha256_digest=hashlib.sha256(b"A fake sdist.").hexdigest(),
+                blake2_256_digest=hashlib.blake2b(
+                    b"A fake sdist.", digest_size=256 // 8
+                ).hexdigest(),
+                path="source/{name[0]}/{name}/{filename}".format(
+                    name=project.name, filename=sdist_filename
+                ),
+            )
+        )
+
+        db_request.user = user
+        db_request.POST = MultiDict(
+            [
+                ("metadata_version", "1.2"),
+                ("name", project.name),
+                ("version", "1.0"),
+                ("filetype", "sdist"),
+                ("filetype", "bdist_wheel"),
+                ("pyversion", "source"),
+                ("pyversion", "py3"),
+                ("md5_digest", hashlib.md5(b"A fake sdist.").hexdigest()),
+                ("md5_digest", hashlib.md5(b"A fake wheel.").hexdigest()),
+                ("content", self._content(sdist_filename, b"A fake sdist.")),
+                ("content", self._content(wheel_filename, b"A fake wheel.")),
+            ]
+        )
+
+        storage_service = pretend.stub(
+            stage=pretend.call_recorder(lambda path, file_path, *, meta: None)
+        )
+        db_request.find_service = lambda svc, name=None: storage_service
+
+        monkeypatch.setattr(
+            legacy, "_inspect_dist_file", lambda *a, **kw: legacy._DistFile(True, None)
+        )
+
+        resp = legacy.file_upload_multiple(db_request)
+
+        assert resp.status_code == 200
+
+        wheel = (
+            db_request.db.query(File)
+            .filter((File.release == release) & (File.filename == wheel_filename))
+            .one()
+        )
+        assert [call.args[0] for call in storage_service.stage.calls] == [wheel.path]
+        assert [
+            path for _, path in db_request.db.info["warehouse.packaging.staged_files"]
+        ] == [wheel.path]
+
+    def test_upload_fails_when_staging_fails(
+        self, tmpdir, monkeypatch, pyramid_config, db_request
+    ):
+        monkeypatch.setattr(tempfile, "tempdir", str(tmpdir))
+
+        pyramid_config.testing_securitypolicy(userid=1)
+        user = UserFactory.create()
+        EmailFactory.create(user=user)
+        project = ProjectFactory.create()
+        RoleFactory.create(user=user, project=project)
+
+        sdist_filename = "{}-1.0.tar.gz".format(project.name)
+        wheel_filename = "{}-1.0-py3-none-any.whl".format(project.name)
+
+        db_request.user = user
+        db_request.POST = MultiDict(
+            [
+                ("metadata_version", "1.2"),
+                ("name", project.name),
+                ("version", "1.0"),
+                ("filetype", "sdist"),
+                ("filetype", "bdist_wheel"),
+                ("pyversion", "source"),
+                ("pyversion", "py3"),
+                ("md5_digest", hashlib.md5(b"A fake sdist.").hexdigest()),
+                ("md5_digest", hashlib.md5(b"A fake wheel.").hexdigest()),
+                ("content", self._content(sdist_filename, b"A fake sdist.")),
+                ("content", self._content(wheel_filename, b"A fake wheel.")),
+            ]
+        )
+
+        class StagingError(Exception):
+            pass
+
+        @pretend.call_recorder
+        def storage_service_stage(path, file_path, *, meta):
+            if path.endswith(".whl"):
+                raise StagingError
+
+        storage_service = pretend.stub(stage=storage_service_stage)
+        db_request.find_service = lambda svc, name=None: storage_service
+
+        monkeypatch.setattr(
+            legacy, "_inspect_dist_file", lambda *a, **kw: legacy._DistFile(True, None)
+        )
+
+        with pytest.raises(StagingError):
+            legacy.file_upload_multiple(db_request)
+
+        # Every file was still staged, and none of them will be promoted.
+        assert len(storage_service.stage.calls) == 2
+        assert "warehouse.packaging.staged_files" not in db_request.db.info
+
+
 @pytest.mark.parametrize("status", [True, False])
 def test_legacy_purge(monkeypatch, status):
     post = pretend.call_recorder(lambda *a, **kw: None)
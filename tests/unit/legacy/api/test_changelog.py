@@ -0,0 +1,281 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+
+import pretend
+import pytest
+
+from warehouse.legacy.api import changelog
+
+from ....common.db.packaging import JournalEntryFactory
+
+
+def _expected(entries):
+    return [
+        (
+            e.name,
+            e.version,
+            int(e.submitted_date.replace(tzinfo=datetime.timezone.utc).timestamp()),
+            e.action,
+            e.id,
+        )
+        for e in entries
+    ]
+
+
+class TestChangelogSinceSerial:
+    @pytest.mark.parametrize("window", [1, 3, 10, 100])
+    def test_windows(self, db_request, window):
+        entries = sorted(
+            [JournalEntryFactory.create() for _ in range(10)], key=lambda e: e.id
+        )
+
+        assert list(
+            changelog.changelog_since_serial(
+                db_request.db, entries[2].id, window=window
+            )
+        ) == _expected(entries[3:])
+
+    @pytest.mark.parametrize("window", [1, 3, 10])
+    def test_limit(self, db_request, window):
+        entries = sorted(
+            [JournalEntryFactory.create() for _ in range(10)], key=lambda e: e.id
+        )
+
+        assert list(
+            changelog.changelog_since_serial(db_request.db, 0, limit=4, window=window)
+        ) == _expected(entries[:4])
+
+    def test_empty(self, db_request):
+        assert list(changelog.changelog_since_serial(db_request.db, 0)) == []
+
+
+class TestChangelogSinceDate:
+    def test_since(self, db_request):
+        now = datetime.datetime(2018, 1, 1)
+        dates = [now + datetime.timedelta(days=d) for d in [3, 1, 5, 2, 4]]
+        entries = [JournalEntryFactory.create(submitted_date=d) for d in dates]
+
+        assert changelog.changelog_since_date(
+            db_request.db, now + datetime.timedelta(days=2)
+        ) == _expected(sorted([entries[0], entries[2], entries[4]], key=lambda e: e.id))
+
+    def test_limit(self, db_request):
+        now = datetime.datetime(2018, 1, 1)
+        entries = sorted(
+            [
+                JournalEntryFactory.create(submitted_date=now + datetime.timedelta(d))
+                for d in range(1, 6)
+            ],
+            key=lambda e: e.id,
+        )
+
+        assert changelog.changelog_since_date(db_request.db, now, limit=2) == _expected(
+            entries[:2]
+        )
+
+    def test_none(self, db_request):
+        JournalEntryFactory.create(submitted_date=datetime.datetime(2018, 1, 1))
+
+        assert (
+            changelog.changelog_since_date(db_request.db, datetime.datetime(2019, 1, 1))
+            == []
+        )
+
+
+@pytest.fixture
+def fakeredis():
+    import fakeredis
+
+    _fakeredis = fakeredis.FakeStrictRedis()
+    yield _fakeredis
+    _fakeredis.flushall()
+
+
+@pytest.mark.parametrize(
+    ("settings", "configured"),
+    [({}, False), ({"changelog.redis_url": "redis://"}, True)],
+)
+def test_changelog_redis(monkeypatch, settings, configured):
+    redis_conn = pretend.stub()
+    from_url = pretend.call_recorder(lambda url: redis_conn)
+    monkeypatch.setattr(changelog.redis.StrictRedis, "from_url", from_url)
+
+    if configured:
+        assert changelog.changelog_redis(settings) is redis_conn
+        assert from_url.calls == [pretend.call("redis://")]
+    else:
+        assert changelog.changelog_redis(settings) is None
+        assert from_url.calls == []
+
+
+class TestPublishSerial:
+    def test_publish(self, fakeredis):
+        pubsub = fakeredis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(changelog.SERIAL_CHANNEL)
+        pubsub.get_message()
+
+        changelog.publish_serial(fakeredis, 10)
+        changelog.publish_serial(fakeredis, 10, changed=False)
+
+        assert changelog.get_last_serial(fakeredis) == 10
+        assert (
+            0 < fakeredis.ttl(changelog.LAST_SERIAL_KEY) <= (changelog.LAST_SERIAL_TTL)
+        )
+        assert pubsub.get_message()["data"] == b"10"
+        assert pubsub.get_message() is None
+
+    def test_not_running(self, fakeredis):
+        assert changelog.get_last_serial(fakeredis) is None
+
+
+class FakePubSub:
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.subscribe = pretend.call_recorder(lambda channel: None)
+        self.get_message = pretend.call_recorder(self._get_message)
+        self.close = pretend.call_recorder(lambda: None)
+
+    def _get_message(self, timeout):
+        if self.messages:
+            return self.messages.pop(0)
+
+
+class TestWaitForSerial:
+    def test_not_running(self, fakeredis):
+        assert changelog.wait_for_serial(fakeredis, 10, 30) is None
+
+    @pytest.mark.parametrize(("serial", "timeout"), [(11, 30), (10, 0), (5, 0)])
+    def test_no_wait(self, fakeredis, serial, timeout):
+        fakeredis.pubsub = pretend.call_recorder(lambda **kw: None)
+        changelog.publish_serial(fakeredis, serial)
+
+        assert changelog.wait_for_serial(fakeredis, 10, timeout) == serial
+        assert fakeredis.pubsub.calls == []
+
+    def test_waits(self, fakeredis):
+        changelog.publish_serial(fakeredis, 10)
+        pubsub = FakePubSub(
+            [
+                None,
+                {"type": "message", "data": b"9"},
+                {"type": "message", "data": b"12"},
+                {"type": "message", "data": b"13"},
+            ]
+        )
+        fakeredis.pubsub = lambda ignore_subscribe_messages: pubsub
+
+        assert changelog.wait_for_serial(fakeredis, 10, 30) == 12
+        assert pubsub.subscribe.calls == [pretend.call(changelog.SERIAL_CHANNEL)]
+        assert len(pubsub.get_message.calls) == 3
+        assert pubsub.close.calls == [pretend.call()]
+
+    def test_published_before_subscribed(self, fakeredis):
+        changelog.publish_serial(fakeredis, 10)
+        pubsub = FakePubSub([])
+
+        def subscribe(channel):
+            changelog.publish_serial(fakeredis, 11)
+
+        pubsub.subscribe = subscribe
+        fakeredis.pubsub = lambda ignore_subscribe_messages: pubsub
+
+        assert changelog.wait_for_serial(fakeredis, 10, 30) == 11
+        assert pubsub.get_message.calls == []
+
+    def test_times_out(self, fakeredis, monkeypatch):
+        changelog.publish_serial(fakeredis, 10)
+        pubsub = FakePubSub([None, None])
+        fakeredis.pubsub = lambda ignore_subscribe_messages: pubsub
+        now = iter([0, 0, 1, 4])
+        monkeypatch.setattr(changelog.time, "monotonic", lambda: next(now))
+
+        assert changelog.wait_for_serial(fakeredis, 10, 3) == 10
+        assert pubsub.get_message.calls == [
+            pretend.call(timeout=3),
+            pretend.call(timeout=2),
+        ]
+        assert pubsub.close.calls == [pretend.call()]
+
+    def test_wait_is_bounded(self, fakeredis, monkeypatch):
+        changelog.publish_serial(fakeredis, 10)
+        pubsub = FakePubSub([None])
+        fakeredis.pubsub = lambda ignore_subscribe_messages: pubsub
+        now = iter([0, 0, changelog.MAX_WAIT])
+        monkeypatch.setattr(changelog.time, "monotonic", lambda: next(now))
+
+        assert changelog.wait_for_serial(fakeredis, 10, 3600) == 10
+        assert pubsub.get_message.calls == [pretend.call(timeout=changelog.MAX_WAIT)]
+
+
+class TestRelayJournalNotifications:
+    def test_relays(self, monkeypatch):
+        class Stop(Exception):
+            pass
+
+        notifies = []
+        batches = iter(
+            [
+                [pretend.stub(payload="11"), pretend.stub(payload="13")],
+                [],
+                [pretend.stub(payload="12")],
+            ]
+        )
+
+        def poll():
+            notifies.extend(next(batches))
+
+        cursor = pretend.stub(
+            execute=pretend.call_recorder(lambda sql: None), fetchone=lambda: (10,)
+        )
+        connection = pretend.stub(
+            detach=pretend.call_recorder(lambda: None),
+            set_session=pretend.call_recorder(lambda autocommit: None),
+            cursor=lambda: cursor,
+            poll=poll,
+            notifies=notifies,
+            close=pretend.call_recorder(lambda: None),
+        )
+        engine = pretend.stub(raw_connection=lambda: connection)
+
+        ready = iter(
+            [([connection], [], []), ([], [], []), ([connection], [], []), Stop]
+        )
+
+        def select(rlist, wlist, xlist, timeout):
+            result = next(ready)
+            if result is Stop:
+                raise Stop
+            return result
+
+        monkeypatch.setattr(changelog.select, "select", select)
+        publish_serial = pretend.call_recorder(lambda conn, serial, changed=True: None)
+        monkeypatch.setattr(changelog, "publish_serial", publish_serial)
+        redis_conn = pretend.stub()
+
+        with pytest.raises(Stop):
+            changelog.relay_journal_notifications(engine, redis_conn)
+
+        assert connection.detach.calls == [pretend.call()]
+        assert connection.set_session.calls == [pretend.call(autocommit=True)]
+        assert cursor.execute.calls == [
+            pretend.call("LISTEN journals"),
+            pretend.call("SELECT max(id) FROM journals"),
+        ]
+        assert publish_serial.calls == [
+            pretend.call(redis_conn, 10),
+            pretend.call(redis_conn, 13, changed=True),
+            pretend.call(redis_conn, 13, changed=False),
+            pretend.call(redis_conn, 13, changed=False),
+        ]
+        assert connection.close.calls == [pretend.call()]
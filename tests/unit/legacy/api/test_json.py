@@ -13,10 +13,13 @@
 from collections import OrderedDict
 
 import pretend
+import pytest
 
-from pyramid.httpexceptions import HTTPMovedPermanently, HTTPNotFound
+from pyramid.httpexceptions import HTTPBadRequest, HTTPMovedPermanently, HTTPNotFound
+from webob.multidict import MultiDict
 
 from warehouse.legacy.api import json
+from warehouse.legacy.api.json_cache.interfaces import IJSONCache
 from warehouse.packaging.models import Dependency, DependencyKind
 
 from ....common.db.accounts import UserFactory
@@ -280,6 +283,7 @@ class TestJSONRelease:
                         ),
                         "url": "/the/fake/url/",
                         "requires_python": None,
+                        "dist_info_metadata": None,
                     }
                 ],
                 "2.0": [
@@ -301,6 +305,7 @@ class TestJSONRelease:
                         ),
                         "url": "/the/fake/url/",
                         "requires_python": None,
+                        "dist_info_metadata": None,
                     }
                 ],
                 "3.0": [
@@ -322,6 +327,7 @@ class TestJSONRelease:
                         ),
                         "url": "/the/fake/url/",
                         "requires_python": None,
+                        "dist_info_metadata": None,
                     }
                 ],
             },
@@ -342,6 +348,7 @@ class TestJSONRelease:
                     "upload_time": files[2].upload_time.strftime("%Y-%m-%dT%H:%M:%S"),
                     "url": "/the/fake/url/",
                     "requires_python": None,
+                    "dist_info_metadata": None,
                 }
             ],
             "last_serial": je.id,
@@ -423,6 +430,7 @@ class TestJSONRelease:
                         "upload_time": file.upload_time.strftime("%Y-%m-%dT%H:%M:%S"),
                         "url": "/the/fake/url/",
                         "requires_python": None,
+                        "dist_info_metadata": None,
                     }
                 ]
             },
@@ -440,12 +448,59 @@ class TestJSONRelease:
                     "upload_time": file.upload_time.strftime("%Y-%m-%dT%H:%M:%S"),
                     "url": "/the/fake/url/",
                     "requires_python": None,
+                    "dist_info_metadata": None,
                 }
             ],
             "last_serial": je.id,
         }
 
 
+class TestJSONReleaseCache:
+    def test_serves_cached(self, pyramid_request, pyramid_services):
+        project = pretend.stub(name="Foo", normalized_name="foo", last_serial=12)
+        release = pretend.stub(project=project, version="1.0")
+        json_cache = pretend.stub(
+            get=pretend.call_recorder(lambda tag, key: b'{"cached":true}')
+        )
+        pyramid_services.register_service(IJSONCache, None, json_cache)
+
+        resp = json.json_release(release, pyramid_request)
+
+        assert resp is pyramid_request.response
+        assert resp.body == b'{"cached":true}'
+        assert resp.content_type == "application/json"
+        assert resp.headers["X-PyPI-Last-Serial"] == "12"
+        assert json_cache.get.calls == [pretend.call("project/foo", "1.0:12")]
+        _assert_has_cors_headers(resp.headers)
+
+    def test_stores_on_miss(self, monkeypatch, db_request, pyramid_services):
+        project = ProjectFactory.create()
+        release = ReleaseFactory.create(project=project, version="1.0")
+        db_request.db.refresh(project)
+        data = {"info": {"name": project.name}}
+        monkeypatch.setattr(json, "_json_data", lambda *a: data)
+        render = pretend.call_recorder(lambda *a, **kw: '{"info":{}}')
+        monkeypatch.setattr(json, "render", render)
+        json_cache = pretend.stub(
+            get=lambda tag, key: None,
+            set=pretend.call_recorder(lambda tag, key, value: None),
+        )
+        pyramid_services.register_service(IJSONCache, None, json_cache)
+
+        resp = json.json_release(release, db_request)
+
+        assert resp is db_request.response
+        assert resp.body == b'{"info":{}}'
+        assert render.calls == [pretend.call("json", data, request=db_request)]
+        assert json_cache.set.calls == [
+            pretend.call(
+                "project/{}".format(project.normalized_name),
+                "1.0:{}".format(project.last_serial),
+                b'{"info":{}}',
+            )
+        ]
+
+
 class TestJSONReleaseSlash:
     def test_normalizing_redirects(self, db_request):
         release = ReleaseFactory.create()
@@ -465,3 +520,299 @@ class TestJSONReleaseSlash:
             )
         ]
         assert resp.headers["Location"] == "/project/the-redirect"
+
+
+class TestJSONBulk:
+    def test_requested(self, pyramid_request):
+        pyramid_request.params = MultiDict(
+            [
+                ("project", "Foo"),
+                ("project", "foo"),
+                ("project", "Bar_Baz == 1.0"),
+                ("project", "foo==2.0"),
+            ]
+        )
+
+        assert json._bulk_requested(pyramid_request) == [
+            (("foo", None), ("Foo", None)),
+            (("bar-baz", "1.0"), ("Bar_Baz", "1.0")),
+            (("foo", "2.0"), ("foo", "2.0")),
+        ]
+
+    @pytest.mark.parametrize(
+        "projects", [[], [("project", "")], [("project", "==1.0")]]
+    )
+    def test_requested_invalid(self, pyramid_request, projects):
+        pyramid_request.params = MultiDict(projects)
+
+        with pytest.raises(HTTPBadRequest):
+            json._bulk_requested(pyramid_request)
+
+    def test_requested_too_many(self, monkeypatch, pyramid_request):
+        monkeypatch.setattr(json, "BULK_MAX_PROJECTS", 2)
+        pyramid_request.params = MultiDict(
+            [("project", "foo"), ("project", "bar"), ("project", "baz")]
+        )
+
+        with pytest.raises(HTTPBadRequest):
+            json._bulk_requested(pyramid_request)
+
+    def test_bad_request(self, pyramid_request):
+        pyramid_request.params = MultiDict()
+
+        resp = json.json_bulk(pyramid_request)
+
+        assert isinstance(resp, HTTPBadRequest)
+        _assert_has_cors_headers(resp.headers)
+
+    def test_streams_response(self, monkeypatch, pyramid_request):
+        app_iter = iter([b"{}\n"])
+        _json_bulk_app_iter = pretend.call_recorder(lambda r, req: app_iter)
+        monkeypatch.setattr(json, "_json_bulk_app_iter", _json_bulk_app_iter)
+        pyramid_request.params = MultiDict([("project", "foo")])
+
+        resp = json.json_bulk(pyramid_request)
+
+        assert resp is pyramid_request.response
+        assert resp.content_type == "application/x-ndjson"
+        assert resp.app_iter is app_iter
+        assert _json_bulk_app_iter.calls == [
+            pretend.call(pyramid_request, [(("foo", None), ("foo", None))])
+        ]
+        _assert_has_cors_headers(resp.headers)
+
+    def test_app_iter(self, monkeypatch, pyramid_request):
+        monkeypatch.setattr(json, "BULK_WINDOW", 2)
+        connection = pretend.stub(close=pretend.call_recorder(lambda: None))
+        pyramid_request.registry["sqlalchemy.engine"] = pretend.stub(
+            connect=lambda: connection
+        )
+        session = pretend.stub(
+            expunge_all=pretend.call_recorder(lambda: None),
+            close=pretend.call_recorder(lambda: None),
+        )
+        Session = pretend.call_recorder(lambda bind: session)
+        monkeypatch.setattr(json, "Session", Session)
+        _json_bulk = pretend.call_recorder(
+            lambda s, r, requested: [{"name": n} for (n, _), _ in requested]
+        )
+        monkeypatch.setattr(json, "_json_bulk", _json_bulk)
+        requested = [((n, None), (n, None)) for n in ["a", "b", "c"]]
+
+        assert list(json._json_bulk_app_iter(pyramid_request, requested)) == [
+            b'{"name": "a"}\n',
+            b'{"name": "b"}\n',
+            b'{"name": "c"}\n',
+        ]
+        assert Session.calls == [pretend.call(bind=connection)]
+        assert _json_bulk.calls == [
+            pretend.call(session, pyramid_request, requested[:2]),
+            pretend.call(session, pyramid_request, requested[2:]),
+        ]
+        assert session.expunge_all.calls == [pretend.call(), pretend.call()]
+        assert session.close.calls == [pretend.call()]
+        assert connection.close.calls == [pretend.call()]
+
+    def test_json_bulk(self, pyramid_config, db_request):
+        project = ProjectFactory.create(has_docs=False)
+        releases = [
+            ReleaseFactory.create(project=project, version=v)
+            for v in ["1.0", "2.0", "3.0b1"]
+        ]
+        for release in releases:
+            FileFactory.create(
+                release=release,
+                filename="{}-{}.tar.gz".format(project.name, release.version),
+            )
+        other = ProjectFactory.create(has_docs=False)
+        other_release = ReleaseFactory.create(project=other)
+        for i, release in enumerate(releases):
+            release._pypi_ordering = i
+
+        db_request.route_url = pretend.call_recorder(lambda *a, **kw: "/the/url/")
+
+        requested = [
+            ((project.normalized_name, None), (project.name, None)),
+            ((project.normalized_name, "1.0.0"), (project.name, "1.0.0")),
+            ((other.normalized_name, None), (other.name, None)),
+            ((other.normalized_name, "9.9"), (other.name, "9.9")),
+            (("missing", None), ("Missing", None)),
+        ]
+
+        assert list(json._json_bulk(db_request.db, db_request, requested)) == [
+            json.json_release(releases[1], db_request),
+            json.json_release(releases[0], db_request),
+            json.json_release(other_release, db_request),
+            {"name": other.name, "version": "9.9", "error": "Not Found"},
+            {"name": "Missing", "version": None, "error": "Not Found"},
+        ]
+
+    def test_json_bulk_queries(self, db_request, query_recorder):
+        projects = [ProjectFactory.create(has_docs=False) for _ in range(3)]
+        for project in projects:
+            for version in ["1.0", "2.0"]:
+                release = ReleaseFactory.create(project=project, version=version)
+                FileFactory.create(
+                    release=release,
+                    filename="{}-{}.tar.gz".format(project.name, version),
+                )
+
+        db_request.route_url = pretend.call_recorder(lambda *a, **kw: "/the/url/")
+
+        requested = [((p.normalized_name, None), (p.name, None)) for p in projects]
+
+        def count_queries(requested):
+            # Start from nothing being loaded, as when the endpoint streams its
+            # response with a session of its own.
+            db_request.db.flush()
+            db_request.db.expunge_all()
+            query_recorder.clear()
+
+            with query_recorder:
+                list(json._json_bulk(db_request.db, db_request, requested))
+
+            return len(query_recorder.queries)
+
+        # Asking for more projects doesn't take any more trips to the database.
+        assert count_queries(requested) == count_queries(requested[:1])
+
+
+class TestJSONChangelog:
+    @pytest.mark.parametrize(
+        "params",
+        [
+            [],
+            [("since", "foo")],
+            [("since", "-1")],
+            [("since", "1"), ("limit", "0")],
+            [("since", "1"), ("limit", "bar")],
+            [("since", "1"), ("wait", "-1")],
+        ],
+    )
+    def test_bad_request(self, pyramid_request, params):
+        pyramid_request.params = MultiDict(params)
+
+        resp = json.json_changelog(pyramid_request)
+
+        assert isinstance(resp, HTTPBadRequest)
+        _assert_has_cors_headers(resp.headers)
+
+    @pytest.mark.parametrize(
+        ("params", "limit"),
+        [
+            ([("since", "10")], json.CHANGELOG_MAX_ENTRIES),
+            ([("since", "10"), ("limit", "20")], 20),
+            ([("since", "10"), ("limit", "1000000")], json.CHANGELOG_MAX_ENTRIES),
+        ],
+    )
+    def test_streams_response(self, monkeypatch, pyramid_request, params, limit):
+        app_iter = iter([b"{}\n"])
+        _changelog_app_iter = pretend.call_recorder(lambda r, since, limit: app_iter)
+        monkeypatch.setattr(json, "_changelog_app_iter", _changelog_app_iter)
+        monkeypatch.setattr(json, "changelog_redis", lambda settings: None)
+        pyramid_request.params = MultiDict(params)
+        pyramid_request.db = pretend.stub(
+            query=lambda *a: pretend.stub(scalar=lambda: 42)
+        )
+
+        resp = json.json_changelog(pyramid_request)
+
+        assert resp is pyramid_request.response
+        assert resp.content_type == "application/x-ndjson"
+        assert resp.headers["X-PyPI-Last-Serial"] == "42"
+        assert resp.app_iter is app_iter
+        assert _changelog_app_iter.calls == [pretend.call(pyramid_request, 10, limit)]
+        _assert_has_cors_headers(resp.headers)
+
+    @pytest.mark.parametrize(("max_serial", "last_serial"), [(None, "0"), (10, "10")])
+    def test_nothing_new(self, monkeypatch, pyramid_request, max_serial, last_serial):
+        _changelog_app_iter = pretend.call_recorder(lambda r, since, limit: None)
+        monkeypatch.setattr(json, "_changelog_app_iter", _changelog_app_iter)
+        monkeypatch.setattr(json, "changelog_redis", lambda settings: None)
+        pyramid_request.params = MultiDict([("since", "10")])
+        pyramid_request.db = pretend.stub(
+            query=lambda *a: pretend.stub(scalar=lambda: max_serial)
+        )
+
+        resp = json.json_changelog(pyramid_request)
+
+        assert resp.headers["X-PyPI-Last-Serial"] == last_serial
+        assert resp.body == b""
+        assert _changelog_app_iter.calls == []
+
+    @pytest.mark.parametrize(
+        ("params", "timeout"),
+        [
+            ([("since", "10")], 0),
+            ([("since", "10"), ("wait", "3")], 3),
+            ([("since", "10"), ("wait", "30")], json.MAX_WAIT),
+            ([("since", "10"), ("wait", "3600")], json.MAX_WAIT),
+        ],
+    )
+    def test_waits_on_relay(self, monkeypatch, pyramid_request, params, timeout):
+        app_iter = iter([b"{}\n"])
+        monkeypatch.setattr(
+            json, "_changelog_app_iter", lambda r, since, limit: app_iter
+        )
+        redis_conn = pretend.stub()
+        monkeypatch.setattr(json, "changelog_redis", lambda settings: redis_conn)
+        wait_for_serial = pretend.call_recorder(lambda conn, since, timeout: 11)
+        monkeypatch.setattr(json, "wait_for_serial", wait_for_serial)
+        pyramid_request.params = MultiDict(params)
+        pyramid_request.db = pretend.stub()
+
+        resp = json.json_changelog(pyramid_request)
+
+        assert resp.headers["X-PyPI-Last-Serial"] == "11"
+        assert resp.app_iter is app_iter
+        assert wait_for_serial.calls == [pretend.call(redis_conn, 10, timeout)]
+
+    def test_relay_not_running(self, monkeypatch, pyramid_request):
+        monkeypatch.setattr(json, "changelog_redis", lambda settings: pretend.stub())
+        monkeypatch.setattr(json, "wait_for_serial", lambda c, s, t: None)
+        pyramid_request.params = MultiDict([("since", "10"), ("wait", "30")])
+        pyramid_request.db = pretend.stub(
+            query=lambda *a: pretend.stub(scalar=lambda: 5)
+        )
+
+        resp = json.json_changelog(pyramid_request)
+
+        assert resp.headers["X-PyPI-Last-Serial"] == "5"
+        assert resp.body == b""
+
+    def test_app_iter(self, monkeypatch, pyramid_request):
+        connection = pretend.stub(close=pretend.call_recorder(lambda: None))
+        pyramid_request.registry["sqlalchemy.engine"] = pretend.stub(
+            connect=lambda: connection
+        )
+        session = pretend.stub(close=pretend.call_recorder(lambda: None))
+        Session = pretend.call_recorder(lambda bind: session)
+        monkeypatch.setattr(json, "Session", Session)
+        changelog_since_serial = pretend.call_recorder(
+            lambda s, since, limit: iter(
+                [("foo", "1.0", 1000, "new release", 11), ("bar", None, 1001, "x", 12)]
+            )
+        )
+        monkeypatch.setattr(json, "changelog_since_serial", changelog_since_serial)
+
+        assert list(json._changelog_app_iter(pyramid_request, 10, 20)) == [
+            b'{"name": "foo", "version": "1.0", "timestamp": 1000, '
+            b'"action": "new release", "serial": 11}\n',
+            b'{"name": "bar", "version": null, "timestamp": 1001, '
+            b'"action": "x", "serial": 12}\n',
+        ]
+        assert Session.calls == [pretend.call(bind=connection)]
+        assert changelog_since_serial.calls == [pretend.call(session, 10, limit=20)]
+        assert session.close.calls == [pretend.call()]
+        assert connection.close.calls == [pretend.call()]
+
+    def test_json_changelog(self, monkeypatch, db_request):
+        entries = sorted(
+            [JournalEntryFactory.create() for _ in range(3)], key=lambda e: e.id
+        )
+        db_request.params = MultiDict([("since", str(entries[0].id))])
+        monkeypatch.setattr(json, "changelog_redis", lambda settings: None)
+
+        resp = json.json_changelog(db_request)
+
+        assert resp.headers["X-PyPI-Last-Serial"] == str(entries[-1].id)
@@ -0,0 +1,226 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import celery.exceptions
+import pretend
+import pytest
+
+from warehouse.cache.origin import CacheKeys
+from warehouse.legacy.api import json_cache
+from warehouse.legacy.api.json_cache import services
+from warehouse.legacy.api.json_cache.interfaces import CacheError, IJSONCache
+from warehouse.legacy.api.json_cache.services import RedisJSONCache
+
+
+@pytest.fixture
+def fakeredis():
+    import fakeredis
+
+    _fakeredis = fakeredis.FakeStrictRedis()
+    yield _fakeredis
+    _fakeredis.flushall()
+
+
+@pytest.fixture
+def redis_cache(fakeredis):
+    purger = pretend.call_recorder(lambda tag: None)
+    service = RedisJSONCache("redis://", purger, expires=60)
+    service.redis_conn = fakeredis
+    return service
+
+
+class TestRedisJSONCache:
+    def test_create_service(self):
+        purge_tag = pretend.stub(delay=pretend.call_recorder(lambda tag: None))
+        request = pretend.stub(
+            registry=pretend.stub(
+                settings={
+                    "warehouse.json.cache.url": "redis://",
+                    "warehouse.json.cache.expires": "30",
+                }
+            ),
+            task=pretend.call_recorder(lambda f: purge_tag),
+        )
+
+        service = RedisJSONCache.create_service(None, request)
+        service.purge_tags(["project/foo", "project/bar"])
+
+        assert isinstance(service, RedisJSONCache)
+        assert service.name == "json"
+        assert service.expires == 30
+        assert request.task.calls == [pretend.call(services.purge_tag)]
+        assert purge_tag.delay.calls == [
+            pretend.call("project/foo"),
+            pretend.call("project/bar"),
+        ]
+
+    def test_get_set(self, redis_cache, fakeredis):
+        assert redis_cache.get("project/foo", "1.0:5") is None
+
+        redis_cache.set("project/foo", "1.0:5", b'{"foo":1}')
+
+        assert redis_cache.get("project/foo", "1.0:5") == b'{"foo":1}'
+        assert redis_cache.get("project/foo", "1.0:6") is None
+        assert redis_cache.get("project/bar", "1.0:5") is None
+        assert 0 < fakeredis.ttl("json/project/foo") <= 60
+
+    def test_purge(self, redis_cache):
+        redis_cache.set("project/foo", "1.0:5", b"{}")
+        redis_cache.set("project/foo", "2.0:5", b"{}")
+        redis_cache.set("project/bar", "1.0:5", b"{}")
+
+        redis_cache.purge("project/foo")
+
+        assert redis_cache.get("project/foo", "1.0:5") is None
+        assert redis_cache.get("project/foo", "2.0:5") is None
+        assert redis_cache.get("project/bar", "1.0:5") == b"{}"
+
+    def test_redis_down(self):
+        service = RedisJSONCache("redis://localhost:1/", pretend.stub())
+
+        assert service.get("project/foo", "1.0:5") is None
+        service.set("project/foo", "1.0:5", b"{}")
+        with pytest.raises(CacheError):
+            service.purge("project/foo")
+
+
+class TestPurgeTask:
+    def test_purges_successfully(self):
+        task = pretend.stub()
+        service = pretend.stub(purge=pretend.call_recorder(lambda k: None))
+        request = pretend.stub(
+            find_service=pretend.call_recorder(lambda iface: service),
+            log=pretend.stub(info=pretend.call_recorder(lambda *args, **kwargs: None)),
+        )
+
+        services.purge_tag(task, request, "foo")
+
+        assert request.find_service.calls == [pretend.call(IJSONCache)]
+        assert service.purge.calls == [pretend.call("foo")]
+        assert request.log.info.calls == [pretend.call("Purging %s", "foo")]
+
+    def test_purges_fails(self):
+        exc = CacheError()
+
+        @pretend.call_recorder
+        def purge(key):
+            raise exc
+
+        @pretend.call_recorder
+        def retry(exc):
+            raise celery.exceptions.Retry
+
+        task = pretend.stub(retry=retry)
+        service = pretend.stub(purge=purge)
+        request = pretend.stub(
+            find_service=lambda iface: service,
+            log=pretend.stub(
+                info=pretend.call_recorder(lambda *args, **kwargs: None),
+                error=pretend.call_recorder(lambda *args, **kwargs: None),
+            ),
+        )
+
+        with pytest.raises(celery.exceptions.Retry):
+            services.purge_tag(task, request, "foo")
+
+        assert task.retry.calls == [pretend.call(exc=exc)]
+        assert request.log.error.calls == [
+            pretend.call("Error purging %s: %s", "foo", "")
+        ]
+
+
+def test_project_tag():
+    assert json_cache.project_tag(pretend.stub(normalized_name="foo")) == (
+        "project/foo"
+    )
+
+
+def test_store_purge_keys():
+    class Type1:
+        pass
+
+    class Type2:
+        pass
+
+    class Type3:
+        pass
+
+    config = pretend.stub(
+        registry={
+            "cache_keys": {
+                Type1: lambda o: CacheKeys(cache=[], purge=["project/foo"]),
+                Type2: lambda o: CacheKeys(
+                    cache=[], purge=["project/bar", "user/foo", "all-projects"]
+                ),
+            }
+        }
+    )
+    session = pretend.stub(info={}, new={Type1()}, dirty={Type2()}, deleted={Type3()})
+
+    json_cache.store_purge_keys(config, session, pretend.stub())
+
+    assert session.info["warehouse.legacy.api.json_cache.purges"] == {
+        "project/foo",
+        "project/bar",
+    }
+
+
+def test_execute_purge(app_config):
+    service = pretend.stub(purge_tags=pretend.call_recorder(lambda purges: None))
+    factory = pretend.call_recorder(lambda ctx, config: service)
+    app_config.register_service_factory(factory, IJSONCache)
+    app_config.commit()
+    session = pretend.stub(
+        info={"warehouse.legacy.api.json_cache.purges": {"project/foo"}}
+    )
+
+    json_cache.execute_purge(app_config, session)
+
+    assert factory.calls == [pretend.call(None, app_config)]
+    assert service.purge_tags.calls == [pretend.call({"project/foo"})]
+    assert "warehouse.legacy.api.json_cache.purges" not in session.info
+
+
+def test_execute_purge_no_cache():
+    @pretend.call_recorder
+    def find_service_factory(interface):
+        raise LookupError
+
+    config = pretend.stub(find_service_factory=find_service_factory)
+    session = pretend.stub(
+        info={"warehouse.legacy.api.json_cache.purges": {"project/foo"}}
+    )
+
+    json_cache.execute_purge(config, session)
+
+    assert find_service_factory.calls == [pretend.call(IJSONCache)]
+    assert "warehouse.legacy.api.json_cache.purges" not in session.info
+
+
+@pytest.mark.parametrize(
+    ("settings", "registered"),
+    [({}, False), ({"warehouse.json.cache.url": "redis://"}, True)],
+)
+def test_includeme(settings, registered):
+    config = pretend.stub(
+        registry=pretend.stub(settings=settings),
+        register_service_factory=pretend.call_recorder(lambda *a, **kw: None),
+    )
+
+    json_cache.includeme(config)
+
+    if registered:
+        assert config.register_service_factory.calls == [
+            pretend.call(RedisJSONCache.create_service, iface=IJSONCache)
+        ]
+    else:
+        assert config.register_service_factory.calls == []
@@ -10,11 +10,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+
+import celery.exceptions
 import pretend
+import pytest
 
 from pyramid.httpexceptions import HTTPMovedPermanently
+from webob.acceptparse import create_accept_header
 
 from warehouse.legacy.api import simple
+from warehouse.packaging.interfaces import ISimpleStorage
 
 from ....common.db.accounts import UserFactory
 from ....common.db.packaging import (
@@ -25,15 +31,49 @@ from ....common.db.packaging import (
 )
 
 
+@pytest.fixture
+def simple_index_config(pyramid_config):
+    pyramid_config.include("pyramid_jinja2")
+    pyramid_config.add_jinja2_renderer(".html")
+    pyramid_config.add_jinja2_search_path("warehouse:templates", name=".html")
+    pyramid_config.add_route("legacy.api.simple.detail", "/simple/{name}/")
+    pyramid_config.commit()
+    return pyramid_config
+
+
+def _strip_lines(content):
+    return "".join(line.strip() for line in content.decode("utf8").splitlines())
+
+
+def _simple_index_body(projects):
+    return "".join(
+        '<a href="/simple/{}/">{}</a>'.format(normalized_name, name)
+        for name, normalized_name in projects
+    )
+
+
 class TestSimpleIndex:
+    @pytest.fixture
+    def db_request(self, db_request, simple_index_config):
+        # Our streamed body uses its own connection rather than the request's
+        # session, so we hand it a branch of the test connection to make sure
+        # that it can see the data our tests have created.
+        db_request.registry["sqlalchemy.engine"] = db_request.db.connection()
+        return db_request
+
     def test_no_results_no_serial(self, db_request):
-        assert simple.simple_index(db_request) == {"projects": []}
+        resp = simple.simple_index(db_request)
+
+        assert resp is db_request.response
+        assert _simple_index_body([]) in _strip_lines(resp.body)
         assert db_request.response.headers["X-PyPI-Last-Serial"] == "0"
 
     def test_no_results_with_serial(self, db_request):
         user = UserFactory.create()
         je = JournalEntryFactory.create(submitted_by=user)
-        assert simple.simple_index(db_request) == {"projects": []}
+        resp = simple.simple_index(db_request)
+
+        assert "<a" not in _strip_lines(resp.body)
         assert db_request.response.headers["X-PyPI-Last-Serial"] == str(je.id)
 
     def test_with_results_no_serial(self, db_request):
@@ -41,9 +81,11 @@ class TestSimpleIndex:
             (x.name, x.normalized_name)
             for x in [ProjectFactory.create() for _ in range(3)]
         ]
-        assert simple.simple_index(db_request) == {
-            "projects": sorted(projects, key=lambda x: x[1])
-        }
+        resp = simple.simple_index(db_request)
+
+        assert _simple_index_body(sorted(projects, key=lambda x: x[1])) in self._body(
+            resp
+        )
         assert db_request.response.headers["X-PyPI-Last-Serial"] == "0"
 
     def test_with_results_with_serial(self, db_request):
@@ -53,14 +95,107 @@ class TestSimpleIndex:
         ]
         user = UserFactory.create()
         je = JournalEntryFactory.create(submitted_by=user)
+        resp = simple.simple_index(db_request)
 
-        assert simple.simple_index(db_request) == {
-            "projects": sorted(projects, key=lambda x: x[1])
-        }
+        assert _simple_index_body(sorted(projects, key=lambda x: x[1])) in self._body(
+            resp
+        )
         assert db_request.response.headers["X-PyPI-Last-Serial"] == str(je.id)
 
 
+class TestSimpleIndexStreaming:
+    @pytest.fixture
+    def projects(self, monkeypatch):
+        state = {"closed": False, "engines": []}
+        rows = [
+            pretend.stub(name="Foo{}".format(i), normalized_name="foo{}".format(i))
+            for i in range(50)
+        ]
+
+        def _projects(engine):
+            state["engines"].append(engine)
+            try:
+                yield from rows
+            finally:
+                state["closed"] = True
+
+        monkeypatch.setattr(simple, "_simple_index_projects", _projects)
+        return pretend.stub(rows=rows, state=state)
+
+    @pytest.fixture
+    def request_(self, pyramid_request, simple_index_config):
+        pyramid_request.db = pretend.stub(
+            query=lambda *a: pretend.stub(scalar=lambda: 12)
+        )
+        pyramid_request.registry["sqlalchemy.engine"] = pretend.stub()
+        pyramid_request.registry.settings["warehouse.commit"] = "abc"
+        return pyramid_request
+
+    def test_streams_in_chunks(self, monkeypatch, projects, request_):
+        monkeypatch.setattr(simple, "SIMPLE_INDEX_CHUNK_SIZE", 100)
+
+        resp = simple.simple_index(request_)
+        chunks = list(resp.app_iter)
+
+        assert len(chunks) > 1
+        assert all(isinstance(chunk, bytes) for chunk in chunks)
+        assert _simple_index_body(
+            (p.name, p.normalized_name) for p in projects.rows
+        ) in _strip_lines(b"".join(chunks))
+        assert projects.state["engines"] == [request_.registry["sqlalchemy.engine"]]
+        assert projects.state["closed"]
+
+    def test_is_lazy(self, projects, request_):
+        resp = simple.simple_index(request_)
+
+        assert resp.content_length is None
+        assert projects.state["engines"] == []
+
+    def test_sets_etag(self, projects, request_):
+        resp = simple.simple_index(request_)
+
+        assert resp.etag == "simple-index-abc-12"
+        assert resp.headers["X-PyPI-Last-Serial"] == "12"
+
+    def test_closes_projects_on_early_close(self, monkeypatch, projects, request_):
+        monkeypatch.setattr(simple, "SIMPLE_INDEX_CHUNK_SIZE", 100)
+
+        resp = simple.simple_index(request_)
+        app_iter = iter(resp.app_iter)
+        next(app_iter)
+
+        assert not projects.state["closed"]
+
+        app_iter.close()
+
+        assert projects.state["closed"]
+
+
+def _file_data(file_):
+    data = {
+        "filename": file_.filename,
+        "url": "/the/file/",
+        "hashes": {"sha256": file_.sha256_digest},
+    }
+    if file_.release.requires_python:
+        data["requires-python"] = file_.release.requires_python
+    if file_.metadata_file_sha256_digest:
+        data["dist-info-metadata"] = {"sha256": file_.metadata_file_sha256_digest}
+    return data
+
+
 class TestSimpleDetail:
+    @pytest.fixture
+    def db_request(self, db_request):
+        db_request.route_url = pretend.call_recorder(lambda *a, **kw: "/the/file/")
+        return db_request
+
+    @pytest.fixture
+    def render(self, monkeypatch):
+        render = pretend.call_recorder(lambda *a, **kw: "<html></html>")
+        monkeypatch.setattr(simple, "render", render)
+        return render
+
     def test_redirects(self, pyramid_request):
         project = pretend.stub(normalized_name="foo")
 
@@ -75,19 +210,26 @@ class TestSimpleDetail:
         assert resp.headers["Location"] == "/foobar/"
         assert pyramid_request.current_route_path.calls == [pretend.call(name="foo")]
 
-    def test_no_files_no_serial(self, db_request):
+    def test_no_files_no_serial(self, db_request, render):
         project = ProjectFactory.create()
         db_request.matchdict["name"] = project.normalized_name
         user = UserFactory.create()
         JournalEntryFactory.create(submitted_by=user)
 
-        assert simple.simple_detail(project, db_request) == {
-            "project": project,
-            "files": [],
-        }
+        resp = simple.simple_detail(project, db_request)
+
+        assert resp is db_request.response
+        assert resp.body == b"<html></html>"
+        assert render.calls == [
+            pretend.call(
+                "legacy/api/simple/detail.html",
+                {"project": project, "files": []},
+                request=db_request,
+            )
+        ]
         assert db_request.response.headers["X-PyPI-Last-Serial"] == "0"
 
-    def test_no_files_with_serial(self, db_request):
+    def test_no_files_with_serial(self, db_request, render):
         project = ProjectFactory.create()
         db_request.matchdict["name"] = project.normalized_name
         user = UserFactory.create()
@@ -97,13 +239,12 @@ class TestSimpleDetail:
         # saved.
         db_request.db.refresh(project)
 
-        assert simple.simple_detail(project, db_request) == {
-            "project": project,
-            "files": [],
-        }
+        simple.simple_detail(project, db_request)
+
+        assert render.calls[0].args[1] == {"project": project, "files": []}
         assert db_request.response.headers["X-PyPI-Last-Serial"] == str(je.id)
 
-    def test_with_files_no_serial(self, db_request):
+    def test_with_files_no_serial(self, db_request, render):
         project = ProjectFactory.create()
         releases = [ReleaseFactory.create(project=project) for _ in range(3)]
         files = [
@@ -122,13 +263,15 @@ class TestSimpleDetail:
         # saved.
         db_request.db.refresh(project)
 
-        assert simple.simple_detail(project, db_request) == {
+        simple.simple_detail(project, db_request)
+
+        assert render.calls[0].args[1] == {
             "project": project,
-            "files": files,
+            "files": [_file_data(f) for f in files],
         }
         assert db_request.response.headers["X-PyPI-Last-Serial"] == "0"
 
-    def test_with_files_with_serial(self, db_request):
+    def test_with_files_with_serial(self, db_request, render):
         project = ProjectFactory.create()
         releases = [ReleaseFactory.create(project=project) for _ in range(3)]
         files = [
@@ -147,13 +290,15 @@ class TestSimpleDetail:
         # saved.
         db_request.db.refresh(project)
 
-        assert simple.simple_detail(project, db_request) == {
+        simple.simple_detail(project, db_request)
+
+        assert render.calls[0].args[1] == {
             "project": project,
-            "files": files,
+            "files": [_file_data(f) for f in files],
         }
         assert db_request.response.headers["X-PyPI-Last-Serial"] == str(je.id)
 
-    def test_with_files_with_version_multi_digit(self, db_request):
+    def test_with_files_with_version_multi_digit(self, db_request, render):
         project = ProjectFactory.create()
         releases = [ReleaseFactory.create(project=project) for _ in range(3)]
         release_versions = [
@@ -205,9 +350,361 @@ class TestSimpleDetail:
         # saved.
         db_request.db.refresh(project)
 
-        assert simple.simple_detail(project, db_request) == {
+        simple.simple_detail(project, db_request)
+
+        assert render.calls[0].args[1] == {
             "project": project,
-            "files": files,
+            "files": [_file_data(f) for f in files],
         }
-
         assert db_request.response.headers["X-PyPI-Last-Serial"] == str(je.id)
+
+    def test_with_files_json(self, db_request):
+        project = ProjectFactory.create()
+        release = ReleaseFactory.create(project=project, requires_python=">=3.6")
+        file_ = FileFactory.create(
+            release=release,
+            filename="{}-{}.tar.gz".format(project.name, release.version),
+        )
+        db_request.matchdict["name"] = project.normalized_name
+        db_request.accept = create_accept_header("application/vnd.pypi.simple.v1+json")
+        db_request.db.refresh(project)
+
+        resp = simple.simple_detail(project, db_request)
+
+        assert resp.content_type == "application/vnd.pypi.simple.v1+json"
+        assert json.loads(resp.body) == {
+            "meta": {"api-version": "1.0", "_last-serial": project.last_serial},
+            "name": project.normalized_name,
+            "files": [
+                {
+                    "filename": file_.filename,
+                    "url": "/the/file/",
+                    "hashes": {"sha256": file_.sha256_digest},
+                    "requires-python": ">=3.6",
+                }
+            ],
+        }
+
+    @pytest.mark.parametrize(
+        ("accept", "fmt", "content_type"),
+        [
+            (None, "html", "text/html"),
+            ("text/html", "html", "text/html"),
+            (
+                "application/vnd.pypi.simple.v1+html",
+                "html",
+                "application/vnd.pypi.simple.v1+html",
+            ),
+            ("image/png", "html", "text/html"),
+            (
+                "text/html;q=0.1, application/vnd.pypi.simple.v1+json",
+                "json",
+                "application/vnd.pypi.simple.v1+json",
+            ),
+        ],
+    )
+    def test_serves_stored_rendering(
+        self, pyramid_request, pyramid_services, accept, fmt, content_type
+    ):
+        project = pretend.stub(normalized_name="foo", last_serial=12)
+        content = {
+            "html": b"<html></html>\n<!--SERIAL 12-->\n",
+            "json": b'{"meta":{"_last-serial":12,"api-version":"1.0"}}',
+        }[fmt]
+        storage = pretend.stub(
+            get=pretend.call_recorder(
+                lambda path: pretend.stub(read=lambda: content, close=lambda: None)
+            )
+        )
+        pyramid_services.register_service(ISimpleStorage, None, storage)
+        pyramid_request.matchdict["name"] = "foo"
+        pyramid_request.accept = create_accept_header(accept)
+
+        resp = simple.simple_detail(project, pyramid_request)
+
+        assert resp is pyramid_request.response
+        assert resp.body == content
+        assert resp.content_type == content_type
+        assert resp.charset == "UTF-8"
+        assert resp.headers["X-PyPI-Last-Serial"] == "12"
+        assert storage.get.calls == [pretend.call("foo/index.{}".format(fmt))]
+
+    @pytest.mark.parametrize(
+        ("accept", "content"),
+        [
+            ("text/html", b"<html></html>\n<!--SERIAL 12-->"),
+            (
+                "application/vnd.pypi.simple.v1+json",
+                b'{"meta":{"_last-serial":12,"api-version":"1.0"}}',
+            ),
+            ("application/vnd.pypi.simple.v1+json", b"<html></html>"),
+        ],
+    )
+    def test_stored_rendering_old_serial(
+        self, monkeypatch, pyramid_request, pyramid_services, accept, content
+    ):
+        project = pretend.stub(normalized_name="foo", last_serial=13)
+        storage = pretend.stub(
+            get=lambda path: pretend.stub(read=lambda: content, close=lambda: None)
+        )
+        pyramid_services.register_service(ISimpleStorage, None, storage)
+        data = {"meta": {}, "name": "foo", "files": []}
+        simple_detail_data = pretend.call_recorder(lambda p, r: data)
+        monkeypatch.setattr(simple, "simple_detail_data", simple_detail_data)
+        render_simple_detail = pretend.call_recorder(lambda p, r, data: b"<html>")
+        monkeypatch.setattr(simple, "render_simple_detail", render_simple_detail)
+        delay = pretend.call_recorder(lambda *a: None)
+        pyramid_request.task = pretend.call_recorder(
+            lambda t: pretend.stub(delay=delay)
+        )
+        pyramid_request.matchdict["name"] = "foo"
+        pyramid_request.accept = create_accept_header(accept)
+
+        resp = simple.simple_detail(project, pyramid_request)
+
+        assert pyramid_request.task.calls == [pretend.call(simple.update_simple_detail)]
+        assert delay.calls == [pretend.call("foo")]
+        assert simple_detail_data.calls == [pretend.call(project, pyramid_request)]
+        if accept == "text/html":
+            assert resp.body == b"<html>"
+            assert render_simple_detail.calls == [
+                pretend.call(project, pyramid_request, data=data)
+            ]
+        else:
+            assert resp.body == simple.serialize_simple_detail(data)
+            assert render_simple_detail.calls == []
+
+    def test_no_stored_rendering(self, monkeypatch, pyramid_request, pyramid_services):
+        project = pretend.stub(normalized_name="foo", last_serial=13)
+
+        def get(path):
+            raise FileNotFoundError
+
+        pyramid_services.register_service(ISimpleStorage, None, pretend.stub(get=get))
+        data = {"meta": {}, "name": "foo", "files": []}
+        monkeypatch.setattr(simple, "simple_detail_data", lambda p, r: data)
+        monkeypatch.setattr(
+            simple, "render_simple_detail", lambda p, r, data: b"<html>"
+        )
+        delay = pretend.call_recorder(lambda *a: None)
+        pyramid_request.task = pretend.call_recorder(
+            lambda t: pretend.stub(delay=delay)
+        )
+        pyramid_request.matchdict["name"] = "foo"
+
+        resp = simple.simple_detail(project, pyramid_request)
+
+        assert resp.body == b"<html>"
+        assert pyramid_request.task.calls == [pretend.call(simple.update_simple_detail)]
+        assert delay.calls == [pretend.call("foo")]
+
+
+class TestRenderSimpleDetail:
+    def test_simple_detail_data(self, monkeypatch, pyramid_request):
+        project = pretend.stub(normalized_name="foo", last_serial=7)
+        files = [
+            pretend.stub(
+                filename="foo-1.0.tar.gz",
+                path="ab/foo-1.0.tar.gz",
+                sha256_digest="abcdef",
+                metadata_file_sha256_digest=None,
+                release=pretend.stub(requires_python=None),
+            ),
+            pretend.stub(
+                filename="foo-2.0-py3-none-any.whl",
+                path="cd/foo-2.0-py3-none-any.whl",
+                sha256_digest="123456",
+                metadata_file_sha256_digest="7890ab",
+                release=pretend.stub(requires_python=">=3.6"),
+            ),
+        ]
+        _simple_detail_files = pretend.call_recorder(lambda p, r: files)
+        monkeypatch.setattr(simple, "_simple_detail_files", _simple_detail_files)
+        pyramid_request.route_url = pretend.call_recorder(
+            lambda name, path: "/files/" + path
+        )
+
+        assert simple.simple_detail_data(project, pyramid_request) == {
+            "meta": {"api-version": "1.0", "_last-serial": 7},
+            "name": "foo",
+            "files": [
+                {
+                    "filename": "foo-1.0.tar.gz",
+                    "url": "/files/ab/foo-1.0.tar.gz",
+                    "hashes": {"sha256": "abcdef"},
+                },
+                {
+                    "filename": "foo-2.0-py3-none-any.whl",
+                    "url": "/files/cd/foo-2.0-py3-none-any.whl",
+                    "hashes": {"sha256": "123456"},
+                    "requires-python": ">=3.6",
+                    "dist-info-metadata": {"sha256": "7890ab"},
+                },
+            ],
+        }
+        assert _simple_detail_files.calls == [pretend.call(project, pyramid_request)]
+        assert pyramid_request.route_url.calls == [
+            pretend.call("packaging.file", path="ab/foo-1.0.tar.gz"),
+            pretend.call("packaging.file", path="cd/foo-2.0-py3-none-any.whl"),
+        ]
+
+    def test_render_simple_detail(self, monkeypatch, pyramid_request):
+        project = pretend.stub(normalized_name="foo")
+        files = [pretend.stub()]
+        monkeypatch.setattr(simple, "simple_detail_data", lambda p, r: {"files": files})
+        render = pretend.call_recorder(lambda *a, **kw: "<html>\u2603</html>")
+        monkeypatch.setattr(simple, "render", render)
+
+        assert simple.render_simple_detail(
+            project, pyramid_request
+        ) == "<html>\u2603</html>".encode("utf8")
+        assert render.calls == [
+            pretend.call(
+                "legacy/api/simple/detail.html",
+                {"project": project, "files": files},
+                request=pyramid_request,
+            )
+        ]
+
+    def test_render_simple_detail_with_data(self, monkeypatch, pyramid_request):
+        project = pretend.stub(normalized_name="foo")
+        files = [pretend.stub()]
+        render = pretend.call_recorder(lambda *a, **kw: "<html></html>")
+        monkeypatch.setattr(simple, "render", render)
+
+        assert (
+            simple.render_simple_detail(project, pyramid_request, data={"files": files})
+            == b"<html></html>"
+        )
+        assert render.calls[0].args[1] == {"project": project, "files": files}
+
+    def test_serialize_simple_detail(self):
+        data = {"name": "foo", "meta": {"api-version": "1.0"}, "files": []}
+
+        assert simple.serialize_simple_detail(data) == (
+            b'{"files":[],"meta":{"api-version":"1.0"},"name":"foo"}'
+        )
+
+    def test_store_simple_detail(self, monkeypatch, pyramid_request, pyramid_services):
+        project = pretend.stub(normalized_name="foo", last_serial=3)
+        data = {"name": "foo"}
+        simple_detail_data = pretend.call_recorder(lambda p, r: data)
+        monkeypatch.setattr(simple, "simple_detail_data", simple_detail_data)
+        monkeypatch.setattr(
+            simple, "render_simple_detail", lambda p, r, data: b"<html>"
+        )
+        stored = {}
+
+        def store(path, file_path, *, meta=None):
+            with open(file_path, "rb") as fp:
+                stored[path] = (fp.read(), meta)
+
+        pyramid_services.register_service(
+            ISimpleStorage, None, pretend.stub(store=store)
+        )
+
+        simple.store_simple_detail(project, pyramid_request)
+
+        assert simple_detail_data.calls == [pretend.call(project, pyramid_request)]
+        assert stored == {
+            "foo/index.html": (
+                b"<html>",
+                {"project": "foo", "pypi-last-serial": "3"},
+            ),
+            "foo/index.json": (
+                b'{"name":"foo"}',
+                {"project": "foo", "pypi-last-serial": "3"},
+            ),
+        }
+
+
+class TestUpdateSimpleDetail:
+    def test_renders_project(self, monkeypatch, db_request):
+        project = ProjectFactory.create()
+        store_simple_detail = pretend.call_recorder(lambda p, r: None)
+        monkeypatch.setattr(simple, "store_simple_detail", store_simple_detail)
+        db_request.log = pretend.stub(info=pretend.call_recorder(lambda *a: None))
+
+        simple.update_simple_detail(pretend.stub(), db_request, project.name)
+
+        assert store_simple_detail.calls == [pretend.call(project, db_request)]
+
+    def test_missing_project(self, monkeypatch, db_request):
+        store_simple_detail = pretend.call_recorder(lambda p, r: None)
+        monkeypatch.setattr(simple, "store_simple_detail", store_simple_detail)
+
+        simple.update_simple_detail(pretend.stub(), db_request, "missing")
+
+        assert store_simple_detail.calls == []
+
+    def test_retries_on_error(self, monkeypatch, db_request):
+        project = ProjectFactory.create()
+        exc = ValueError("failed")
+
+        def store_simple_detail(project, request):
+            raise exc
+
+        monkeypatch.setattr(simple, "store_simple_detail", store_simple_detail)
+        db_request.log = pretend.stub(
+            info=lambda *a: None, error=pretend.call_recorder(lambda *a: None)
+        )
+
+        class Task:
+            @staticmethod
+            @pretend.call_recorder
+            def retry(exc):
+                raise celery.exceptions.Retry
+
+        task = Task()
+
+        with pytest.raises(celery.exceptions.Retry):
+            simple.update_simple_detail(task, db_request, project.name)
+
+        assert task.retry.calls == [pretend.call(exc=exc)]
+
+
+def test_store_projects_for_simple_update(db_request):
+    project0 = ProjectFactory.create()
+    release0 = ReleaseFactory.create(project=project0)
+    project1 = ProjectFactory.create()
+    file1 = FileFactory.create(release=ReleaseFactory.create(project=project1))
+    project2 = ProjectFactory.create()
+    config = pretend.stub()
+    session = pretend.stub(info={}, new={release0}, dirty={project2}, deleted={file1})
+
+    simple.store_projects_for_simple_update(config, session, pretend.stub())
+
+    assert session.info["warehouse.legacy.api.simple.updates"] == {
+        project0.normalized_name,
+        project1.normalized_name,
+    }
+
+
+def test_execute_simple_update():
+    delay = pretend.call_recorder(lambda name: None)
+    config = pretend.stub(
+        find_service_factory=pretend.call_recorder(lambda iface: pretend.stub()),
+        task=pretend.call_recorder(lambda t: pretend.stub(delay=delay)),
+    )
+    session = pretend.stub(info={"warehouse.legacy.api.simple.updates": {"foo"}})
+
+    simple.execute_simple_update(config, session)
+
+    assert config.find_service_factory.calls == [pretend.call(ISimpleStorage)]
+    assert config.task.calls == [pretend.call(simple.update_simple_detail)]
+    assert delay.calls == [pretend.call("foo")]
+    assert "warehouse.legacy.api.simple.updates" not in session.info
+
+
+def test_execute_simple_update_no_storage():
+    @pretend.call_recorder
+    def find_service_factory(iface):
+        raise LookupError
+
+    config = pretend.stub(find_service_factory=find_service_factory)
+    session = pretend.stub(info={"warehouse.legacy.api.simple.updates": {"foo"}})
+
+    simple.execute_simple_update(config, session)
+
+    assert find_service_factory.calls == [pretend.call(ISimpleStorage)]
+    assert "warehouse.legacy.api.simple.updates" not in session.info
@@ -22,11 +22,19 @@ from warehouse.legacy.api.xmlrpc.cache import services
 from warehouse.legacy.api.xmlrpc import cache
 from warehouse.legacy.api.xmlrpc.cache import (
     cached_return_view,
+    LocalLru,
     NullXMLRPCCache,
     RedisLru,
     RedisXMLRPCCache,
 )
 from warehouse.legacy.api.xmlrpc.cache.interfaces import CacheError, IXMLRPCCache
+from warehouse.legacy.api.xmlrpc.cache import fncache
+from warehouse.legacy.api.xmlrpc.cache.fncache import DEFAULT_EXPIRES
+from warehouse.legacy.api.xmlrpc.cache.serializers import (
+    JSONSerializer,
+    MsgpackSerializer,
+)
+from warehouse.metrics import IMetricsService
 
 
 @pytest.fixture
@@ -84,7 +92,12 @@ class TestRedisXMLRPCCache:
         ]
         assert redis_lru_cls.calls == [
             pretend.call(
-                strict_redis_obj, name="lru", expires=None, metric_reporter=None
+                strict_redis_obj,
+                name="lru",
+                expires=None,
+                metric_reporter=None,
+                local=None,
+                serializer=None,
             )
         ]
 
@@ -140,6 +153,77 @@ class TestIncludeMe:
             )
         ]
 
+    def test_local_configuration(self, monkeypatch):
+        monkeypatch.setattr(
+            cache, "RedisXMLRPCCache", pretend.stub(create_service=pretend.stub())
+        )
+
+        registry = {}
+        config = pretend.stub(
+            add_view_deriver=lambda deriver, over=None, under=None: None,
+            register_service_factory=lambda service, iface=None: None,
+            registry=pretend.stub(
+                settings={
+                    "warehouse.xmlrpc.cache.url": "redis://",
+                    "warehouse.xmlrpc.cache.local_size": 100,
+                    "warehouse.xmlrpc.cache.local_ttl": "10",
+                },
+                __setitem__=registry.__setitem__,
+            ),
+        )
+
+        cache.includeme(config)
+
+        local = registry["warehouse.xmlrpc.cache.local"]
+        assert isinstance(local, LocalLru)
+        assert local.maxsize == 100
+        assert local.ttl == 10
+
+    @pytest.mark.parametrize(
+        ("settings", "serializer_cls"),
+        [
+            ({}, MsgpackSerializer),
+            ({"warehouse.xmlrpc.cache.serializer": "json"}, JSONSerializer),
+        ],
+    )
+    def test_serializer_configuration(self, monkeypatch, settings, serializer_cls):
+        monkeypatch.setattr(
+            cache, "RedisXMLRPCCache", pretend.stub(create_service=pretend.stub())
+        )
+
+        registry = {}
+        config = pretend.stub(
+            add_view_deriver=lambda deriver, over=None, under=None: None,
+            register_service_factory=lambda service, iface=None: None,
+            registry=pretend.stub(
+                settings=dict(settings, **{"warehouse.xmlrpc.cache.url": "redis://"}),
+                __setitem__=registry.__setitem__,
+            ),
+        )
+
+        cache.includeme(config)
+
+        assert isinstance(registry["warehouse.xmlrpc.cache.serializer"], serializer_cls)
+
+    @pytest.mark.parametrize(
+        "settings",
+        [
+            {"warehouse.xmlrpc.cache.serializer": "pickle"},
+            {"warehouse.xmlrpc.cache.compression": "bzip2"},
+        ],
+    )
+    def test_bad_serializer_configuration(self, settings):
+        registry = {}
+        config = pretend.stub(
+            registry=pretend.stub(
+                settings=dict(settings, **{"warehouse.xmlrpc.cache.url": "redis://"}),
+                __setitem__=registry.__setitem__,
+            )
+        )
+
+        with pytest.raises(ConfigurationError):
+            cache.includeme(config)
+
     def test_no_url_configuration(self, monkeypatch):
         registry = {}
         config = pretend.stub(
@@ -197,13 +281,29 @@ class TestIncludeMe:
             pretend.call("evah"),
         ]
 
-    def test_create_redis_service(self):
+    @pytest.mark.parametrize("local", [None, LocalLru(10, 5)])
+    def test_create_redis_service(self, local):
         purge_tags = pretend.stub(delay=pretend.call_recorder(lambda tag: None))
+        metrics = pretend.stub(increment=lambda *a, **kw: None)
+        serializer = MsgpackSerializer()
         request = pretend.stub(
-            registry=pretend.stub(settings={"warehouse.xmlrpc.cache.url": "redis://"}),
+            registry=pretend.stub(
+                settings={"warehouse.xmlrpc.cache.url": "redis://"},
+                get={
+                    "warehouse.xmlrpc.cache.local": local,
+                    "warehouse.xmlrpc.cache.serializer": serializer,
+                }.get,
+            ),
             task=lambda f: purge_tags,
+            find_service=pretend.call_recorder(lambda iface, context=None: metrics),
         )
         service = RedisXMLRPCCache.create_service(None, request)
+        assert request.find_service.calls == [
+            pretend.call(IMetricsService, context=None)
+        ]
+        assert service.redis_lru.local is local
+        assert service.redis_lru.serializer is serializer
+        assert service.redis_lru.metric_reporter is metrics
         service.purge_tags(["wu", "tang", "4", "evah"])
         assert isinstance(service, RedisXMLRPCCache)
         assert service._purger is purge_tags.delay
@@ -276,14 +376,50 @@ class TestRedisLru:
             pretend.call("lru.cache.hit"),
         ]
 
+    def test_redis_purge_only_tag(self, fakeredis):
+        redis_lru = RedisLru(fakeredis)
+
+        def other_func_test(arg0):
+            return [arg0]
+
+        redis_lru.fetch(func_test, [0, 1], {}, "a", "test", None)
+        redis_lru.fetch(other_func_test, [0], {}, "a", "test", None)
+        redis_lru.fetch(func_test, [0, 1], {}, "a", "other", None)
+        redis_lru.fetch(func_test, [0, 1], {}, "a", None, None)
+
+        assert fakeredis.smembers("lru:tag-index:test") == {
+            b"lru:test:func_test",
+            b"lru:test:other_func_test",
+        }
+        assert 0 < fakeredis.ttl("lru:tag-index:test") <= DEFAULT_EXPIRES
+
+        redis_lru.purge("test")
+
+        assert not fakeredis.exists("lru:test:func_test")
+        assert not fakeredis.exists("lru:test:other_func_test")
+        assert not fakeredis.exists("lru:tag-index:test")
+        assert fakeredis.exists("lru:other:func_test")
+        assert fakeredis.exists("lru:tag:func_test")
+        assert fakeredis.smembers("lru:tag-index:tag") == {b"lru:tag:func_test"}
+
+    def test_redis_purge_unknown_tag(self, fakeredis):
+        metric_reporter = pretend.stub(
+            increment=pretend.call_recorder(lambda *args: None)
+        )
+        redis_lru = RedisLru(fakeredis, metric_reporter=metric_reporter)
+
+        redis_lru.purge("test")
+
+        assert metric_reporter.increment.calls == [pretend.call("lru.cache.purge")]
+
     def test_redis_down(self):
         metric_reporter = pretend.stub(
             increment=pretend.call_recorder(lambda *args: None)
         )
         down_redis = pretend.stub(
-            hget=pretend.raiser(redis.exceptions.RedisError),
+            hmget=pretend.raiser(redis.exceptions.RedisError),
             pipeline=pretend.raiser(redis.exceptions.RedisError),
-            scan_iter=pretend.raiser(redis.exceptions.RedisError),
+            smembers=pretend.raiser(redis.exceptions.RedisError),
         )
         redis_lru = RedisLru(down_redis, metric_reporter=metric_reporter)
 
@@ -309,6 +445,242 @@ class TestRedisLru:
         ]
 
 
+class TestRedisLruStampede:
+    def test_caches_falsy_values(self, fakeredis):
+        calls = []
+
+        def empty():
+            calls.append(None)
+            return []
+
+        redis_lru = RedisLru(fakeredis)
+
+        assert redis_lru.fetch(empty, [], {}, "key", "test", None) == []
+        assert redis_lru.fetch(empty, [], {}, "key", "test", None) == []
+        assert len(calls) == 1
+
+    def test_stores_meta(self, fakeredis, monkeypatch):
+        monkeypatch.setattr(fncache.time, "time", lambda: 1000)
+        redis_lru = RedisLru(fakeredis)
+
+        redis_lru.add("func_test", "key", [], "test", 60, delta=2.5)
+
+        assert fakeredis.hget("lru:test:func_test", "key:meta") == b"2.5 1060"
+
+    def test_waits_for_lock_holder(self, fakeredis, monkeypatch):
+        redis_lru = RedisLru(fakeredis)
+        fakeredis.set("lru:test:func_test:lock:key", "someone else")
+
+        def sleep(seconds):
+            # The worker holding the lock stores the value while we wait.
+            redis_lru.add("func_test", "key", ["computed"], "test", None)
+
+        monkeypatch.setattr(fncache.time, "sleep", sleep)
+        func = pretend.call_recorder(func_test)
+        func.__name__ = "func_test"
+
+        assert redis_lru.fetch(func, [0, 1], {}, "key", "test", None) == ["computed"]
+        assert func.calls == []
+
+    def test_computes_when_wait_times_out(self, fakeredis, monkeypatch):
+        metric_reporter = pretend.stub(
+            increment=pretend.call_recorder(lambda *args: None)
+        )
+        redis_lru = RedisLru(fakeredis, metric_reporter=metric_reporter)
+        fakeredis.set("lru:test:func_test:lock:key", "someone else")
+        monkeypatch.setattr(fncache, "LOCK_WAIT", 0)
+
+        assert redis_lru.fetch(func_test, [0, 1], {}, "key", "test", None) == (
+            func_test(0, 1)
+        )
+        assert metric_reporter.increment.calls == [
+            pretend.call("lru.cache.wait"),
+            pretend.call("lru.cache.miss"),
+        ]
+        # The lock wasn't ours, so we left it alone.
+        assert fakeredis.get("lru:test:func_test:lock:key") == b"someone else"
+
+    def test_releases_lock(self, fakeredis):
+        redis_lru = RedisLru(fakeredis)
+
+        redis_lru.fetch(func_test, [0, 1], {}, "key", "test", None)
+
+        assert not fakeredis.exists("lru:test:func_test:lock:key")
+
+    def test_releases_lock_on_error(self, fakeredis):
+        class TestException(Exception):
+            pass
+
+        def func_test():
+            raise TestException
+
+        redis_lru = RedisLru(fakeredis)
+
+        with pytest.raises(TestException):
+            redis_lru.fetch(func_test, [], {}, "key", "test", None)
+
+        assert not fakeredis.exists("lru:test:func_test:lock:key")
+
+    @pytest.mark.parametrize(("refresh", "locked"), [(True, False), (True, True)])
+    def test_early_refresh(self, fakeredis, monkeypatch, refresh, locked):
+        metric_reporter = pretend.stub(
+            increment=pretend.call_recorder(lambda *args: None)
+        )
+        redis_lru = RedisLru(fakeredis, metric_reporter=metric_reporter)
+        redis_lru.add("func_test", "key", ["stale"], "test", None, delta=1)
+        monkeypatch.setattr(redis_lru, "_should_refresh", lambda meta: refresh)
+        if locked:
+            fakeredis.set("lru:test:func_test:lock:key", "someone else")
+
+        value = redis_lru.fetch(func_test, [0, 1], {}, "key", "test", None)
+
+        if locked:
+            assert value == ["stale"]
+        else:
+            assert value == func_test(0, 1)
+            assert redis_lru.get("func_test", "key", "test") == func_test(0, 1)
+            assert pretend.call("lru.cache.refresh") in metric_reporter.increment.calls
+
+    @pytest.mark.parametrize(
+        ("meta", "random", "expected"),
+        [
+            (None, 0.5, False),
+            (b"1 2000", 0.5, False),
+            (b"1 1000.5", 0.5, True),
+            (b"1000 2000", 0.9, True),
+            (b"1000 2000", 0.1, False),
+        ],
+    )
+    def test_should_refresh(self, monkeypatch, meta, random, expected):
+        monkeypatch.setattr(fncache.time, "time", lambda: 1000)
+        monkeypatch.setattr(fncache.random, "random", lambda: random)
+        redis_lru = RedisLru(pretend.stub())
+
+        assert redis_lru._should_refresh(meta) is expected
+
+
+class TestSerializers:
+    VALUE = {"foo": [1, 2, None, True], "bar": {"baz": "qux" * 10}}
+
+    @pytest.mark.parametrize(
+        "serializer",
+        [
+            JSONSerializer(),
+            MsgpackSerializer(),
+            MsgpackSerializer(compression="zlib", compression_threshold=0),
+            MsgpackSerializer(compression="zlib", compression_threshold=1000),
+        ],
+    )
+    def test_round_trip(self, serializer):
+        payload = serializer.dumps(self.VALUE)
+        assert isinstance(payload, bytes)
+        assert serializer.loads(payload) == self.VALUE
+
+    def test_compresses_above_threshold(self):
+        serializer = MsgpackSerializer(compression="zlib", compression_threshold=10)
+        uncompressed = MsgpackSerializer().dumps(self.VALUE)
+        payload = serializer.dumps(self.VALUE)
+
+        assert payload[:1] == b"\x02"
+        assert len(payload) < len(uncompressed)
+        assert serializer.dumps([]) == MsgpackSerializer().dumps([])
+
+    def test_reads_json_payloads(self):
+        payload = JSONSerializer().dumps(self.VALUE)
+        assert MsgpackSerializer().loads(payload) == self.VALUE
+
+    def test_reads_any_compression(self):
+        payload = MsgpackSerializer(compression="zlib", compression_threshold=0).dumps(
+            self.VALUE
+        )
+        assert MsgpackSerializer().loads(payload) == self.VALUE
+
+    def test_unknown_compression(self):
+        with pytest.raises(ValueError):
+            MsgpackSerializer(compression="bzip2")
+
+    @pytest.mark.parametrize("compression", [None, "zlib"])
+    def test_redis_lru(self, fakeredis, compression):
+        metric_reporter = pretend.stub(
+            increment=pretend.call_recorder(lambda *args: None),
+            histogram=pretend.call_recorder(lambda *args: None),
+        )
+        serializer = MsgpackSerializer(
+            compression=compression, compression_threshold=10
+        )
+        redis_lru = RedisLru(
+            fakeredis, metric_reporter=metric_reporter, serializer=serializer
+        )
+        payload = serializer.dumps(self.VALUE)
+
+        def func_test():
+            return self.VALUE
+
+        assert redis_lru.fetch(func_test, [], {}, "key", "test", None) == self.VALUE
+        assert redis_lru.fetch(func_test, [], {}, "key", "test", None) == self.VALUE
+        assert fakeredis.hget("lru:test:func_test", "key") == payload
+        assert metric_reporter.histogram.calls == [
+            pretend.call("lru.cache.size", len(payload))
+        ]
+
+
+class TestLocalLru:
+    def test_get_set(self):
+        now = [0]
+        local = LocalLru(2, 5, clock=lambda: now[0])
+
+        assert local.get("a") is None
+        local.set("a", [])
+        assert local.get("a") == []
+
+        now[0] = 5
+        assert local.get("a", "missing") == "missing"
+
+    def test_evicts_least_recently_used(self):
+        local = LocalLru(2, 5)
+
+        local.set("a", 1)
+        local.set("b", 2)
+        local.get("a")
+        local.set("c", 3)
+
+        assert local.get("a") == 1
+        assert local.get("b") is None
+        assert local.get("c") == 3
+
+    def test_purge(self):
+        local = LocalLru(10, 5)
+        local.set(("lru:test:func", "key"), 1)
+        local.set(("lru:other:func", "key"), 2)
+
+        local.purge(lambda k: k[0].startswith("lru:test:"))
+
+        assert local.get(("lru:test:func", "key")) is None
+        assert local.get(("lru:other:func", "key")) == 2
+
+    def test_redis_lru_uses_local(self, fakeredis):
+        metric_reporter = pretend.stub(
+            increment=pretend.call_recorder(lambda *args: None)
+        )
+        redis_lru = RedisLru(
+            fakeredis, metric_reporter=metric_reporter, local=LocalLru(10, 5)
+        )
+
+        expected = func_test(0, 1)
+        assert redis_lru.fetch(func_test, [0, 1], {}, "key", "test", None) == expected
+        assert redis_lru.fetch(func_test, [0, 1], {}, "key", "test", None) == expected
+
+        redis_lru.purge("test")
+        assert redis_lru.fetch(func_test, [0, 1], {}, "key", "test", None) == expected
+
+        assert metric_reporter.increment.calls == [
+            pretend.call("lru.cache.miss"),
+            pretend.call("lru.cache.local.hit"),
+            pretend.call("lru.cache.purge"),
+            pretend.call("lru.cache.miss"),
+        ]
+
+
 class TestDeriver:
     @pytest.mark.parametrize(
         ("service_available", "xmlrpc_cache"),
@@ -459,6 +459,28 @@ def test_list_packages_with_serial(db_request):
     assert xmlrpc.list_packages_with_serial(db_request) == expected
 
 
+def test_list_packages_with_serial_from_redis(monkeypatch):
+    redis_conn = pretend.stub()
+    serials_redis = pretend.call_recorder(lambda settings: redis_conn)
+    get_project_serials = pretend.call_recorder(lambda conn: {"foo": 1})
+    monkeypatch.setattr(xmlrpc, "serials_redis", serials_redis)
+    monkeypatch.setattr(xmlrpc, "get_project_serials", get_project_serials)
+    request = pretend.stub(registry=pretend.stub(settings={}))
+
+    assert xmlrpc.list_packages_with_serial(request) == {"foo": 1}
+    assert serials_redis.calls == [pretend.call({})]
+    assert get_project_serials.calls == [pretend.call(redis_conn)]
+
+
+def test_list_packages_with_serial_not_built(db_request, monkeypatch):
+    monkeypatch.setattr(xmlrpc, "serials_redis", lambda settings: pretend.stub())
+    monkeypatch.setattr(xmlrpc, "get_project_serials", lambda conn: None)
+    project = ProjectFactory.create()
+    entry = JournalEntryFactory.create(name=project.name)
+
+    assert xmlrpc.list_packages_with_serial(db_request) == {project.name: entry.id}
+
+
 def test_package_hosting_mode_shows_none(db_request):
     assert xmlrpc.package_hosting_mode(db_request, "nope") == "pypi-only"
 
@@ -685,6 +707,32 @@ def test_package_roles(db_request):
     ]
 
 
+def test_changelog_last_serial_from_relay(monkeypatch):
+    redis_conn = pretend.stub()
+    monkeypatch.setattr(
+        xmlrpc.changelog_api, "changelog_redis", lambda settings: redis_conn
+    )
+    get_last_serial = pretend.call_recorder(lambda conn: 42)
+    monkeypatch.setattr(xmlrpc.changelog_api, "get_last_serial", get_last_serial)
+    request = pretend.stub(registry=pretend.stub(settings={}))
+
+    assert xmlrpc.changelog_last_serial(request) == 42
+    assert get_last_serial.calls == [pretend.call(redis_conn)]
+
+
+def test_changelog_last_serial_relay_not_running(monkeypatch):
+    monkeypatch.setattr(
+        xmlrpc.changelog_api, "changelog_redis", lambda settings: pretend.stub()
+    )
+    monkeypatch.setattr(xmlrpc.changelog_api, "get_last_serial", lambda conn: None)
+    request = pretend.stub(
+        registry=pretend.stub(settings={}),
+        db=pretend.stub(query=lambda *a: pretend.stub(scalar=lambda: 7)),
+    )
+
+    assert xmlrpc.changelog_last_serial(request) == 7
+
+
 def test_changelog_last_serial_none(db_request):
     assert xmlrpc.changelog_last_serial(db_request) is None
 
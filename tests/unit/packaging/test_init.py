@@ -12,18 +12,27 @@
 
 import pretend
 import pytest
+import redis
 
 from celery.schedules import crontab
 
 from warehouse import packaging
 from warehouse.accounts.models import Email, User
-from warehouse.packaging.interfaces import IFileStorage, IDocsStorage
-from warehouse.packaging.models import File, Project, Release, Role
-from warehouse.packaging.tasks import compute_trending
+from warehouse.packaging.interfaces import IFileStorage, IDocsStorage, ISimpleStorage
+from warehouse.packaging.models import File, JournalEntry, Project, Release, Role
+from warehouse.packaging.tasks import (
+    compute_trending,
+    promote_staged_files,
+    remove_orphaned_files,
+    reorder_releases,
+    sync_project_serials,
+)
 
 
+@pytest.mark.parametrize("with_serials", [True, False])
+@pytest.mark.parametrize("with_simple_storage", [True, False])
 @pytest.mark.parametrize("with_trending", [True, False])
-def test_includme(monkeypatch, with_trending):
+def test_includme(monkeypatch, with_trending, with_simple_storage, with_serials):
     storage_class = pretend.stub(
         create_service=pretend.call_recorder(lambda *a, **kw: pretend.stub())
     )
@@ -33,17 +42,20 @@ def test_includme(monkeypatch, with_trending):
 
     monkeypatch.setattr(packaging, "key_factory", key_factory)
 
+    settings = {"files.backend": "foo.bar", "docs.backend": "wu.tang"}
+    if with_simple_storage:
+        settings["simple.backend"] = "the.simple"
+
     config = pretend.stub(
         maybe_dotted=lambda dotted: storage_class,
         register_service_factory=pretend.call_recorder(
             lambda factory, iface, name=None: None
         ),
-        registry=pretend.stub(
-            settings={"files.backend": "foo.bar", "docs.backend": "wu.tang"}
-        ),
+        registry=pretend.stub(settings=settings),
         register_origin_cache_keys=pretend.call_recorder(lambda c, **kw: None),
-        get_settings=lambda: (
-            {"warehouse.trending_table": "foobar"} if with_trending else {}
+        get_settings=lambda: dict(
+            {"warehouse.trending_table": "foobar"} if with_trending else {},
+            **({"packaging.serials.redis_url": "redis://"} if with_serials else {}),
         ),
         add_periodic_task=pretend.call_recorder(lambda *a, **kw: None),
     )
@@ -53,7 +65,11 @@ def test_includme(monkeypatch, with_trending):
     assert config.register_service_factory.calls == [
         pretend.call(storage_class.create_service, IFileStorage),
         pretend.call(storage_class.create_service, IDocsStorage),
-    ]
+    ] + (
+        [pretend.call(storage_class.create_service, ISimpleStorage)]
+        if with_simple_storage
+        else []
+    )
     assert config.register_origin_cache_keys.calls == [
         pretend.call(
             File,
@@ -68,6 +84,7 @@ def test_includme(monkeypatch, with_trending):
                 key_factory("user/{itr.username}", iterate_on="users"),
                 key_factory("all-projects"),
             ],
+            purge_intervals={"all-projects": packaging.ALL_PROJECTS_PURGE_INTERVAL},
         ),
         pretend.call(
             Release,
@@ -77,6 +94,7 @@ def test_includme(monkeypatch, with_trending):
                 key_factory("user/{itr.username}", iterate_on="project.users"),
                 key_factory("all-projects"),
             ],
+            purge_intervals={"all-projects": packaging.ALL_PROJECTS_PURGE_INTERVAL},
         ),
         pretend.call(
             Role,
@@ -104,7 +122,155 @@ def test_includme(monkeypatch, with_trending):
         ),
     ]
 
-    if with_trending:
-        assert config.add_periodic_task.calls == [
-            pretend.call(crontab(minute=0, hour=3), compute_trending)
+    assert config.add_periodic_task.calls == (
+        [pretend.call(crontab(minute=0, hour=3), compute_trending)]
+        if with_trending
+        else []
+    ) + (
+        [pretend.call(crontab(minute="*"), sync_project_serials)]
+        if with_serials
+        else []
+    ) + [
+        pretend.call(crontab(minute="*/5"), promote_staged_files),
+        pretend.call(crontab(minute=30, hour=4), remove_orphaned_files),
+        pretend.call(crontab(minute=15), reorder_releases),
+    ]
+
+
+def test_store_journal_entries():
+    session = pretend.stub(
+        info={},
+        new={
+            JournalEntry(id=1, name="foo", action="create"),
+            JournalEntry(id=2, name="foo", action="new release"),
+            Project(name="foo"),
+        },
+    )
+
+    packaging.store_journal_entries(pretend.stub(), session, pretend.stub())
+
+    assert session.info["warehouse.packaging.journal_entries"] == {
+        (1, "foo", "create"),
+        (2, "foo", "new release"),
+    }
+
+
+class TestExecuteJournalEntries:
+    def test_applies_entries(self, monkeypatch):
+        redis_conn = pretend.stub()
+        serials_redis = pretend.call_recorder(lambda settings: redis_conn)
+        apply_journal_entries = pretend.call_recorder(lambda conn, entries: None)
+        monkeypatch.setattr(packaging, "serials_redis", serials_redis)
+        monkeypatch.setattr(packaging, "apply_journal_entries", apply_journal_entries)
+
+        config = pretend.stub(registry=pretend.stub(settings={}))
+        entries = {(1, "foo", "create")}
+        session = pretend.stub(info={"warehouse.packaging.journal_entries": entries})
+
+        packaging.execute_journal_entries(config, session)
+
+        assert session.info == {}
+        assert serials_redis.calls == [pretend.call({})]
+        assert apply_journal_entries.calls == [pretend.call(redis_conn, entries)]
+
+    def test_no_entries(self, monkeypatch):
+        serials_redis = pretend.call_recorder(lambda settings: None)
+        monkeypatch.setattr(packaging, "serials_redis", serials_redis)
+
+        packaging.execute_journal_entries(pretend.stub(), pretend.stub(info={}))
+
+        assert serials_redis.calls == []
+
+    def test_not_configured(self, monkeypatch):
+        monkeypatch.setattr(packaging, "serials_redis", lambda settings: None)
+        config = pretend.stub(registry=pretend.stub(settings={}))
+        session = pretend.stub(
+            info={"warehouse.packaging.journal_entries": {(1, "foo", "create")}}
+        )
+
+        packaging.execute_journal_entries(config, session)
+
+    def test_ignores_redis_errors(self, monkeypatch):
+        @pretend.call_recorder
+        def apply_journal_entries(conn, entries):
+            raise redis.exceptions.ConnectionError
+
+        monkeypatch.setattr(packaging, "serials_redis", lambda s: pretend.stub())
+        monkeypatch.setattr(packaging, "apply_journal_entries", apply_journal_entries)
+        config = pretend.stub(registry=pretend.stub(settings={}))
+        session = pretend.stub(
+            info={"warehouse.packaging.journal_entries": {(1, "foo", "create")}}
+        )
+
+        packaging.execute_journal_entries(config, session)
+
+        assert len(apply_journal_entries.calls) == 1
+
+
+def test_promote_on_commit():
+    storage = pretend.stub()
+    session = pretend.stub(info={})
+
+    packaging.promote_on_commit(session, storage, "a/b/foo.tar.gz")
+    packaging.promote_on_commit(session, storage, "a/b/foo.tar.gz.asc")
+
+    assert session.info["warehouse.packaging.staged_files"] == [
+        (storage, "a/b/foo.tar.gz"),
+        (storage, "a/b/foo.tar.gz.asc"),
+    ]
+
+
+class TestExecutePromoteStagedFiles:
+    def test_promotes_files(self):
+        storage = pretend.stub(promote=pretend.call_recorder(lambda path: None))
+        session = pretend.stub(
+            info={
+                "warehouse.packaging.staged_files": [
+                    (storage, "a/b/foo.tar.gz"),
+                    (storage, "a/b/foo.tar.gz.asc"),
+                ]
+            }
+        )
+
+        packaging.execute_promote_staged_files(pretend.stub(), session)
+
+        assert session.info == {}
+        assert storage.promote.calls == [
+            pretend.call("a/b/foo.tar.gz"),
+            pretend.call("a/b/foo.tar.gz.asc"),
+        ]
+
+    def test_no_files(self):
+        session = pretend.stub(info={})
+
+        packaging.execute_promote_staged_files(pretend.stub(), session)
+
+        assert session.info == {}
+
+    def test_ignores_errors(self, monkeypatch):
+        @pretend.call_recorder
+        def promote(path):
+            raise ValueError
+
+        logger = pretend.stub(exception=pretend.call_recorder(lambda *a, **kw: None))
+        monkeypatch.setattr(packaging, "logger", logger)
+        storage = pretend.stub(promote=promote)
+        session = pretend.stub(
+            info={
+                "warehouse.packaging.staged_files": [
+                    (storage, "a/b/foo.tar.gz"),
+                    (storage, "a/b/bar.tar.gz"),
+                ]
+            }
+        )
+
+        packaging.execute_promote_staged_files(pretend.stub(), session)
+
+        assert promote.calls == [
+            pretend.call("a/b/foo.tar.gz"),
+            pretend.call("a/b/bar.tar.gz"),
+        ]
+        assert logger.exception.calls == [
+            pretend.call("Error promoting staged file %s", "a/b/foo.tar.gz"),
+            pretend.call("Error promoting staged file %s", "a/b/bar.tar.gz"),
         ]
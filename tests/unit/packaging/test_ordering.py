@@ -0,0 +1,91 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+import packaging.version
+import pytest
+
+from warehouse.packaging.models import Release
+from warehouse.packaging.ordering import version_sort_key
+
+
+ORDERED_VERSIONS = [
+    "1.0.dev456",
+    "1.0a1",
+    "1.0a2.dev456",
+    "1.0a12.dev456",
+    "1.0a12",
+    "1.0b1.dev456",
+    "1.0b2",
+    "1.0b2.post345.dev456",
+    "1.0b2.post345",
+    "1.0rc1.dev456",
+    "1.0rc1",
+    "1.0",
+    "1.0+abc.5",
+    "1.0+abc.7",
+    "1.0+5",
+    "1.0.post456.dev34",
+    "1.0.post456",
+    "1.1.dev1",
+    "1.2",
+    "1.10",
+    "1.255",
+    "1.256",
+    "1.70000",
+    "2!0.1",
+]
+
+
+def test_orders_versions():
+    shuffled = list(ORDERED_VERSIONS)
+    random.shuffle(shuffled)
+
+    assert sorted(shuffled, key=version_sort_key) == ORDERED_VERSIONS
+
+
+@pytest.mark.parametrize(
+    ("first", "second"),
+    [("1.0", "1.0.0"), ("1.0", "1.0.0.0"), ("1.0c1", "1.0rc1"), ("1.0", "v1.0")],
+)
+def test_equivalent_versions(first, second):
+    assert version_sort_key(first) == version_sort_key(second)
+
+
+@pytest.mark.parametrize(
+    ("first", "second"),
+    [
+        ("1.0", "1.0.1"),
+        ("1.0+ab", "1.0+abc"),
+        ("1.0+abc", "1.0+1"),
+        ("1.0+1", "1.0+1.abc"),
+    ],
+)
+def test_version_pairs(first, second):
+    assert packaging.version.parse(first) < packaging.version.parse(second)
+    assert version_sort_key(first) < version_sort_key(second)
+
+
+def test_invalid_versions_sort_first():
+    assert version_sort_key("french toast") < version_sort_key("0")
+    assert version_sort_key("french toast") < version_sort_key("spam")
+
+
+def test_release_sets_sort_key():
+    release = Release(version="1.0")
+
+    assert release.version_sort_key == version_sort_key("1.0")
+
+    release.version = "2.0"
+
+    assert release.version_sort_key == version_sort_key("2.0")
@@ -0,0 +1,180 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pretend
+import pytest
+
+from warehouse.packaging import serials
+
+from ...common.db.packaging import JournalEntryFactory, ProjectFactory
+
+
+@pytest.fixture
+def fakeredis():
+    import fakeredis
+
+    _fakeredis = fakeredis.FakeStrictRedis()
+    yield _fakeredis
+    _fakeredis.flushall()
+
+
+@pytest.mark.parametrize(
+    ("settings", "configured"),
+    [({}, False), ({"packaging.serials.redis_url": "redis://"}, True)],
+)
+def test_serials_redis(monkeypatch, settings, configured):
+    redis_conn = pretend.stub()
+    from_url = pretend.call_recorder(lambda url: redis_conn)
+    monkeypatch.setattr(serials.redis.StrictRedis, "from_url", from_url)
+
+    if configured:
+        assert serials.serials_redis(settings) is redis_conn
+        assert from_url.calls == [pretend.call("redis://")]
+    else:
+        assert serials.serials_redis(settings) is None
+        assert from_url.calls == []
+
+
+class TestGetProjectSerials:
+    def test_not_built(self, fakeredis):
+        fakeredis.hmset(serials.SERIALS_KEY, {"foo": 1})
+        assert serials.get_project_serials(fakeredis) is None
+
+    def test_built(self, fakeredis):
+        fakeredis.hmset(serials.SERIALS_KEY, {"foo": 1, "bar": 20})
+        fakeredis.set(serials.SERIALS_CURSOR_KEY, 20)
+        assert serials.get_project_serials(fakeredis) == {"foo": 1, "bar": 20}
+
+    def test_evicted(self, fakeredis):
+        fakeredis.set(serials.SERIALS_CURSOR_KEY, 20)
+        assert serials.get_project_serials(fakeredis) is None
+
+
+class TestApplyJournalEntries:
+    def test_applies_latest(self, fakeredis):
+        fakeredis.hmset(serials.SERIALS_KEY, {"foo": 1, "bar": 2, "baz": 3})
+
+        serials.apply_journal_entries(
+            fakeredis,
+            [
+                (5, "foo", "new release"),
+                (4, "foo", "create"),
+                (6, "bar", "remove project"),
+                (7, "new", "create"),
+                (8, None, "something"),
+            ],
+        )
+
+        assert fakeredis.hgetall(serials.SERIALS_KEY) == {
+            b"foo": b"5",
+            b"baz": b"3",
+            b"new": b"7",
+        }
+
+    def test_recreated(self, fakeredis):
+        fakeredis.hmset(serials.SERIALS_KEY, {"bar": 1})
+
+        serials.apply_journal_entries(
+            fakeredis, [(3, "foo", "create"), (2, "foo", "remove project")]
+        )
+
+        assert fakeredis.hgetall(serials.SERIALS_KEY) == {b"foo": b"3", b"bar": b"1"}
+
+    def test_never_goes_backwards(self, fakeredis):
+        fakeredis.hmset(serials.SERIALS_KEY, {"foo": 10, "bar": 10})
+
+        serials.apply_journal_entries(
+            fakeredis, [(5, "foo", "new release"), (6, "bar", "remove project")]
+        )
+
+        assert fakeredis.hgetall(serials.SERIALS_KEY) == {b"foo": b"10", b"bar": b"10"}
+
+    def test_not_built(self, fakeredis):
+        serials.apply_journal_entries(fakeredis, [(1, "foo", "create")])
+        assert not fakeredis.exists(serials.SERIALS_KEY)
+
+    def test_nothing_to_apply(self, fakeredis):
+        serials.apply_journal_entries(fakeredis, [(1, None, "something")])
+        assert not fakeredis.exists(serials.SERIALS_KEY)
+
+
+def test_update_project_serials(db_request, fakeredis):
+    project = ProjectFactory.create()
+    entry = JournalEntryFactory.create(name=project.name)
+    fakeredis.hmset(serials.SERIALS_KEY, {"gone": 1})
+
+    serials.update_project_serials(
+        db_request.db, fakeredis, {project.name, "gone", None}
+    )
+
+    assert serials.get_project_serials(fakeredis) is None
+    assert fakeredis.hgetall(serials.SERIALS_KEY) == {
+        project.name.encode("utf8"): str(entry.id).encode("utf8")
+    }
+
+
+def test_update_project_serials_no_names(fakeredis):
+    serials.update_project_serials(pretend.stub(), fakeredis, [None])
+    assert not fakeredis.exists(serials.SERIALS_KEY)
+
+
+class TestApplyJournals:
+    def test_rebuilds(self, db_request, fakeredis):
+        projects = [ProjectFactory.create() for _ in range(3)]
+        entries = [JournalEntryFactory.create(name=p.name) for p in projects]
+        fakeredis.hmset(serials.SERIALS_KEY, {"stale": 1})
+
+        serials.apply_journals(db_request.db, fakeredis, batch_size=2)
+
+        assert serials.get_project_serials(fakeredis) == {e.name: e.id for e in entries}
+        assert int(fakeredis.get(serials.SERIALS_CURSOR_KEY)) == entries[-1].id
+
+    def test_rebuilds_empty(self, db_request, fakeredis):
+        fakeredis.hmset(serials.SERIALS_KEY, {"stale": 1})
+
+        serials.apply_journals(db_request.db, fakeredis)
+
+        assert not fakeredis.exists(serials.SERIALS_KEY)
+        assert int(fakeredis.get(serials.SERIALS_CURSOR_KEY)) == 0
+
+    def test_rebuilds_evicted(self, db_request, fakeredis):
+        project = ProjectFactory.create()
+        entry = JournalEntryFactory.create(name=project.name)
+        fakeredis.set(serials.SERIALS_CURSOR_KEY, entry.id + serials.JOURNAL_OVERLAP)
+
+        serials.apply_journals(db_request.db, fakeredis)
+
+        assert serials.get_project_serials(fakeredis) == {project.name: entry.id}
+        assert int(fakeredis.get(serials.SERIALS_CURSOR_KEY)) == entry.id
+
+    def test_applies_new_entries(self, db_request, fakeredis):
+        projects = [ProjectFactory.create() for _ in range(3)]
+        entries = [JournalEntryFactory.create(name=p.name) for p in projects]
+        fakeredis.hmset(serials.SERIALS_KEY, {projects[0].name: entries[0].id})
+        fakeredis.set(serials.SERIALS_CURSOR_KEY, entries[0].id)
+
+        serials.apply_journals(db_request.db, fakeredis, batch_size=1)
+
+        assert serials.get_project_serials(fakeredis) == {e.name: e.id for e in entries}
+        assert int(fakeredis.get(serials.SERIALS_CURSOR_KEY)) == entries[-1].id
+
+    def test_removes_deleted_projects(self, db_request, fakeredis):
+        entry = JournalEntryFactory.create(name="gone", action="remove project")
+        fakeredis.hmset(serials.SERIALS_KEY, {"gone": 1})
+        fakeredis.set(serials.SERIALS_CURSOR_KEY, entry.id + serials.JOURNAL_OVERLAP)
+
+        serials.apply_journals(db_request.db, fakeredis)
+
+        assert not fakeredis.exists(serials.SERIALS_KEY)
+        assert int(fakeredis.get(serials.SERIALS_CURSOR_KEY)) == (
+            entry.id + serials.JOURNAL_OVERLAP
+        )
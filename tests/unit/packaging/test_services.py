@@ -20,12 +20,16 @@ import pytest
 
 from zope.interface.verify import verifyClass
 
-from warehouse.packaging.interfaces import IFileStorage, IDocsStorage
+from warehouse.packaging.interfaces import IFileStorage, IDocsStorage, ISimpleStorage
 from warehouse.packaging.services import (
     LocalFileStorage,
+    LocalSimpleStorage,
     S3FileStorage,
+    S3SimpleStorage,
     LocalDocsStorage,
     S3DocsStorage,
+    S3_DELETE_BATCH_SIZE,
+    S3_TRANSFER_CONFIG,
 )
 
 
@@ -89,6 +93,81 @@ class TestLocalFileStorage:
         with open(os.path.join(storage_dir, "foo/second.txt"), "rb") as fp:
             assert fp.read() == b"Second Test File!"
 
+    def test_stages_and_promotes_file(self, tmpdir):
+        filename = str(tmpdir.join("testfile.txt"))
+        with open(filename, "wb") as fp:
+            fp.write(b"Test File!")
+
+        storage_dir = str(tmpdir.join("storage"))
+        storage = LocalFileStorage(storage_dir)
+        storage.stage("foo/bar.txt", filename)
+
+        assert not os.path.exists(os.path.join(storage_dir, "foo/bar.txt"))
+        assert [path for path, _ in storage.list(staged=True)] == ["foo/bar.txt"]
+        assert list(storage.list()) == []
+
+        storage.promote("foo/bar.txt")
+
+        with open(os.path.join(storage_dir, "foo/bar.txt"), "rb") as fp:
+            assert fp.read() == b"Test File!"
+        assert list(storage.list(staged=True)) == []
+
+    def test_lists_files(self, tmpdir):
+        filename = str(tmpdir.join("testfile.txt"))
+        with open(filename, "wb") as fp:
+            fp.write(b"Test File!")
+
+        storage_dir = str(tmpdir.join("storage"))
+        storage = LocalFileStorage(storage_dir)
+        storage.store("foo/first.txt", filename)
+        storage.store("bar/second.txt", filename)
+        storage.stage("foo/third.txt", filename)
+
+        listed = dict(storage.list())
+
+        assert set(listed) == {"foo/first.txt", "bar/second.txt"}
+        for last_modified in listed.values():
+            assert last_modified.tzinfo is not None
+
+    def test_removes_files(self, tmpdir):
+        filename = str(tmpdir.join("testfile.txt"))
+        with open(filename, "wb") as fp:
+            fp.write(b"Test File!")
+
+        storage_dir = str(tmpdir.join("storage"))
+        storage = LocalFileStorage(storage_dir)
+        storage.store("foo/first.txt", filename)
+        storage.stage("foo/second.txt", filename)
+
+        storage.remove(["foo/first.txt", "foo/missing.txt"])
+        storage.remove(["foo/second.txt"], staged=True)
+
+        assert list(storage.list()) == []
+        assert list(storage.list(staged=True)) == []
+
+
+class TestLocalSimpleStorage:
+    def test_verify_service(self):
+        assert verifyClass(ISimpleStorage, LocalSimpleStorage)
+
+    def test_create_service(self):
+        request = pretend.stub(
+            registry=pretend.stub(settings={"simple.path": "/the/one/two/"})
+        )
+        storage = LocalSimpleStorage.create_service(None, request)
+        assert storage.base == "/the/one/two/"
+
+    def test_stores_and_gets_file(self, tmpdir):
+        filename = str(tmpdir.join("index.html"))
+        with open(filename, "wb") as fp:
+            fp.write(b"<html></html>")
+
+        storage = LocalSimpleStorage(str(tmpdir.join("storage")))
+        storage.store("foo/index.html", filename)
+
+        with storage.get("foo/index.html") as fp:
+            assert fp.read() == b"<html></html>"
+
 
 class TestLocalDocsStorage:
     def test_verify_service(self):
@@ -153,6 +232,26 @@ class TestS3FileStorage:
 
         assert request.find_service.calls == [pretend.call(name="aws.session")]
         assert storage.bucket.name == "froblob"
+        assert storage.transfer_config is S3_TRANSFER_CONFIG
+
+    def test_stores_file_with_transfer_config(self, tmpdir):
+        filename = str(tmpdir.join("testfile.txt"))
+        with open(filename, "wb") as fp:
+            fp.write(b"Test File!")
+
+        bucket = pretend.stub(
+            upload_file=pretend.call_recorder(
+                lambda filename, key, ExtraArgs, Config: None
+            )
+        )
+        storage = S3FileStorage(bucket, transfer_config=S3_TRANSFER_CONFIG)
+        storage.store("foo/bar.txt", filename)
+
+        assert bucket.upload_file.calls == [
+            pretend.call(
+                filename, "foo/bar.txt", ExtraArgs={}, Config=S3_TRANSFER_CONFIG
+            )
+        ]
 
     def test_gets_file(self):
         s3key = pretend.stub(get=lambda: {"Body": io.BytesIO(b"my contents")})
@@ -266,6 +365,156 @@ class TestS3FileStorage:
         assert file_object.read() == b"my contents"
         assert bucket.Object.calls == [pretend.call("ab/file.txt")]
 
+    @pytest.mark.parametrize(
+        ("prefix", "expected"),
+        [(None, "staging/ab/file.txt"), ("packages/", "packages/staging/ab/file.txt")],
+    )
+    def test_stages_file(self, tmpdir, prefix, expected):
+        filename = str(tmpdir.join("testfile.txt"))
+        with open(filename, "wb") as fp:
+            fp.write(b"Test File!")
+
+        bucket = pretend.stub(
+            upload_file=pretend.call_recorder(lambda filename, key, ExtraArgs: None)
+        )
+        storage = S3FileStorage(bucket, prefix=prefix)
+        storage.stage("ab/file.txt", filename, meta={"foo": "bar"})
+
+        assert bucket.upload_file.calls == [
+            pretend.call(filename, expected, ExtraArgs={"Metadata": {"foo": "bar"}})
+        ]
+
+    def test_stages_file_with_transfer_config(self, tmpdir):
+        filename = str(tmpdir.join("testfile.txt"))
+        with open(filename, "wb") as fp:
+            fp.write(b"Test File!")
+
+        bucket = pretend.stub(
+            upload_file=pretend.call_recorder(
+                lambda filename, key, ExtraArgs, Config: None
+            )
+        )
+        storage = S3FileStorage(bucket, transfer_config=S3_TRANSFER_CONFIG)
+        storage.stage("ab/file.txt", filename)
+
+        assert bucket.upload_file.calls == [
+            pretend.call(
+                filename,
+                "staging/ab/file.txt",
+                ExtraArgs={},
+                Config=S3_TRANSFER_CONFIG,
+            )
+        ]
+
+    def test_promotes_file(self):
+        objects = {}
+
+        def Object(key):
+            objects[key] = pretend.stub(
+                copy_from=pretend.call_recorder(lambda CopySource: None),
+                delete=pretend.call_recorder(lambda: None),
+            )
+            return objects[key]
+
+        bucket = pretend.stub(name="the-bucket", Object=Object)
+        storage = S3FileStorage(bucket, prefix="packages/")
+        storage.promote("ab/file.txt")
+
+        assert objects["packages/ab/file.txt"].copy_from.calls == [
+            pretend.call(
+                CopySource={
+                    "Bucket": "the-bucket",
+                    "Key": "packages/staging/ab/file.txt",
+                }
+            )
+        ]
+        assert objects["packages/ab/file.txt"].delete.calls == []
+        assert objects["packages/staging/ab/file.txt"].delete.calls == [pretend.call()]
+
+    @pytest.mark.parametrize(
+        ("staged", "expected"),
+        [(False, ["ab/file.txt", "cd/other.txt"]), (True, ["ab/staged.txt"])],
+    )
+    def test_lists_files(self, staged, expected):
+        keys = {
+            "packages/": [
+                "packages/ab/file.txt",
+                "packages/staging/ab/staged.txt",
+                "packages/cd/other.txt",
+            ],
+            "packages/staging/": ["packages/staging/ab/staged.txt"],
+        }
+        filter_ = pretend.call_recorder(
+            lambda Prefix: [
+                pretend.stub(key=key, last_modified=pretend.stub())
+                for key in keys[Prefix]
+            ]
+        )
+        bucket = pretend.stub(objects=pretend.stub(filter=filter_))
+        storage = S3FileStorage(bucket, prefix="packages/")
+
+        assert [path for path, _ in storage.list(staged=staged)] == expected
+        assert filter_.calls == [
+            pretend.call(Prefix="packages/staging/" if staged else "packages/")
+        ]
+
+    @pytest.mark.parametrize(
+        ("staged", "expected"),
+        [(False, "packages/ab/file.txt"), (True, "packages/staging/ab/file.txt")],
+    )
+    def test_removes_files(self, staged, expected):
+        bucket = pretend.stub(delete_objects=pretend.call_recorder(lambda Delete: None))
+        storage = S3FileStorage(bucket, prefix="packages/")
+        storage.remove(["ab/file.txt"], staged=staged)
+
+        assert bucket.delete_objects.calls == [
+            pretend.call(Delete={"Objects": [{"Key": expected}]})
+        ]
+
+    def test_removes_files_in_batches(self):
+        bucket = pretend.stub(delete_objects=pretend.call_recorder(lambda Delete: None))
+        storage = S3FileStorage(bucket)
+        paths = ["ab/file{}.txt".format(i) for i in range(S3_DELETE_BATCH_SIZE + 1)]
+        storage.remove(paths)
+
+        assert [
+            len(call.kwargs["Delete"]["Objects"])
+            for call in bucket.delete_objects.calls
+        ] == [S3_DELETE_BATCH_SIZE, 1]
+
+
+class TestS3SimpleStorage:
+    def test_verify_service(self):
+        assert verifyClass(ISimpleStorage, S3SimpleStorage)
+
+    def test_create_service(self):
+        session = boto3.session.Session()
+        request = pretend.stub(
+            find_service=pretend.call_recorder(lambda name: session),
+            registry=pretend.stub(
+                settings={"simple.bucket": "froblob", "simple.prefix": "simple/"}
+            ),
+        )
+        storage = S3SimpleStorage.create_service(None, request)
+
+        assert request.find_service.calls == [pretend.call(name="aws.session")]
+        assert storage.bucket.name == "froblob"
+        assert storage.prefix == "simple/"
+
+    @pytest.mark.parametrize(
+        ("prefix", "expected"),
+        [(None, "foobar/index.html"), ("simple/", "simple/foobar/index.html")],
+    )
+    def test_path_always_prefixed(self, prefix, expected):
+        s3key = pretend.stub(get=lambda: {"Body": io.BytesIO(b"my contents")})
+        bucket = pretend.stub(Object=pretend.call_recorder(lambda path: s3key))
+        storage = S3SimpleStorage(bucket, prefix=prefix)
+
+        file_object = storage.get("foobar/index.html")
+
+        assert file_object.read() == b"my contents"
+        assert bucket.Object.calls == [pretend.call(expected)]
+
 
 class TestS3DocsStorage:
     def test_verify_service(self):
@@ -10,16 +10,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import datetime
+
 import pretend
 import pytest
 
 from google.cloud.bigquery import Row
 
 from warehouse.cache.origin import IOriginCache
+from warehouse.packaging import serials, tasks
+from warehouse.packaging.interfaces import IFileStorage
 from warehouse.packaging.models import Project
-from warehouse.packaging.tasks import compute_trending
+from warehouse.packaging.tasks import (
+    compute_trending,
+    promote_staged_files,
+    remove_orphaned_files,
+    reorder_releases,
+    sync_project_serials,
+)
 
-from ...common.db.packaging import ProjectFactory
+from ...common.db.packaging import FileFactory, ProjectFactory, ReleaseFactory
 
 
 class TestComputeTrending:
@@ -108,3 +118,170 @@ class TestComputeTrending:
             projects[1].name: 2,
             projects[2].name: -1,
         }
+
+
+class TestSyncProjectSerials:
+    def test_sync(self, monkeypatch):
+        redis_conn = pretend.stub()
+        monkeypatch.setattr(serials, "serials_redis", lambda settings: redis_conn)
+        apply_journals = pretend.call_recorder(lambda db, conn: None)
+        monkeypatch.setattr(serials, "apply_journals", apply_journals)
+        request = pretend.stub(db=pretend.stub(), registry=pretend.stub(settings={}))
+
+        sync_project_serials(request)
+
+        assert apply_journals.calls == [pretend.call(request.db, redis_conn)]
+
+    def test_not_configured(self, monkeypatch):
+        monkeypatch.setattr(serials, "serials_redis", lambda settings: None)
+        apply_journals = pretend.call_recorder(lambda db, conn: None)
+        monkeypatch.setattr(serials, "apply_journals", apply_journals)
+        request = pretend.stub(db=pretend.stub(), registry=pretend.stub(settings={}))
+
+        sync_project_serials(request)
+
+        assert apply_journals.calls == []
+
+
+def test_batched():
+    assert list(tasks._batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(tasks._batched([], 2)) == []
+
+
+def test_known_paths(db_request):
+    file_ = FileFactory.create()
+
+    assert tasks._known_paths(
+        db_request.db,
+        [
+            file_.path,
+            file_.path + ".asc",
+            file_.path + ".metadata",
+            "ab/cd/unknown.tar.gz",
+            "ab/cd/unknown.tar.gz.metadata",
+        ],
+    ) == {file_.path, file_.path + ".asc", file_.path + ".metadata"}
+
+
+def _storage(listed):
+    return pretend.stub(
+        list=pretend.call_recorder(lambda **kw: iter(listed)),
+        promote=pretend.call_recorder(lambda path: None),
+        remove=pretend.call_recorder(lambda paths, **kw: None),
+    )
+
+
+def _request(storage):
+    return pretend.stub(
+        db=pretend.stub(),
+        find_service=lambda iface: {IFileStorage: storage}[iface],
+        log=pretend.stub(info=lambda *a: None),
+    )
+
+
+class TestPromoteStagedFiles:
+    def test_promotes_known_and_removes_expired(self, monkeypatch):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        old = now - tasks.STAGED_FILE_MAX_AGE - datetime.timedelta(minutes=1)
+        storage = _storage(
+            [("a/known", old), ("a/expired", old), ("a/in-progress", now)]
+        )
+        known_paths = pretend.call_recorder(lambda db, paths: {"a/known"})
+        monkeypatch.setattr(tasks, "_known_paths", known_paths)
+        request = _request(storage)
+
+        promote_staged_files(request)
+
+        assert storage.list.calls == [pretend.call(staged=True)]
+        assert known_paths.calls == [
+            pretend.call(request.db, ["a/known", "a/expired", "a/in-progress"])
+        ]
+        assert storage.promote.calls == [pretend.call("a/known")]
+        assert storage.remove.calls == [pretend.call(["a/expired"], staged=True)]
+
+    def test_nothing_expired(self, monkeypatch):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        storage = _storage([("a/in-progress", now)])
+        monkeypatch.setattr(tasks, "_known_paths", lambda db, paths: set())
+
+        promote_staged_files(_request(storage))
+
+        assert storage.promote.calls == []
+        assert storage.remove.calls == []
+
+
+class TestRemoveOrphanedFiles:
+    def test_removes_orphans(self, monkeypatch):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        old = now - tasks.ORPHANED_FILE_MIN_AGE - datetime.timedelta(minutes=1)
+        storage = _storage([("a/known", old), ("a/orphan", old), ("a/new", now)])
+        known_paths = pretend.call_recorder(lambda db, paths: {"a/known"})
+        monkeypatch.setattr(tasks, "_known_paths", known_paths)
+        request = _request(storage)
+
+        remove_orphaned_files(request)
+
+        assert storage.list.calls == [pretend.call()]
+        assert known_paths.calls == [pretend.call(request.db, ["a/known", "a/orphan"])]
+        assert storage.remove.calls == [pretend.call(["a/orphan"])]
+
+    def test_skips_new_files(self, monkeypatch):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        storage = _storage([("a/new", now)])
+        known_paths = pretend.call_recorder(lambda db, paths: set())
+        monkeypatch.setattr(tasks, "_known_paths", known_paths)
+
+        remove_orphaned_files(_request(storage))
+
+        assert known_paths.calls == []
+        assert storage.remove.calls == []
+
+    def test_no_orphans(self, monkeypatch):
+        old = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=2)
+        storage = _storage([("a/known", old)])
+        monkeypatch.setattr(tasks, "_known_paths", lambda db, paths: {"a/known"})
+
+        remove_orphaned_files(_request(storage))
+
+        assert storage.remove.calls == []
+
+
+class TestReorderReleases:
+    def test_reorders_releases(self, db_request):
+        project = ProjectFactory.create()
+        releases = {
+            version: ReleaseFactory.create(
+                project=project, version=version, _pypi_ordering=ordering
+            )
+            for version, ordering in [
+                ("1.0", 0),
+                ("3.0", 1),
+                ("2.0", 5),
+                ("2.0.0", 4),
+                ("4.0", None),
+            ]
+        }
+        other = ReleaseFactory.create(version="1.0", _pypi_ordering=3)
+        db_request.log = pretend.stub(info=pretend.call_recorder(lambda *a, **kw: None))
+
+        reorder_releases(db_request)
+
+        for release in list(releases.values()) + [other]:
+            db_request.db.refresh(release)
+        assert {
+            version: release._pypi_ordering for version, release in releases.items()
+        } == {"1.0": 0, "2.0.0": 1, "2.0": 2, "3.0": 3, "4.0": 4}
+        assert other._pypi_ordering == 0
+        assert db_request.log.info.calls == [pretend.call("Reordered %s releases", 5)]
+
+    def test_nothing_to_reorder(self, db_request):
+        project = ProjectFactory.create()
+        for ordering, version in enumerate(["1.0", "2.0"]):
+            ReleaseFactory.create(
+                project=project, version=version, _pypi_ordering=ordering
+            )
+        db_request.log = pretend.stub(info=pretend.call_recorder(lambda *a, **kw: None))
+
+        reorder_releases(db_request)
+
+        assert db_request.log.info.calls == []
@@ -13,6 +13,7 @@
 import pretend
 
 from warehouse import search
+from warehouse.search import tasks
 
 from ...common.db.packaging import ProjectFactory, ReleaseFactory
 
@@ -42,30 +43,33 @@ def test_store_projects_unindex(db_request):
     assert session.info["warehouse.search.project_deletes"] == {project1}
 
 
-def test_execute_reindex_success(app_config):
-    _delay = pretend.call_recorder(lambda x: None)
-    app_config.task = lambda x: pretend.stub(delay=_delay)
+def test_execute_reindex_queues_projects(monkeypatch):
+    r = pretend.stub()
+    queue_project_reindex = pretend.call_recorder(lambda r, names: None)
+    monkeypatch.setattr(tasks, "queue_project_reindex", queue_project_reindex)
+    config = pretend.stub(registry={"search.redis": r})
     session = pretend.stub(
-        info={"warehouse.search.project_updates": {pretend.stub(normalized_name="foo")}}
+        info={
+            "warehouse.search.project_updates": {pretend.stub(normalized_name="foo")},
+            "warehouse.search.project_deletes": {pretend.stub(normalized_name="bar")},
+        }
     )
 
-    search.execute_project_reindex(app_config, session)
+    search.execute_project_reindex(config, session)
 
-    assert _delay.calls == [pretend.call("foo")]
+    assert queue_project_reindex.calls == [pretend.call(r, {"foo", "bar"})]
     assert "warehouse.search.project_updates" not in session.info
+    assert "warehouse.search.project_deletes" not in session.info
 
 
-def test_execute_unindex_success(app_config):
-    _delay = pretend.call_recorder(lambda x: None)
-    app_config.task = lambda x: pretend.stub(delay=_delay)
-    session = pretend.stub(
-        info={"warehouse.search.project_deletes": {pretend.stub(normalized_name="foo")}}
-    )
+def test_execute_reindex_nothing_to_queue(monkeypatch):
+    queue_project_reindex = pretend.call_recorder(lambda r, names: None)
+    monkeypatch.setattr(tasks, "queue_project_reindex", queue_project_reindex)
+    session = pretend.stub(info={})
 
-    search.execute_project_reindex(app_config, session)
+    search.execute_project_reindex(pretend.stub(), session)
 
-    assert _delay.calls == [pretend.call("foo")]
-    assert "warehouse.search.project_deletes" not in session.info
+    assert queue_project_reindex.calls == []
 
 
 def test_es(monkeypatch):
@@ -98,3 +102,42 @@ def test_es(monkeypatch):
         pretend.call(number_of_shards=1, number_of_replicas=0, refresh_interval="1s")
     ]
     assert index_obj.search.calls == [pretend.call()]
+
+
+def test_includeme(monkeypatch):
+    class Registry(dict):
+        def __init__(self):
+            self.settings = {}
+
+    es_client = pretend.stub()
+    es_client_cls = pretend.call_recorder(lambda *a, **kw: es_client)
+    monkeypatch.setattr(search.elasticsearch, "Elasticsearch", es_client_cls)
+    redis_client = pretend.stub()
+    from_url = pretend.call_recorder(lambda url: redis_client)
+    monkeypatch.setattr(search.redis.StrictRedis, "from_url", from_url)
+
+    config = pretend.stub(
+        registry=Registry(),
+        add_request_method=pretend.call_recorder(lambda *a, **kw: None),
+        add_periodic_task=pretend.call_recorder(lambda *a, **kw: None),
+    )
+    config.registry.settings.update(
+        {
+            "elasticsearch.url": "https://some.url/some-index?shards=2&replicas=1",
+            "celery.scheduler_url": "redis://redis:6379/0",
+        }
+    )
+
+    search.includeme(config)
+
+    assert len(es_client_cls.calls) == 1
+    assert config.registry["elasticsearch.client"] is es_client
+    assert config.registry["elasticsearch.index"] == "some-index"
+    assert config.registry["elasticsearch.shards"] == 2
+    assert config.registry["elasticsearch.replicas"] == 1
+    assert from_url.calls == [pretend.call("redis://redis:6379/0")]
+    assert config.registry["search.redis"] is redis_client
+    assert config.add_request_method.calls == [
+        pretend.call(search.es, name="es", reify=True)
+    ]
+    assert len(config.add_periodic_task.calls) == 2
@@ -13,7 +13,6 @@
 import os
 
 import celery
-import elasticsearch
 import packaging.version
 import pretend
 import pytest
@@ -22,10 +21,17 @@ import redis
 from first import first
 
 import warehouse.search.tasks
+from warehouse.packaging.models import Project
 from warehouse.search.tasks import (
+    REINDEX_COMPLETE_KEY,
+    REINDEX_FIRST_QUEUED_KEY,
+    REINDEX_PENDING_KEY,
+    REINDEX_STATE_KEY,
+    queue_project_reindex,
     reindex,
-    reindex_project,
-    unindex_project,
+    reindex_partition,
+    reindex_pending_projects,
+    _column_window_bounds,
     _project_docs,
     SearchLock,
 )
@@ -89,6 +95,39 @@ def test_single_project_doc(db_session):
     ]
 
 
+def test_partition_project_docs(db_session):
+    projects = sorted([ProjectFactory.create() for _ in range(3)], key=lambda p: p.id)
+    for project in projects:
+        ReleaseFactory.create(project=project)
+
+    docs = list(_project_docs(db_session, project_ids=(projects[1].id, None)))
+    assert [d["_id"] for d in docs] == [p.normalized_name for p in projects[1:]]
+
+    docs = list(_project_docs(db_session, project_ids=(projects[0].id, projects[1].id)))
+    assert [d["_id"] for d in docs] == [projects[0].normalized_name]
+
+
+def test_column_window_bounds(db_session):
+    names = sorted(ProjectFactory.create().name for _ in range(5))
+
+    assert list(_column_window_bounds(db_session, Project.name, 2)) == [
+        (names[0], names[2]),
+        (names[2], names[4]),
+        (names[4], None),
+    ]
+
+
+def test_batch_project_docs(db_session):
+    projects = [ProjectFactory.create() for _ in range(3)]
+    for project in projects:
+        ReleaseFactory.create(project=project)
+
+    docs = _project_docs(
+        db_session, normalized_names=[p.normalized_name for p in projects[1:]]
+    )
+    assert {d["_id"] for d in docs} == {p.normalized_name for p in projects[1:]}
+
+
 class FakeESIndices:
     def __init__(self):
         self.indices = {}
@@ -98,6 +137,9 @@ class FakeESIndices:
         self.delete = pretend.call_recorder(lambda *a, **kw: None)
         self.create = pretend.call_recorder(lambda *a, **kw: None)
 
+    def exists(self, index):
+        return index in self.indices
+
     def exists_alias(self, name):
         return name in self.aliases
 
@@ -139,6 +181,43 @@ class NotLock:
         return True
 
 
+@pytest.fixture
+def fake_redis(monkeypatch):
+    import fakeredis
+
+    r = fakeredis.FakeStrictRedis()
+    r.lock = NotLock
+    monkeypatch.setattr(redis.StrictRedis, "from_url", lambda *a, **kw: r)
+    yield r
+    r.flushall()
+
+
+@pytest.fixture
+def search_request(pyramid_request, monkeypatch):
+    pyramid_request.db = pretend.stub(
+        execute=pretend.call_recorder(lambda *a, **kw: None),
+        rollback=pretend.call_recorder(lambda: None),
+        close=pretend.call_recorder(lambda: None),
+    )
+    pyramid_request.registry.update(
+        {"elasticsearch.index": "warehouse", "elasticsearch.shards": 42}
+    )
+    pyramid_request.registry.settings = {
+        "elasticsearch.url": "http://some.url",
+        "celery.scheduler_url": "redis://redis:6379/0",
+    }
+    return pyramid_request
+
+
+@pytest.fixture
+def es_client(monkeypatch):
+    client = FakeESClient()
+    monkeypatch.setattr(
+        warehouse.search.tasks.elasticsearch, "Elasticsearch", lambda *a, **kw: client
+    )
+    return client
+
+
 class TestSearchLock:
     def test_success(self):
         lock_stub = pretend.stub(acquire=pretend.call_recorder(lambda: True))
@@ -157,52 +236,13 @@ class TestSearchLock:
 
 
 class TestReindex:
-    def test_fails_when_raising(self, db_request, monkeypatch):
-        docs = pretend.stub()
-
-        def project_docs(db):
-            return docs
-
-        monkeypatch.setattr(warehouse.search.tasks, "_project_docs", project_docs)
-
-        task = pretend.stub()
-        es_client = FakeESClient()
-
-        db_request.registry.update({"elasticsearch.index": "warehouse"})
-        db_request.registry.settings = {
-            "elasticsearch.url": "http://some.url",
-            "celery.scheduler_url": "redis://redis:6379/0",
-        }
-        monkeypatch.setattr(
-            warehouse.search.tasks.elasticsearch,
-            "Elasticsearch",
-            lambda *a, **kw: es_client,
+    @pytest.fixture
+    def partition_task(self, search_request):
+        partition_task = pretend.stub(
+            delay=pretend.call_recorder(lambda *a, **kw: None)
         )
-
-        class TestException(Exception):
-            pass
-
-        def parallel_bulk(client, iterable, index=None):
-            assert client is es_client
-            assert iterable is docs
-            assert index == "warehouse-cbcbcbcbcb"
-            raise TestException
-
-        monkeypatch.setattr(
-            redis.StrictRedis, "from_url", lambda *a, **kw: pretend.stub(lock=NotLock)
-        )
-
-        monkeypatch.setattr(warehouse.search.tasks, "parallel_bulk", parallel_bulk)
-
-        monkeypatch.setattr(os, "urandom", lambda n: b"\xcb" * n)
-
-        with pytest.raises(TestException):
-            reindex(task, db_request)
-
-        assert es_client.indices.delete.calls == [
-            pretend.call(index="warehouse-cbcbcbcbcb")
-        ]
-        assert es_client.indices.put_settings.calls == []
+        search_request.task = pretend.call_recorder(lambda t: partition_task)
+        return partition_task
 
     def test_retry_on_lock(self, db_request, monkeypatch):
         task = pretend.stub(
@@ -223,44 +263,19 @@ class TestReindex:
 
         assert task.retry.calls == [pretend.call(countdown=60, exc=le)]
 
-    def test_successfully_indexes_and_adds_new(self, db_request, monkeypatch):
-
-        docs = pretend.stub()
-
-        def project_docs(db):
-            return docs
-
-        monkeypatch.setattr(warehouse.search.tasks, "_project_docs", project_docs)
-
-        task = pretend.stub()
-        es_client = FakeESClient()
-
-        db_request.registry.update(
-            {"elasticsearch.index": "warehouse", "elasticsearch.shards": 42}
-        )
-        db_request.registry.settings = {
-            "elasticsearch.url": "http://some.url",
-            "celery.scheduler_url": "redis://redis:6379/0",
-        }
-        monkeypatch.setattr(
-            warehouse.search.tasks.elasticsearch,
-            "Elasticsearch",
-            lambda *a, **kw: es_client,
+    def test_creates_index_and_partitions(
+        self, search_request, partition_task, es_client, fake_redis, monkeypatch
+    ):
+        column_window_bounds = pretend.call_recorder(
+            lambda db, column, size: iter([(1, 2), (2, None)])
         )
         monkeypatch.setattr(
-            redis.StrictRedis, "from_url", lambda *a, **kw: pretend.stub(lock=NotLock)
+            warehouse.search.tasks, "_column_window_bounds", column_window_bounds
         )
-
-        parallel_bulk = pretend.call_recorder(lambda client, iterable, index: [None])
-        monkeypatch.setattr(warehouse.search.tasks, "parallel_bulk", parallel_bulk)
-
         monkeypatch.setattr(os, "urandom", lambda n: b"\xcb" * n)
 
-        reindex(task, db_request)
+        reindex(pretend.stub(), search_request)
 
-        assert parallel_bulk.calls == [
-            pretend.call(es_client, docs, index="warehouse-cbcbcbcbcb")
-        ]
         assert es_client.indices.create.calls == [
             pretend.call(
                 body={
@@ -274,229 +289,469 @@ class TestReindex:
                 index="warehouse-cbcbcbcbcb",
             )
         ]
-        assert es_client.indices.delete.calls == []
-        assert es_client.indices.aliases == {"warehouse": ["warehouse-cbcbcbcbcb"]}
-        assert es_client.indices.put_settings.calls == [
+        assert column_window_bounds.calls == [
             pretend.call(
-                index="warehouse-cbcbcbcbcb",
-                body={"index": {"number_of_replicas": 0, "refresh_interval": "1s"}},
+                search_request.db,
+                warehouse.search.tasks.Project.id,
+                warehouse.search.tasks.REINDEX_PARTITION_SIZE,
             )
         ]
+        assert fake_redis.hgetall(REINDEX_STATE_KEY) == {
+            b"index": b"warehouse-cbcbcbcbcb",
+            b"partitions": b'[["1", "2"], ["2", null]]',
+        }
+        assert search_request.task.calls == [
+            pretend.call(reindex_partition),
+            pretend.call(reindex_partition),
+        ]
+        assert partition_task.delay.calls == [
+            pretend.call("warehouse-cbcbcbcbcb", 0, "1", "2"),
+            pretend.call("warehouse-cbcbcbcbcb", 1, "2", None),
+        ]
+        assert es_client.indices.put_settings.calls == []
+        assert es_client.indices.aliases == {}
 
-    def test_successfully_indexes_and_replaces(self, db_request, monkeypatch):
-        docs = pretend.stub()
-        task = pretend.stub()
+    def test_deletes_index_when_partitioning_fails(
+        self, search_request, partition_task, es_client, fake_redis, monkeypatch
+    ):
+        class TestException(Exception):
+            pass
 
-        def project_docs(db):
-            return docs
+        monkeypatch.setattr(
+            warehouse.search.tasks,
+            "_column_window_bounds",
+            pretend.raiser(TestException),
+        )
+        monkeypatch.setattr(os, "urandom", lambda n: b"\xcb" * n)
 
-        monkeypatch.setattr(warehouse.search.tasks, "_project_docs", project_docs)
+        with pytest.raises(TestException):
+            reindex(pretend.stub(), search_request)
 
-        es_client = FakeESClient()
-        es_client.indices.indices["warehouse-aaaaaaaaaa"] = None
-        es_client.indices.aliases["warehouse"] = ["warehouse-aaaaaaaaaa"]
-        db_engine = pretend.stub()
+        assert es_client.indices.delete.calls == [
+            pretend.call(index="warehouse-cbcbcbcbcb")
+        ]
+        assert fake_redis.hgetall(REINDEX_STATE_KEY) == {}
+        assert partition_task.delay.calls == []
 
-        db_request.registry.update(
+    def test_resumes_incomplete_reindex(
+        self, search_request, partition_task, es_client, fake_redis
+    ):
+        es_client.indices.indices["warehouse-aaaaaaaaaa"] = None
+        fake_redis.hmset(
+            REINDEX_STATE_KEY,
             {
-                "elasticsearch.index": "warehouse",
-                "elasticsearch.shards": 42,
-                "sqlalchemy.engine": db_engine,
-            }
-        )
-        db_request.registry.settings = {
-            "elasticsearch.url": "http://some.url",
-            "celery.scheduler_url": "redis://redis:6379/0",
-        }
-        monkeypatch.setattr(
-            warehouse.search.tasks.elasticsearch,
-            "Elasticsearch",
-            lambda *a, **kw: es_client,
-        )
-        monkeypatch.setattr(
-            redis.StrictRedis, "from_url", lambda *a, **kw: pretend.stub(lock=NotLock)
+                "index": "warehouse-aaaaaaaaaa",
+                "partitions": '[["1", "2"], ["2", "3"], ["3", null]]',
+            },
         )
+        fake_redis.sadd(REINDEX_COMPLETE_KEY, 1)
 
-        parallel_bulk = pretend.call_recorder(lambda client, iterable, index: [None])
-        monkeypatch.setattr(warehouse.search.tasks, "parallel_bulk", parallel_bulk)
+        reindex(pretend.stub(), search_request)
+
+        assert es_client.indices.create.calls == []
+        assert partition_task.delay.calls == [
+            pretend.call("warehouse-aaaaaaaaaa", 0, "1", "2"),
+            pretend.call("warehouse-aaaaaaaaaa", 2, "3", None),
+        ]
 
+    def test_restarts_when_index_missing(
+        self, search_request, partition_task, es_client, fake_redis, monkeypatch
+    ):
+        fake_redis.hmset(
+            REINDEX_STATE_KEY,
+            {"index": "warehouse-aaaaaaaaaa", "partitions": '[["1", null]]'},
+        )
+        fake_redis.sadd(REINDEX_COMPLETE_KEY, 0)
+        monkeypatch.setattr(
+            warehouse.search.tasks,
+            "_column_window_bounds",
+            lambda db, column, size: iter([(1, None)]),
+        )
         monkeypatch.setattr(os, "urandom", lambda n: b"\xcb" * n)
 
-        reindex(task, db_request)
+        reindex(pretend.stub(), search_request)
 
-        assert parallel_bulk.calls == [
-            pretend.call(es_client, docs, index="warehouse-cbcbcbcbcb")
-        ]
-        assert es_client.indices.create.calls == [
-            pretend.call(
-                body={
-                    "settings": {
-                        "number_of_shards": 42,
-                        "number_of_replicas": 0,
-                        "refresh_interval": "-1",
-                    }
-                },
-                wait_for_active_shards=42,
-                index="warehouse-cbcbcbcbcb",
-            )
-        ]
-        assert es_client.indices.delete.calls == [pretend.call("warehouse-aaaaaaaaaa")]
-        assert es_client.indices.aliases == {"warehouse": ["warehouse-cbcbcbcbcb"]}
-        assert es_client.indices.put_settings.calls == [
-            pretend.call(
-                index="warehouse-cbcbcbcbcb",
-                body={"index": {"number_of_replicas": 0, "refresh_interval": "1s"}},
-            )
+        assert fake_redis.smembers(REINDEX_COMPLETE_KEY) == set()
+        assert partition_task.delay.calls == [
+            pretend.call("warehouse-cbcbcbcbcb", 0, "1", None)
         ]
 
+    def test_finishes_when_complete(
+        self, search_request, partition_task, es_client, fake_redis
+    ):
+        es_client.indices.indices["warehouse-cbcbcbcbcb"] = None
+        fake_redis.hmset(
+            REINDEX_STATE_KEY,
+            {"index": "warehouse-cbcbcbcbcb", "partitions": '[["1", null]]'},
+        )
+        fake_redis.sadd(REINDEX_COMPLETE_KEY, 0)
 
-class TestPartialReindex:
-    def test_reindex_fails_when_raising(self, db_request, monkeypatch):
-        docs = pretend.stub()
-        task = pretend.stub()
+        reindex(pretend.stub(), search_request)
 
-        def project_docs(db, project_name=None):
-            return docs
+        assert partition_task.delay.calls == []
+        assert es_client.indices.aliases == {"warehouse": ["warehouse-cbcbcbcbcb"]}
+        assert fake_redis.exists(REINDEX_STATE_KEY) == 0
+        assert fake_redis.exists(REINDEX_COMPLETE_KEY) == 0
 
-        monkeypatch.setattr(warehouse.search.tasks, "_project_docs", project_docs)
 
-        es_client = FakeESClient()
-
-        db_request.registry.update(
-            {"elasticsearch.client": es_client, "elasticsearch.index": "warehouse"}
+class TestReindexPartition:
+    @pytest.fixture
+    def state(self, fake_redis):
+        fake_redis.hmset(
+            REINDEX_STATE_KEY,
+            {
+                "index": "warehouse-cbcbcbcbcb",
+                "partitions": '[["1", "2"], ["2", null]]',
+            },
         )
 
-        class TestException(Exception):
-            pass
-
-        def parallel_bulk(client, iterable, index=None):
-            assert client is es_client
-            assert iterable is docs
-            raise TestException
-
+    def test_ignores_stale_reindex(
+        self, search_request, es_client, fake_redis, state, monkeypatch
+    ):
+        parallel_bulk = pretend.call_recorder(lambda client, iterable, index: [None])
         monkeypatch.setattr(warehouse.search.tasks, "parallel_bulk", parallel_bulk)
-        monkeypatch.setattr(
-            redis.StrictRedis, "from_url", lambda *a, **kw: pretend.stub(lock=NotLock)
-        )
-
-        with pytest.raises(TestException):
-            reindex_project(task, db_request, "foo")
 
-        assert es_client.indices.put_settings.calls == []
+        reindex_partition(
+            pretend.stub(), search_request, "warehouse-aaaaaaaaaa", 0, "1", "2"
+        )
 
-    def test_unindex_fails_when_raising(self, db_request, monkeypatch):
-        task = pretend.stub()
+        assert parallel_bulk.calls == []
+        assert fake_redis.smembers(REINDEX_COMPLETE_KEY) == set()
 
+    def test_retries_when_raising(
+        self, search_request, es_client, fake_redis, state, monkeypatch
+    ):
         class TestException(Exception):
             pass
 
-        es_client = FakeESClient()
-        es_client.delete = pretend.raiser(TestException)
         monkeypatch.setattr(
-            redis.StrictRedis, "from_url", lambda *a, **kw: pretend.stub(lock=NotLock)
+            warehouse.search.tasks,
+            "_project_docs",
+            lambda db, project_ids=None: pretend.stub(),
         )
-
-        db_request.registry.update(
-            {"elasticsearch.client": es_client, "elasticsearch.index": "warehouse"}
+        monkeypatch.setattr(
+            warehouse.search.tasks, "parallel_bulk", pretend.raiser(TestException)
+        )
+        task = pretend.stub(
+            retry=pretend.call_recorder(pretend.raiser(celery.exceptions.Retry))
         )
 
-        with pytest.raises(TestException):
-            unindex_project(task, db_request, "foo")
+        with pytest.raises(celery.exceptions.Retry):
+            reindex_partition(task, search_request, "warehouse-cbcbcbcbcb", 0, "1", "2")
+
+        assert len(task.retry.calls) == 1
+        assert isinstance(task.retry.calls[0].kwargs["exc"], TestException)
+        assert search_request.db.rollback.calls == [pretend.call()]
+        assert search_request.db.close.calls == [pretend.call()]
+        assert fake_redis.smembers(REINDEX_COMPLETE_KEY) == set()
+        assert es_client.indices.aliases == {}
+
+    def test_indexes_partition(
+        self, search_request, es_client, fake_redis, state, monkeypatch
+    ):
+        docs = pretend.stub()
+        project_docs = pretend.call_recorder(lambda db, project_ids=None: docs)
+        monkeypatch.setattr(warehouse.search.tasks, "_project_docs", project_docs)
+        parallel_bulk = pretend.call_recorder(lambda client, iterable, index: [None])
+        monkeypatch.setattr(warehouse.search.tasks, "parallel_bulk", parallel_bulk)
 
-    def test_unindex_accepts_defeat(self, db_request, monkeypatch):
-        task = pretend.stub()
+        reindex_partition(
+            pretend.stub(), search_request, "warehouse-cbcbcbcbcb", 0, "1", "2"
+        )
 
-        es_client = FakeESClient()
-        es_client.delete = pretend.call_recorder(
-            pretend.raiser(elasticsearch.exceptions.NotFoundError)
+        assert project_docs.calls == [
+            pretend.call(search_request.db, project_ids=("1", "2"))
+        ]
+        assert parallel_bulk.calls == [
+            pretend.call(es_client, docs, index="warehouse-cbcbcbcbcb")
+        ]
+        assert search_request.db.execute.calls == [
+            pretend.call("SET statement_timeout = '600s'")
+        ]
+        assert fake_redis.smembers(REINDEX_COMPLETE_KEY) == {b"0"}
+        assert es_client.indices.put_settings.calls == []
+        assert es_client.indices.aliases == {}
+
+    def test_last_partition_adds_alias(
+        self, search_request, es_client, fake_redis, state, monkeypatch
+    ):
+        fake_redis.sadd(REINDEX_COMPLETE_KEY, 0)
+        monkeypatch.setattr(
+            warehouse.search.tasks,
+            "_project_docs",
+            lambda db, project_ids=None: pretend.stub(),
         )
         monkeypatch.setattr(
-            redis.StrictRedis, "from_url", lambda *a, **kw: pretend.stub(lock=NotLock)
+            warehouse.search.tasks,
+            "parallel_bulk",
+            lambda client, iterable, index: [None],
         )
 
-        db_request.registry.update(
-            {"elasticsearch.client": es_client, "elasticsearch.index": "warehouse"}
+        reindex_partition(
+            pretend.stub(), search_request, "warehouse-cbcbcbcbcb", 1, "2", None
         )
 
-        unindex_project(task, db_request, "foo")
-
-        assert es_client.delete.calls == [
-            pretend.call(index="warehouse", doc_type="doc", id="foo")
+        assert es_client.indices.delete.calls == []
+        assert es_client.indices.aliases == {"warehouse": ["warehouse-cbcbcbcbcb"]}
+        assert es_client.indices.put_settings.calls == [
+            pretend.call(
+                index="warehouse-cbcbcbcbcb",
+                body={"index": {"number_of_replicas": 0, "refresh_interval": "1s"}},
+            )
         ]
+        assert fake_redis.exists(REINDEX_STATE_KEY) == 0
+        assert fake_redis.exists(REINDEX_COMPLETE_KEY) == 0
 
-    def test_unindex_retry_on_lock(self, db_request, monkeypatch):
-        task = pretend.stub(
-            retry=pretend.call_recorder(pretend.raiser(celery.exceptions.Retry))
+    def test_last_partition_replaces_alias(
+        self, search_request, es_client, fake_redis, state, monkeypatch
+    ):
+        es_client.indices.indices["warehouse-aaaaaaaaaa"] = None
+        es_client.indices.aliases["warehouse"] = ["warehouse-aaaaaaaaaa"]
+        fake_redis.sadd(REINDEX_COMPLETE_KEY, 0)
+        monkeypatch.setattr(
+            warehouse.search.tasks,
+            "_project_docs",
+            lambda db, project_ids=None: pretend.stub(),
+        )
+        monkeypatch.setattr(
+            warehouse.search.tasks,
+            "parallel_bulk",
+            lambda client, iterable, index: [None],
         )
 
-        db_request.registry.settings = {"celery.scheduler_url": "redis://redis:6379/0"}
+        reindex_partition(
+            pretend.stub(), search_request, "warehouse-cbcbcbcbcb", 1, "2", None
+        )
+
+        assert es_client.indices.delete.calls == [pretend.call("warehouse-aaaaaaaaaa")]
+        assert es_client.indices.aliases == {"warehouse": ["warehouse-cbcbcbcbcb"]}
 
+    def test_last_partition_retry_on_lock(
+        self, search_request, es_client, fake_redis, state, monkeypatch
+    ):
+        fake_redis.sadd(REINDEX_COMPLETE_KEY, 0)
         le = redis.exceptions.LockError()
+        fake_redis.lock = pretend.raiser(le)
         monkeypatch.setattr(
-            redis.StrictRedis,
-            "from_url",
-            lambda *a, **kw: pretend.stub(lock=pretend.raiser(le)),
+            warehouse.search.tasks,
+            "_project_docs",
+            lambda db, project_ids=None: pretend.stub(),
+        )
+        monkeypatch.setattr(
+            warehouse.search.tasks,
+            "parallel_bulk",
+            lambda client, iterable, index: [None],
+        )
+        task = pretend.stub(
+            retry=pretend.call_recorder(pretend.raiser(celery.exceptions.Retry))
         )
 
         with pytest.raises(celery.exceptions.Retry):
-            unindex_project(task, db_request, "foo")
+            reindex_partition(
+                task, search_request, "warehouse-cbcbcbcbcb", 1, "2", None
+            )
 
         assert task.retry.calls == [pretend.call(countdown=60, exc=le)]
+        assert fake_redis.smembers(REINDEX_COMPLETE_KEY) == {b"0", b"1"}
+        assert es_client.indices.aliases == {}
 
-    def test_reindex_retry_on_lock(self, db_request, monkeypatch):
-        task = pretend.stub(
-            retry=pretend.call_recorder(pretend.raiser(celery.exceptions.Retry))
-        )
 
-        db_request.registry.settings = {"celery.scheduler_url": "redis://redis:6379/0"}
+def test_queue_project_reindex(fake_redis, monkeypatch):
+    now = [100]
+    monkeypatch.setattr(warehouse.search.tasks.time, "time", lambda: now[0])
+
+    queue_project_reindex(fake_redis, {"foo", "bar"})
+    queue_project_reindex(fake_redis, set())
+
+    now[0] = 200
+    queue_project_reindex(fake_redis, {"foo", "spam"})
 
+    assert fake_redis.zrange(REINDEX_PENDING_KEY, 0, -1, withscores=True) == [
+        (b"bar", 100),
+        (b"foo", 200),
+        (b"spam", 200),
+    ]
+    assert fake_redis.zrange(REINDEX_FIRST_QUEUED_KEY, 0, -1, withscores=True) == [
+        (b"bar", 100),
+        (b"foo", 100),
+        (b"spam", 200),
+    ]
+
+
+class TestReindexPendingProjects:
+    @pytest.fixture
+    def es_client(self, search_request):
+        es_client = FakeESClient()
+        search_request.registry["elasticsearch.client"] = es_client
+        return es_client
+
+    @pytest.fixture
+    def now(self, monkeypatch):
+        monkeypatch.setattr(warehouse.search.tasks.time, "time", lambda: 1000)
+
+    def test_retry_on_lock(self, search_request, fake_redis):
         le = redis.exceptions.LockError()
-        monkeypatch.setattr(
-            redis.StrictRedis,
-            "from_url",
-            lambda *a, **kw: pretend.stub(lock=pretend.raiser(le)),
+        fake_redis.lock = pretend.raiser(le)
+        task = pretend.stub(
+            retry=pretend.call_recorder(pretend.raiser(celery.exceptions.Retry))
         )
 
         with pytest.raises(celery.exceptions.Retry):
-            reindex_project(task, db_request, "foo")
+            reindex_pending_projects(task, search_request)
 
         assert task.retry.calls == [pretend.call(countdown=60, exc=le)]
 
-    def test_successfully_indexes(self, db_request, monkeypatch):
-        docs = pretend.stub()
-        task = pretend.stub()
+    def test_nothing_pending(
+        self, search_request, es_client, fake_redis, now, monkeypatch
+    ):
+        fake_redis.zadd(REINDEX_PENDING_KEY, 990, "foo")
+        parallel_bulk = pretend.call_recorder(lambda *a, **kw: [])
+        monkeypatch.setattr(warehouse.search.tasks, "parallel_bulk", parallel_bulk)
+
+        reindex_pending_projects(pretend.stub(), search_request)
 
-        def project_docs(db, project_name=None):
-            return docs
+        assert parallel_bulk.calls == []
+        assert fake_redis.zrange(REINDEX_PENDING_KEY, 0, -1) == [b"foo"]
 
+    def test_indexes_overdue_projects(
+        self, search_request, es_client, fake_redis, now, monkeypatch
+    ):
+        # Both projects have changed too recently to have been debounced, but
+        # foo was first queued long enough ago that it has waited long enough.
+        fake_redis.zadd(REINDEX_PENDING_KEY, 995, "foo", 995, "bar")
+        fake_redis.zadd(REINDEX_FIRST_QUEUED_KEY, 600, "foo", 990, "bar")
+
+        project_docs = pretend.call_recorder(
+            lambda db, normalized_names: [
+                {"_id": name, "_type": "doc"} for name in normalized_names
+            ]
+        )
         monkeypatch.setattr(warehouse.search.tasks, "_project_docs", project_docs)
+        monkeypatch.setattr(
+            warehouse.search.tasks,
+            "parallel_bulk",
+            lambda client, actions, index, raise_on_error: [
+                (True, {"index": {"_id": action["_id"], "status": 200}})
+                for action in actions
+            ],
+        )
 
-        es_client = FakeESClient()
-        es_client.indices.indices["warehouse-aaaaaaaaaa"] = None
-        es_client.indices.aliases["warehouse"] = ["warehouse-aaaaaaaaaa"]
-        db_engine = pretend.stub()
+        reindex_pending_projects(pretend.stub(), search_request)
 
-        db_request.registry.update(
-            {
-                "elasticsearch.client": es_client,
-                "elasticsearch.index": "warehouse",
-                "elasticsearch.shards": 42,
-                "sqlalchemy.engine": db_engine,
-            }
+        assert project_docs.calls == [
+            pretend.call(search_request.db, normalized_names=["foo"])
+        ]
+        assert fake_redis.zrange(REINDEX_PENDING_KEY, 0, -1) == [b"bar"]
+        assert fake_redis.zrange(REINDEX_FIRST_QUEUED_KEY, 0, -1) == [b"bar"]
+
+    def test_indexes_and_deletes_in_batches(
+        self, search_request, es_client, fake_redis, now, monkeypatch
+    ):
+        monkeypatch.setattr(warehouse.search.tasks, "REINDEX_BATCH_SIZE", 2)
+        fake_redis.zadd(
+            REINDEX_PENDING_KEY, 900, "foo", 910, "bar", 920, "spam", 990, "eggs"
+        )
+        fake_redis.hmset(
+            REINDEX_STATE_KEY,
+            {"index": "warehouse-cbcbcbcbcb", "partitions": '[["1", null]]'},
         )
 
-        parallel_bulk = pretend.call_recorder(
-            lambda client, iterable, index=None: [None]
+        project_docs = pretend.call_recorder(
+            lambda db, normalized_names: [
+                {"_id": name, "_type": "doc"}
+                for name in normalized_names
+                if name != "bar"
+            ]
         )
+        monkeypatch.setattr(warehouse.search.tasks, "_project_docs", project_docs)
+
+        bulk_calls = []
+
+        def parallel_bulk(client, actions, index, raise_on_error):
+            assert client is es_client
+            assert not raise_on_error
+            bulk_calls.append((index, actions))
+            for action in actions:
+                if action.get("_op_type") == "delete":
+                    yield False, {"delete": {"_id": action["_id"], "status": 404}}
+                else:
+                    yield True, {"index": {"_id": action["_id"], "status": 200}}
+
         monkeypatch.setattr(warehouse.search.tasks, "parallel_bulk", parallel_bulk)
+
+        reindex_pending_projects(pretend.stub(), search_request)
+
+        assert project_docs.calls == [
+            pretend.call(search_request.db, normalized_names=["foo", "bar"]),
+            pretend.call(search_request.db, normalized_names=["spam"]),
+        ]
+        assert bulk_calls == [
+            (
+                "warehouse",
+                [
+                    {"_id": "foo", "_type": "doc"},
+                    {"_op_type": "delete", "_type": "doc", "_id": "bar"},
+                ],
+            ),
+            (
+                "warehouse-cbcbcbcbcb",
+                [
+                    {"_id": "foo", "_type": "doc"},
+                    {"_op_type": "delete", "_type": "doc", "_id": "bar"},
+                ],
+            ),
+            ("warehouse", [{"_id": "spam", "_type": "doc"}]),
+            ("warehouse-cbcbcbcbcb", [{"_id": "spam", "_type": "doc"}]),
+        ]
+        assert search_request.db.rollback.calls == [pretend.call(), pretend.call()]
+        assert fake_redis.zrange(REINDEX_PENDING_KEY, 0, -1) == [b"eggs"]
+
+    def test_requeues_failed_projects(
+        self, search_request, es_client, fake_redis, now, monkeypatch
+    ):
+        fake_redis.zadd(REINDEX_PENDING_KEY, 900, "foo", 910, "bar")
+        monkeypatch.setattr(
+            warehouse.search.tasks,
+            "_project_docs",
+            lambda db, normalized_names: [
+                {"_id": name, "_type": "doc"} for name in normalized_names
+            ],
+        )
         monkeypatch.setattr(
-            redis.StrictRedis, "from_url", lambda *a, **kw: pretend.stub(lock=NotLock)
+            warehouse.search.tasks,
+            "parallel_bulk",
+            lambda client, actions, index, raise_on_error: [
+                (True, {"index": {"_id": "foo", "status": 200}}),
+                (False, {"index": {"_id": "bar", "status": 500}}),
+            ],
         )
 
-        reindex_project(task, db_request, "foo")
+        reindex_pending_projects(pretend.stub(), search_request)
 
-        assert parallel_bulk.calls == [pretend.call(es_client, docs, index="warehouse")]
-        assert es_client.indices.create.calls == []
-        assert es_client.indices.delete.calls == []
-        assert es_client.indices.aliases == {"warehouse": ["warehouse-aaaaaaaaaa"]}
-        assert es_client.indices.put_settings.calls == []
+        assert fake_redis.zrange(REINDEX_PENDING_KEY, 0, -1, withscores=True) == [
+            (b"bar", 1000)
+        ]
+
+    def test_requeues_and_retries_when_raising(
+        self, search_request, es_client, fake_redis, now, monkeypatch
+    ):
+        class TestException(Exception):
+            pass
+
+        fake_redis.zadd(REINDEX_PENDING_KEY, 900, "foo")
+        monkeypatch.setattr(
+            warehouse.search.tasks, "_project_docs", pretend.raiser(TestException)
+        )
+        task = pretend.stub(
+            retry=pretend.call_recorder(pretend.raiser(celery.exceptions.Retry))
+        )
+
+        with pytest.raises(celery.exceptions.Retry):
+            reindex_pending_projects(task, search_request)
+
+        assert len(task.retry.calls) == 1
+        assert isinstance(task.retry.calls[0].kwargs["exc"], TestException)
+        assert search_request.db.rollback.calls == [pretend.call()]
+        assert fake_redis.zrange(REINDEX_PENDING_KEY, 0, -1, withscores=True) == [
+            (b"foo", 1000)
+        ]
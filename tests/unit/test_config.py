@@ -298,6 +298,7 @@ def test_configure(monkeypatch, settings, environment, other_settings):
             pretend.call("pyramid_retry"),
             pretend.call("pyramid_tm"),
             pretend.call(".legacy.api.xmlrpc.cache"),
+            pretend.call(".legacy.api.json_cache"),
             pretend.call("pyramid_rpc.xmlrpc"),
             pretend.call(".legacy.action_routing"),
             pretend.call(".domain"),
@@ -235,6 +235,15 @@ def test_routes(warehouse):
             read_only=True,
             domain=warehouse,
         ),
+        pretend.call(
+            "legacy.api.json.bulk", "/pypi/json", read_only=True, domain=warehouse
+        ),
+        pretend.call(
+            "legacy.api.json.changelog",
+            "/pypi/json/changelog",
+            read_only=True,
+            domain=warehouse,
+        ),
         pretend.call(
             "legacy.api.json.project",
             "/pypi/{name}/json",
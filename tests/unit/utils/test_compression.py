@@ -98,6 +98,43 @@ class TestCompressor:
         assert response.body == compressed_body
         assert response.etag == "rfbezwKUdGjz6VPWDLDTvA"
 
+    def test_doesnt_change_etag_streaming_identity(self):
+        decompressed_body = b"foofoofoofoofoofoofoofoofoofoofoofoofoofoo"
+
+        request = pretend.stub(accept_encoding=AcceptEncodingNoHeader())
+        response = Response(app_iter=iter([decompressed_body]))
+        response.etag = "foo"
+
+        compressor(request, response)
+
+        assert response.content_encoding is None
+        assert response.content_length is None
+        assert response.body == decompressed_body
+        assert response.etag == "foo"
+
+    def test_closes_streaming(self):
+        closed = []
+
+        class AppIter:
+            def __iter__(self):
+                yield b"foo"
+                yield b"bar"
+
+            def close(self):
+                closed.append(True)
+
+        request = pretend.stub(accept_encoding=AcceptEncodingValidHeader("gzip"))
+        response = Response(app_iter=AppIter())
+
+        compressor(request, response)
+
+        app_iter = iter(response.app_iter)
+        next(app_iter)
+        assert closed == []
+
+        app_iter.close()
+        assert closed == [True]
+
     def test_buffers_small_streaming(self):
         decompressed_body = b"foofoofoofoofoofoofoofoofoofoofoofoofoofoo"
         compressed_body = b"".join(list(gzip_app_iter([decompressed_body])))
@@ -13,6 +13,7 @@
 from pyramid.httpexceptions import HTTPSeeOther
 from pyramid.view import view_config, view_defaults
 
+from warehouse.classifiers.cache import classifiers_changed
 from warehouse.packaging.models import Classifier
 
 
@@ -50,6 +51,7 @@ class AddClassifier:
         self.request.db.flush()  # To get the ID
 
         classifier.l2 = classifier.id
+        classifiers_changed(self.request.db)
 
         self.request.session.flash(
             f"Added classifier {classifier.classifier!r}", queue="success"
@@ -78,6 +80,8 @@ class AddClassifier:
                 setattr(classifier, level, classifier.id)
                 break
 
+        classifiers_changed(self.request.db)
+
         self.request.session.flash(
             f"Added classifier {classifier.classifier!r}", queue="success"
         )
@@ -97,6 +101,7 @@ def deprecate_classifier(request):
     classifier = request.db.query(Classifier).get(request.params.get("classifier_id"))
 
     classifier.deprecated = True
+    classifiers_changed(request.db)
 
     request.session.flash(
         f"Deprecated classifier {classifier.classifier!r}", queue="success"
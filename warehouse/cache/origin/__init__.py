@@ -20,6 +20,7 @@ from sqlalchemy.orm.session import Session
 from warehouse import db
 from warehouse.cache.origin.derivers import html_cache_deriver
 from warehouse.cache.origin.interfaces import IOriginCache
+from warehouse.cache.origin.throttle import throttle_from_config
 
 
 @db.listens_for(db.Session, "after_flush")
@@ -50,6 +51,10 @@ def execute_purge(config, session):
     except LookupError:
         return
 
+    throttle = throttle_from_config(config)
+    if throttle is not None:
+        purges = throttle.filter(purges)
+
     cacher = cacher_factory(None, config)
     cacher.purge(purges)
 
@@ -125,10 +130,17 @@ def key_maker_factory(cache_keys, purge_keys):
     return key_maker
 
 
-def register_origin_cache_keys(config, klass, cache_keys=None, purge_keys=None):
+def register_origin_cache_keys(
+    config, klass, cache_keys=None, purge_keys=None, purge_intervals=None
+):
     key_makers = config.registry.setdefault("cache_keys", {})
     key_makers[klass] = key_maker_factory(cache_keys=cache_keys, purge_keys=purge_keys)
 
+    # Keys with a purge interval will be purged at most once per that many
+    # seconds, see warehouse.cache.origin.throttle.
+    if purge_intervals:
+        config.registry.setdefault("cache_purge_intervals", {}).update(purge_intervals)
+
 
 def receive_set(attribute, config, target):
     cache_keys = config.registry["cache_keys"]
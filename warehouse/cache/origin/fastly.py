@@ -10,8 +10,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 import urllib.parse
 
+import redis
 import requests
 
 from zope.interface import implementer
@@ -20,42 +22,115 @@ from warehouse import tasks
 from warehouse.cache.origin.interfaces import IOriginCache
 
 
+# Fastly will accept at most this many surrogate keys in a single bulk purge.
+PURGE_BATCH_SIZE = 256
+
+# Keys that are purged are buffered in Redis for this many seconds, so that the
+# purges from many sessions can be collapsed into a few bulk purges.
+PURGE_WINDOW = 5
+
+PENDING_PURGES_KEY = "origin-cache/pending-purges"
+PURGE_SCHEDULED_KEY = "origin-cache/purge-scheduled"
+
+
 class UnsuccessfulPurge(Exception):
     pass
 
 
+PURGE_ERRORS = (
+    requests.ConnectionError,
+    requests.HTTPError,
+    requests.Timeout,
+    UnsuccessfulPurge,
+)
+
+
 @tasks.task(bind=True, ignore_result=True, acks_late=True)
 def purge_key(task, request, key):
     cacher = request.find_service(IOriginCache)
     request.log.info("Purging %s", key)
     try:
         cacher.purge_key(key)
-    except (
-        requests.ConnectionError,
-        requests.HTTPError,
-        requests.Timeout,
-        UnsuccessfulPurge,
-    ) as exc:
+    except PURGE_ERRORS as exc:
         request.log.error("Error purging %s: %s", key, str(exc))
         raise task.retry(exc=exc)
 
 
+def _purge_keys(request, cacher, keys):
+    keys = sorted(keys)
+    for start in range(0, len(keys), PURGE_BATCH_SIZE):
+        batch = keys[start : start + PURGE_BATCH_SIZE]
+        request.log.info("Purging %d keys", len(batch))
+        try:
+            cacher.purge_keys(batch)
+        except PURGE_ERRORS as exc:
+            # If the bulk purge fails, then we fall back to purging each of the
+            # keys on their own, which will individually retry as needed.
+            request.log.error("Error purging %d keys: %s", len(batch), str(exc))
+            for key in batch:
+                request.task(purge_key).delay(key)
+
+
+@tasks.task(bind=True, ignore_result=True, acks_late=True)
+def purge_keys(task, request, keys):
+    _purge_keys(request, request.find_service(IOriginCache), keys)
+
+
+@tasks.task(bind=True, ignore_result=True, acks_late=True)
+def purge_pending_keys(task, request):
+    cacher = request.find_service(IOriginCache)
+    _purge_keys(request, cacher, cacher.pop_pending_purges())
+
+
 @implementer(IOriginCache)
 class FastlyCache:
 
     _api_domain = "https://api.fastly.com"
 
-    def __init__(self, *, api_key, service_id, purger):
+    def __init__(
+        self,
+        *,
+        api_key,
+        service_id,
+        purger,
+        batch_purger=None,
+        http=None,
+        redis_conn=None,
+        purge_window=PURGE_WINDOW
+    ):
         self.api_key = api_key
         self.service_id = service_id
         self._purger = purger
+        self._batch_purger = batch_purger
+        self._http = http if http is not None else requests
+        self.redis_conn = redis_conn
+        self.purge_window = purge_window
 
     @classmethod
     def create_service(cls, context, request):
+        settings = request.registry.settings
+        purge_window = int(settings.get("origin_cache.purge_window", PURGE_WINDOW))
+
+        if "origin_cache.redis_url" in settings:
+            redis_conn = redis.StrictRedis.from_url(settings["origin_cache.redis_url"])
+            batch_purger = functools.partial(
+                request.task(purge_pending_keys).apply_async, countdown=purge_window
+            )
+        else:
+            redis_conn = None
+            batch_purger = request.task(purge_keys).delay
+
         return cls(
-            api_key=request.registry.settings["origin_cache.api_key"],
-            service_id=request.registry.settings["origin_cache.service_id"],
+            api_key=settings["origin_cache.api_key"],
+            service_id=settings["origin_cache.service_id"],
             purger=request.task(purge_key).delay,
+            batch_purger=batch_purger,
+            # Purges are triggered once a session has been committed, in which
+            # case we're created with the Configurator rather than a request
+            # and we won't be making any HTTP requests ourselves.
+            http=getattr(request, "http", None),
+            redis_conn=redis_conn,
+            purge_window=purge_window,
         )
 
     def cache(
@@ -87,8 +162,38 @@ class FastlyCache:
             response.headers["Surrogate-Control"] = ", ".join(values)
 
     def purge(self, keys):
-        for key in keys:
-            self._purger(key)
+        keys = set(keys)
+        if not keys:
+            return
+
+        if self._batch_purger is None:
+            for key in keys:
+                self._purger(key)
+        elif self.redis_conn is None:
+            self._batch_purger(sorted(keys))
+        else:
+            # Add our keys to the pending set, which deduplicates them with the
+            # keys from any other session, and then schedule a purge of the
+            # pending set unless one has already been scheduled. The scheduled
+            # marker expires on its own, so that a lost task can't stop purges
+            # from ever being scheduled again.
+            pipeline = self.redis_conn.pipeline()
+            pipeline.sadd(PENDING_PURGES_KEY, *keys)
+            pipeline.set(PURGE_SCHEDULED_KEY, "1", nx=True, ex=self.purge_window * 12)
+            _, scheduled = pipeline.execute()
+            if scheduled:
+                self._batch_purger()
+
+    def pop_pending_purges(self):
+        # Clearing the scheduled marker in the same transaction that takes the
+        # pending keys means that any key added after this point will schedule
+        # another purge.
+        pipeline = self.redis_conn.pipeline()
+        pipeline.delete(PURGE_SCHEDULED_KEY)
+        pipeline.smembers(PENDING_PURGES_KEY)
+        pipeline.delete(PENDING_PURGES_KEY)
+        _, keys, _ = pipeline.execute()
+        return {key.decode("utf8") for key in keys}
 
     def purge_key(self, key):
         path = "/service/{service_id}/purge/{key}".format(
@@ -101,8 +206,27 @@ class FastlyCache:
             "Fastly-Soft-Purge": "1",
         }
 
-        resp = requests.post(url, headers=headers)
+        resp = self._http.post(url, headers=headers)
         resp.raise_for_status()
 
         if resp.json().get("status") != "ok":
             raise UnsuccessfulPurge("Could not purge {!r}".format(key))
+
+    def purge_keys(self, keys):
+        path = "/service/{service_id}/purge".format(service_id=self.service_id)
+        url = urllib.parse.urljoin(self._api_domain, path)
+        headers = {
+            "Accept": "application/json",
+            "Fastly-Key": self.api_key,
+            "Fastly-Soft-Purge": "1",
+            "Surrogate-Key": " ".join(keys),
+        }
+
+        resp = self._http.post(url, headers=headers)
+        resp.raise_for_status()
+
+        # A successful bulk purge returns a mapping of each key to the id of
+        # the purge for that key.
+        purged = resp.json()
+        if not isinstance(purged, dict) or set(keys) - set(purged):
+            raise UnsuccessfulPurge("Could not purge {!r}".format(keys))
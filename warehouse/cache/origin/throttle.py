@@ -0,0 +1,130 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import redis
+
+from warehouse import tasks
+from warehouse.cache.origin.interfaces import IOriginCache
+from warehouse.metrics import IMetricsService
+
+
+THROTTLE_KEY = "origin-cache/throttle/{}"
+COLLAPSED_KEY = "origin-cache/throttle/{}/collapsed"
+
+
+class PurgeThrottle:
+    """
+    Limits how often each of the configured keys is purged, to at most once
+    per its interval. The first purge of a key is sent straight away, and any
+    purges requested during the interval that follows are collapsed into a
+    single trailing purge at the end of it.
+    """
+
+    def __init__(self, redis_conn, intervals, *, metrics, scheduler):
+        self.redis_conn = redis_conn
+        self.intervals = intervals
+        self._metrics = metrics
+        self._scheduler = scheduler
+
+    def _record(self, key, action):
+        self._metrics.increment(
+            "warehouse.cache.origin.throttle", tags=[f"key:{key}", f"action:{action}"]
+        )
+
+    def filter(self, keys):
+        """
+        Return the keys which should be purged now.
+        """
+        keys = set(keys)
+        for key in keys & self.intervals.keys():
+            interval = self.intervals[key]
+            if self.redis_conn.set(THROTTLE_KEY.format(key), "1", nx=True, ex=interval):
+                self._scheduler(key, interval)
+                self._record(key, "purged")
+            else:
+                # The collapsed marker outlives the interval, so that it will
+                # still be there when the trailing purge for it runs.
+                self.redis_conn.set(COLLAPSED_KEY.format(key), "1", ex=interval * 2)
+                keys.discard(key)
+                self._record(key, "collapsed")
+        return keys
+
+    def trailing(self, key):
+        """
+        Return whether a trailing purge of the key is needed, because purges of
+        it were collapsed during the interval that has just ended. If it is,
+        then a new interval is started.
+        """
+        pipeline = self.redis_conn.pipeline()
+        pipeline.get(COLLAPSED_KEY.format(key))
+        pipeline.delete(COLLAPSED_KEY.format(key))
+        collapsed, _ = pipeline.execute()
+
+        if collapsed is None:
+            return False
+
+        interval = self.intervals.get(key)
+        if interval is not None:
+            self.redis_conn.set(THROTTLE_KEY.format(key), "1", ex=interval)
+            self._scheduler(key, interval)
+        self._record(key, "trailing")
+
+        return True
+
+
+def _scheduler(request):
+    def schedule(key, interval):
+        request.task(purge_throttled_key).apply_async((key,), countdown=interval)
+
+    return schedule
+
+
+def _create_throttle(registry, metrics_factory, scheduler):
+    intervals = registry.get("cache_purge_intervals")
+    redis_url = registry.settings.get("origin_cache.redis_url")
+    if not intervals or redis_url is None:
+        return
+
+    return PurgeThrottle(
+        redis.StrictRedis.from_url(redis_url),
+        intervals,
+        metrics=metrics_factory(),
+        scheduler=scheduler,
+    )
+
+
+def throttle_from_config(config):
+    """
+    Return the PurgeThrottle for purges triggered by a committed session, or
+    None if no keys are throttled.
+    """
+    return _create_throttle(
+        config.registry,
+        lambda: config.find_service_factory(IMetricsService)(None, config),
+        _scheduler(config),
+    )
+
+
+def throttle_from_request(request):
+    return _create_throttle(
+        request.registry,
+        lambda: request.find_service(IMetricsService, context=None),
+        _scheduler(request),
+    )
+
+
+@tasks.task(bind=True, ignore_result=True, acks_late=True)
+def purge_throttled_key(task, request, key):
+    throttle = throttle_from_request(request)
+    if throttle is not None and throttle.trailing(key):
+        request.log.info("Purging throttled key %s", key)
+        request.find_service(IOriginCache).purge([key])
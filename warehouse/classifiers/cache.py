@@ -0,0 +1,156 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+import redis
+
+from warehouse import db
+from warehouse.classifiers.models import Classifier
+
+
+# The version of the classifiers is bumped in Redis whenever they're changed,
+# so that every process knows to reload its copy of them.
+CLASSIFIERS_VERSION_KEY = "warehouse.classifiers.version"
+
+# Even if the version hasn't changed, we'll reload the classifiers once our
+# copy of them is this many seconds old, in case we missed a change to them.
+CLASSIFIERS_MAX_AGE = 5 * 60
+
+
+def classifiers_redis(settings):
+    url = settings.get("classifiers.redis_url")
+    if url is None:
+        return None
+    return redis.StrictRedis.from_url(url)
+
+
+class ClassifierSet:
+    """
+    An unchanging copy of the trove classifiers table, indexed for the lookups
+    that we make while validating an upload.
+    """
+
+    def __init__(self, classifiers, *, version=None, loaded_at=None):
+        self.version = version
+        self.loaded_at = loaded_at
+        self.ids = {}
+        self.deprecated = set()
+        for id_, classifier, deprecated in classifiers:
+            self.ids[classifier] = id_
+            if deprecated:
+                self.deprecated.add(classifier)
+
+    @classmethod
+    def load(cls, session, **kwargs):
+        query = session.query(
+            Classifier.id, Classifier.classifier, Classifier.deprecated
+        )
+        return cls(query.all(), **kwargs)
+
+    def __contains__(self, classifier):
+        return classifier in self.ids
+
+    def __iter__(self):
+        # We're iterated over as the choices of a SelectMultipleField.
+        for classifier in self.ids:
+            yield (classifier, classifier)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class ClassifierCache:
+    """
+    A per process cache of the trove classifiers, which is reloaded whenever
+    the version of them in Redis changes.
+    """
+
+    def __init__(self, *, max_age=CLASSIFIERS_MAX_AGE, clock=time.monotonic):
+        self.max_age = max_age
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._current = None
+
+    def _version(self, redis_conn):
+        if redis_conn is None:
+            return None
+        try:
+            return redis_conn.get(CLASSIFIERS_VERSION_KEY)
+        except redis.exceptions.RedisError:
+            return None
+
+    def _is_fresh(self, current, version):
+        return (
+            current is not None
+            and current.version == version
+            and self._clock() - current.loaded_at < self.max_age
+        )
+
+    def get(self, session, redis_conn=None):
+        # We have to get the version before we load the classifiers, otherwise
+        # a change made in between would leave us with the old classifiers
+        # under the new version.
+        version = self._version(redis_conn)
+
+        current = self._current
+        if self._is_fresh(current, version):
+            return current
+
+        with self._lock:
+            current = self._current
+            if not self._is_fresh(current, version):
+                current = self._current = ClassifierSet.load(
+                    session, version=version, loaded_at=self._clock()
+                )
+            return current
+
+    def invalidate(self):
+        self._current = None
+
+
+classifier_cache = ClassifierCache()
+
+
+def get_classifiers(request):
+    """
+    Return the current ClassifierSet, from this process's cache if possible.
+    """
+    return classifier_cache.get(
+        request.db, classifiers_redis(request.registry.settings)
+    )
+
+
+def classifiers_changed(session):
+    """
+    Mark the classifiers as having been changed in the given session, so that
+    every process reloads them once the session has been committed.
+    """
+    session.info["warehouse.classifiers.changed"] = True
+
+
+@db.listens_for(db.Session, "after_commit")
+def execute_classifiers_changed(config, session):
+    if not session.info.pop("warehouse.classifiers.changed", False):
+        return
+
+    classifier_cache.invalidate()
+
+    redis_conn = classifiers_redis(config.registry.settings)
+    if redis_conn is not None:
+        # If this fails the other processes will still reload the classifiers
+        # once their copy of them has reached CLASSIFIERS_MAX_AGE.
+        try:
+            redis_conn.incr(CLASSIFIERS_VERSION_KEY)
+        except redis.exceptions.RedisError:
+            pass
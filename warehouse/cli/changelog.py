@@ -0,0 +1,51 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+import click
+
+from warehouse.cli import warehouse
+from warehouse.legacy.api.changelog import (
+    RELAY_INTERVAL,
+    changelog_redis,
+    relay_journal_notifications,
+)
+
+
+@warehouse.group()  # pragma: no branch
+def changelog():
+    """
+    Manage the changelog feed.
+    """
+
+
+@changelog.command()
+@click.pass_obj
+def relay(config):
+    """
+    Relay new journal serials from PostgreSQL to Redis.
+    """
+
+    redis_conn = changelog_redis(config.registry.settings)
+    if redis_conn is None:
+        raise click.ClickException("changelog.redis_url is not configured.")
+
+    engine = config.registry["sqlalchemy.engine"]
+    while True:
+        try:
+            relay_journal_notifications(engine, redis_conn)
+        except Exception as exc:
+            # If we lose either connection, we'll just start again from the
+            # latest serial once we're able to.
+            click.echo(f"Error relaying journal notifications: {exc!r}", err=True)
+            time.sleep(RELAY_INTERVAL)
@@ -174,6 +174,21 @@ def configure(settings=None):
     maybe_set(settings, "token.password.secret", "TOKEN_PASSWORD_SECRET")
     maybe_set(settings, "token.email.secret", "TOKEN_EMAIL_SECRET")
     maybe_set(settings, "warehouse.xmlrpc.cache.url", "REDIS_URL")
+    maybe_set(
+        settings,
+        "warehouse.xmlrpc.cache.local_size",
+        "XMLRPC_CACHE_LOCAL_SIZE",
+        coercer=int,
+    )
+    maybe_set(settings, "warehouse.xmlrpc.cache.serializer", "XMLRPC_CACHE_SERIALIZER")
+    maybe_set(
+        settings, "warehouse.xmlrpc.cache.compression", "XMLRPC_CACHE_COMPRESSION"
+    )
+    maybe_set(settings, "warehouse.json.cache.url", "REDIS_URL")
+    maybe_set(settings, "origin_cache.redis_url", "REDIS_URL")
+    maybe_set(settings, "packaging.serials.redis_url", "REDIS_URL")
+    maybe_set(settings, "changelog.redis_url", "REDIS_URL")
+    maybe_set(settings, "classifiers.redis_url", "REDIS_URL")
     maybe_set(settings, "token.password.max_age", "TOKEN_PASSWORD_MAX_AGE", coercer=int)
     maybe_set(settings, "token.email.max_age", "TOKEN_EMAIL_MAX_AGE", coercer=int)
     maybe_set(
@@ -185,6 +200,7 @@ def configure(settings=None):
     )
     maybe_set_compound(settings, "files", "backend", "FILES_BACKEND")
     maybe_set_compound(settings, "docs", "backend", "DOCS_BACKEND")
+    maybe_set_compound(settings, "simple", "backend", "SIMPLE_BACKEND")
     maybe_set_compound(settings, "origin_cache", "backend", "ORIGIN_CACHE")
     maybe_set_compound(settings, "mail", "backend", "MAIL_BACKEND")
     maybe_set_compound(settings, "metrics", "backend", "METRICS_BACKEND")
@@ -318,6 +334,9 @@ def configure(settings=None):
     # Register our XMLRPC cache
     config.include(".legacy.api.xmlrpc.cache")
 
+    # Register support for caching the responses from our JSON API
+    config.include(".legacy.api.json_cache")
+
     # Register support for XMLRPC and override it's renderer to allow
     # specifying custom dumps arguments.
     config.include("pyramid_rpc.xmlrpc")
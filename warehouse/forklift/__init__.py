@@ -33,6 +33,9 @@ def includeme(config):
     config.add_legacy_action_route(
         "forklift.legacy.file_upload", "file_upload", domain=forklift
     )
+    config.add_legacy_action_route(
+        "forklift.legacy.file_upload_multiple", "file_upload_multiple", domain=forklift
+    )
     config.add_legacy_action_route("forklift.legacy.submit", "submit", domain=forklift)
     config.add_legacy_action_route(
         "forklift.legacy.submit_pkg_info", "submit_pkg_info", domain=forklift
@@ -10,6 +10,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import concurrent.futures
 import email
 import hashlib
 import hmac
@@ -17,6 +19,7 @@ import os.path
 import re
 import tempfile
 import zipfile
+import zlib
 from cgi import parse_header
 
 from cgi import FieldStorage
@@ -35,13 +38,17 @@ import wtforms.validators
 from pyramid.httpexceptions import HTTPBadRequest, HTTPForbidden, HTTPGone
 from pyramid.response import Response
 from pyramid.view import view_config
-from sqlalchemy import exists, func, orm
+from sqlalchemy import exists, func, literal, select, true
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
+from webob.multidict import MultiDict
 
 from warehouse import forms
 from warehouse.admin.squats import Squat
+from warehouse.classifiers.cache import get_classifiers
 from warehouse.classifiers.models import Classifier
+from warehouse.packaging import promote_on_commit
 from warehouse.packaging.interfaces import IFileStorage
+from warehouse.packaging.ordering import version_sort_key
 from warehouse.packaging.models import (
     Project,
     Release,
@@ -59,6 +66,16 @@ from warehouse.utils import http
 MAX_FILESIZE = 60 * 1024 * 1024  # 60M
 MAX_SIGSIZE = 8 * 1024  # 8K
 
+# The most files that can be uploaded for a release in a single request.
+MAX_FILES_PER_UPLOAD = 100
+
+# How many files we'll stage at once when several are uploaded together.
+UPLOAD_STAGE_CONCURRENCY = 4
+
+# How much of an uploaded file we read at a time. This is large enough that the
+# hash functions will release the GIL while they're working on each chunk.
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1M
+
 PATH_HASHER = "blake2_256"
 
 
@@ -339,6 +356,91 @@ class ListField(wtforms.Field):
         self.data = [v.strip() for v in valuelist if v.strip()]
 
 
+class ClassifiersField(wtforms.fields.SelectMultipleField):
+    def pre_validate(self, form):
+        # Our choices are a ClassifierSet, so rather than building a list of
+        # every classifier for each upload to search through, we can just
+        # check whether each classifier is in it.
+        for classifier in self.data or []:
+            if classifier not in self.choices:
+                raise ValueError(
+                    self.gettext("'%(value)s' is not a valid choice for this field")
+                    % dict(value=classifier)
+                )
+
+
+class FileForm(forms.Form):
+
+    # The information about a single file being uploaded for a release.
+    pyversion = wtforms.StringField(validators=[wtforms.validators.Optional()])
+    filetype = wtforms.StringField(
+        validators=[
+            wtforms.validators.DataRequired(),
+            wtforms.validators.AnyOf(
+                [
+                    "bdist_dmg",
+                    "bdist_dumb",
+                    "bdist_egg",
+                    "bdist_msi",
+                    "bdist_rpm",
+                    "bdist_wheel",
+                    "bdist_wininst",
+                    "sdist",
+                ],
+                message="Use a known file type.",
+            ),
+        ]
+    )
+    comment = wtforms.StringField(validators=[wtforms.validators.Optional()])
+    md5_digest = wtforms.StringField(validators=[wtforms.validators.Optional()])
+    sha256_digest = wtforms.StringField(
+        validators=[
+            wtforms.validators.Optional(),
+            wtforms.validators.Regexp(
+                r"^[A-F0-9]{64}$",
+                re.IGNORECASE,
+                message="Use a valid, hex-encoded, SHA256 message digest.",
+            ),
+        ]
+    )
+    blake2_256_digest = wtforms.StringField(
+        validators=[
+            wtforms.validators.Optional(),
+            wtforms.validators.Regexp(
+                r"^[A-F0-9]{64}$",
+                re.IGNORECASE,
+                message="Use a valid, hex-encoded, BLAKE2 message digest.",
+            ),
+        ]
+    )
+
+    def full_validate(self):
+        # All non source releases *must* have a pyversion
+        if (
+            self.filetype.data
+            and self.filetype.data != "sdist"
+            and not self.pyversion.data
+        ):
+            raise wtforms.validators.ValidationError(
+                "Python version is required for binary distribution uploads."
+            )
+
+        # All source releases *must* have a pyversion of "source"
+        if self.filetype.data == "sdist":
+            if not self.pyversion.data:
+                self.pyversion.data = "source"
+            elif self.pyversion.data != "source":
+                raise wtforms.validators.ValidationError(
+                    "Use 'source' as Python version for an sdist."
+                )
+
+        # We *must* have at least one digest to verify against.
+        if not self.md5_digest.data and not self.sha256_digest.data:
+            raise wtforms.validators.ValidationError(
+                "Include at least one message digest."
+            )
+
+
 # TODO: Eventually this whole validation thing should move to the packaging
 #       library and we should just call that. However until PEP 426 is done
 #       that library won't have an API for this.
@@ -425,7 +527,7 @@ class MetadataForm(forms.Form):
     keywords = wtforms.StringField(
         description="Keywords", validators=[wtforms.validators.Optional()]
     )
-    classifiers = wtforms.fields.SelectMultipleField(description="Classifier")
+    classifiers = ClassifiersField(description="Classifier")
     platform = wtforms.StringField(
         description="Platform", validators=[wtforms.validators.Optional()]
     )
@@ -446,49 +548,6 @@ class MetadataForm(forms.Form):
         validators=[wtforms.validators.Optional(), _validate_pep440_specifier_field],
     )
 
-    # File information
-    pyversion = wtforms.StringField(validators=[wtforms.validators.Optional()])
-    filetype = wtforms.StringField(
-        validators=[
-            wtforms.validators.DataRequired(),
-            wtforms.validators.AnyOf(
-                [
-                    "bdist_dmg",
-                    "bdist_dumb",
-                    "bdist_egg",
-                    "bdist_msi",
-                    "bdist_rpm",
-                    "bdist_wheel",
-                    "bdist_wininst",
-                    "sdist",
-                ],
-                message="Use a known file type.",
-            ),
-        ]
-    )
-    comment = wtforms.StringField(validators=[wtforms.validators.Optional()])
-    md5_digest = wtforms.StringField(validators=[wtforms.validators.Optional()])
-    sha256_digest = wtforms.StringField(
-        validators=[
-            wtforms.validators.Optional(),
-            wtforms.validators.Regexp(
-                r"^[A-F0-9]{64}$",
-                re.IGNORECASE,
-                message="Use a valid, hex-encoded, SHA256 message digest.",
-            ),
-        ]
-    )
-    blake2_256_digest = wtforms.StringField(
-        validators=[
-            wtforms.validators.Optional(),
-            wtforms.validators.Regexp(
-                r"^[A-F0-9]{64}$",
-                re.IGNORECASE,
-                message="Use a valid, hex-encoded, BLAKE2 message digest.",
-            ),
-        ]
-    )
-
     # Legacy dependency information
     requires = ListField(
         validators=[wtforms.validators.Optional(), _validate_legacy_non_dist_req_list]
@@ -524,163 +583,314 @@ class MetadataForm(forms.Form):
         validators=[wtforms.validators.Optional(), _validate_project_url_list],
     )
 
-    def full_validate(self):
-        # All non source releases *must* have a pyversion
-        if (
-            self.filetype.data
-            and self.filetype.data != "sdist"
-            and not self.pyversion.data
-        ):
-            raise wtforms.validators.ValidationError(
-                "Python version is required for binary distribution uploads."
-            )
 
-        # All source releases *must* have a pyversion of "source"
-        if self.filetype.data == "sdist":
-            if not self.pyversion.data:
-                self.pyversion.data = "source"
-            elif self.pyversion.data != "source":
-                raise wtforms.validators.ValidationError(
-                    "Use 'source' as Python version for an sdist."
-                )
+_PGP_SIGNATURE_HEADER = b"-----BEGIN PGP SIGNATURE-----"
 
-        # We *must* have at least one digest to verify against.
-        if not self.md5_digest.data and not self.sha256_digest.data:
-            raise wtforms.validators.ValidationError(
-                "Include at least one message digest."
-            )
+_safe_zipnames = re.compile(r"(purelib|platlib|headers|scripts|data).+", re.I)
 
 
-_safe_zipnames = re.compile(r"(purelib|platlib|headers|scripts|data).+", re.I)
+# The compression methods that we allow the members of a zip file to use.
+_zip_compression_types = {zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED}
+
+# The member that a zip file of each kind must contain, at any depth.
+_zip_required_members = {".zip": "PKG-INFO", ".egg": "PKG-INFO", ".whl": "WHEEL"}
 
+# We don't pull a wheel's METADATA out of it if it claims to be larger than this,
+# since we'd have to hold all of it in memory.
+MAX_WHEEL_METADATA_SIZE = 10 * 1024 * 1024
 
-def _is_valid_dist_file(filename, filetype):
+_DistFile = collections.namedtuple("_DistFile", ["valid", "metadata"])
+
+
+def _inspect_dist_file(filename, filetype):
     """
     Perform some basic checks to see whether the indicated file could be
-    a valid distribution file.
-    """
+    a valid distribution file, and if it's a wheel, pull out its METADATA.
 
-    # If our file is a zipfile, then ensure that it's members are only
-    # compressed with supported compression methods.
-    if zipfile.is_zipfile(filename):
-        with zipfile.ZipFile(filename) as zfp:
-            for zinfo in zfp.infolist():
-                if zinfo.compress_type not in {
-                    zipfile.ZIP_STORED,
-                    zipfile.ZIP_DEFLATED,
-                }:
-                    return False
+    The central directory of a zip file is only read once, with all of the
+    checks against its members being done in a single pass over it.
+    """
+    invalid = _DistFile(valid=False, metadata=None)
 
     if filename.endswith(".exe"):
         # The only valid filetype for a .exe file is "bdist_wininst".
         if filetype != "bdist_wininst":
-            return False
-
-        # Ensure that the .exe is a valid zip file, and that all of the files
-        # contained within it have safe filenames.
-        try:
-            with zipfile.ZipFile(filename, "r") as zfp:
-                # We need the no branch below to work around a bug in
-                # coverage.py where it's detecting a missed branch where there
-                # isn't one.
-                for zipname in zfp.namelist():  # pragma: no branch
-                    if not _safe_zipnames.match(zipname):
-                        return False
-        except zipfile.BadZipFile:
-            return False
+            return invalid
     elif filename.endswith(".msi"):
         # The only valid filetype for a .msi is "bdist_msi"
         if filetype != "bdist_msi":
-            return False
+            return invalid
 
         # Check the first 8 bytes of the MSI file. This was taken from the
         # legacy implementation of PyPI which itself took it from the
         # implementation of `file` I believe.
         with open(filename, "rb") as fp:
             if fp.read(8) != b"\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1":
-                return False
-    elif filename.endswith(".zip") or filename.endswith(".egg"):
-        # Ensure that the .zip/.egg is a valid zip file, and that it has a
-        # PKG-INFO file.
-        try:
-            with zipfile.ZipFile(filename, "r") as zfp:
-                for zipname in zfp.namelist():
-                    parts = os.path.split(zipname)
-                    if len(parts) == 2 and parts[1] == "PKG-INFO":
-                        # We need the no branch below to work around a bug in
-                        # coverage.py where it's detecting a missed branch
-                        # where there isn't one.
-                        break  # pragma: no branch
-                else:
-                    return False
-        except zipfile.BadZipFile:
-            return False
-    elif filename.endswith(".whl"):
-        # Ensure that the .whl is a valid zip file, and that it has a WHEEL
-        # file.
-        try:
-            with zipfile.ZipFile(filename, "r") as zfp:
-                for zipname in zfp.namelist():
-                    parts = os.path.split(zipname)
-                    if len(parts) == 2 and parts[1] == "WHEEL":
-                        # We need the no branch below to work around a bug in
-                        # coverage.py where it's detecting a missed branch
-                        # where there isn't one.
-                        break  # pragma: no branch
-                else:
-                    return False
-        except zipfile.BadZipFile:
-            return False
+                return invalid
+
+    _, extension = os.path.splitext(filename)
+    required_member = _zip_required_members.get(extension)
+
+    # A .exe, .zip, .egg, or .whl must be a valid zip file, but any other file
+    # only has to pass our checks on its members if it happens to be one.
+    try:
+        zfp = zipfile.ZipFile(filename, "r")
+    except (OSError, zipfile.BadZipFile):
+        if extension == ".exe" or required_member is not None:
+            return invalid
+        return _DistFile(valid=True, metadata=None)
+
+    with zfp:
+        metadata_name = None
+        if extension == ".whl":
+            wheel_info = _wheel_file_re.match(os.path.basename(filename))
+            if wheel_info is not None:
+                metadata_name = wheel_info.group("namever") + ".dist-info/METADATA"
+
+        has_required_member = required_member is None
+        metadata_info = None
+        for zinfo in zfp.infolist():
+            # Ensure that the members are only compressed with supported
+            # compression methods.
+            if zinfo.compress_type not in _zip_compression_types:
+                return invalid
+
+            # Ensure that all of the files contained within a .exe have safe
+            # filenames.
+            if extension == ".exe" and not _safe_zipnames.match(zinfo.filename):
+                return invalid
+
+            if os.path.basename(zinfo.filename) == required_member:
+                has_required_member = True
+
+            if zinfo.filename == metadata_name:
+                metadata_info = zinfo
+
+        if not has_required_member:
+            return invalid
+
+        metadata = None
+        if (
+            metadata_info is not None
+            and metadata_info.file_size <= MAX_WHEEL_METADATA_SIZE
+        ):
+            try:
+                metadata = zfp.read(metadata_info)
+            except (EOFError, zipfile.BadZipFile, zlib.error):
+                return invalid
 
     # If we haven't yet decided it's not valid, then we'll assume it is and
     # allow it.
-    return True
+    return _DistFile(valid=True, metadata=metadata)
+
+
+# Each of our hash functions runs in its own thread, so that the file is being
+# hashed with all of them at once while we're reading the next chunk of it.
+_hash_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=3, thread_name_prefix="forklift-hash"
+)
+
+
+class _FileHasher:
+    """
+    Computes several hashes of a file, one chunk at a time, updating each of
+    the hashes in the background while the next chunk is read.
+    """
+
+    def __init__(self, hashers, *, executor=None):
+        self.hashers = hashers
+        self.executor = executor if executor is not None else _hash_executor
+        self._pending = []
+
+    def _wait(self):
+        # Each hash has to be updated with the chunks in order, so we have to
+        # finish hashing each chunk before we start on the next one.
+        for future in self._pending:
+            future.result()
+        self._pending = []
+
+    def update(self, chunk):
+        self._wait()
+        self._pending = [
+            self.executor.submit(hasher.update, chunk)
+            for hasher in self.hashers.values()
+        ]
+
+    def hexdigests(self):
+        self._wait()
+        return {k: h.hexdigest().lower() for k, h in self.hashers.items()}
+
+
+# How many edits a project's name can be away from the name of a new project
+# for the new project to be considered to be squatting on it.
+SQUAT_MAX_DISTANCE = 2
+
+# Each edit to a name takes away at most this many of its trigrams and adds at
+# most this many others, which bounds how dissimilar pg_trgm can find the names
+# that are within SQUAT_MAX_DISTANCE edits of it.
+SQUAT_TRIGRAMS_PER_EDIT = 3
+
+# Names with so few trigrams that the names close to them can be less similar
+# than this barely get narrowed down by the trigram index, so we find the names
+# close to those by their length instead.
+SQUAT_TRIGRAM_MIN_SIMILARITY = 0.2
+
+
+def _find_squattees(db_session, name):
+    """
+    Find the projects whose names are similar enough to the given name for a
+    new project with it to be squatting on them.
+
+    Rather than computing the distance to the name of every project we have,
+    we use an index to find the candidates that could be close enough first.
+    """
+    normalized_name = func.normalize_pep426_name(name)
+    length = len(packaging.utils.canonicalize_name(name))
+
+    trigrams = (
+        db_session.query(func.array_length(func.show_trgm(normalized_name), 1)).scalar()
+        or 0
+    )
+    changed = SQUAT_TRIGRAMS_PER_EDIT * SQUAT_MAX_DISTANCE
+    similarity = (trigrams - changed) / (trigrams + changed)
+
+    query = db_session.query(Project)
+    if similarity < SQUAT_TRIGRAM_MIN_SIMILARITY:
+        query = query.filter(
+            func.length(Project.normalized_name).between(
+                length - SQUAT_MAX_DISTANCE, length + SQUAT_MAX_DISTANCE
+            )
+        )
+    else:
+        # The similarity operator only matches names at least as similar as
+        # its threshold, whose default is higher than the names a couple of
+        # edits away from ours can be, so we set it for the rest of this
+        # transaction to the least similar they can be. It's set a little
+        # lower still because pg_trgm computes similarities as single
+        # precision floats.
+        db_session.execute(
+            select(
+                [
+                    func.set_config(
+                        "pg_trgm.similarity_threshold", str(similarity - 0.001), True
+                    )
+                ]
+            )
+        )
+        # This is pg_trgm's similarity operator, with its percent sign escaped
+        # for psycopg2.
+        query = query.filter(Project.normalized_name.op("%%")(normalized_name))
+
+    return query.filter(
+        func.levenshtein(Project.normalized_name, normalized_name) <= SQUAT_MAX_DISTANCE
+    ).all()
+
+
+def _make_room_for_release(db_session, project, version):
+    """
+    Make room in the ordering of the given project's releases for a new release
+    of the given version, returning the position that the new release should
+    take in it.
+
+    Only the releases that come after the new one are moved, and they're all
+    moved with a single UPDATE, rather than renumbering every release. The
+    reorder_releases task repairs the ordering if it ever goes wrong.
+    """
+    sort_key = version_sort_key(version)
+
+    position = (
+        db_session.query(func.coalesce(func.max(Release._pypi_ordering) + 1, 0))
+        .filter((Release.project == project) & (Release.version_sort_key <= sort_key))
+        .scalar()
+    )
+
+    db_session.query(Release).filter(
+        (Release.project == project) & (Release._pypi_ordering >= position)
+    ).update(
+        {Release._pypi_ordering: Release._pypi_ordering + 1},
+        synchronize_session=False,
+    )
+
+    return position
+
+
+_FileConflicts = collections.namedtuple(
+    "_FileConflicts", ["duplicate", "filename_used", "release_has_sdist"]
+)
 
 
-def _is_duplicate_file(db_session, filename, hashes):
+def _file_conflicts(db_session, release, filename, hashes):
     """
-    Check to see if file already exists, and if it's content matches.
-    A file is considered to exist if its filename *or* blake2 digest are
-    present in a file row in the database.
+    Check for everything already in the database that could conflict with
+    adding the given file to the given release, in a single query.
 
-    Returns:
+    The duplicate field is whether the file already exists, and if so, whether
+    its content matches. A file is considered to exist if its filename *or*
+    blake2 digest are present in a file row in the database.
     - True: This file is a duplicate and all further processing should halt.
     - False: This file exists, but it is not a duplicate.
     - None: This file does not exist.
+
+    The filename_used field is whether the filename is in our filename log, and
+    the release_has_sdist field is whether the release already has an sdist.
     """
 
-    file_ = (
-        db_session.query(File)
+    existing_file = (
+        db_session.query(
+            File.filename,
+            File.sha256_digest,
+            File.md5_digest,
+            File.blake2_256_digest,
+        )
         .filter(
             (File.filename == filename)
             | (File.blake2_256_digest == hashes["blake2_256"])
         )
-        .first()
+        .limit(1)
+        .cte("existing_file")
     )
 
-    if file_ is not None:
-        return (
-            file_.filename == filename
-            and file_.sha256_digest == hashes["sha256"]
-            and file_.md5_digest == hashes["md5"]
-            and file_.blake2_256_digest == hashes["blake2_256"]
+    # We select from a single row, which the existing file (if there is one)
+    # is joined onto, so that we always get back exactly one row.
+    row = (
+        db_session.query(
+            db_session.query(Filename)
+            .filter(Filename.filename == filename)
+            .exists()
+            .label("filename_used"),
+            db_session.query(File)
+            .filter((File.release == release) & (File.packagetype == "sdist"))
+            .exists()
+            .label("release_has_sdist"),
+            existing_file.c.filename,
+            existing_file.c.sha256_digest,
+            existing_file.c.md5_digest,
+            existing_file.c.blake2_256_digest,
         )
+        .select_from(select([literal(1)]).alias("conflicts"))
+        .outerjoin(existing_file, true())
+        .one()
+    )
 
-    return None
+    duplicate = None
+    if row.filename is not None:
+        duplicate = (
+            row.filename == filename
+            and row.sha256_digest == hashes["sha256"]
+            and row.md5_digest == hashes["md5"]
+            and row.blake2_256_digest == hashes["blake2_256"]
+        )
 
+    return _FileConflicts(
+        duplicate=duplicate,
+        filename_used=row.filename_used,
+        release_has_sdist=row.release_has_sdist,
+    )
 
-def _no_deprecated_classifiers(request):
-    deprecated_classifiers = {
-        classifier.classifier
-        for classifier in (
-            request.db.query(Classifier.classifier)
-            .filter(Classifier.deprecated.is_(True))
-            .all()
-        )
-    }
 
+def _no_deprecated_classifiers(request, classifiers):
     def validate_no_deprecated_classifiers(form, field):
-        invalid_classifiers = set(field.data or []) & deprecated_classifiers
+        invalid_classifiers = set(field.data or []) & classifiers.deprecated
         if invalid_classifiers:
             first_invalid_classifier = sorted(invalid_classifiers)[0]
             host = request.registry.settings.get("warehouse.domain")
@@ -695,13 +905,35 @@ def _no_deprecated_classifiers(request):
     return validate_no_deprecated_classifiers
 
 
-@view_config(
-    route_name="forklift.legacy.file_upload",
-    uses_session=True,
-    require_csrf=False,
-    require_methods=["POST"],
-)
-def file_upload(request):
+def _form_error_message(form):
+    for field_name in _error_message_order:
+        if field_name in form.errors:
+            break
+    else:
+        field_name = sorted(form.errors.keys())[0]
+
+    if field_name in form:
+        field = form[field_name]
+        if field.description and isinstance(field, wtforms.StringField):
+            error_message = (
+                "{value!r} is an invalid value for {field}. ".format(
+                    value=field.data, field=field.description
+                )
+                + "Error: {} ".format(form.errors[field_name][0])
+                + "See "
+                "https://packaging.python.org/specifications/core-metadata"
+            )
+        else:
+            error_message = "Invalid value for {field}. Error: {msgs[0]}".format(
+                field=field_name, msgs=form.errors[field_name]
+            )
+    else:
+        error_message = "Error: {}".format(form.errors[field_name][0])
+
+    return error_message
+
+
+def _check_upload_request(request):
     # If we're in read-only mode, let upload clients know
     if request.flags.enabled("read-only"):
         raise _exc_with_message(
@@ -735,20 +967,27 @@ def file_upload(request):
             ),
         ) from None
 
-    # Do some cleanup of the various form fields
-    for key in list(request.POST):
-        value = request.POST.get(key)
+    # Do some cleanup of the various form fields, one value at a time so that
+    # the other values of a field given more than once are kept.
+    items = list(request.POST.items())
+    request.POST.clear()
+    for key, value in items:
         if isinstance(value, str):
             # distutils "helpfully" substitutes unknown, but "required" values
             # with the string "UNKNOWN". This is basically never what anyone
-            # actually wants so we'll just go ahead and delete anything whose
-            # value is UNKNOWN.
+            # actually wants so we'll just go ahead and delete any value that
+            # is UNKNOWN. The fields for each of the files in an upload of
+            # several files are matched up with their files by position though,
+            # so we blank those out instead to keep them in line.
             if value.strip() == "UNKNOWN":
-                del request.POST[key]
+                if key not in _file_form_fields:
+                    continue
+                value = ""
 
             # Escape NUL characters, which psycopg doesn't like
-            if "\x00" in value:
-                request.POST[key] = value.replace("\x00", "\\x00")
+            value = value.replace("\x00", "\\x00")
+
+        request.POST.add(key, value)
 
     # We require protocol_version 1, it's the only supported version however
     # passing a different version should raise an error.
@@ -765,47 +1004,25 @@ def file_upload(request):
         if any(isinstance(value, FieldStorage) for value in values):
             raise _exc_with_message(HTTPBadRequest, f"{field}: Should not be a tuple.")
 
+
+def _validate_metadata(request):
     # Look up all of the valid classifiers
-    all_classifiers = request.db.query(Classifier).all()
+    classifiers = get_classifiers(request)
 
     # Validate and process the incoming metadata.
     form = MetadataForm(request.POST)
 
     # Add a validator for deprecated classifiers
-    form.classifiers.validators.append(_no_deprecated_classifiers(request))
+    form.classifiers.validators.append(_no_deprecated_classifiers(request, classifiers))
 
-    form.classifiers.choices = [(c.classifier, c.classifier) for c in all_classifiers]
+    form.classifiers.choices = classifiers
     if not form.validate():
-        for field_name in _error_message_order:
-            if field_name in form.errors:
-                break
-        else:
-            field_name = sorted(form.errors.keys())[0]
-
-        if field_name in form:
-            field = form[field_name]
-            if field.description and isinstance(field, wtforms.StringField):
-                error_message = (
-                    "{value!r} is an invalid value for {field}. ".format(
-                        value=field.data, field=field.description
-                    )
-                    + "Error: {} ".format(form.errors[field_name][0])
-                    + "See "
-                    "https://packaging.python.org/specifications/core-metadata"
-                )
-            else:
-                error_message = "Invalid value for {field}. Error: {msgs[0]}".format(
-                    field=field_name, msgs=form.errors[field_name]
-                )
-        else:
-            error_message = "Error: {}".format(form.errors[field_name][0])
+        raise _exc_with_message(HTTPBadRequest, _form_error_message(form))
 
-        raise _exc_with_message(HTTPBadRequest, error_message)
+    return form, classifiers
 
-    # Ensure that we have file data in the request.
-    if "content" not in request.POST:
-        raise _exc_with_message(HTTPBadRequest, "Upload payload does not have a file.")
 
+def _get_or_create_project(request, form):
     # Look up the project first before doing anything else, this is so we can
     # automatically register it if we need to and can check permissions before
     # going any further.
@@ -866,16 +1083,7 @@ def file_upload(request):
 
         # The project doesn't exist in our database, so first we'll check for
         # projects with a similar name
-        squattees = (
-            request.db.query(Project)
-            .filter(
-                func.levenshtein(
-                    Project.normalized_name, func.normalize_pep426_name(form.name.data)
-                )
-                <= 2
-            )
-            .all()
-        )
+        squattees = _find_squattees(request.db, form.name.data)
 
         # Next we'll create the project
         project = Project(name=form.name.data)
@@ -924,6 +1132,10 @@ def file_upload(request):
             ),
         )
 
+    return project
+
+
+def _get_or_create_release(request, project, form, classifiers):
     # Uploading should prevent broken rendered descriptions.
     # Temporarily disabled, see
     # https://github.com/pypa/warehouse/issues/4079
@@ -978,9 +1190,20 @@ def file_upload(request):
     except NoResultFound:
         release = Release(
             project=project,
-            _classifiers=[
-                c for c in all_classifiers if c.classifier in form.classifiers.data
-            ],
+            _pypi_ordering=_make_room_for_release(
+                request.db, project, form.version.data
+            ),
+            _classifiers=(
+                request.db.query(Classifier)
+                .filter(
+                    Classifier.id.in_(
+                        {classifiers.ids[c] for c in form.classifiers.data}
+                    )
+                )
+                .all()
+                if form.classifiers.data
+                else []
+            ),
             dependencies=list(
                 _construct_dependencies(
                     form,
@@ -1035,22 +1258,38 @@ def file_upload(request):
             )
         )
 
-    # TODO: We need a better solution to this than to just do it inline inside
-    #       this method. Ideally the version field would just be sortable, but
-    #       at least this should be some sort of hook or trigger.
-    releases = (
-        request.db.query(Release)
-        .filter(Release.project == project)
-        .options(orm.load_only(Release._pypi_ordering))
-        .all()
-    )
-    for i, r in enumerate(
-        sorted(releases, key=lambda x: packaging.version.parse(x.version))
-    ):
-        r._pypi_ordering = i
+    return release
+
+
+_StagedFile = collections.namedtuple("_StagedFile", ["path", "file_path", "meta"])
+
+# Staging a file is mostly spent waiting on the storage service, so when several
+# files have been uploaded together we stage them in the background, sharing a
+# pool of threads so that there's a limit to how many are being staged at once.
+_stage_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=UPLOAD_STAGE_CONCURRENCY, thread_name_prefix="forklift-stage"
+)
+
+# The fields of the FileForm, which are given once for each of the files in an
+# upload of several files.
+_file_form_fields = [
+    "pyversion",
+    "filetype",
+    "comment",
+    "md5_digest",
+    "sha256_digest",
+    "blake2_256_digest",
+]
+
 
-    # Pull the filename out of our POST data.
-    filename = request.POST["content"].filename
+def _process_file(request, tmpdir, project, release, form, content, signature):
+    """
+    Check the given file, buffering it and its signature into tmpdir, and add
+    it to the release. Returns the files that need to be staged for it, or None
+    if exactly the same file has already been uploaded.
+    """
+    # Pull the filename out of the file.
+    filename = content.filename
 
     # Make sure that the filename does not contain any path separators.
     if "/" in filename or "\\" in filename:
@@ -1076,9 +1315,7 @@ def file_upload(request):
         )
 
     # Check the content type of what is being uploaded
-    if not request.POST["content"].type or request.POST["content"].type.startswith(
-        "image/"
-    ):
+    if not content.type or content.type.startswith("image/"):
         raise _exc_with_message(HTTPBadRequest, "Invalid distribution file.")
 
     # Ensure that the package filetype is allowed.
@@ -1096,210 +1333,375 @@ def file_upload(request):
     # size limits.
     file_size_limit = max(filter(None, [MAX_FILESIZE, project.upload_limit]))
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        temporary_filename = os.path.join(tmpdir, filename)
+    temporary_filename = os.path.join(tmpdir, filename)
 
-        # Buffer the entire file onto disk, checking the hash of the file as we
-        # go along.
-        with open(temporary_filename, "wb") as fp:
-            file_size = 0
-            file_hashes = {
+    # Buffer the entire file onto disk, checking the hash of the file as we
+    # go along.
+    with open(temporary_filename, "wb") as fp:
+        file_size = 0
+        file_hasher = _FileHasher(
+            {
                 "md5": hashlib.md5(),
                 "sha256": hashlib.sha256(),
                 "blake2_256": hashlib.blake2b(digest_size=256 // 8),
             }
-            for chunk in iter(lambda: request.POST["content"].file.read(8096), b""):
-                file_size += len(chunk)
-                if file_size > file_size_limit:
-                    raise _exc_with_message(
-                        HTTPBadRequest,
-                        "File too large. "
-                        + "Limit for project {name!r} is {limit} MB. ".format(
-                            name=project.name, limit=file_size_limit // (1024 * 1024)
-                        )
-                        + "See "
-                        + request.help_url(_anchor="file-size-limit"),
+        )
+        for chunk in iter(lambda: content.file.read(UPLOAD_CHUNK_SIZE), b""):
+            file_size += len(chunk)
+            if file_size > file_size_limit:
+                raise _exc_with_message(
+                    HTTPBadRequest,
+                    "File too large. "
+                    + "Limit for project {name!r} is {limit} MB. ".format(
+                        name=project.name, limit=file_size_limit // (1024 * 1024)
                     )
-                fp.write(chunk)
-                for hasher in file_hashes.values():
-                    hasher.update(chunk)
+                    + "See "
+                    + request.help_url(_anchor="file-size-limit"),
+                )
+            file_hasher.update(chunk)
+            fp.write(chunk)
+
+    # Take our hash functions and compute the final hashes for them now.
+    file_hashes = file_hasher.hexdigests()
+
+    # Actually verify the digests that we've gotten. We're going to use
+    # hmac.compare_digest even though we probably don't actually need to
+    # because it's better safe than sorry. In the case of multiple digests
+    # we expect them all to be given.
+    if not all(
+        [
+            hmac.compare_digest(
+                getattr(form, "{}_digest".format(digest_name)).data.lower(),
+                digest_value,
+            )
+            for digest_name, digest_value in file_hashes.items()
+            if getattr(form, "{}_digest".format(digest_name)).data
+        ]
+    ):
+        raise _exc_with_message(
+            HTTPBadRequest,
+            "The digest supplied does not match a digest calculated "
+            "from the uploaded file.",
+        )
 
-        # Take our hash functions and compute the final hashes for them now.
-        file_hashes = {k: h.hexdigest().lower() for k, h in file_hashes.items()}
+    # Check to see if the file that was uploaded conflicts with anything
+    # that we already have, all at once so that it only takes a single
+    # trip to the database.
+    conflicts = _file_conflicts(request.db, release, filename, file_hashes)
 
-        # Actually verify the digests that we've gotten. We're going to use
-        # hmac.compare_digest even though we probably don't actually need to
-        # because it's better safe than sorry. In the case of multiple digests
-        # we expect them all to be given.
-        if not all(
-            [
-                hmac.compare_digest(
-                    getattr(form, "{}_digest".format(digest_name)).data.lower(),
-                    digest_value,
+    # Check to see if the file that was uploaded exists already or not.
+    if conflicts.duplicate:
+        return None
+    elif conflicts.duplicate is not None:
+        raise _exc_with_message(
+            HTTPBadRequest,
+            # Note: Changing this error message to something that doesn't
+            # start with "File already exists" will break the
+            # --skip-existing functionality in twine
+            # ref: https://github.com/pypa/warehouse/issues/3482
+            # ref: https://github.com/pypa/twine/issues/332
+            "File already exists. See " + request.help_url(_anchor="file-name-reuse"),
+        )
+
+    # Check to see if the file that was uploaded exists in our filename log
+    if conflicts.filename_used:
+        raise _exc_with_message(
+            HTTPBadRequest,
+            "This filename has already been used, use a "
+            "different version. "
+            "See " + request.help_url(_anchor="file-name-reuse"),
+        )
+
+    # Check to see if uploading this file would create a duplicate sdist
+    # for the current release.
+    if form.filetype.data == "sdist" and conflicts.release_has_sdist:
+        raise _exc_with_message(
+            HTTPBadRequest, "Only one sdist may be uploaded per release."
+        )
+
+    # Check the file to make sure it is a valid distribution file.
+    dist_file = _inspect_dist_file(temporary_filename, form.filetype.data)
+    if not dist_file.valid:
+        raise _exc_with_message(HTTPBadRequest, "Invalid distribution file.")
+
+    # Check that if it's a binary wheel, it's on a supported platform
+    if filename.endswith(".whl"):
+        wheel_info = _wheel_file_re.match(filename)
+        plats = wheel_info.group("plat").split(".")
+        for plat in plats:
+            if not _valid_platform_tag(plat):
+                raise _exc_with_message(
+                    HTTPBadRequest,
+                    "Binary wheel '{filename}' has an unsupported "
+                    "platform tag '{plat}'.".format(filename=filename, plat=plat),
                 )
-                for digest_name, digest_value in file_hashes.items()
-                if getattr(form, "{}_digest".format(digest_name)).data
-            ]
-        ):
+
+    # Also buffer the entire signature file to disk.
+    if signature is not None:
+        has_signature = True
+        with open(os.path.join(tmpdir, filename + ".asc"), "wb") as fp:
+            signature_size = 0
+            signature_head = b""
+            for chunk in iter(lambda: signature.file.read(8096), b""):
+                signature_size += len(chunk)
+                if signature_size > MAX_SIGSIZE:
+                    raise _exc_with_message(HTTPBadRequest, "Signature too large.")
+
+                # Keep hold of the start of the signature as we write it, so
+                # that we don't have to read it back to check it.
+                if len(signature_head) < len(_PGP_SIGNATURE_HEADER):
+                    signature_head += chunk[
+                        : len(_PGP_SIGNATURE_HEADER) - len(signature_head)
+                    ]
+
+                fp.write(chunk)
+
+        # Check whether signature is ASCII armored
+        if signature_head != _PGP_SIGNATURE_HEADER:
             raise _exc_with_message(
-                HTTPBadRequest,
-                "The digest supplied does not match a digest calculated "
-                "from the uploaded file.",
+                HTTPBadRequest, "PGP signature isn't ASCII armored."
             )
+    else:
+        has_signature = False
+
+    # TODO: This should be handled by some sort of database trigger or a
+    #       SQLAlchemy hook or the like instead of doing it inline in this
+    #       view.
+    request.db.add(Filename(filename=filename))
+
+    # Store the information about the file in the database.
+    file_ = File(
+        release=release,
+        filename=filename,
+        python_version=form.pyversion.data,
+        packagetype=form.filetype.data,
+        comment_text=form.comment.data,
+        size=file_size,
+        has_signature=bool(has_signature),
+        md5_digest=file_hashes["md5"],
+        sha256_digest=file_hashes["sha256"],
+        blake2_256_digest=file_hashes["blake2_256"],
+        metadata_file_sha256_digest=(
+            hashlib.sha256(dist_file.metadata).hexdigest().lower()
+            if dist_file.metadata is not None
+            else None
+        ),
+        # Figure out what our filepath is going to be, we're going to use a
+        # directory structure based on the hash of the file contents. This
+        # will ensure that the contents of the file cannot change without
+        # it also changing the path that the file is saved too.
+        path="/".join(
+            [
+                file_hashes[PATH_HASHER][:2],
+                file_hashes[PATH_HASHER][2:4],
+                file_hashes[PATH_HASHER][4:],
+                filename,
+            ]
+        ),
+        uploaded_via=request.user_agent,
+    )
+    request.db.add(file_)
+
+    # TODO: This should be handled by some sort of database trigger or a
+    #       SQLAlchemy hook or the like instead of doing it inline in this
+    #       view.
+    request.db.add(
+        JournalEntry(
+            name=release.project.name,
+            version=release.version,
+            action="add {python_version} file {filename}".format(
+                python_version=file_.python_version, filename=file_.filename
+            ),
+            submitted_by=request.user,
+            submitted_from=request.remote_addr,
+        )
+    )
+
+    # Store the core metadata next to the file, so that installers can resolve
+    # dependencies without having to download the whole file.
+    if dist_file.metadata is not None:
+        with open(os.path.join(tmpdir, filename + ".metadata"), "wb") as fp:
+            fp.write(dist_file.metadata)
+
+    meta = {
+        "project": file_.release.project.normalized_name,
+        "version": file_.release.version,
+        "package-type": file_.packagetype,
+        "python-version": file_.python_version,
+    }
+    staged_files = [_StagedFile(file_.path, os.path.join(tmpdir, filename), meta)]
+    if has_signature:
+        staged_files.append(
+            _StagedFile(file_.pgp_path, os.path.join(tmpdir, filename + ".asc"), meta)
+        )
+    if dist_file.metadata is not None:
+        staged_files.append(
+            _StagedFile(
+                file_.metadata_path, os.path.join(tmpdir, filename + ".metadata"), meta
+            )
+        )
+
+    return staged_files
+
+
+@view_config(
+    route_name="forklift.legacy.file_upload",
+    uses_session=True,
+    require_csrf=False,
+    require_methods=["POST"],
+)
+def file_upload(request):
+    _check_upload_request(request)
+
+    form, classifiers = _validate_metadata(request)
+
+    # Validate the fields describing the file, which are given alongside the
+    # metadata for the release.
+    file_form = FileForm(request.POST)
+    if not file_form.validate():
+        raise _exc_with_message(HTTPBadRequest, _form_error_message(file_form))
+
+    # Ensure that we have file data in the request.
+    if "content" not in request.POST:
+        raise _exc_with_message(HTTPBadRequest, "Upload payload does not have a file.")
+
+    project = _get_or_create_project(request, form)
+    release = _get_or_create_release(request, project, form, classifiers)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        staged_files = _process_file(
+            request,
+            tmpdir,
+            project,
+            release,
+            file_form,
+            request.POST["content"],
+            request.POST.get("gpg_signature"),
+        )
 
         # Check to see if the file that was uploaded exists already or not.
-        is_duplicate = _is_duplicate_file(request.db, filename, file_hashes)
-        if is_duplicate:
+        if staged_files is None:
             return Response()
-        elif is_duplicate is not None:
-            raise _exc_with_message(
-                HTTPBadRequest,
-                # Note: Changing this error message to something that doesn't
-                # start with "File already exists" will break the
-                # --skip-existing functionality in twine
-                # ref: https://github.com/pypa/warehouse/issues/3482
-                # ref: https://github.com/pypa/twine/issues/332
-                "File already exists. See "
-                + request.help_url(_anchor="file-name-reuse"),
+
+        # We don't want the file to be available until the transaction that
+        # adds it has been committed, and we don't want it to be left behind
+        # where it would be served if that transaction fails, so we stage it
+        # now and only promote it to where it will be served after the commit.
+        storage = request.find_service(IFileStorage)
+        for staged_file in staged_files:
+            storage.stage(
+                staged_file.path, staged_file.file_path, meta=staged_file.meta
             )
+            promote_on_commit(request.db, storage, staged_file.path)
 
-        # Check to see if the file that was uploaded exists in our filename log
-        if request.db.query(
-            request.db.query(Filename).filter(Filename.filename == filename).exists()
-        ).scalar():
+    return Response()
+
+
+# Uploading several files for a release at once means that we only have to
+# authenticate, validate the metadata and look up (or create) the project and
+# release once for all of them, instead of once for each of them. The metadata
+# is given in the same way as it is for file_upload, and each of the files is
+# given as a "content" part, with the fields of the FileForm given once for
+# each of the files in the same order as the files themselves. Signatures are
+# matched up with their files by name.
+@view_config(
+    route_name="forklift.legacy.file_upload_multiple",
+    uses_session=True,
+    require_csrf=False,
+    require_methods=["POST"],
+)
+def file_upload_multiple(request):
+    _check_upload_request(request)
+
+    form, classifiers = _validate_metadata(request)
+
+    # Ensure that we have file data in the request, but not too much of it.
+    contents = request.POST.getall("content")
+    if not contents:
+        raise _exc_with_message(HTTPBadRequest, "Upload payload does not have a file.")
+    if len(contents) > MAX_FILES_PER_UPLOAD:
+        raise _exc_with_message(
+            HTTPBadRequest,
+            "Upload at most {} files at once.".format(MAX_FILES_PER_UPLOAD),
+        )
+
+    filenames = [content.filename for content in contents]
+    if len(set(filenames)) != len(filenames):
+        raise _exc_with_message(HTTPBadRequest, "Upload each file only once.")
+
+    # Split the fields for each of the files out from each other, and validate
+    # them on their own.
+    file_data = [MultiDict() for _ in contents]
+    for field in _file_form_fields:
+        values = request.POST.getall(field)
+        if values and len(values) != len(contents):
             raise _exc_with_message(
-                HTTPBadRequest,
-                "This filename has already been used, use a "
-                "different version. "
-                "See " + request.help_url(_anchor="file-name-reuse"),
+                HTTPBadRequest, f"{field}: Give one value for each file."
             )
+        for data, value in zip(file_data, values):
+            data[field] = value
 
-        # Check to see if uploading this file would create a duplicate sdist
-        # for the current release.
-        if (
-            form.filetype.data == "sdist"
-            and request.db.query(
-                request.db.query(File)
-                .filter((File.release == release) & (File.packagetype == "sdist"))
-                .exists()
-            ).scalar()
-        ):
+    file_forms = []
+    for filename, data in zip(filenames, file_data):
+        file_form = FileForm(data)
+        if not file_form.validate():
             raise _exc_with_message(
-                HTTPBadRequest, "Only one sdist may be uploaded per release."
+                HTTPBadRequest,
+                "{}: {}".format(filename, _form_error_message(file_form)),
             )
+        file_forms.append(file_form)
 
-        # Check the file to make sure it is a valid distribution file.
-        if not _is_valid_dist_file(temporary_filename, form.filetype.data):
-            raise _exc_with_message(HTTPBadRequest, "Invalid distribution file.")
-
-        # Check that if it's a binary wheel, it's on a supported platform
-        if filename.endswith(".whl"):
-            wheel_info = _wheel_file_re.match(filename)
-            plats = wheel_info.group("plat").split(".")
-            for plat in plats:
-                if not _valid_platform_tag(plat):
-                    raise _exc_with_message(
-                        HTTPBadRequest,
-                        "Binary wheel '{filename}' has an unsupported "
-                        "platform tag '{plat}'.".format(filename=filename, plat=plat),
-                    )
-
-        # Also buffer the entire signature file to disk.
-        if "gpg_signature" in request.POST:
-            has_signature = True
-            with open(os.path.join(tmpdir, filename + ".asc"), "wb") as fp:
-                signature_size = 0
-                for chunk in iter(
-                    lambda: request.POST["gpg_signature"].file.read(8096), b""
-                ):
-                    signature_size += len(chunk)
-                    if signature_size > MAX_SIGSIZE:
-                        raise _exc_with_message(HTTPBadRequest, "Signature too large.")
-                    fp.write(chunk)
-
-            # Check whether signature is ASCII armored
-            with open(os.path.join(tmpdir, filename + ".asc"), "rb") as fp:
-                if not fp.read().startswith(b"-----BEGIN PGP SIGNATURE-----"):
-                    raise _exc_with_message(
-                        HTTPBadRequest, "PGP signature isn't ASCII armored."
-                    )
-        else:
-            has_signature = False
-
-        # TODO: This should be handled by some sort of database trigger or a
-        #       SQLAlchemy hook or the like instead of doing it inline in this
-        #       view.
-        request.db.add(Filename(filename=filename))
-
-        # Store the information about the file in the database.
-        file_ = File(
-            release=release,
-            filename=filename,
-            python_version=form.pyversion.data,
-            packagetype=form.filetype.data,
-            comment_text=form.comment.data,
-            size=file_size,
-            has_signature=bool(has_signature),
-            md5_digest=file_hashes["md5"],
-            sha256_digest=file_hashes["sha256"],
-            blake2_256_digest=file_hashes["blake2_256"],
-            # Figure out what our filepath is going to be, we're going to use a
-            # directory structure based on the hash of the file contents. This
-            # will ensure that the contents of the file cannot change without
-            # it also changing the path that the file is saved too.
-            path="/".join(
-                [
-                    file_hashes[PATH_HASHER][:2],
-                    file_hashes[PATH_HASHER][2:4],
-                    file_hashes[PATH_HASHER][4:],
-                    filename,
-                ]
-            ),
-            uploaded_via=request.user_agent,
+    signatures = {
+        signature.filename: signature
+        for signature in request.POST.getall("gpg_signature")
+    }
+    if set(signatures) - {filename + ".asc" for filename in filenames}:
+        raise _exc_with_message(
+            HTTPBadRequest,
+            "gpg_signature: Name each signature after its file, with '.asc' added.",
         )
-        request.db.add(file_)
 
-        # TODO: This should be handled by some sort of database trigger or a
-        #       SQLAlchemy hook or the like instead of doing it inline in this
-        #       view.
-        request.db.add(
-            JournalEntry(
-                name=release.project.name,
-                version=release.version,
-                action="add {python_version} file {filename}".format(
-                    python_version=file_.python_version, filename=file_.filename
-                ),
-                submitted_by=request.user,
-                submitted_from=request.remote_addr,
+    project = _get_or_create_project(request, form)
+    release = _get_or_create_release(request, project, form, classifiers)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        staged_files = []
+        for content, file_form in zip(contents, file_forms):
+            file_staged_files = _process_file(
+                request,
+                tmpdir,
+                project,
+                release,
+                file_form,
+                content,
+                signatures.get(content.filename + ".asc"),
             )
-        )
 
-        # TODO: We need a better answer about how to make this transactional so
-        #       this won't take affect until after a commit has happened, for
-        #       now we'll just ignore it and save it before the transaction is
-        #       committed.
+            # A file that has already been uploaded is skipped, just as it
+            # would have been if it had been uploaded on its own.
+            if file_staged_files is not None:
+                staged_files.extend(file_staged_files)
+
         storage = request.find_service(IFileStorage)
-        storage.store(
-            file_.path,
-            os.path.join(tmpdir, filename),
-            meta={
-                "project": file_.release.project.normalized_name,
-                "version": file_.release.version,
-                "package-type": file_.packagetype,
-                "python-version": file_.python_version,
-            },
-        )
-        if has_signature:
-            storage.store(
-                file_.pgp_path,
-                os.path.join(tmpdir, filename + ".asc"),
-                meta={
-                    "project": file_.release.project.normalized_name,
-                    "version": file_.release.version,
-                    "package-type": file_.packagetype,
-                    "python-version": file_.python_version,
-                },
+        futures = [
+            _stage_executor.submit(
+                storage.stage,
+                staged_file.path,
+                staged_file.file_path,
+                meta=staged_file.meta,
             )
+            for staged_file in staged_files
+        ]
+
+        # Wait for all of the files to be staged before we check whether any of
+        # them failed, so that none of them are still being read when tmpdir is
+        # removed.
+        concurrent.futures.wait(futures)
+        for future in futures:
+            future.result()
+
+        for staged_file in staged_files:
+            promote_on_commit(request.db, storage, staged_file.path)
 
     return Response()
 
@@ -0,0 +1,219 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import select
+import time
+
+import redis
+
+from sqlalchemy import func
+
+from warehouse.packaging.models import JournalEntry
+
+
+# The most entries that we'll return for any one request to the changelog, and
+# how many of them we'll fetch from the database at a time while streaming it.
+CHANGELOG_MAX_ENTRIES = 50000
+CHANGELOG_WINDOW = 1000
+
+# Every journal insert sends a notification on this PostgreSQL channel, which
+# relay_journal_notifications publishes to Redis, so that everything waiting for
+# a new serial can wait on Redis instead of each of them polling the database.
+JOURNAL_CHANNEL = "journals"
+LAST_SERIAL_KEY = "changelog:last-serial"
+SERIAL_CHANNEL = "changelog:serial"
+
+# The relay refreshes the last serial at least this often, and it expires if
+# it isn't refreshed for long enough, so that if the relay stops we go back to
+# asking the database instead of handing out an old serial forever.
+RELAY_INTERVAL = 5
+LAST_SERIAL_TTL = 6 * RELAY_INTERVAL
+
+# The longest that anyone can wait for a new serial in a single request. Each
+# waiting request holds on to a web worker for the whole time, so this has to be
+# kept well under the worker timeout, clients wanting to wait longer than this
+# can just ask again.
+MAX_WAIT = 5
+
+
+def _entry(row):
+    name, version, submitted_date, action, serial = row
+    timestamp = int(submitted_date.replace(tzinfo=datetime.timezone.utc).timestamp())
+    return (name, version, timestamp, action, serial)
+
+
+def _query(session):
+    # We only ever want these columns, and selecting them directly is a lot
+    # cheaper than building a full JournalEntry for every row.
+    return session.query(
+        JournalEntry.name,
+        JournalEntry.version,
+        JournalEntry.submitted_date,
+        JournalEntry.action,
+        JournalEntry.id,
+    )
+
+
+def changelog_since_serial(
+    session, serial, *, limit=CHANGELOG_MAX_ENTRIES, window=CHANGELOG_WINDOW
+):
+    """
+    Yield a (name, version, timestamp, action, serial) tuple for each journal
+    entry after the given serial, in order, up to limit of them.
+
+    The entries are fetched window at a time, each window starting after the
+    last serial of the one before it, so the cost of each query doesn't depend
+    on how far into the journal we are. The serial of the last entry yielded is
+    the serial to continue from.
+    """
+    while limit > 0:
+        rows = (
+            _query(session)
+            .filter(JournalEntry.id > serial)
+            .order_by(JournalEntry.id)
+            .limit(min(window, limit))
+            .all()
+        )
+
+        for row in rows:
+            yield _entry(row)
+
+        if len(rows) < min(window, limit):
+            break
+
+        serial = rows[-1].id
+        limit -= len(rows)
+
+
+def changelog_since_date(session, since, *, limit=CHANGELOG_MAX_ENTRIES):
+    """
+    Return a (name, version, timestamp, action, serial) tuple for each journal
+    entry submitted after the given datetime, in serial order, up to limit of
+    them.
+    """
+    # Filtering the whole journal on submitted_date and then sorting everything
+    # in the range by id means reading every entry since then, no matter how
+    # many we return. Instead we find the first serial in the range from the
+    # (submitted_date, id) index alone, and then read the journal in serial
+    # order from there, stopping as soon as we have enough entries.
+    first_serial = (
+        session.query(func.min(JournalEntry.id))
+        .filter(JournalEntry.submitted_date > since)
+        .scalar()
+    )
+    if first_serial is None:
+        return []
+
+    rows = (
+        _query(session)
+        .filter(JournalEntry.id >= first_serial)
+        .filter(JournalEntry.submitted_date > since)
+        .order_by(JournalEntry.id)
+        .limit(limit)
+    )
+
+    return [_entry(row) for row in rows]
+
+
+def changelog_redis(settings):
+    url = settings.get("changelog.redis_url")
+    if url is None:
+        return None
+    return redis.StrictRedis.from_url(url)
+
+
+def get_last_serial(redis_conn):
+    """
+    Return the last serial that the relay has published, or None if the relay
+    isn't running.
+    """
+    serial = redis_conn.get(LAST_SERIAL_KEY)
+    return int(serial) if serial is not None else None
+
+
+def publish_serial(redis_conn, serial, *, changed=True):
+    pipeline = redis_conn.pipeline()
+    pipeline.set(LAST_SERIAL_KEY, serial, ex=LAST_SERIAL_TTL)
+    if changed:
+        pipeline.publish(SERIAL_CHANNEL, serial)
+    pipeline.execute()
+
+
+def wait_for_serial(redis_conn, since, timeout):
+    """
+    Wait up to timeout (but never more than MAX_WAIT) seconds for the last
+    serial to be later than since, and return the last serial, or None if the
+    relay isn't running.
+    """
+    timeout = min(timeout, MAX_WAIT)
+
+    serial = get_last_serial(redis_conn)
+    if serial is None or serial > since or timeout <= 0:
+        return serial
+
+    pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+    try:
+        pubsub.subscribe(SERIAL_CHANNEL)
+
+        # A new serial could have been published before we subscribed.
+        serial = get_last_serial(redis_conn)
+        deadline = time.monotonic() + timeout
+        while serial is not None and serial <= since:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            message = pubsub.get_message(timeout=remaining)
+            if message is not None and message["type"] == "message":
+                serial = max(serial, int(message["data"]))
+    finally:
+        pubsub.close()
+
+    return serial
+
+
+def relay_journal_notifications(engine, redis_conn, *, interval=RELAY_INTERVAL):
+    """
+    Listen for journal notifications from PostgreSQL, and publish the latest
+    serial to Redis as each one arrives, until the connection fails.
+    """
+    # This connection is going to be left in autocommit mode, so we don't want
+    # it going back into the pool for anything else to use.
+    connection = engine.raw_connection()
+    connection.detach()
+    try:
+        connection.set_session(autocommit=True)
+        cursor = connection.cursor()
+        cursor.execute(f"LISTEN {JOURNAL_CHANNEL}")
+
+        # Anything journaled before we started listening won't be notified, so
+        # we start from whatever the latest serial is now.
+        cursor.execute("SELECT max(id) FROM journals")
+        (serial,) = cursor.fetchone()
+        serial = serial or 0
+        publish_serial(redis_conn, serial)
+
+        while True:
+            changed = False
+            if select.select([connection], [], [], interval) != ([], [], []):
+                connection.poll()
+                while connection.notifies:
+                    notify = connection.notifies.pop(0)
+                    if int(notify.payload) > serial:
+                        serial = int(notify.payload)
+                        changed = True
+
+            # We publish whether or not anything changed, so that the last serial
+            # doesn't expire while the relay is still running.
+            publish_serial(redis_conn, serial, changed=changed)
+    finally:
+        connection.close()
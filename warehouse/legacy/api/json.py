@@ -10,16 +10,35 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+
 from collections import OrderedDict
 
-from pyramid.httpexceptions import HTTPMovedPermanently, HTTPNotFound
+from packaging.utils import canonicalize_name, canonicalize_version
+from pyramid.httpexceptions import (
+    HTTPBadRequest,
+    HTTPMovedPermanently,
+    HTTPNotFound,
+)
+from pyramid.renderers import render
 from pyramid.view import view_config
-from sqlalchemy.orm import Load
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import Load, selectinload, undefer
 from sqlalchemy.orm.exc import NoResultFound
 
 from warehouse.cache.http import cache_control
 from warehouse.cache.origin import origin_cache
-from warehouse.packaging.models import File, Release, Project
+from warehouse.db import Session
+from warehouse.legacy.api.changelog import (
+    CHANGELOG_MAX_ENTRIES,
+    MAX_WAIT,
+    changelog_redis,
+    changelog_since_serial,
+    wait_for_serial,
+)
+from warehouse.legacy.api.json_cache import project_tag
+from warehouse.legacy.api.json_cache.interfaces import IJSONCache
+from warehouse.packaging.models import File, JournalEntry, Release, Project
 
 
 # Generate appropriate CORS headers for the JSON endpoint.
@@ -41,6 +60,11 @@ _CORS_HEADERS = {
     "Access-Control-Expose-Headers": ", ".join(["X-PyPI-Last-Serial"]),
 }
 
+# The most projects that can be asked for in a single bulk request, and how
+# many of them we'll fetch from the database at a time while streaming them.
+BULK_MAX_PROJECTS = 500
+BULK_WINDOW = 100
+
 _CACHE_DECORATOR = [
     cache_control(15 * 60),  # 15 minutes
     origin_cache(
@@ -110,6 +134,20 @@ def json_release(release, request):
     # Get the latest serial number for this project.
     request.response.headers["X-PyPI-Last-Serial"] = str(project.last_serial)
 
+    # The serial changes whenever anything about this project does, so as long
+    # as we include it in our key we never need to worry about serving an out
+    # of date response from our cache.
+    try:
+        json_cache = request.find_service(IJSONCache, context=None)
+    except LookupError:
+        json_cache = None
+    else:
+        cache_tag = project_tag(project)
+        cache_key = f"{release.version}:{project.last_serial}"
+        content = json_cache.get(cache_tag, cache_key)
+        if content is not None:
+            return _json_response(request, content)
+
     # Get all of the releases and files for this project.
     release_files = (
         request.db.query(Release, File)
@@ -120,6 +158,24 @@ def json_release(release, request):
         .all()
     )
 
+    data = _json_data(request, project, release, release_files)
+
+    if json_cache is None:
+        return data
+
+    content = render("json", data, request=request).encode("utf8")
+    json_cache.set(cache_tag, cache_key, content)
+
+    return _json_response(request, content)
+
+
+def _json_response(request, content):
+    request.response.content_type = "application/json"
+    request.response.body = content
+    return request.response
+
+
+def _json_data(request, project, release, release_files):
     # Map our releases + files into a dictionary that maps each release to a
     # list of all its files.
     releases = {}
@@ -147,6 +203,13 @@ def json_release(release, request):
                 "upload_time": f.upload_time.strftime("%Y-%m-%dT%H:%M:%S"),
                 "url": request.route_url("packaging.file", path=f.path),
                 "requires_python": r.requires_python if r.requires_python else None,
+                # The core metadata for the file is served at its url with
+                # .metadata appended to it.
+                "dist_info_metadata": (
+                    {"sha256": f.metadata_file_sha256_digest}
+                    if f.metadata_file_sha256_digest
+                    else None
+                ),
             }
             for f in fs
         ]
@@ -179,7 +242,13 @@ def json_release(release, request):
             "requires_dist": (
                 list(release.requires_dist) if release.requires_dist else None
             ),
-            "docs_url": project.documentation_url,
+            # We don't use Project.documentation_url here, because it relies on
+            # the current request, which we may not have when streaming.
+            "docs_url": (
+                request.route_url("legacy.docs", project=project.name)
+                if project.has_docs
+                else None
+            ),
             "bugtrack_url": None,
             "home_page": release.home_page,
             "download_url": release.download_url,
@@ -205,3 +274,238 @@ def json_release_slash(release, request):
         ),
         headers=_CORS_HEADERS,
     )
+
+
+def _bulk_requested(request):
+    requested = OrderedDict()
+    for item in request.params.getall("project"):
+        name, _, version = item.partition("==")
+        name, version = name.strip(), version.strip() or None
+        if not name:
+            raise HTTPBadRequest("Invalid project: {!r}".format(item))
+        requested.setdefault((canonicalize_name(name), version), (name, version))
+
+    if not requested:
+        raise HTTPBadRequest("At least one project is required.")
+    if len(requested) > BULK_MAX_PROJECTS:
+        raise HTTPBadRequest(
+            "No more than {} projects may be requested at once.".format(
+                BULK_MAX_PROJECTS
+            )
+        )
+
+    return list(requested.items())
+
+
+def _bulk_releases(session, projects, requested):
+    # We want everything that goes into the "info" section for each of our
+    # releases to come back with them, instead of being lazily loaded one
+    # release at a time.
+    options = [
+        undefer(Release.description),
+        selectinload(Release._classifiers),
+        selectinload(Release._requires_dist),
+        selectinload(Release._project_urls),
+    ]
+
+    latest = {projects[n].id for n, v in requested if v is None and n in projects}
+    versioned = {
+        (projects[n].id, canonicalize_version(v))
+        for n, v in requested
+        if v is not None and n in projects
+    }
+
+    releases = {}
+    if latest:
+        query = (
+            session.query(Release)
+            .options(*options)
+            .filter(Release.project_id.in_(list(latest)))
+            .order_by(
+                Release.project_id,
+                Release.is_prerelease.nullslast(),
+                Release._pypi_ordering.desc(),
+            )
+            .distinct(Release.project_id)
+        )
+        for release in query:
+            releases[(release.project_id, None)] = release
+    if versioned:
+        query = (
+            session.query(Release)
+            .options(*options)
+            .filter(
+                tuple_(Release.project_id, Release.canonical_version).in_(
+                    list(versioned)
+                )
+            )
+        )
+        for release in query:
+            releases.setdefault(
+                (release.project_id, release.canonical_version), release
+            )
+
+    return releases
+
+
+def _json_bulk(session, request, requested):
+    projects = {
+        p.normalized_name: p
+        for p in session.query(Project).filter(
+            Project.normalized_name.in_([n for (n, _), _ in requested])
+        )
+    }
+    releases = _bulk_releases(session, projects, [key for key, _ in requested])
+
+    # Get all of the releases and files for every one of our projects at once,
+    # instead of once per project like json_release does.
+    release_files = {}
+    if releases:
+        query = (
+            session.query(Release, File)
+            .options(
+                Load(Release).load_only("project_id", "version", "requires_python")
+            )
+            .outerjoin(File)
+            .filter(Release.project_id.in_(list({pid for pid, _ in releases})))
+            .order_by(Release.project_id, Release._pypi_ordering.desc(), File.filename)
+        )
+        for row in query:
+            release_files.setdefault(row[0].project_id, []).append(row)
+
+    for (normalized_name, version), (name, raw_version) in requested:
+        project = projects.get(normalized_name)
+        release = None
+        if project is not None:
+            release = releases.get(
+                (
+                    project.id,
+                    canonicalize_version(version) if version is not None else None,
+                )
+            )
+
+        if release is None:
+            yield {"name": name, "version": raw_version, "error": "Not Found"}
+        else:
+            yield _json_data(request, project, release, release_files[project.id])
+
+
+def _json_bulk_app_iter(request, requested):
+    # Our response body isn't iterated over until after the request has
+    # finished and its session has been closed, so we need our own.
+    connection = request.registry["sqlalchemy.engine"].connect()
+    session = Session(bind=connection)
+
+    try:
+        for start in range(0, len(requested), BULK_WINDOW):
+            for data in _json_bulk(
+                session, request, requested[start : start + BULK_WINDOW]
+            ):
+                yield (json.dumps(data) + "\n").encode("utf8")
+
+            # Nothing from this window is going to be used again, so we don't
+            # need to hold on to it while we serialize the rest.
+            session.expunge_all()
+    finally:
+        session.close()
+        connection.close()
+
+
+@view_config(
+    route_name="legacy.api.json.bulk",
+    decorator=[cache_control(5 * 60)],  # 5 minutes
+)
+def json_bulk(request):
+    """
+    Return the JSON for many projects at once, as one JSON document per line.
+
+    Each requested project is given as a ``project`` query parameter, either as
+    just the name of the project to get its latest release, or as
+    ``name==version`` to get a specific release.
+    """
+    try:
+        requested = _bulk_requested(request)
+    except HTTPBadRequest as exc:
+        exc.headers.update(_CORS_HEADERS)
+        return exc
+
+    request.response.headers.update(_CORS_HEADERS)
+    request.response.content_type = "application/x-ndjson"
+    request.response.app_iter = _json_bulk_app_iter(request, requested)
+
+    return request.response
+
+
+def _changelog_app_iter(request, since, limit):
+    # Our response body isn't iterated over until after the request has
+    # finished and its session has been closed, so we need our own.
+    connection = request.registry["sqlalchemy.engine"].connect()
+    session = Session(bind=connection)
+
+    try:
+        for name, version, timestamp, action, serial in changelog_since_serial(
+            session, since, limit=limit
+        ):
+            data = {
+                "name": name,
+                "version": version,
+                "timestamp": timestamp,
+                "action": action,
+                "serial": serial,
+            }
+            yield (json.dumps(data) + "\n").encode("utf8")
+    finally:
+        session.close()
+        connection.close()
+
+
+@view_config(route_name="legacy.api.json.changelog")
+def json_changelog(request):
+    """
+    Return the journal entries after the serial given as the ``since`` query
+    parameter, in order, as one JSON document per line.
+
+    At most ``limit`` (and never more than 50,000) entries are returned, to get
+    the ones after those, request the changelog again with ``since`` set to the
+    serial of the last one. The X-PyPI-Last-Serial header holds the latest
+    serial at the time of the request.
+
+    If ``wait`` is given, and there aren't any entries after ``since`` yet, then
+    the response is held for up to that many seconds (and never more than 5)
+    until there are.
+    """
+    try:
+        since = int(request.params["since"])
+        limit = int(request.params.get("limit", CHANGELOG_MAX_ENTRIES))
+        wait = int(request.params.get("wait", 0))
+    except (KeyError, ValueError):
+        exc = HTTPBadRequest("An integer since serial is required.")
+        exc.headers.update(_CORS_HEADERS)
+        return exc
+
+    if since < 0 or limit < 1 or wait < 0:
+        exc = HTTPBadRequest("The since serial, limit and wait must be positive.")
+        exc.headers.update(_CORS_HEADERS)
+        return exc
+
+    # If the relay is running then we know the last serial without asking the
+    # database, and anyone waiting for a new one can wait on a notification
+    # from Redis rather than polling for it.
+    last_serial = None
+    redis_conn = changelog_redis(request.registry.settings)
+    if redis_conn is not None:
+        last_serial = wait_for_serial(redis_conn, since, min(wait, MAX_WAIT))
+    if last_serial is None:
+        last_serial = request.db.query(func.max(JournalEntry.id)).scalar() or 0
+
+    request.response.headers.update(_CORS_HEADERS)
+    request.response.headers["X-PyPI-Last-Serial"] = str(last_serial)
+    request.response.content_type = "application/x-ndjson"
+    if last_serial > since:
+        request.response.app_iter = _changelog_app_iter(
+            request, since, min(limit, CHANGELOG_MAX_ENTRIES)
+        )
+    else:
+        request.response.app_iter = []
+
+    return request.response
@@ -0,0 +1,62 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from warehouse import db
+from warehouse.legacy.api.json_cache.interfaces import IJSONCache
+from warehouse.legacy.api.json_cache.services import RedisJSONCache
+
+
+def project_tag(project):
+    # This matches the origin cache key for the project, so that whatever
+    # would purge the project from our CDN also purges it from this cache.
+    return f"project/{project.normalized_name}"
+
+
+@db.listens_for(db.Session, "after_flush")
+def store_purge_keys(config, session, flush_context):
+    cache_keys = config.registry["cache_keys"]
+
+    # We'll (ab)use the session.info dictionary to store a list of pending
+    # purges to the session.
+    purges = session.info.setdefault("warehouse.legacy.api.json_cache.purges", set())
+
+    # Go through each new, changed, and deleted object and attempt to store
+    # a cache key that we'll want to purge when the session has been committed.
+    for obj in session.new | session.dirty | session.deleted:
+        try:
+            key_maker = cache_keys[obj.__class__]
+        except KeyError:
+            continue
+
+        # We only ever store responses under a project's key, so there's no
+        # reason to issue purges for any of the others.
+        purges.update(k for k in key_maker(obj).purge if k.startswith("project/"))
+
+
+@db.listens_for(db.Session, "after_commit")
+def execute_purge(config, session):
+    purges = session.info.pop("warehouse.legacy.api.json_cache.purges", set())
+
+    try:
+        json_cache_factory = config.find_service_factory(IJSONCache)
+    except LookupError:
+        return
+
+    json_cache = json_cache_factory(None, config)
+    json_cache.purge_tags(purges)
+
+
+def includeme(config):
+    # The JSON cache is optional, without it every request that misses our CDN
+    # will be rendered from the database.
+    if config.registry.settings.get("warehouse.json.cache.url"):
+        config.register_service_factory(RedisJSONCache.create_service, iface=IJSONCache)
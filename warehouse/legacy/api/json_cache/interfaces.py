@@ -0,0 +1,49 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from zope.interface import Interface
+
+
+class CacheError(Exception):
+    pass
+
+
+class IJSONCache(Interface):
+    def create_service(context, request):
+        """
+        Create the service, given the context and request for which it is being
+        created for.
+        """
+
+    def get(tag, key):
+        """
+        Return the encoded response stored under the given key for the given
+        tag, or None if there isn't one.
+        """
+
+    def set(tag, key, value):
+        """
+        Store the encoded response under the given key for the given tag, so
+        that it is removed whenever the tag is purged.
+        """
+
+    def purge(tag):
+        """
+        Issues a purge, clearing all cached responses associated with the tag
+        from the cache.
+        """
+
+    def purge_tags(tags):
+        """
+        Issues a purge, clearing all cached responses associated with each tag
+        in the iterable tags.
+        """
@@ -0,0 +1,84 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import redis
+
+from zope.interface import implementer
+
+from warehouse import tasks
+from warehouse.legacy.api.json_cache.interfaces import CacheError, IJSONCache
+
+
+@tasks.task(bind=True, ignore_result=True, acks_late=True)
+def purge_tag(task, request, tag):
+    service = request.find_service(IJSONCache)
+    request.log.info("Purging %s", tag)
+    try:
+        service.purge(tag)
+    except CacheError as exc:
+        request.log.error("Error purging %s: %s", tag, str(exc))
+        raise task.retry(exc=exc)
+
+
+@implementer(IJSONCache)
+class RedisJSONCache:
+    def __init__(self, redis_url, purger, name="json", expires=None):
+        self.redis_conn = redis.StrictRedis.from_url(redis_url)
+        self.name = name
+        self.expires = expires
+        self._purger = purger
+
+    @classmethod
+    def create_service(cls, context, request):
+        return cls(
+            request.registry.settings.get("warehouse.json.cache.url"),
+            request.task(purge_tag).delay,
+            name=request.registry.settings.get("warehouse.json.cache.name", "json"),
+            expires=int(
+                request.registry.settings.get(
+                    "warehouse.json.cache.expires", 25 * 60 * 60
+                )
+            ),
+        )
+
+    def _tag_key(self, tag):
+        return f"{self.name}/{tag}"
+
+    def get(self, tag, key):
+        # Failing to talk to our cache shouldn't fail the request, we'll just
+        # treat it as a miss and go to the database instead.
+        try:
+            return self.redis_conn.hget(self._tag_key(tag), key)
+        except redis.exceptions.RedisError:
+            return None
+
+    def set(self, tag, key, value):
+        # Everything for a tag lives in a single hash, so that purging the tag
+        # is a single DEL no matter how many keys have been stored under it.
+        try:
+            pipeline = self.redis_conn.pipeline()
+            pipeline.hset(self._tag_key(tag), key, value)
+            if self.expires:
+                pipeline.expire(self._tag_key(tag), self.expires)
+            pipeline.execute()
+        except redis.exceptions.RedisError:
+            pass
+
+    def purge(self, tag):
+        try:
+            self.redis_conn.delete(self._tag_key(tag))
+        except redis.exceptions.RedisError as exc:
+            raise CacheError(str(exc)) from exc
+
+    def purge_tags(self, tags):
+        for tag in tags:
+            self._purger(tag)
@@ -9,19 +9,293 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import contextlib
+import json
+import tempfile
 
-
-from packaging.version import parse
 from pyramid.httpexceptions import HTTPMovedPermanently
+from pyramid.renderers import render
 from pyramid.view import view_config
-from sqlalchemy import func
+from pyramid_jinja2 import IJinja2Environment
+from sqlalchemy import func, select
 from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.exc import NoResultFound
 
-from warehouse.cache.http import cache_control
+from warehouse import db, tasks
+from warehouse.cache.http import add_vary, cache_control
 from warehouse.cache.origin import origin_cache
+from warehouse.packaging.interfaces import ISimpleStorage
 from warehouse.packaging.models import JournalEntry, File, Project, Release
 
 
+MIME_TEXT_HTML = "text/html"
+MIME_PYPI_SIMPLE_V1_HTML = "application/vnd.pypi.simple.v1+html"
+MIME_PYPI_SIMPLE_V1_JSON = "application/vnd.pypi.simple.v1+json"
+
+# The content types that we can serve a simple page as, in the order that we
+# prefer them when a client doesn't have a preference.
+SIMPLE_CONTENT_TYPES = [
+    MIME_TEXT_HTML,
+    MIME_PYPI_SIMPLE_V1_HTML,
+    MIME_PYPI_SIMPLE_V1_JSON,
+]
+
+SIMPLE_API_VERSION = "1.0"
+
+SIMPLE_INDEX_TEMPLATE = "legacy/api/simple/index.html"
+SIMPLE_DETAIL_TEMPLATE = "legacy/api/simple/detail.html"
+
+# How many projects we'll pull from the database at a time, and roughly how
+# much rendered HTML we'll collect before handing it to the WSGI server, when
+# streaming the simple index.
+SIMPLE_INDEX_WINDOW = 1000
+SIMPLE_INDEX_CHUNK_SIZE = 64 * 1024
+
+
+def _simple_detail_path(normalized_name, fmt="html"):
+    return "{}/index.{}".format(normalized_name, fmt)
+
+
+def _simple_detail_serial_marker(serial):
+    # This has to match the trailing comment in our detail.html template.
+    return "<!--SERIAL {}-->".format(serial).encode("utf8")
+
+
+def _simple_detail_files(project, request):
+    return (
+        request.db.query(File)
+        .options(joinedload(File.release))
+        .join(Release)
+        .filter(Release.project == project)
+        .order_by(Release.version_sort_key, File.filename)
+        .all()
+    )
+
+
+def _simple_detail_file(file_, request):
+    data = {
+        "filename": file_.filename,
+        "url": request.route_url("packaging.file", path=file_.path),
+        "hashes": {"sha256": file_.sha256_digest},
+    }
+    if file_.release.requires_python:
+        data["requires-python"] = file_.release.requires_python
+    if file_.metadata_file_sha256_digest:
+        data["dist-info-metadata"] = {"sha256": file_.metadata_file_sha256_digest}
+    return data
+
+
+def simple_detail_data(project, request):
+    """
+    Fetch everything that goes onto the simple page for the given project, in
+    the form that the JSON simple API serves it, so that a single trip to the
+    database can be used to render the page in any of our formats.
+    """
+    return {
+        "meta": {
+            "api-version": SIMPLE_API_VERSION,
+            "_last-serial": project.last_serial,
+        },
+        "name": project.normalized_name,
+        "files": [
+            _simple_detail_file(f, request)
+            for f in _simple_detail_files(project, request)
+        ],
+    }
+
+
+def render_simple_detail(project, request, *, data=None):
+    """
+    Render the simple page for the given project, returning the rendered page
+    as bytes.
+    """
+    if data is None:
+        data = simple_detail_data(project, request)
+    content = render(
+        SIMPLE_DETAIL_TEMPLATE,
+        {"project": project, "files": data["files"]},
+        request=request,
+    )
+    return content.encode("utf8")
+
+
+def serialize_simple_detail(data):
+    """
+    Serialize the data for a simple page into the body of a JSON simple API
+    response.
+    """
+    return json.dumps(data, sort_keys=True, separators=(",", ":")).encode("utf8")
+
+
+def store_simple_detail(project, request):
+    """
+    Render the simple page for the given project in each of our formats and
+    save them to our simple storage, so that the view can serve them without
+    querying for the files.
+    """
+    storage = request.find_service(ISimpleStorage, context=None)
+    data = simple_detail_data(project, request)
+    meta = {
+        "project": project.normalized_name,
+        "pypi-last-serial": str(project.last_serial),
+    }
+
+    for fmt, content in [
+        ("html", render_simple_detail(project, request, data=data)),
+        ("json", serialize_simple_detail(data)),
+    ]:
+        with tempfile.NamedTemporaryFile() as fp:
+            fp.write(content)
+            fp.flush()
+
+            storage.store(
+                _simple_detail_path(project.normalized_name, fmt), fp.name, meta=meta
+            )
+
+
+@tasks.task(bind=True, ignore_result=True, acks_late=True)
+def update_simple_detail(task, request, project_name):
+    try:
+        project = (
+            request.db.query(Project)
+            .filter(Project.normalized_name == func.normalize_pep426_name(project_name))
+            .one()
+        )
+    except NoResultFound:
+        # The project has been deleted since this task was queued, there is
+        # nothing for us to render.
+        return
+
+    request.log.info("Rendering simple page for %s", project.normalized_name)
+    try:
+        store_simple_detail(project, request)
+    except Exception as exc:
+        request.log.error(
+            "Error rendering simple page for %s: %s", project.normalized_name, exc
+        )
+        raise task.retry(exc=exc)
+
+
+@db.listens_for(db.Session, "after_flush")
+def store_projects_for_simple_update(config, session, flush_context):
+    # We'll (ab)use the session.info dictionary to store a list of pending
+    # simple page renderings to the session.
+    projects = session.info.setdefault("warehouse.legacy.api.simple.updates", set())
+
+    # Go through each new, changed, and deleted object and attempt to store
+    # the name of any project whose simple page they appear on, so that we can
+    # render it again once the session has been committed.
+    for obj in session.new | session.dirty | session.deleted:
+        if obj.__class__ == File:
+            projects.add(obj.release.project.normalized_name)
+        if obj.__class__ == Release:
+            projects.add(obj.project.normalized_name)
+
+
+@db.listens_for(db.Session, "after_commit")
+def execute_simple_update(config, session):
+    projects = session.info.pop("warehouse.legacy.api.simple.updates", set())
+
+    # If we don't have anywhere to store our rendered pages, then there isn't
+    # any reason to render them.
+    try:
+        config.find_service_factory(ISimpleStorage)
+    except LookupError:
+        return
+
+    for project_name in projects:
+        config.task(update_simple_detail).delay(project_name)
+
+
+def _is_current_simple_detail(content, fmt, serial):
+    if fmt == "json":
+        try:
+            return json.loads(content)["meta"]["_last-serial"] == serial
+        except (ValueError, KeyError, TypeError):
+            return False
+    return content.rstrip().endswith(_simple_detail_serial_marker(serial))
+
+
+def _stored_simple_detail(project, request, fmt="html"):
+    try:
+        storage = request.find_service(ISimpleStorage, context=None)
+    except LookupError:
+        return None
+
+    try:
+        with contextlib.closing(
+            storage.get(_simple_detail_path(project.normalized_name, fmt))
+        ) as fp:
+            content = fp.read()
+    except FileNotFoundError:
+        # This project has never been rendered, most likely because it hasn't
+        # changed since we started storing rendered pages, so we'll queue up a
+        # rendering for it.
+        request.task(update_simple_detail).delay(project.normalized_name)
+        return None
+
+    # If the stored page is for an older serial then we can't serve it. Not
+    # every change that moves a project's serial forward changes its files
+    # (adding or removing a role doesn't, for instance), so a new rendering
+    # might not be on its way, and we'll queue one up to be sure.
+    if not _is_current_simple_detail(content, fmt, project.last_serial):
+        request.task(update_simple_detail).delay(project.normalized_name)
+        return None
+
+    return content
+
+
+def _select_content_type(request):
+    offers = request.accept.acceptable_offers(SIMPLE_CONTENT_TYPES)
+    # Clients that don't tell us what they want, or that only accept things we
+    # don't have, get the HTML that the simple API has always served.
+    if not offers:
+        return MIME_TEXT_HTML
+    return offers[0][0]
+
+
+def _simple_index_projects(engine):
+    # We can't use request.db for this, because our response body isn't
+    # iterated over until after the request has finished, by which point the
+    # request's session has been closed. Instead we use our own connection, and
+    # a server side cursor so that we only hold one window of rows at a time.
+    connection = engine.connect()
+    try:
+        result = connection.execution_options(stream_results=True).execute(
+            select(
+                [Project.name, Project.normalized_name.label("normalized_name")]
+            ).order_by(Project.normalized_name)
+        )
+        while True:
+            rows = result.fetchmany(SIMPLE_INDEX_WINDOW)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        connection.close()
+
+
+def _simple_index_app_iter(request):
+    env = request.registry.queryUtility(IJinja2Environment, name=".html")
+    template = env.get_template(SIMPLE_INDEX_TEMPLATE)
+    projects = _simple_index_projects(request.registry["sqlalchemy.engine"])
+
+    try:
+        chunk, size = [], 0
+        for item in template.generate(request=request, projects=projects):
+            chunk.append(item)
+            size += len(item)
+            if size >= SIMPLE_INDEX_CHUNK_SIZE:
+                yield "".join(chunk).encode("utf8")
+                chunk, size = [], 0
+        if chunk:
+            yield "".join(chunk).encode("utf8")
+    finally:
+        # Make sure that we give our connection back, even if the client has
+        # gone away before we've finished sending them the page.
+        projects.close()
+
+
 @view_config(
     route_name="legacy.api.simple.index",
     renderer="legacy/api/simple/index.html",
@@ -39,14 +313,20 @@ def simple_index(request):
     serial = request.db.query(func.max(JournalEntry.id)).scalar() or 0
     request.response.headers["X-PyPI-Last-Serial"] = str(serial)
 
-    # Fetch the name and normalized name for all of our projects
-    projects = (
-        request.db.query(Project.name, Project.normalized_name)
-        .order_by(Project.normalized_name)
-        .all()
+    # Every project being added or removed creates a new journal entry, so the
+    # serial (along with the version of our code, in case the template has
+    # changed) tells us everything we need to know about whether this page has
+    # changed, without having to render and hash the whole thing.
+    request.response.etag = "simple-index-{}-{}".format(
+        request.registry.settings.get("warehouse.commit", ""), serial
     )
 
-    return {"projects": projects}
+    # There are far too many projects to render the entire page in memory, so
+    # instead we stream it out to the client as we pull the projects from the
+    # database.
+    request.response.app_iter = _simple_index_app_iter(request)
+
+    return request.response
 
 
 @view_config(
@@ -54,6 +334,7 @@ def simple_index(request):
     context=Project,
     renderer="legacy/api/simple/detail.html",
     decorator=[
+        add_vary("Accept"),
         cache_control(10 * 60),  # 10 minutes
         origin_cache(
             1 * 24 * 60 * 60,  # 1 day
@@ -76,14 +357,21 @@ def simple_detail(project, request):
     # Get the latest serial number for this project.
     request.response.headers["X-PyPI-Last-Serial"] = str(project.last_serial)
 
-    # Get all of the files for this project.
-    files = sorted(
-        request.db.query(File)
-        .options(joinedload(File.release))
-        .join(Release)
-        .filter(Release.project == project)
-        .all(),
-        key=lambda f: (parse(f.release.version), f.filename),
-    )
+    content_type = _select_content_type(request)
+    fmt = "json" if content_type == MIME_PYPI_SIMPLE_V1_JSON else "html"
+
+    # If we have a pre-rendered page for this project, then we'll serve that
+    # instead of going back to the database for all of the files.
+    content = _stored_simple_detail(project, request, fmt)
+    if content is None:
+        data = simple_detail_data(project, request)
+        if fmt == "json":
+            content = serialize_simple_detail(data)
+        else:
+            content = render_simple_detail(project, request, data=data)
+
+    request.response.content_type = content_type
+    request.response.charset = "UTF-8"
+    request.response.body = content
 
-    return {"project": project, "files": files}
+    return request.response
@@ -20,12 +20,13 @@ from sqlalchemy.orm.session import Session
 
 from warehouse import db
 from warehouse.accounts.models import Email, User
-from warehouse.legacy.api.xmlrpc.cache.fncache import RedisLru
+from warehouse.legacy.api.xmlrpc.cache.fncache import LocalLru, RedisLru
 from warehouse.legacy.api.xmlrpc.cache.derivers import cached_return_view
 from warehouse.legacy.api.xmlrpc.cache.services import NullXMLRPCCache, RedisXMLRPCCache
 from warehouse.legacy.api.xmlrpc.cache.interfaces import IXMLRPCCache
+from warehouse.legacy.api.xmlrpc.cache.serializers import serializer_from_settings
 
-__all__ = ["RedisLru"]
+__all__ = ["LocalLru", "RedisLru"]
 
 
 CacheKeys = collections.namedtuple("CacheKeys", ["cache", "purge"])
@@ -113,6 +114,24 @@ def includeme(config):
             " to integer"
         )
 
+    try:
+        config.registry["warehouse.xmlrpc.cache.serializer"] = serializer_from_settings(
+            config.registry.settings
+        )
+    except ValueError as exc:
+        raise ConfigurationError(f"Unable to configure XMLRPCCache serializer: {exc}")
+
+    # Optionally keep the hottest entries in each process as well, for a short
+    # time, so that they don't have to be fetched from Redis and decoded again.
+    xmlrpc_cache_local_size = config.registry.settings.get(
+        "warehouse.xmlrpc.cache.local_size"
+    )
+    if xmlrpc_cache_local_size is not None:
+        config.registry["warehouse.xmlrpc.cache.local"] = LocalLru(
+            int(xmlrpc_cache_local_size),
+            int(config.registry.settings.get("warehouse.xmlrpc.cache.local_ttl", 5)),
+        )
+
     config.register_service_factory(
         xmlrpc_cache_class.create_service, iface=IXMLRPCCache
     )
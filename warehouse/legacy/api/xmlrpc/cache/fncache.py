@@ -10,31 +10,106 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import json
+import collections
+import math
+import random
+import threading
+import time
+import uuid
+
 import redis
 
 from warehouse.legacy.api.xmlrpc.cache.interfaces import CacheError
+from warehouse.legacy.api.xmlrpc.cache.serializers import JSONSerializer
 
 DEFAULT_EXPIRES = 86400
 
+# How long a worker recomputing a missing value holds the lock for it, and how
+# long other workers will wait for that value before computing it themselves.
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 10
+LOCK_POLL_INTERVAL = 0.05
+
+# Scales how early, relative to how long the value took to compute, entries are
+# probabilistically refreshed before they expire.
+EARLY_REFRESH_BETA = 1.0
+
+_MISSING = object()
+
 
 class StubMetricReporter(object):
     def increment(self, metric_name):
         return
 
+    def histogram(self, metric_name, value):
+        return
+
+
+class LocalLru(object):
+    """
+    A bounded, thread safe, in process LRU cache whose entries expire after a
+    (short) ttl, used in front of Redis for the hottest entries.
+    """
+
+    def __init__(self, maxsize, ttl, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires_at = self._data[key]
+            except KeyError:
+                return default
+            if expires_at <= self._clock():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, self._clock() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def purge(self, predicate):
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+
+REDIS_ERRORS = (redis.exceptions.RedisError, redis.exceptions.ConnectionError)
+
 
 class RedisLru(object):
     """
     Redis backed LRU cache for functions which return an object which
-    can survive json.dumps() and json.loads() intact
+    can survive being encoded and decoded by the serializer intact
     """
 
-    def __init__(self, conn, name="lru", expires=None, metric_reporter=None):
+    def __init__(
+        self,
+        conn,
+        name="lru",
+        expires=None,
+        metric_reporter=None,
+        local=None,
+        serializer=None,
+    ):
         """
         conn:            Redis Connection Object
         name:            Prefix for all keys in the cache
         expires:         Default expiration
-        metric_reporter: Object implementing an `increment(<string>)` method
+        metric_reporter: Object implementing an `increment(<string>)` method,
+                         and optionally a `histogram(<string>, <number>)` one
+        local:           Optional LocalLru to use in front of Redis
+        serializer:      Object implementing `dumps` and `loads` methods which
+                         encode values to, and decode them from, bytes
         """
         self.conn = conn
         self.name = name
@@ -43,49 +118,222 @@ class RedisLru(object):
             self.metric_reporter = metric_reporter
         else:
             self.metric_reporter = StubMetricReporter()
+        self.local = local
+        self.serializer = serializer if serializer is not None else JSONSerializer()
 
     def format_key(self, func_name, tag):
         if tag is not None:
             return ":".join([self.name, tag, func_name])
         return ":".join([self.name, "tag", func_name])
 
+    def format_tag_index_key(self, tag):
+        # Each tag has a set of the cache keys that have been stored under it,
+        # so that purging a tag only has to touch the keys for that tag rather
+        # than scanning the entire keyspace for them.
+        if tag is not None:
+            return ":".join([self.name, "tag-index", tag])
+        return ":".join([self.name, "tag-index", "tag"])
+
+    def format_lock_key(self, func_name, key, tag):
+        return f"{self.format_key(func_name, tag)}:lock:{key}"
+
+    @staticmethod
+    def format_meta_field(key):
+        # Alongside each value we store how long it took to compute and when it
+        # expires, which we use to decide when to refresh it early.
+        return f"{key}:meta"
+
+    def _lookup(self, func_name, key, tag):
+        value, meta = self.conn.hmget(
+            self.format_key(func_name, tag), [key, self.format_meta_field(key)]
+        )
+        return value, meta
+
+    def _histogram(self, metric_name, value):
+        histogram = getattr(self.metric_reporter, "histogram", None)
+        if callable(histogram):
+            histogram(metric_name, value)
+
+    def _decode(self, payload):
+        return self.serializer.loads(payload)
+
+    def _should_refresh(self, meta):
+        # This is the "XFetch" algorithm, as the entry gets closer to expiring
+        # it gets more likely that any one fetch will recompute it, so that it
+        # will usually be recomputed by a single worker before it expires.
+        if meta is None:
+            return False
+        delta, expires_at = (float(i) for i in meta.split())
+        return (
+            time.time() - delta * EARLY_REFRESH_BETA * math.log(1 - random.random())
+            >= expires_at
+        )
+
+    def _acquire(self, lock_key, token):
+        try:
+            return bool(self.conn.set(lock_key, token, nx=True, px=LOCK_TIMEOUT * 1000))
+        except REDIS_ERRORS:
+            self.metric_reporter.increment(f"{self.name}.cache.error")
+            return True
+
+    def _release(self, lock_key, token):
+        # Only delete the lock if it is still ours, it may have timed out and
+        # been taken by another worker in the meantime.
+        try:
+            with self.conn.pipeline() as pipeline:
+                pipeline.watch(lock_key)
+                if pipeline.get(lock_key) == token.encode("utf8"):
+                    pipeline.multi()
+                    pipeline.delete(lock_key)
+                    pipeline.execute()
+        except REDIS_ERRORS:
+            pass
+
+    def _wait(self, func_name, key, tag):
+        self.metric_reporter.increment(f"{self.name}.cache.wait")
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            try:
+                payload, _ = self._lookup(func_name, key, tag)
+            except REDIS_ERRORS:
+                self.metric_reporter.increment(f"{self.name}.cache.error")
+                return None
+            if payload is not None:
+                self.metric_reporter.increment(f"{self.name}.cache.hit")
+                return payload
+        return None
+
+    def _compute(self, func, args, kwargs, key, tag, expires):
+        start = time.monotonic()
+        value = func(*args, **kwargs)
+        payload = self._store(
+            func.__name__, key, value, tag, expires, delta=time.monotonic() - start
+        )
+        return value, payload
+
     def get(self, func_name, key, tag):
         try:
-            value = self.conn.hget(self.format_key(func_name, tag), key)
-        except (redis.exceptions.RedisError, redis.exceptions.ConnectionError):
+            payload, _ = self._lookup(func_name, key, tag)
+        except REDIS_ERRORS:
             self.metric_reporter.increment(f"{self.name}.cache.error")
             return None
-        if value:
-            self.metric_reporter.increment(f"{self.name}.cache.hit")
-            value = json.loads(value)
+        if payload is None:
+            return None
+        self.metric_reporter.increment(f"{self.name}.cache.hit")
+        return self._decode(payload)
+
+    def add(self, func_name, key, value, tag, expires, delta=0):
+        self._store(func_name, key, value, tag, expires, delta=delta)
         return value
 
-    def add(self, func_name, key, value, tag, expires):
+    def _store(self, func_name, key, value, tag, expires, delta=0):
+        # The value is only encoded once, and the encoded payload is returned so
+        # that it can be handed straight to anything that wants it that way.
+        payload = self.serializer.dumps(value)
+        self._histogram(f"{self.name}.cache.size", len(payload))
         try:
             self.metric_reporter.increment(f"{self.name}.cache.miss")
-            pipeline = self.conn.pipeline()
-            pipeline.hset(self.format_key(func_name, tag), key, json.dumps(value))
+            cache_key = self.format_key(func_name, tag)
+            tag_index_key = self.format_tag_index_key(tag)
             ttl = expires if expires else self.expires
-            pipeline.expire(self.format_key(func_name, tag), ttl)
+            pipeline = self.conn.pipeline()
+            pipeline.hmset(
+                cache_key,
+                {
+                    key: payload,
+                    self.format_meta_field(key): f"{delta} {time.time() + ttl}",
+                },
+            )
+            pipeline.expire(cache_key, ttl)
+            pipeline.sadd(tag_index_key, cache_key)
+            # The index has to outlive every key that it refers to, otherwise
+            # those keys could no longer be purged.
+            pipeline.expire(tag_index_key, max(ttl, self.expires))
             pipeline.execute()
-            return value
-        except (redis.exceptions.RedisError, redis.exceptions.ConnectionError):
+        except REDIS_ERRORS:
             self.metric_reporter.increment(f"{self.name}.cache.error")
-            return value
+        return payload
 
     def purge(self, tag):
+        # Other processes may still have this tag in their local cache, but
+        # those entries are short lived.
+        if self.local is not None:
+            prefix = self.format_key("", tag)
+            self.local.purge(lambda local_key: local_key[0].startswith(prefix))
+
         try:
-            keys = self.conn.scan_iter(":".join([self.name, tag, "*"]))
-            pipeline = self.conn.pipeline()
-            for key in keys:
-                pipeline.delete(key)
-            pipeline.execute()
+            tag_index_key = self.format_tag_index_key(tag)
+            keys = self.conn.smembers(tag_index_key)
+            if keys:
+                # Only remove the keys that we're deleting from the index, so
+                # that any key added to it since we read it can still be purged.
+                pipeline = self.conn.pipeline()
+                pipeline.delete(*keys)
+                pipeline.srem(tag_index_key, *keys)
+                pipeline.execute()
             self.metric_reporter.increment(f"{self.name}.cache.purge")
-        except (redis.exceptions.RedisError, redis.exceptions.ConnectionError):
+        except REDIS_ERRORS:
             self.metric_reporter.increment(f"{self.name}.cache.error")
             raise CacheError()
 
     def fetch(self, func, args, kwargs, key, tag, expires):
-        return self.get(func.__name__, key, tag) or self.add(
-            func.__name__, key, func(*args, **kwargs), tag, expires
-        )
+        """
+        Return the cached result of calling func, calling it (and caching the
+        result) if there isn't one.
+        """
+        local_key = (self.format_key(func.__name__, tag), key)
+        if self.local is not None:
+            value = self.local.get(local_key, _MISSING)
+            if value is not _MISSING:
+                self.metric_reporter.increment(f"{self.name}.cache.local.hit")
+                return value
+
+        value, payload = self._fetch(func, args, kwargs, key, tag, expires)
+        if value is _MISSING:
+            value = self._decode(payload)
+
+        if self.local is not None:
+            self.local.set(local_key, value)
+        return value
+
+    def _fetch(self, func, args, kwargs, key, tag, expires):
+        # Returns the value, if we have it, and its encoded payload, so that we
+        # only ever decode a payload if something actually wants the value.
+        try:
+            payload, meta = self._lookup(func.__name__, key, tag)
+        except REDIS_ERRORS:
+            # If Redis is unavailable then there's no point in trying to
+            # coordinate with any other workers.
+            self.metric_reporter.increment(f"{self.name}.cache.error")
+            value = func(*args, **kwargs)
+            return value, self._store(func.__name__, key, value, tag, expires)
+
+        if payload is not None:
+            self.metric_reporter.increment(f"{self.name}.cache.hit")
+            if not self._should_refresh(meta):
+                return _MISSING, payload
+
+        # Only one worker at a time computes any given value, any others either
+        # keep using the current value if there is one, or wait for the worker
+        # that holds the lock to store the new one.
+        lock_key = self.format_lock_key(func.__name__, key, tag)
+        token = uuid.uuid4().hex
+        if self._acquire(lock_key, token):
+            if payload is not None:
+                self.metric_reporter.increment(f"{self.name}.cache.refresh")
+            try:
+                return self._compute(func, args, kwargs, key, tag, expires)
+            finally:
+                self._release(lock_key, token)
+
+        if payload is not None:
+            return _MISSING, payload
+
+        payload = self._wait(func.__name__, key, tag)
+        if payload is not None:
+            return _MISSING, payload
+
+        # The worker holding the lock is taking too long, so rather than
+        # waiting any longer we'll compute the value ourselves.
+        return self._compute(func, args, kwargs, key, tag, expires)
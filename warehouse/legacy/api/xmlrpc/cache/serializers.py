@@ -0,0 +1,114 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import zlib
+
+import msgpack
+
+try:
+    import lz4.frame
+except ImportError:  # pragma: no cover
+    lz4 = None
+
+
+# Every payload written by a serializer other than JSONSerializer starts with
+# one of these bytes, which no JSON document can start with, so that entries
+# written before the serializer was changed can still be read.
+_MSGPACK = b"\x01"
+_MSGPACK_ZLIB = b"\x02"
+_MSGPACK_LZ4 = b"\x03"
+
+
+class JSONSerializer:
+    """
+    Stores values as JSON, this is what the cache has always used, so it can
+    always be used to read existing entries.
+    """
+
+    def dumps(self, value):
+        return json.dumps(value).encode("utf8")
+
+    def loads(self, payload):
+        return json.loads(payload)
+
+
+def _zlib_compress(data):
+    return zlib.compress(data, 1)
+
+
+def _lz4_compress(data):
+    return lz4.frame.compress(data)
+
+
+def _lz4_decompress(data):
+    if lz4 is None:
+        raise ValueError("Cannot decode lz4 payload without the lz4 package")
+    return lz4.frame.decompress(data)
+
+
+class MsgpackSerializer:
+    """
+    Stores values as msgpack, which is both smaller and a lot faster to decode
+    than JSON for the large values (such as the result of
+    list_packages_with_serial) that get stored in the cache, optionally
+    compressing any payload that is larger than compression_threshold bytes.
+    """
+
+    compressors = {
+        "zlib": (_MSGPACK_ZLIB, _zlib_compress),
+        "lz4": (_MSGPACK_LZ4, _lz4_compress),
+    }
+
+    decompressors = {
+        _MSGPACK_ZLIB: zlib.decompress,
+        _MSGPACK_LZ4: _lz4_decompress,
+    }
+
+    def __init__(self, compression=None, compression_threshold=16384):
+        if compression is not None and compression not in self.compressors:
+            raise ValueError(f"Unknown compression: {compression!r}")
+        if compression == "lz4" and lz4 is None:
+            raise ValueError("Cannot use lz4 compression without the lz4 package")
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+
+    def dumps(self, value):
+        data = msgpack.packb(value, use_bin_type=True)
+        if self.compression is not None and len(data) > self.compression_threshold:
+            marker, compress = self.compressors[self.compression]
+            return marker + compress(data)
+        return _MSGPACK + data
+
+    def loads(self, payload):
+        marker, data = payload[:1], payload[1:]
+        if marker == _MSGPACK:
+            pass
+        elif marker in self.decompressors:
+            data = self.decompressors[marker](data)
+        else:
+            return json.loads(payload)
+        return msgpack.unpackb(data, raw=False)
+
+
+def serializer_from_settings(settings):
+    name = settings.get("warehouse.xmlrpc.cache.serializer", "msgpack")
+    if name == "json":
+        return JSONSerializer()
+    if name != "msgpack":
+        raise ValueError(f"Unknown serializer: {name!r}")
+    return MsgpackSerializer(
+        compression=settings.get("warehouse.xmlrpc.cache.compression") or None,
+        compression_threshold=int(
+            settings.get("warehouse.xmlrpc.cache.compression_threshold", 16384)
+        ),
+    )
@@ -17,6 +17,7 @@ from zope.interface import implementer
 from warehouse import tasks
 from warehouse.legacy.api.xmlrpc import cache
 from warehouse.legacy.api.xmlrpc.cache import interfaces
+from warehouse.metrics import IMetricsService
 
 
 @tasks.task(bind=True, ignore_result=True, acks_late=True)
@@ -40,10 +41,17 @@ class RedisXMLRPCCache:
         name="lru",
         expires=None,
         metric_reporter=None,
+        local=None,
+        serializer=None,
     ):
         self.redis_conn = redis.StrictRedis.from_url(redis_url, db=redis_db)
         self.redis_lru = cache.RedisLru(
-            self.redis_conn, name=name, expires=expires, metric_reporter=metric_reporter
+            self.redis_conn,
+            name=name,
+            expires=expires,
+            metric_reporter=metric_reporter,
+            local=local,
+            serializer=serializer,
         )
         self._purger = purger
 
@@ -58,6 +66,9 @@ class RedisXMLRPCCache:
                     "warehouse.xmlrpc.cache.expires", 25 * 60 * 60
                 )
             ),
+            metric_reporter=request.find_service(IMetricsService, context=None),
+            local=request.registry.get("warehouse.xmlrpc.cache.local"),
+            serializer=request.registry.get("warehouse.xmlrpc.cache.serializer"),
         )
 
     def fetch(self, func, args, kwargs, key, tag, expires):
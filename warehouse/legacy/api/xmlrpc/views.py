@@ -35,6 +35,7 @@ from sqlalchemy.orm.exc import NoResultFound
 
 from warehouse.accounts.models import User
 from warehouse.classifiers.models import Classifier
+from warehouse.legacy.api import changelog as changelog_api
 from warehouse.metrics import IMetricsService
 from warehouse.packaging.models import (
     Role,
@@ -44,6 +45,7 @@ from warehouse.packaging.models import (
     JournalEntry,
     release_classifiers,
 )
+from warehouse.packaging.serials import get_project_serials, serials_redis
 from warehouse.search.queries import SEARCH_BOOSTS
 
 
@@ -234,8 +236,17 @@ def list_packages(request):
     return [n[0] for n in names]
 
 
-@xmlrpc_cache_all_projects(method="list_packages_with_serial")
+@xmlrpc_method(method="list_packages_with_serial")
 def list_packages_with_serial(request):
+    # This isn't cached like list_packages is, since we keep the serials in a
+    # hash that is updated as each change is journaled, which is both cheaper
+    # to read and always up to date.
+    redis_conn = serials_redis(request.registry.settings)
+    if redis_conn is not None:
+        serials = get_project_serials(redis_conn)
+        if serials is not None:
+            return serials
+
     serials = request.db.query(Project.name, Project.last_serial).all()
     return dict((serial[0], serial[1]) for serial in serials)
 
@@ -425,53 +436,31 @@ def package_roles(request, package_name: str):
 
 @xmlrpc_method(method="changelog_last_serial")
 def changelog_last_serial(request):
+    redis_conn = changelog_api.changelog_redis(request.registry.settings)
+    if redis_conn is not None:
+        serial = changelog_api.get_last_serial(redis_conn)
+        if serial is not None:
+            return serial
+
     return request.db.query(func.max(JournalEntry.id)).scalar()
 
 
 @xmlrpc_method(method="changelog_since_serial")
 def changelog_since_serial(request, serial: int):
-    entries = (
-        request.db.query(JournalEntry)
-        .filter(JournalEntry.id > serial)
-        .order_by(JournalEntry.id)
-        .limit(50000)
-    )
-
-    return [
-        (
-            e.name,
-            e.version,
-            int(e.submitted_date.replace(tzinfo=datetime.timezone.utc).timestamp()),
-            e.action,
-            e.id,
+    return list(
+        changelog_api.changelog_since_serial(
+            request.db, serial, window=changelog_api.CHANGELOG_MAX_ENTRIES
         )
-        for e in entries
-    ]
+    )
 
 
 @xmlrpc_method(method="changelog")
 def changelog(request, since: int, with_ids: bool = False):
     since = datetime.datetime.utcfromtimestamp(since)
-    entries = (
-        request.db.query(JournalEntry)
-        .filter(JournalEntry.submitted_date > since)
-        .order_by(JournalEntry.id)
-        .limit(50000)
-    )
-
-    results = (
-        (
-            e.name,
-            e.version,
-            int(e.submitted_date.replace(tzinfo=datetime.timezone.utc).timestamp()),
-            e.action,
-            e.id,
-        )
-        for e in entries
-    )
+    results = changelog_api.changelog_since_date(request.db, since)
 
     if with_ids:
-        return list(results)
+        return results
     else:
         return [r[:-1] for r in results]
 
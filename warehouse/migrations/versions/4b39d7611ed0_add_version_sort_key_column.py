@@ -0,0 +1,68 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Add version_sort_key column
+
+Revision ID: 4b39d7611ed0
+Revises: 2d6390eebe90
+Create Date: 2018-11-20 17:03:11.409812
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from warehouse.packaging.ordering import version_sort_key
+
+
+revision = "4b39d7611ed0"
+down_revision = "2d6390eebe90"
+
+releases = sa.Table(
+    "releases",
+    sa.MetaData(),
+    sa.Column("version", sa.Text(), primary_key=True),
+    sa.Column("version_sort_key", sa.LargeBinary()),
+)
+
+
+def upgrade():
+    op.add_column(
+        "releases", sa.Column("version_sort_key", sa.LargeBinary(), nullable=True)
+    )
+
+    connection = op.get_bind()
+    version_query = sa.select([releases.c.version]).distinct()
+
+    for release in connection.execute(version_query):
+        connection.execute(
+            releases.update()
+            .where(
+                sa.and_(
+                    releases.c.version == release.version,
+                    releases.c.version_sort_key.is_(None),
+                )
+            )
+            .values(version_sort_key=version_sort_key(release.version))
+        )
+
+    op.alter_column("releases", "version_sort_key", nullable=False)
+    op.create_index(
+        "release_project_version_sort_key_idx",
+        "releases",
+        ["project_id", "version_sort_key"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("release_project_version_sort_key_idx", table_name="releases")
+    op.drop_column("releases", "version_sort_key")
@@ -0,0 +1,38 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Add metadata_file_sha256_digest
+
+Revision ID: 71f547df3448
+Revises: 7a8c380cefa4
+Create Date: 2018-11-29 10:21:44.920163
+"""
+
+import citext
+import sqlalchemy as sa
+
+from alembic import op
+
+
+revision = "71f547df3448"
+down_revision = "7a8c380cefa4"
+
+
+def upgrade():
+    op.add_column(
+        "release_files",
+        sa.Column("metadata_file_sha256_digest", citext.CIText(), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_column("release_files", "metadata_file_sha256_digest")
@@ -0,0 +1,53 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Notify on journal insert
+
+Revision ID: 7a8c380cefa4
+Revises: 4b39d7611ed0
+Create Date: 2018-11-27 14:52:06.215748
+"""
+
+from alembic import op
+
+
+revision = "7a8c380cefa4"
+down_revision = "4b39d7611ed0"
+
+
+def upgrade():
+    # Notifications are only delivered once the transaction that sent them has
+    # been committed, so anything listening will never see a serial before it
+    # is visible to everything else.
+    op.execute(
+        """ CREATE OR REPLACE FUNCTION notify_journal_insert()
+            RETURNS TRIGGER AS $$
+                BEGIN
+                    PERFORM pg_notify('journals', NEW.id::text);
+                    RETURN NULL;
+                END;
+            $$
+            LANGUAGE plpgsql;
+        """
+    )
+    op.execute(
+        """ CREATE TRIGGER journals_notify
+              AFTER INSERT ON journals
+              FOR EACH ROW
+                  EXECUTE PROCEDURE notify_journal_insert();
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER journals_notify ON journals")
+    op.execute("DROP FUNCTION notify_journal_insert()")
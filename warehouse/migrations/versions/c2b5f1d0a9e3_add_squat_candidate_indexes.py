@@ -0,0 +1,46 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Add squat candidate indexes
+
+Revision ID: c2b5f1d0a9e3
+Revises: 71f547df3448
+Create Date: 2018-12-03 11:47:19.602815
+"""
+
+from alembic import op
+
+
+revision = "c2b5f1d0a9e3"
+down_revision = "71f547df3448"
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute(
+        """ CREATE INDEX project_name_pep426_normalized_trgm_idx
+            ON projects
+            USING gin
+            (normalize_pep426_name(name) gin_trgm_ops)
+        """
+    )
+    op.execute(
+        """ CREATE INDEX project_name_pep426_normalized_length_idx
+            ON projects
+            (length(normalize_pep426_name(name)))
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX project_name_pep426_normalized_length_idx")
+    op.execute("DROP INDEX project_name_pep426_normalized_trgm_idx")
@@ -10,15 +10,35 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import logging
+
+import redis
+
 from celery.schedules import crontab
 from sqlalchemy.orm.base import NO_VALUE
 
 from warehouse import db
 from warehouse.accounts.models import User, Email
 from warehouse.cache.origin import key_factory, receive_set
-from warehouse.packaging.interfaces import IFileStorage, IDocsStorage
-from warehouse.packaging.models import File, Project, Release, Role
-from warehouse.packaging.tasks import compute_trending
+from warehouse.packaging.interfaces import IFileStorage, IDocsStorage, ISimpleStorage
+from warehouse.packaging.models import File, JournalEntry, Project, Release, Role
+from warehouse.packaging.serials import apply_journal_entries, serials_redis
+from warehouse.packaging.tasks import (
+    compute_trending,
+    promote_staged_files,
+    remove_orphaned_files,
+    reorder_releases,
+    sync_project_serials,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+# The all-projects key is purged by every change to any project or release, so
+# under steady upload traffic the pages using it would never stay cached. So we
+# purge it at most once per this many seconds instead.
+ALL_PROJECTS_PURGE_INTERVAL = 5 * 60
 
 
 @db.listens_for(User.name, "set")
@@ -33,6 +53,55 @@ def email_primary_receive_set(config, target, value, oldvalue, initiator):
         receive_set(Email.primary, config, target)
 
 
+@db.listens_for(db.Session, "after_flush")
+def store_journal_entries(config, session, flush_context):
+    # We'll (ab)use the session.info dictionary to store the journal entries
+    # that have been written in this session, so that we can apply them to the
+    # project serials once the session has been committed.
+    entries = session.info.setdefault("warehouse.packaging.journal_entries", set())
+    for obj in session.new:
+        if obj.__class__ == JournalEntry:
+            entries.add((obj.id, obj.name, obj.action))
+
+
+@db.listens_for(db.Session, "after_commit")
+def execute_journal_entries(config, session):
+    entries = session.info.pop("warehouse.packaging.journal_entries", set())
+    if not entries:
+        return
+
+    redis_conn = serials_redis(config.registry.settings)
+    if redis_conn is not None:
+        # This is only an optimization so that the serials are updated
+        # immediately, the sync_project_serials task will correct anything
+        # that goes wrong here.
+        try:
+            apply_journal_entries(redis_conn, entries)
+        except redis.exceptions.RedisError:
+            pass
+
+
+def promote_on_commit(session, storage, path):
+    """
+    Promote the file staged in storage for the given path once the session has
+    been committed.
+    """
+    staged = session.info.setdefault("warehouse.packaging.staged_files", [])
+    staged.append((storage, path))
+
+
+@db.listens_for(db.Session, "after_commit")
+def execute_promote_staged_files(config, session):
+    for storage, path in session.info.pop("warehouse.packaging.staged_files", []):
+        # The transaction has already been committed, so there's nothing to be
+        # gained from failing now, the promote_staged_files task will promote
+        # anything that we weren't able to.
+        try:
+            storage.promote(path)
+        except Exception:
+            logger.exception("Error promoting staged file %s", path)
+
+
 def includeme(config):
     # Register whatever file storage backend has been configured for storing
     # our package files.
@@ -42,6 +111,17 @@ def includeme(config):
     docs_storage_class = config.maybe_dotted(config.registry.settings["docs.backend"])
     config.register_service_factory(docs_storage_class.create_service, IDocsStorage)
 
+    # Register a storage backend for our pre-rendered simple pages, if one has
+    # been configured. Without one, the simple pages are always rendered from
+    # the database.
+    if config.registry.settings.get("simple.backend"):
+        simple_storage_class = config.maybe_dotted(
+            config.registry.settings["simple.backend"]
+        )
+        config.register_service_factory(
+            simple_storage_class.create_service, ISimpleStorage
+        )
+
     # Register our origin cache keys
     config.register_origin_cache_keys(
         File,
@@ -56,6 +136,7 @@ def includeme(config):
             key_factory("user/{itr.username}", iterate_on="users"),
             key_factory("all-projects"),
         ],
+        purge_intervals={"all-projects": ALL_PROJECTS_PURGE_INTERVAL},
     )
     config.register_origin_cache_keys(
         Release,
@@ -65,6 +146,7 @@ def includeme(config):
             key_factory("user/{itr.username}", iterate_on="project.users"),
             key_factory("all-projects"),
         ],
+        purge_intervals={"all-projects": ALL_PROJECTS_PURGE_INTERVAL},
     )
     config.register_origin_cache_keys(
         Role,
@@ -93,3 +175,18 @@ def includeme(config):
     # been configured to be able to access BigQuery.
     if config.get_settings().get("warehouse.trending_table"):
         config.add_periodic_task(crontab(minute=0, hour=3), compute_trending)
+
+    # Add a periodic task to keep the project serials used by
+    # list_packages_with_serial in sync with the journal.
+    if config.get_settings().get("packaging.serials.redis_url"):
+        config.add_periodic_task(crontab(minute="*"), sync_project_serials)
+
+    # Add periodic tasks to promote any staged files that weren't promoted when
+    # their upload was committed, and to remove any stored files that don't
+    # belong to a file in the database.
+    config.add_periodic_task(crontab(minute="*/5"), promote_staged_files)
+    config.add_periodic_task(crontab(minute=30, hour=4), remove_orphaned_files)
+
+    # Add a periodic task to repair the ordering of any project's releases that
+    # uploads have left out of order.
+    config.add_periodic_task(crontab(minute=15), reorder_releases)
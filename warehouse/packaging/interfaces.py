@@ -33,6 +33,54 @@ class IFileStorage(Interface):
         extra information that an implementation may or may not store.
         """
 
+    def stage(path, file_path, *, meta=None):
+        """
+        Save the file located at file_path to a staging area, where it will not
+        be available at the location specified by path until it is promoted.
+        An additional meta keyword argument may contain extra information that
+        an implementation may or may not store.
+        """
+
+    def promote(path):
+        """
+        Move the staged file for the given path to that location, making it
+        available.
+        """
+
+    def list(*, staged=False):
+        """
+        Return an iterable of (path, last modified datetime in UTC) for every
+        file in the file storage, or for every staged file if staged is True.
+        """
+
+    def remove(paths, *, staged=False):
+        """
+        Remove the files located at the given paths, or the staged files for
+        them if staged is True.
+        """
+
+
+class ISimpleStorage(Interface):
+    def create_service(context, request):
+        """
+        Create the service, given the context and request for which it is being
+        created for, passing a name for settings.
+        """
+
+    def get(path):
+        """
+        Return a file like object that can be read to access the pre-rendered
+        simple page located at the given path.
+        """
+
+    def store(path, file_path, *, meta=None):
+        """
+        Save the pre-rendered simple page located at file_path to the simple
+        storage at the location specified by path. An additional meta keyword
+        argument may contain extra information that an implementation may or
+        may not store.
+        """
+
 
 class IDocsStorage(Interface):
     def create_service(context, request):
@@ -30,6 +30,7 @@ from sqlalchemy import (
     DateTime,
     Integer,
     Float,
+    LargeBinary,
     Table,
     Text,
 )
@@ -44,6 +45,7 @@ from sqlalchemy.ext.hybrid import hybrid_property
 from warehouse import db
 from warehouse.accounts.models import User
 from warehouse.classifiers.models import Classifier
+from warehouse.packaging.ordering import version_sort_key
 from warehouse.sitemap.models import SitemapMixin
 from warehouse.utils import dotted_navigator
 from warehouse.utils.attrs import make_repr
@@ -196,7 +198,7 @@ class Project(SitemapMixin, db.Model):
             orm.object_session(self)
             .query(Release.version, Release.created, Release.is_prerelease)
             .filter(Release.project == self)
-            .order_by(Release._pypi_ordering.desc())
+            .order_by(Release.version_sort_key.desc())
             .all()
         )
 
@@ -206,7 +208,9 @@ class Project(SitemapMixin, db.Model):
             orm.object_session(self)
             .query(Release.version, Release.created, Release.is_prerelease)
             .filter(Release.project == self)
-            .order_by(Release.is_prerelease.nullslast(), Release._pypi_ordering.desc())
+            .order_by(
+                Release.is_prerelease.nullslast(), Release.version_sort_key.desc()
+            )
             .first()
         )
 
@@ -262,6 +266,11 @@ class Release(db.Model):
             Index("release_created_idx", cls.created.desc()),
             Index("release_project_created_idx", cls.project_id, cls.created.desc()),
             Index("release_version_idx", cls.version),
+            Index(
+                "release_project_version_sort_key_idx",
+                cls.project_id,
+                cls.version_sort_key,
+            ),
         )
 
     __repr__ = make_repr("project", "version")
@@ -274,6 +283,10 @@ class Release(db.Model):
     )
     version = Column(Text, nullable=False)
     canonical_version = Column(Text, nullable=False)
+    # This is computed from the version whenever it is set, and compares (as
+    # bytes) in the same order as the versions do under PEP 440, so that we
+    # can sort releases in the database instead of parsing them in Python.
+    version_sort_key = Column(LargeBinary, nullable=False)
     is_prerelease = orm.column_property(func.pep440_is_prerelease(version))
     author = Column(Text)
     author_email = Column(Text)
@@ -398,6 +411,11 @@ class Release(db.Model):
             ]
         )
 
+    @validates("version")
+    def validates_version(self, key, value):
+        self.version_sort_key = version_sort_key(value)
+        return value
+
 
 class File(db.Model):
 
@@ -447,6 +465,7 @@ class File(db.Model):
     md5_digest = Column(Text, unique=True, nullable=False)
     sha256_digest = Column(CIText, unique=True, nullable=False)
     blake2_256_digest = Column(CIText, unique=True, nullable=False)
+    metadata_file_sha256_digest = Column(CIText, nullable=True)
     upload_time = Column(DateTime(timezone=False), server_default=func.now())
     uploaded_via = Column(Text)
 
@@ -463,6 +482,14 @@ class File(db.Model):
     def pgp_path(self):
         return func.concat(self.path, ".asc")
 
+    @hybrid_property
+    def metadata_path(self):
+        return self.path + ".metadata"
+
+    @metadata_path.expression
+    def metadata_path(self):
+        return func.concat(self.path, ".metadata")
+
     @validates("requires_python")
     def validates_requires_python(self, *args, **kwargs):
         raise RuntimeError("Cannot set File.requires_python")
@@ -0,0 +1,103 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import packaging.version
+
+
+# Each of these markers is used to stand in for a value that PEP 440 says
+# sorts before (or after) any actual value in that position, so they need to
+# sort correctly relative to the tag byte that we put before actual values.
+_NEGATIVE_INFINITY = b"\x00"
+_VALUE = b"\x01"
+_INFINITY = b"\x02"
+
+_END = b"\x00"
+_STRING = b"\x01"
+_INTEGER = b"\x02"
+
+_PRE_RELEASES = {"a": 0, "b": 1, "rc": 2}
+
+
+def _integer(value):
+    # A length prefix makes a larger integer sort after a smaller one, no
+    # matter how many bytes it takes to store either of them.
+    data = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return bytes([len(data)]) + data
+
+
+def _string(value):
+    return value.encode("utf8") + _END
+
+
+def _release_key(version):
+    # Trailing zeros don't affect the ordering of a version, so 1.0 and 1.0.0
+    # need to end up with the same key.
+    release = list(version.release)
+    while release and release[-1] == 0:
+        release.pop()
+
+    key = [_integer(version.epoch)]
+    key.extend(_VALUE + _integer(part) for part in release)
+    key.append(_END)
+
+    # A dev release that isn't also a pre or post release sorts before the
+    # pre releases of the same version.
+    if version.pre is None and version.post is None and version.dev is not None:
+        key.append(_NEGATIVE_INFINITY)
+    elif version.pre is None:
+        key.append(_INFINITY)
+    else:
+        letter, number = version.pre
+        key.append(_VALUE + bytes([_PRE_RELEASES[letter]]) + _integer(number))
+
+    if version.post is None:
+        key.append(_NEGATIVE_INFINITY)
+    else:
+        key.append(_VALUE + _integer(version.post))
+
+    if version.dev is None:
+        key.append(_INFINITY)
+    else:
+        key.append(_VALUE + _integer(version.dev))
+
+    if version.local is None:
+        key.append(_NEGATIVE_INFINITY)
+    else:
+        key.append(_VALUE)
+        for part in version.local.split("."):
+            if part.isdigit():
+                key.append(_INTEGER + _integer(int(part)))
+            else:
+                key.append(_STRING + _string(part))
+        key.append(_END)
+
+    return b"".join(key)
+
+
+def version_sort_key(version):
+    """
+    Compute a key for the given version string which, when compared as bytes
+    (for instance as a bytea in PostgreSQL), sorts in the same order as
+    PEP 440 says that the versions themselves sort in.
+
+    Versions which are not valid PEP 440 versions sort before all of those
+    that are, and amongst themselves by their string value.
+    """
+    try:
+        parsed = packaging.version.parse(version)
+    except packaging.version.InvalidVersion:
+        parsed = None
+
+    if not isinstance(parsed, packaging.version.Version):
+        return _NEGATIVE_INFINITY + _string(version.lower())
+
+    return _VALUE + _release_key(parsed)
@@ -10,8 +10,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import packaging.version
-
 from elasticsearch_dsl import Document, Text, Keyword, analyzer, Date
 
 from warehouse.search.utils import doc_type
@@ -56,9 +54,7 @@ class Project(Document):
         obj = cls(meta={"id": release.normalized_name})
         obj["name"] = release.name
         obj["normalized_name"] = release.normalized_name
-        obj["version"] = sorted(
-            release.all_versions, key=lambda r: packaging.version.parse(r), reverse=True
-        )
+        obj["version"] = release.all_versions
         obj["latest_version"] = release.latest_version
         obj["summary"] = release.summary
         obj["description"] = release.description
@@ -0,0 +1,199 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import redis
+
+from sqlalchemy import func
+
+from warehouse.packaging.models import JournalEntry, Project
+
+
+# A hash of project name to that project's last_serial, which is kept up to date
+# from the journal so that list_packages_with_serial doesn't have to read every
+# project from the database, along with the id of the last journal entry that
+# has been applied to it.
+SERIALS_KEY = "project-serials"
+SERIALS_CURSOR_KEY = "project-serials:cursor"
+
+# Journal entries are numbered when they are inserted, not when they are
+# committed, so an entry with a lower id than one we've already applied can
+# still show up. To catch those we always reread this many entries before the
+# last one that we've applied.
+JOURNAL_OVERLAP = 1000
+JOURNAL_BATCH_SIZE = 10000
+
+
+def serials_redis(settings):
+    url = settings.get("packaging.serials.redis_url")
+    if url is None:
+        return None
+    return redis.StrictRedis.from_url(url)
+
+
+def get_project_serials(redis_conn):
+    """
+    Return a dictionary of project name to last_serial, or None if the hash
+    hasn't been built yet.
+    """
+    pipeline = redis_conn.pipeline()
+    pipeline.hgetall(SERIALS_KEY)
+    pipeline.get(SERIALS_CURSOR_KEY)
+    serials, cursor = pipeline.execute()
+
+    # If the hash has been evicted, or was never written, then all we'd be able
+    # to return is whatever has been applied to it since, which isn't enough.
+    if cursor is None or not serials:
+        return None
+    return {name.decode("utf8"): int(serial) for name, serial in serials.items()}
+
+
+def _update_serials(redis_conn, serials, removed):
+    """
+    Set each of the given projects to the given serial, and remove each of the
+    removed projects, but only where that doesn't take a project's serial
+    backwards. Removed projects map to the serial of their removal, or None to
+    remove them no matter what. Nothing is changed if the hash doesn't exist,
+    as adding to it would make a partial hash look like a complete one.
+    """
+    names = list(serials) + list(removed)
+
+    def update(pipeline):
+        if not pipeline.exists(SERIALS_KEY):
+            return
+
+        # Commits don't always finish in the same order as their journal
+        # entries were numbered, so we may be applying an older serial than
+        # the one that we already have.
+        current = {
+            name: int(serial) if serial is not None else None
+            for name, serial in zip(names, pipeline.hmget(SERIALS_KEY, names))
+        }
+        newer = {
+            name: serial
+            for name, serial in serials.items()
+            if current[name] is None or current[name] < serial
+        }
+        gone = [
+            name
+            for name, serial in removed.items()
+            if serial is None or current[name] is None or current[name] < serial
+        ]
+
+        pipeline.multi()
+        if newer:
+            pipeline.hmset(SERIALS_KEY, newer)
+        if gone:
+            pipeline.hdel(SERIALS_KEY, *gone)
+
+    redis_conn.transaction(update, SERIALS_KEY)
+
+
+def apply_journal_entries(redis_conn, entries):
+    """
+    Apply the given (id, name, action) journal entries directly, without going
+    back to the database, which lets them be applied as soon as they've been
+    committed.
+    """
+    serials = {}
+    removed = {}
+    for id_, name, action in sorted(entries, key=lambda entry: entry[0]):
+        if name is None:
+            continue
+        if action == "remove project":
+            serials.pop(name, None)
+            removed[name] = id_
+        else:
+            serials[name] = id_
+            removed.pop(name, None)
+
+    if not serials and not removed:
+        return
+
+    _update_serials(redis_conn, serials, removed)
+
+
+def update_project_serials(db, redis_conn, names):
+    """
+    Set the serial of each of the named projects to the one currently in the
+    database, removing any project that no longer exists.
+    """
+    names = {name for name in names if name is not None}
+    if not names:
+        return
+
+    serials = dict(
+        db.query(Project.name, Project.last_serial).filter(Project.name.in_(names))
+    )
+
+    _update_serials(redis_conn, serials, {name: None for name in names - set(serials)})
+
+
+def rebuild_project_serials(db, redis_conn, batch_size=JOURNAL_BATCH_SIZE):
+    """
+    Rebuild the hash from scratch from the projects table.
+    """
+    # Anything journaled after we take the cursor will be in the projects that
+    # we read below, or will be applied the next time we read the journal.
+    cursor = db.query(func.max(JournalEntry.id)).scalar() or 0
+
+    temp_key = f"{SERIALS_KEY}:rebuild"
+    redis_conn.delete(temp_key)
+    batch = {}
+    for name, serial in db.query(Project.name, Project.last_serial).yield_per(
+        batch_size
+    ):
+        batch[name] = serial
+        if len(batch) >= batch_size:
+            redis_conn.hmset(temp_key, batch)
+            batch = {}
+    if batch:
+        redis_conn.hmset(temp_key, batch)
+
+    # Swap the new hash in all at once, so nothing ever reads a partial one.
+    pipeline = redis_conn.pipeline()
+    if redis_conn.exists(temp_key):
+        pipeline.rename(temp_key, SERIALS_KEY)
+    else:
+        pipeline.delete(SERIALS_KEY)
+    pipeline.set(SERIALS_CURSOR_KEY, cursor)
+    pipeline.execute()
+
+
+def apply_journals(db, redis_conn, batch_size=JOURNAL_BATCH_SIZE):
+    """
+    Apply every journal entry past the last one that has been applied, building
+    the hash from scratch if it doesn't exist yet, or no longer exists.
+    """
+    pipeline = redis_conn.pipeline()
+    pipeline.get(SERIALS_CURSOR_KEY)
+    pipeline.exists(SERIALS_KEY)
+    cursor, exists = pipeline.execute()
+    if cursor is None or not exists:
+        return rebuild_project_serials(db, redis_conn, batch_size=batch_size)
+
+    cursor = int(cursor)
+    last_id = max(cursor - JOURNAL_OVERLAP, 0)
+    while True:
+        entries = (
+            db.query(JournalEntry.id, JournalEntry.name)
+            .filter(JournalEntry.id > last_id)
+            .order_by(JournalEntry.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not entries:
+            break
+        update_project_serials(db, redis_conn, {name for _, name in entries})
+        last_id = entries[-1].id
+
+    if last_id > cursor:
+        redis_conn.set(SERIALS_CURSOR_KEY, last_id)
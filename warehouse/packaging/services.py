@@ -10,21 +10,39 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import datetime
 import os.path
 import shutil
 import warnings
 
+import boto3.s3.transfer
 import botocore.exceptions
 
 from zope.interface import implementer
 
-from warehouse.packaging.interfaces import IFileStorage, IDocsStorage
+from warehouse.packaging.interfaces import IFileStorage, IDocsStorage, ISimpleStorage
 
 
 class InsecureStorageWarning(UserWarning):
     pass
 
 
+# Files are uploaded to this directory first, and only moved to where they will
+# be served from once the upload has been committed.
+STAGING_PREFIX = "staging/"
+
+# The most keys that S3 will delete in a single request.
+S3_DELETE_BATCH_SIZE = 1000
+
+# Anything larger than the multipart chunk size is uploaded to S3 in parts of
+# that size, several of them at once, rather than in one long request.
+S3_TRANSFER_CONFIG = boto3.s3.transfer.TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=8,
+)
+
+
 @implementer(IFileStorage)
 class LocalFileStorage:
     def __init__(self, base):
@@ -55,6 +73,45 @@ class LocalFileStorage:
             with open(file_path, "rb") as src_fp:
                 dest_fp.write(src_fp.read())
 
+    def stage(self, path, file_path, *, meta=None):
+        self.store(STAGING_PREFIX + path, file_path, meta=meta)
+
+    def promote(self, path):
+        destination = os.path.join(self.base, path)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.replace(os.path.join(self.base, STAGING_PREFIX + path), destination)
+
+    def list(self, *, staged=False):
+        top = os.path.join(self.base, STAGING_PREFIX) if staged else self.base
+        for dirpath, dirnames, filenames in os.walk(top):
+            # Staged files aren't stored files yet.
+            if not staged and dirpath == top:
+                dirnames[:] = [d for d in dirnames if d != STAGING_PREFIX.strip("/")]
+            for filename in filenames:
+                filepath = os.path.join(dirpath, filename)
+                yield (
+                    os.path.relpath(filepath, top),
+                    datetime.datetime.fromtimestamp(
+                        os.path.getmtime(filepath), tz=datetime.timezone.utc
+                    ),
+                )
+
+    def remove(self, paths, *, staged=False):
+        for path in paths:
+            try:
+                os.remove(
+                    os.path.join(self.base, (STAGING_PREFIX if staged else "") + path)
+                )
+            except FileNotFoundError:
+                pass
+
+
+@implementer(ISimpleStorage)
+class LocalSimpleStorage(LocalFileStorage):
+    @classmethod
+    def create_service(cls, context, request):
+        return cls(request.registry.settings["simple.path"])
+
 
 @implementer(IDocsStorage)
 class LocalDocsStorage:
@@ -86,9 +143,10 @@ class LocalDocsStorage:
 
 @implementer(IFileStorage)
 class S3FileStorage:
-    def __init__(self, bucket, *, prefix=None):
+    def __init__(self, bucket, *, prefix=None, transfer_config=None):
         self.bucket = bucket
         self.prefix = prefix
+        self.transfer_config = transfer_config
 
     @classmethod
     def create_service(cls, context, request):
@@ -96,7 +154,7 @@ class S3FileStorage:
         s3 = session.resource("s3")
         bucket = s3.Bucket(request.registry.settings["files.bucket"])
         prefix = request.registry.settings.get("files.prefix")
-        return cls(bucket, prefix=prefix)
+        return cls(bucket, prefix=prefix, transfer_config=S3_TRANSFER_CONFIG)
 
     def _get_path(self, path):
         # Legacy paths will have a first directory of something like 2.7, we
@@ -127,7 +185,80 @@ class S3FileStorage:
 
         path = self._get_path(path)
 
-        self.bucket.upload_file(file_path, path, ExtraArgs=extra_args)
+        if self.transfer_config is not None:
+            self.bucket.upload_file(
+                file_path, path, ExtraArgs=extra_args, Config=self.transfer_config
+            )
+        else:
+            self.bucket.upload_file(file_path, path, ExtraArgs=extra_args)
+
+    def _get_staged_path(self, path):
+        return (self.prefix or "") + STAGING_PREFIX + path
+
+    def stage(self, path, file_path, *, meta=None):
+        # Staged files aren't legacy files, so they always get our prefix, and
+        # we don't want to pass them through _get_path, which would treat them
+        # as legacy files because of their first directory.
+        extra_args = {}
+        if meta is not None:
+            extra_args["Metadata"] = meta
+
+        staged_path = self._get_staged_path(path)
+
+        if self.transfer_config is not None:
+            self.bucket.upload_file(
+                file_path,
+                staged_path,
+                ExtraArgs=extra_args,
+                Config=self.transfer_config,
+            )
+        else:
+            self.bucket.upload_file(file_path, staged_path, ExtraArgs=extra_args)
+
+    def promote(self, path):
+        # This is a copy entirely within S3, so none of the file has to go
+        # through us again, and it keeps the metadata that it was staged with.
+        staged_path = self._get_staged_path(path)
+        self.bucket.Object(self._get_path(path)).copy_from(
+            CopySource={"Bucket": self.bucket.name, "Key": staged_path}
+        )
+        self.bucket.Object(staged_path).delete()
+
+    def list(self, *, staged=False):
+        prefix = self.prefix or ""
+        staging = prefix + STAGING_PREFIX
+        for obj in self.bucket.objects.filter(Prefix=staging if staged else prefix):
+            if staged:
+                yield obj.key[len(staging) :], obj.last_modified
+            elif not obj.key.startswith(staging):
+                yield obj.key[len(prefix) :], obj.last_modified
+
+    def remove(self, paths, *, staged=False):
+        get_path = self._get_staged_path if staged else self._get_path
+        keys = [{"Key": get_path(path)} for path in paths]
+        for start in range(0, len(keys), S3_DELETE_BATCH_SIZE):
+            self.bucket.delete_objects(
+                Delete={"Objects": keys[start : start + S3_DELETE_BATCH_SIZE]}
+            )
+
+
+@implementer(ISimpleStorage)
+class S3SimpleStorage(S3FileStorage):
+    @classmethod
+    def create_service(cls, context, request):
+        session = request.find_service(name="aws.session")
+        s3 = session.resource("s3")
+        bucket = s3.Bucket(request.registry.settings["simple.bucket"])
+        prefix = request.registry.settings.get("simple.prefix")
+        return cls(bucket, prefix=prefix)
+
+    def _get_path(self, path):
+        # Unlike our package files, there are no legacy paths for the simple
+        # pages, so we always want to apply our prefix if we have one.
+        if self.prefix:
+            path = self.prefix + path
+
+        return path
 
 
 @implementer(IDocsStorage)
@@ -10,9 +10,31 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import datetime
+import itertools
+
+from sqlalchemy import func, select
+
 from warehouse import tasks
 from warehouse.cache.origin import IOriginCache
-from warehouse.packaging.models import Project
+from warehouse.packaging import serials
+from warehouse.packaging.interfaces import IFileStorage
+from warehouse.packaging.models import File, Project, Release
+
+
+# A staged file is promoted as soon as the upload that staged it is committed,
+# so one that is still staged after this long belongs to an upload that failed.
+STAGED_FILE_MAX_AGE = datetime.timedelta(hours=6)
+
+# We don't consider any stored file to be orphaned until it is at least this
+# old, so that we never remove a file whose upload is still being committed.
+ORPHANED_FILE_MIN_AGE = datetime.timedelta(days=1)
+
+# How many stored files we check against the database at a time.
+FILE_GC_BATCH_SIZE = 1000
+
+# The suffixes of the files that we store alongside each uploaded file.
+_FILE_COMPANION_SUFFIXES = [".asc", ".metadata"]
 
 
 @tasks.task(ignore_result=True, acks_late=True)
@@ -94,3 +116,120 @@ def compute_trending(request):
         pass
     else:
         cacher.purge(["trending"])
+
+
+@tasks.task(ignore_result=True, acks_late=True)
+def sync_project_serials(request):
+    redis_conn = serials.serials_redis(request.registry.settings)
+    if redis_conn is not None:
+        serials.apply_journals(request.db, redis_conn)
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _known_paths(db, paths):
+    # Signatures and metadata are stored alongside the file that they're for, so
+    # they belong to a file in the database if that file does.
+    file_paths = {}
+    for path in paths:
+        file_path = path
+        for suffix in _FILE_COMPANION_SUFFIXES:
+            if path.endswith(suffix):
+                file_path = path[: -len(suffix)]
+                break
+        file_paths[path] = file_path
+    known = {
+        path
+        for (path,) in db.query(File.path).filter(
+            File.path.in_(set(file_paths.values()))
+        )
+    }
+    return {path for path, file_path in file_paths.items() if file_path in known}
+
+
+@tasks.task(ignore_result=True, acks_late=True)
+def promote_staged_files(request):
+    storage = request.find_service(IFileStorage)
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    for batch in _batched(storage.list(staged=True), FILE_GC_BATCH_SIZE):
+        known = _known_paths(request.db, [path for path, _ in batch])
+
+        for path, _ in batch:
+            if path in known:
+                request.log.info("Promoting staged file %s", path)
+                storage.promote(path)
+
+        expired = [
+            path
+            for path, last_modified in batch
+            if path not in known and now - last_modified > STAGED_FILE_MAX_AGE
+        ]
+        if expired:
+            request.log.info("Removing %s expired staged files", len(expired))
+            storage.remove(expired, staged=True)
+
+
+@tasks.task(ignore_result=True, acks_late=True)
+def remove_orphaned_files(request):
+    storage = request.find_service(IFileStorage)
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    for batch in _batched(storage.list(), FILE_GC_BATCH_SIZE):
+        candidates = [
+            path
+            for path, last_modified in batch
+            if now - last_modified > ORPHANED_FILE_MIN_AGE
+        ]
+        if not candidates:
+            continue
+
+        known = _known_paths(request.db, candidates)
+        orphaned = [path for path in candidates if path not in known]
+        if orphaned:
+            request.log.info("Removing %s orphaned files", len(orphaned))
+            storage.remove(orphaned)
+
+
+@tasks.task(ignore_result=True, acks_late=True)
+def reorder_releases(request):
+    """
+    Renumber the ordering of every project's releases, wherever it doesn't
+    match the order of their versions.
+    """
+    releases = Release.__table__
+
+    # Releases whose versions sort the same are kept in the order that they
+    # already have, so that running this again doesn't change anything.
+    ordering = select(
+        [
+            releases.c.id,
+            (
+                func.row_number().over(
+                    partition_by=releases.c.project_id,
+                    order_by=[
+                        releases.c.version_sort_key,
+                        releases.c._pypi_ordering,
+                        releases.c.version,
+                    ],
+                )
+                - 1
+            ).label("position"),
+        ]
+    ).alias("ordering")
+
+    result = request.db.execute(
+        releases.update()
+        .values(_pypi_ordering=ordering.c.position)
+        .where(releases.c.id == ordering.c.id)
+        .where(releases.c._pypi_ordering.is_distinct_from(ordering.c.position))
+    )
+    if result.rowcount:
+        request.log.info("Reordered %s releases", result.rowcount)
@@ -222,6 +222,15 @@ def includeme(config):
         domain=warehouse,
     )
 
+    config.add_route(
+        "legacy.api.json.bulk", "/pypi/json", read_only=True, domain=warehouse
+    )
+    config.add_route(
+        "legacy.api.json.changelog",
+        "/pypi/json/changelog",
+        read_only=True,
+        domain=warehouse,
+    )
     config.add_route(
         "legacy.api.json.project",
         "/pypi/{name}/json",
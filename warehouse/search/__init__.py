@@ -14,6 +14,7 @@ import urllib.parse
 
 import certifi
 import elasticsearch
+import redis
 
 from celery.schedules import crontab
 from elasticsearch_dsl import serializer
@@ -54,13 +55,18 @@ def execute_project_reindex(config, session):
     projects_to_update = session.info.pop("warehouse.search.project_updates", set())
     projects_to_delete = session.info.pop("warehouse.search.project_deletes", set())
 
-    from warehouse.search.tasks import reindex_project, unindex_project
+    # Rather than reindexing each project immediately we queue it, so that a
+    # burst of changes to one project is coalesced into a single reindex by
+    # the reindex_pending_projects task. Deleted projects are queued the same
+    # way, as a project which no longer exists is removed from the index.
+    normalized_names = {
+        project.normalized_name for project in projects_to_update | projects_to_delete
+    }
 
-    for project in projects_to_update:
-        config.task(reindex_project).delay(project.normalized_name)
+    if normalized_names:
+        from warehouse.search.tasks import queue_project_reindex
 
-    for project in projects_to_delete:
-        config.task(unindex_project).delay(project.normalized_name)
+        queue_project_reindex(config.registry["search.redis"], normalized_names)
 
 
 def es(request):
@@ -94,6 +100,14 @@ def includeme(config):
     config.registry["elasticsearch.replicas"] = int(qs.get("replicas", ["0"])[0])
     config.add_request_method(es, name="es", reify=True)
 
-    from warehouse.search.tasks import reindex
+    # Projects waiting to be reindexed are queued in Redis after every commit
+    # that changes one, so we keep a single client (and its connection pool)
+    # around for that instead of creating one each time.
+    config.registry["search.redis"] = redis.StrictRedis.from_url(
+        config.registry.settings["celery.scheduler_url"]
+    )
+
+    from warehouse.search.tasks import reindex, reindex_pending_projects
 
     config.add_periodic_task(crontab(minute=0, hour=6), reindex)
+    config.add_periodic_task(crontab(minute="*"), reindex_pending_projects)
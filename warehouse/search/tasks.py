@@ -11,12 +11,17 @@
 # limitations under the License.
 
 import binascii
+import collections
+import itertools
+import json
+import time
 import urllib
 import os
 
 from elasticsearch.helpers import parallel_bulk
 from elasticsearch_dsl import serializer
-from sqlalchemy import func
+from sqlalchemy import and_, func, text
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 from sqlalchemy.orm import aliased
 import certifi
 import elasticsearch
@@ -29,14 +34,52 @@ from warehouse import tasks
 from warehouse.utils.db import windowed_query
 
 
-def _project_docs(db, project_name=None):
+def _column_window_bounds(session, column, windowsize):
+    """
+    Return a series of (start, end) tuples which break the given column into
+    windows of at most windowsize rows each.
+
+    The start of each window is inclusive and the end is exclusive, the end of
+    the final window is None as it is unbounded.
+    """
+    q = session.query(
+        column, func.row_number().over(order_by=column).label("rownum")
+    ).from_self(column)
+
+    if windowsize > 1:
+        q = q.filter(text("rownum %% %d=1" % windowsize))
+
+    intervals = [row[0] for row in q]
+
+    while intervals:
+        start = intervals.pop(0)
+        if intervals:
+            end = intervals[0]
+        else:
+            end = None
+
+        yield start, end
+
+
+def _column_window_clause(column, start, end):
+    """
+    Return a WHERE clause that limits the given column to the window between
+    start (inclusive) and end (exclusive, or unbounded if None).
+    """
+    if end is not None:
+        return and_(column >= start, column < end)
+    else:
+        return column >= start
+
+
+def _project_docs(db, project_name=None, project_ids=None, normalized_names=None):
 
     releases_list = (
         db.query(Release.id)
         .order_by(
             Release.project_id,
             Release.is_prerelease.nullslast(),
-            Release._pypi_ordering.desc(),
+            Release.version_sort_key.desc(),
         )
         .distinct(Release.project_id)
     )
@@ -44,12 +87,24 @@ def _project_docs(db, project_name=None):
     if project_name:
         releases_list = releases_list.join(Project).filter(Project.name == project_name)
 
+    if project_ids is not None:
+        releases_list = releases_list.filter(
+            _column_window_clause(Release.project_id, *project_ids)
+        )
+
+    if normalized_names is not None:
+        releases_list = releases_list.join(Project).filter(
+            Project.normalized_name.in_(normalized_names)
+        )
+
     releases_list = releases_list.subquery()
 
     r = aliased(Release, name="r")
 
     all_versions = (
-        db.query(func.array_agg(r.version))
+        db.query(
+            func.array_agg(aggregate_order_by(r.version, r.version_sort_key.desc()))
+        )
         .filter(r.project_id == Release.project_id)
         .correlate(Release)
         .as_scalar()
@@ -90,7 +145,14 @@ def _project_docs(db, project_name=None):
         .outerjoin(Release.project)
     )
 
-    for release in windowed_query(release_data, Release.project_id, 50000):
+    if project_ids is not None or normalized_names is not None:
+        # A single partition or batch is already bounded in size, so there's no
+        # need to break it up into further windows.
+        releases = release_data.order_by(Release.project_id)
+    else:
+        releases = windowed_query(release_data, Release.project_id, 50000)
+
+    for release in releases:
         p = ProjectDocument.from_db(release)
         p._index = None
         p.full_clean()
@@ -115,128 +177,342 @@ class SearchLock:
         self.lock.release()
 
 
+# The number of projects which are indexed by each reindex_partition task.
+REINDEX_PARTITION_SIZE = 10000
+
+# Projects which have changed are collected in a sorted set, scored by the time
+# they last changed, and are only reindexed once they haven't changed for
+# REINDEX_DEBOUNCE seconds, at most REINDEX_BATCH_SIZE at a time. So that a
+# project which never stops changing still gets reindexed, we also keep the
+# time that each project was first queued, and reindex it regardless once it
+# has been waiting for REINDEX_MAX_WAIT seconds.
+REINDEX_PENDING_KEY = "search-reindex:pending"
+REINDEX_FIRST_QUEUED_KEY = "search-reindex:first-queued"
+REINDEX_DEBOUNCE = 30
+REINDEX_MAX_WAIT = 5 * 60
+REINDEX_BATCH_SIZE = 500
+
+# The state of an in progress reindex is stored in Redis, so that a reindex
+# which fails part way through can be resumed rather than restarted.
+REINDEX_STATE_KEY = "search-reindex"
+REINDEX_COMPLETE_KEY = "search-reindex:complete"
+
+
+def _redis_client(request):
+    return redis.StrictRedis.from_url(request.registry.settings["celery.scheduler_url"])
+
+
+def _es_client(request):
+    p = urllib.parse.urlparse(request.registry.settings["elasticsearch.url"])
+    return elasticsearch.Elasticsearch(
+        [urllib.parse.urlunparse(p[:2] + ("",) * 4)],
+        verify_certs=True,
+        ca_certs=certifi.where(),
+        timeout=30,
+        retry_on_timeout=True,
+        serializer=serializer.serializer,
+    )
+
+
+def _reindex_index_name(r):
+    """
+    Return the name of the index that a reindex is currently building, or None
+    if there isn't one in progress.
+    """
+    index_name = r.hget(REINDEX_STATE_KEY, "index")
+    if index_name is not None:
+        return index_name.decode("utf8")
+
+
+def _clear_reindex_state(r):
+    r.delete(REINDEX_STATE_KEY, REINDEX_COMPLETE_KEY)
+
+
+def _finish_reindex(request, r, index_name):
+    """
+    Make the given, fully built, index live and clean up after the reindex.
+    """
+    client = _es_client(request)
+    index_base = request.registry["elasticsearch.index"]
+
+    # Now that we've finished indexing all of our data we can update the
+    # replicas and refresh intervals.
+    client.indices.put_settings(
+        index=index_name,
+        body={
+            "index": {
+                "number_of_replicas": request.registry.get("elasticsearch.replicas", 0),
+                "refresh_interval": request.registry.get(
+                    "elasticsearch.interval", "1s"
+                ),
+            }
+        },
+    )
+
+    # Point the alias at our new randomly named index and delete the old index.
+    if client.indices.exists_alias(name=index_base):
+        to_delete = set()
+        actions = []
+        for name in client.indices.get_alias(name=index_base):
+            to_delete.add(name)
+            actions.append({"remove": {"index": name, "alias": index_base}})
+        actions.append({"add": {"index": index_name, "alias": index_base}})
+        client.indices.update_aliases({"actions": actions})
+        client.indices.delete(",".join(to_delete))
+    else:
+        client.indices.put_alias(name=index_base, index=index_name)
+
+    _clear_reindex_state(r)
+
+
 @tasks.task(bind=True, ignore_result=True, acks_late=True)
 def reindex(self, request):
     """
     Recreate the Search Index.
+
+    The projects are split into ranges of ids, each of which is indexed by its
+    own reindex_partition task. If a previous reindex didn't complete, then
+    only the partitions which it didn't finish are indexed again.
     """
-    r = redis.StrictRedis.from_url(request.registry.settings["celery.scheduler_url"])
+    r = _redis_client(request)
     try:
         with SearchLock(r, timeout=30 * 60, blocking_timeout=30):
-            p = urllib.parse.urlparse(request.registry.settings["elasticsearch.url"])
-            client = elasticsearch.Elasticsearch(
-                [urllib.parse.urlunparse(p[:2] + ("",) * 4)],
-                verify_certs=True,
-                ca_certs=certifi.where(),
-                timeout=30,
-                retry_on_timeout=True,
-                serializer=serializer.serializer,
-            )
-            number_of_replicas = request.registry.get("elasticsearch.replicas", 0)
-            refresh_interval = request.registry.get("elasticsearch.interval", "1s")
-
-            # We use a randomly named index so that we can do a zero downtime reindex.
-            # Essentially we'll use a randomly named index which we will use until all
-            # of the data has been reindexed, at which point we'll point an alias at
-            # our randomly named index, and then delete the old randomly named index.
-
-            # Create the new index and associate all of our doc types with it.
-            index_base = request.registry["elasticsearch.index"]
-            random_token = binascii.hexlify(os.urandom(5)).decode("ascii")
-            new_index_name = "{}-{}".format(index_base, random_token)
-            doc_types = request.registry.get("search.doc_types", set())
-            shards = request.registry.get("elasticsearch.shards", 1)
-
-            # Create the new index with zero replicas and index refreshes disabled
-            # while we are bulk indexing.
-            new_index = get_index(
-                new_index_name,
-                doc_types,
-                using=client,
-                shards=shards,
-                replicas=0,
-                interval="-1",
-            )
-            new_index.create(wait_for_active_shards=shards)
-
-            # From this point on, if any error occurs, we want to be able to delete our
-            # in progress index.
-            try:
-                request.db.execute("SET statement_timeout = '600s'")
-
-                for _ in parallel_bulk(
-                    client, _project_docs(request.db), index=new_index_name
-                ):
-                    pass
-            except:  # noqa
-                new_index.delete()
-                raise
-            finally:
-                request.db.rollback()
-                request.db.close()
-
-            # Now that we've finished indexing all of our data we can update the
-            # replicas and refresh intervals.
-            client.indices.put_settings(
-                index=new_index_name,
-                body={
-                    "index": {
-                        "number_of_replicas": number_of_replicas,
-                        "refresh_interval": refresh_interval,
-                    }
-                },
-            )
+            client = _es_client(request)
 
-            # Point the alias at our new randomly named index and delete the old index.
-            if client.indices.exists_alias(name=index_base):
-                to_delete = set()
-                actions = []
-                for name in client.indices.get_alias(name=index_base):
-                    to_delete.add(name)
-                    actions.append({"remove": {"index": name, "alias": index_base}})
-                actions.append({"add": {"index": new_index_name, "alias": index_base}})
-                client.indices.update_aliases({"actions": actions})
-                client.indices.delete(",".join(to_delete))
+            index_name = _reindex_index_name(r)
+            if index_name is not None and client.indices.exists(index=index_name):
+                partitions = json.loads(r.hget(REINDEX_STATE_KEY, "partitions"))
             else:
-                client.indices.put_alias(name=index_base, index=new_index_name)
+                _clear_reindex_state(r)
+
+                # We use a randomly named index so that we can do a zero downtime
+                # reindex. Essentially we'll use a randomly named index which we
+                # will use until all of the data has been reindexed, at which point
+                # we'll point an alias at our randomly named index, and then delete
+                # the old randomly named index.
+
+                # Create the new index and associate all of our doc types with it.
+                index_base = request.registry["elasticsearch.index"]
+                random_token = binascii.hexlify(os.urandom(5)).decode("ascii")
+                index_name = "{}-{}".format(index_base, random_token)
+                doc_types = request.registry.get("search.doc_types", set())
+                shards = request.registry.get("elasticsearch.shards", 1)
+
+                # Create the new index with zero replicas and index refreshes
+                # disabled while we are bulk indexing.
+                new_index = get_index(
+                    index_name,
+                    doc_types,
+                    using=client,
+                    shards=shards,
+                    replicas=0,
+                    interval="-1",
+                )
+                new_index.create(wait_for_active_shards=shards)
+
+                try:
+                    partitions = [
+                        (str(start), str(end) if end is not None else None)
+                        for start, end in _column_window_bounds(
+                            request.db, Project.id, REINDEX_PARTITION_SIZE
+                        )
+                    ]
+                except:  # noqa
+                    new_index.delete()
+                    raise
+
+                r.hmset(
+                    REINDEX_STATE_KEY,
+                    {"index": index_name, "partitions": json.dumps(partitions)},
+                )
+
+            complete = {int(i) for i in r.smembers(REINDEX_COMPLETE_KEY)}
+            pending = [i for i in range(len(partitions)) if i not in complete]
+
+            if not pending:
+                _finish_reindex(request, r, index_name)
+
+            for partition in pending:
+                request.task(reindex_partition).delay(
+                    index_name, partition, *partitions[partition]
+                )
     except redis.exceptions.LockError as exc:
         raise self.retry(countdown=60, exc=exc)
 
 
 @tasks.task(bind=True, ignore_result=True, acks_late=True)
-def reindex_project(self, request, project_name):
-    r = redis.StrictRedis.from_url(request.registry.settings["celery.scheduler_url"])
+def reindex_partition(self, request, index_name, partition, start, end):
+    """
+    Index the projects with an id in [start, end) into the given index, as one
+    partition of a full reindex.
+    """
+    r = _redis_client(request)
+
+    # If the reindex that this partition belongs to has since been abandoned
+    # then there's nothing left for us to do.
+    if _reindex_index_name(r) != index_name:
+        return
+
+    client = _es_client(request)
+
     try:
-        with SearchLock(r, timeout=15, blocking_timeout=1):
-            client = request.registry["elasticsearch.client"]
-            doc_types = request.registry.get("search.doc_types", set())
-            index_name = request.registry["elasticsearch.index"]
-            get_index(
-                index_name,
-                doc_types,
-                using=client,
-                shards=request.registry.get("elasticsearch.shards", 1),
-                replicas=request.registry.get("elasticsearch.replicas", 0),
+        request.db.execute("SET statement_timeout = '600s'")
+
+        for _ in parallel_bulk(
+            client,
+            _project_docs(request.db, project_ids=(start, end)),
+            index=index_name,
+        ):
+            pass
+    except Exception as exc:
+        raise self.retry(exc=exc)
+    finally:
+        request.db.rollback()
+        request.db.close()
+
+    # Record that this partition is complete, the task which completes the last
+    # outstanding partition is the one that makes the new index live.
+    partitions = len(json.loads(r.hget(REINDEX_STATE_KEY, "partitions")))
+    _, completed = (
+        r.pipeline().sadd(REINDEX_COMPLETE_KEY, partition).scard(REINDEX_COMPLETE_KEY)
+    ).execute()
+
+    if completed >= partitions:
+        try:
+            with SearchLock(r, timeout=15 * 60, blocking_timeout=30):
+                # Make sure that another task hasn't already finished (or
+                # abandoned) this reindex while we were waiting for the lock.
+                if _reindex_index_name(r) == index_name:
+                    _finish_reindex(request, r, index_name)
+        except redis.exceptions.LockError as exc:
+            raise self.retry(countdown=60, exc=exc)
+
+
+def _index_names(request, r):
+    """
+    Return the names of every index that a change to a single project should be
+    written to, which includes the index being built by an in progress reindex.
+    """
+    index_names = [request.registry["elasticsearch.index"]]
+    in_progress = _reindex_index_name(r)
+    if in_progress is not None:
+        index_names.append(in_progress)
+    return index_names
+
+
+def queue_project_reindex(r, normalized_names):
+    """
+    Record that the given projects need to be reindexed (or unindexed, if they
+    no longer exist) by reindex_pending_projects.
+    """
+    now = time.time()
+    normalized_names = list(normalized_names)
+    if normalized_names:
+        pipeline = r.pipeline()
+        for name in normalized_names:
+            pipeline.zscore(REINDEX_FIRST_QUEUED_KEY, name)
+        first_queued = pipeline.execute()
+
+        pipeline = r.pipeline()
+        pipeline.zadd(
+            REINDEX_PENDING_KEY,
+            *itertools.chain.from_iterable((now, name) for name in normalized_names),
+        )
+        new_names = [
+            name
+            for name, queued in zip(normalized_names, first_queued)
+            if queued is None
+        ]
+        if new_names:
+            pipeline.zadd(
+                REINDEX_FIRST_QUEUED_KEY,
+                *itertools.chain.from_iterable((now, name) for name in new_names),
             )
+        pipeline.execute()
 
-            for _ in parallel_bulk(
-                client, _project_docs(request.db, project_name), index=index_name
-            ):
-                pass
-    except redis.exceptions.LockError as exc:
-        raise self.retry(countdown=60, exc=exc)
+
+def _reindex_batch(request, r, client, normalized_names):
+    """
+    Reindex the given projects in a single bulk request per index, returning
+    the names of any projects which failed.
+    """
+    docs = list(_project_docs(request.db, normalized_names=normalized_names))
+
+    # Any project that we didn't get a document for has either been deleted or
+    # no longer has any releases, either way it shouldn't be in the index.
+    actions = docs + [
+        {"_op_type": "delete", "_type": "doc", "_id": name}
+        for name in set(normalized_names) - {doc["_id"] for doc in docs}
+    ]
+
+    failed = set()
+    for index_name in _index_names(request, r):
+        for ok, item in parallel_bulk(
+            client, actions, index=index_name, raise_on_error=False
+        ):
+            if not ok:
+                op_type, info = next(iter(item.items()))
+                if not (op_type == "delete" and info.get("status") == 404):
+                    failed.add(info["_id"])
+    return failed
 
 
 @tasks.task(bind=True, ignore_result=True, acks_late=True)
-def unindex_project(self, request, project_name):
-    r = redis.StrictRedis.from_url(request.registry.settings["celery.scheduler_url"])
+def reindex_pending_projects(self, request):
+    """
+    Reindex the projects which have been queued by queue_project_reindex, and
+    which have since gone without any further changes for long enough, or which
+    have been waiting for too long.
+    """
+    r = _redis_client(request)
     try:
-        with SearchLock(r, timeout=15, blocking_timeout=1):
+        with SearchLock(r, timeout=5 * 60, blocking_timeout=1):
             client = request.registry["elasticsearch.client"]
-            index_name = request.registry["elasticsearch.index"]
-            try:
-                client.delete(index=index_name, doc_type="doc", id=project_name)
-            except elasticsearch.exceptions.NotFoundError:
-                pass
+            now = time.time()
+
+            while True:
+                # A project is due once it has gone long enough without being
+                # changed, or once it has been waiting for too long in total.
+                debounced = r.zrangebyscore(
+                    REINDEX_PENDING_KEY,
+                    "-inf",
+                    now - REINDEX_DEBOUNCE,
+                    start=0,
+                    num=REINDEX_BATCH_SIZE,
+                )
+                overdue = r.zrangebyscore(
+                    REINDEX_FIRST_QUEUED_KEY,
+                    "-inf",
+                    now - REINDEX_MAX_WAIT,
+                    start=0,
+                    num=REINDEX_BATCH_SIZE,
+                )
+                pending = list(collections.OrderedDict.fromkeys(debounced + overdue))
+                pending = pending[:REINDEX_BATCH_SIZE]
+                if not pending:
+                    break
+
+                # Remove the batch before we read from the database, that way a
+                # project which changes while we're indexing it will be queued
+                # again rather than being lost.
+                r.pipeline().zrem(REINDEX_PENDING_KEY, *pending).zrem(
+                    REINDEX_FIRST_QUEUED_KEY, *pending
+                ).execute()
+
+                normalized_names = [name.decode("utf8") for name in pending]
+                try:
+                    failed = _reindex_batch(request, r, client, normalized_names)
+                except Exception as exc:
+                    queue_project_reindex(r, normalized_names)
+                    raise self.retry(exc=exc)
+                finally:
+                    request.db.rollback()
+
+                # Failed projects are queued again, so that they're retried by
+                # the next run instead of holding up the rest of this one.
+                queue_project_reindex(r, failed)
+
+                if len(pending) < REINDEX_BATCH_SIZE:
+                    break
     except redis.exceptions.LockError as exc:
         raise self.retry(countdown=60, exc=exc)
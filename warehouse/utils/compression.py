@@ -15,12 +15,27 @@ import hashlib
 
 from collections.abc import Sequence
 
+from webob.response import gzip_app_iter
+
 
 ENCODINGS = ["identity", "gzip"]
 DEFAULT_ENCODING = "identity"
 BUFFER_MAX = 1 * 1024 * 1024  # We'll buffer up to 1MB
 
 
+def _gzip_app_iter(app_iter):
+    # WebOb's gzip_app_iter doesn't pass a close() through to the app_iter that
+    # it is wrapping, which means that a streaming body that holds on to some
+    # resource (like a database cursor) would never get a chance to release it
+    # if the client went away before we finished sending it.
+    try:
+        yield from gzip_app_iter(app_iter)
+    finally:
+        close = getattr(app_iter, "close", None)
+        if close is not None:
+            close()
+
+
 def _compressor(request, response):
     # Skip items with a Vary: Cookie/Authorization Header because we don't know
     # if they are safe from the CRIME attack.
@@ -56,17 +71,20 @@ def _compressor(request, response):
         streaming = False
 
     if streaming:
-        response.encode_content(encoding=target_encoding, lazy=True)
+        if target_encoding != "identity":
+            response.app_iter = _gzip_app_iter(response.app_iter)
+            response.content_encoding = target_encoding
 
         # We need to remove the content_length from this response, since
         # we no longer know what the length of the content will be.
         response.content_length = None
 
-        # If this has a streaming response, then we need to adjust the ETag
-        # header, if it has one, so that it reflects this. We don't just append
-        # ;gzip to this because we don't want people to try and use it to infer
-        # any information about it.
-        if response.etag is not None:
+        # If this has a streaming response that we've encoded, then we need to
+        # adjust the ETag header, if it has one, so that it reflects this. We
+        # don't just append ;gzip to this because we don't want people to try
+        # and use it to infer any information about it. If we haven't encoded
+        # it then the body is unchanged, so the original ETag still stands.
+        if response.etag is not None and response.content_encoding is not None:
             md5_digest = hashlib.md5((response.etag + ";gzip").encode("utf8"))
             md5_digest = md5_digest.digest()
             md5_digest = base64.b64encode(md5_digest)
@@ -44,8 +44,9 @@ def confirm_project(project, request, fail_route):
 
 
 def remove_project(project, request, flash=True):
-    # TODO: We don't actually delete files from the data store. We should add
-    #       some kind of garbage collection at some point.
+    # We don't delete the project's files from the file storage here, they are
+    # removed by the remove_orphaned_files task once they no longer belong to a
+    # file in the database.
 
     request.db.add(
         JournalEntry(